@@ -1,7 +1,268 @@
 import asyncio
+import base64
+import bisect
+import hashlib
 import logging
 import json
 import os
+import socket
+import struct
+import time
+import zlib
+
+# length prefixed framing, matches peertopeermessagingapp.framing as the name server runs on its own
+FRAME_HEADER = struct.Struct('!I')
+MAX_FRAME_SIZE = 16 * 1024 * 1024
+
+# lan discovery, matches peertopeermessagingapp.lan_discovery
+MULTICAST_GROUP = '239.255.80.80'
+MULTICAST_PORT = 8890
+ANNOUNCE_INTERVAL = 5
+MAX_DATAGRAM_SIZE = 8192
+
+
+def encode_frame(message: str | bytes) -> bytes:
+    """
+    encode_frame prefixes a message with its length
+
+    Args:
+        message (str | bytes): the message, str is encoded as utf-8
+
+    Returns:
+        bytes: the frame
+    """
+    if isinstance(message, str):
+        message = message.encode('utf-8')
+    return FRAME_HEADER.pack(len(message)) + message
+
+
+async def read_frame(reader: asyncio.StreamReader, max_frame_size: int = MAX_FRAME_SIZE) -> bytes:
+    """
+    read_frame reads one frame from the stream
+
+    Args:
+        reader (asyncio.StreamReader): reads from the network stream
+        max_frame_size (int): the largest message accepted. Defaults to MAX_FRAME_SIZE.
+
+    Raises:
+        ValueError: if the frame is larger than max_frame_size
+
+    Returns:
+        bytes: the message
+    """
+    header = await reader.readexactly(FRAME_HEADER.size)
+    (frame_size,) = FRAME_HEADER.unpack(header)
+    if frame_size > max_frame_size:
+        raise ValueError(f'frame of {frame_size} bytes is larger than the max of {max_frame_size} bytes')
+    return await reader.readexactly(frame_size)
+
+
+class Lan_announcer(asyncio.DatagramProtocol):
+    """
+    Lan_announcer announces the name server on the local network so peers do not need its ip
+    answers each query from a starting peer and announces on a schedule, both to the group
+    attrs:
+        logger: logging object
+            the error and info logger for the announcer
+        announcement: bytes
+            the announcement datagram
+        transport: asyncio.DatagramTransport | None
+            the udp transport, None until started
+        __task: asyncio.Task | None
+            the task announcing on a schedule
+    methods:
+        start()
+            joins the multicast group and starts announcing
+        close()
+            stops announcing
+    """
+    def __init__(self, name: str, port: int) -> None:
+        """
+        __init__ initialises the announcer
+
+        Args:
+            name (str): the name of the name server
+            port (int): the port the name server listens on
+        """
+        self.logger = logging.getLogger(__name__)
+        self.announcement = json.dumps({
+            'type': 'announce',
+            'query': False,
+            'name': name,
+            'role': 'name_server',
+            'port': port,
+            'public_key_n': 0,  # unencrypted comms
+            'public_key_e': 0
+        }).encode('utf-8')
+        self.transport: asyncio.DatagramTransport | None = None
+        self.__task: asyncio.Task | None = None
+
+    async def start(self) -> None:
+        """
+        start joins the multicast group, announces and starts announcing on a schedule
+
+        Raises:
+            OSError: if the udp socket can not be created or the group can not be joined
+        """
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
+        try:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            if hasattr(socket, 'SO_REUSEPORT'):
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+            sock.bind(('', MULTICAST_PORT))
+            membership = struct.pack('4s4s', socket.inet_aton(MULTICAST_GROUP), socket.inet_aton('0.0.0.0'))
+            sock.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, membership)
+            sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, 1)  # stay on the local network
+        except OSError:
+            sock.close()
+            raise
+        await asyncio.get_running_loop().create_datagram_endpoint(lambda: self, sock=sock)
+        self.__task = asyncio.create_task(self.__run_announce())
+
+    def close(self) -> None:
+        """
+        close stops announcing and leaves the multicast group
+        """
+        if self.__task is not None:
+            self.__task.cancel()
+        if self.transport is not None:
+            self.transport.close()
+
+    def connection_made(self, transport: asyncio.DatagramTransport) -> None:
+        self.transport = transport
+
+    def datagram_received(self, data: bytes, addr: tuple[str, int]) -> None:
+        if len(data) > MAX_DATAGRAM_SIZE:
+            return
+        try:
+            announcement = json.loads(data)
+        except (UnicodeDecodeError, json.JSONDecodeError):
+            return
+        if (
+            isinstance(announcement, dict)
+            and announcement.get('type') == 'announce'
+            and announcement.get('query') is True
+        ):
+            self.transport.sendto(self.announcement, (MULTICAST_GROUP, MULTICAST_PORT))
+
+    async def __run_announce(self) -> None:
+        """
+        __run_announce announces to the group every ANNOUNCE_INTERVAL
+        """
+        while True:
+            self.transport.sendto(self.announcement, (MULTICAST_GROUP, MULTICAST_PORT))
+            await asyncio.sleep(ANNOUNCE_INTERVAL)
+
+
+class Hash_ring:
+    """
+    Hash_ring a consistent hash ring assigning keys to nodes
+    each node is placed at virtual_nodes points so keys spread evenly
+    and adding or removing a node only moves the keys next to its points
+    attrs:
+        virtual_nodes: int
+            the points on the ring for each node
+        __points: list[tuple[int, str]]
+            the (hash, node) points sorted by hash
+        __nodes: set[str]
+            the nodes on the ring
+    methods:
+        add(node)
+            adds a node to the ring
+        remove(node)
+            removes a node from the ring
+        get(key)
+            gets the node a key is assigned to
+        get_nodes(key)
+            gets every node in the order met clockwise from a key
+    """
+    def __init__(self, virtual_nodes: int = 64) -> None:
+        """
+        __init__ initialises an empty ring
+
+        Args:
+            virtual_nodes (int): the points on the ring for each node. Defaults to 64.
+        """
+        self.virtual_nodes = virtual_nodes
+        self.__points: list[tuple[int, str]] = []
+        self.__nodes: set[str] = set()
+
+    def __len__(self) -> int:
+        return len(self.__nodes)
+
+    def __contains__(self, node: str) -> bool:
+        return node in self.__nodes
+
+    @staticmethod
+    def hash(key: str) -> int:
+        """
+        hash the position of a key on the ring
+
+        Args:
+            key (str): the key
+
+        Returns:
+            int: the position
+        """
+        return int.from_bytes(hashlib.sha256(key.encode('utf-8')).digest()[:8], 'big')
+
+    def add(self, node: str) -> None:
+        """
+        add adds a node to the ring if it is not already on it
+
+        Args:
+            node (str): the node
+        """
+        if node not in self.__nodes:
+            self.__nodes.add(node)
+            for index in range(self.virtual_nodes):
+                bisect.insort(self.__points, (self.hash(f'{node}#{index}'), node))
+
+    def remove(self, node: str) -> None:
+        """
+        remove removes a node from the ring if it is on it
+
+        Args:
+            node (str): the node
+        """
+        if node in self.__nodes:
+            self.__nodes.remove(node)
+            self.__points = [point for point in self.__points if point[1] != node]
+
+    def get(self, key: str) -> str | None:
+        """
+        get gets the node a key is assigned to, the first point clockwise from the key
+
+        Args:
+            key (str): the key
+
+        Returns:
+            str | None: the node or None if the ring is empty
+        """
+        if len(self.__points) == 0:
+            return None
+        index = bisect.bisect(self.__points, (self.hash(key), ''))
+        return self.__points[index % len(self.__points)][1]
+
+    def get_nodes(self, key: str) -> list[str]:
+        """
+        get_nodes gets every node in the order met clockwise from a key, so the next ones take over from the first
+
+        Args:
+            key (str): the key
+
+        Returns:
+            list[str]: the nodes, the one the key is assigned to first
+        """
+        nodes: list[str] = []
+        index = bisect.bisect(self.__points, (self.hash(key), ''))
+        for offset in range(len(self.__points)):
+            node = self.__points[(index + offset) % len(self.__points)][1]
+            if node not in nodes:
+                nodes.append(node)
+                if len(nodes) == len(self.__nodes):
+                    break
+        return nodes
 
 
 class Name_server:
@@ -15,14 +276,41 @@ class Name_server:
         save_file: str
             the path to the save file
         address_book: dict
-            holds the addres of the current chat_server if any
+            holds the addresses of the registered chat servers by name
+        chat_server_endpoints: dict[tuple[str, int], str]
+            the name of the registered chat server at each (ip, port)
         own_address: dict
             holds the address of the name server
-        message_separator: bytes
-            the message separator for communication over the network
-        server_locked_in: bool
-            whether or not a chat server has locked in hosting
-            esures the name server can only have one chat server
+        max_frame_size: int
+            the largest message accepted from the network
+        max_chat_servers: int
+            the most chat servers that can be registered or waiting to be established at once
+        clients_per_chat_server: int
+            the clients each chat server should serve before more chat servers are asked for
+        privilege_timeout: float
+            the seconds a peer given server privileges has to establish its chat server
+        pending_chat_servers: dict[str, float]
+            the time.monotonic() each peer was given server privileges that has not established yet
+        hash_ring: Hash_ring
+            assigns clients to chat servers by consistent hashing on their name
+        clients: set[str]
+            the names of the clients that have asked for a chat server
+        ping_interval: float
+            the seconds between health checks of the chat servers
+        ping_timeout: float
+            the seconds to wait for a chat server to answer a ping
+        max_missed_pings: int
+            the pings in a row a chat server can miss before it is removed
+        chat_server_health: dict[str, dict]
+            whether each chat server answered its last ping, when it last did and the pings it has missed in a row
+        health_check_task: asyncio.Task | None
+            the task pinging the chat servers on a schedule
+        ping_tasks: dict[str, asyncio.Task]
+            the tasks pinging chat servers reported dead by name
+        announce_on_lan: bool
+            whether the name server announces itself to peers on the local network
+        lan_announcer: Lan_announcer | None
+            the lan announcer, None until the name server is created
     methods:
         add_address(name: str, ip: str, port: int)
             adds a new address to the address book
@@ -32,6 +320,16 @@ class Name_server:
             saves the address book to file
         is_active_server()
             checks if there is an active server
+        get_chat_server(client_name: str)
+            gets the chat server a client is assigned to
+        get_chat_servers()
+            gets every registered chat server
+        ping_chat_server(name: str)
+            pings a chat server sending it the other chat servers and caches whether it answered
+        check_chat_server_health()
+            pings the chat servers on a schedule removing them once they stop answering
+        is_chat_server_alive(name: str)
+            checks the cached health of a chat server
         create_chat_server()
             creates a new chat server
         listner(server: asyncio.Server)
@@ -46,27 +344,72 @@ class Name_server:
             save_file: str
                 the path to the save file
             address_book: dict
-                holds the addres of the current chat_server if any
+                holds the addresses of the registered chat servers by name
+            chat_server_endpoints: dict[tuple[str, int], str]
+                the name of the registered chat server at each (ip, port)
             own_address: dict
                 holds the address of the name server
-            message_separator: bytes
-                the message separator for communication over the network
-            server_locked_in: bool
-                whether or not a chat server has locked in hosting
-                esures the name server can only have one chat server
+            max_frame_size: int
+                the largest message accepted from the network
+            max_chat_servers: int
+                the most chat servers that can be registered or waiting to be established at once
+            clients_per_chat_server: int
+                the clients each chat server should serve before more chat servers are asked for
+            privilege_timeout: float
+                the seconds a peer given server privileges has to establish its chat server
+            pending_chat_servers: dict[str, float]
+                the time.monotonic() each peer was given server privileges that has not established yet
+            hash_ring: Hash_ring
+                assigns clients to chat servers by consistent hashing on their name
+            clients: set[str]
+                the names of the clients that have asked for a chat server
+            ping_interval: float
+                the seconds between health checks of the chat servers
+            ping_timeout: float
+                the seconds to wait for a chat server to answer a ping
+            max_missed_pings: int
+                the pings in a row a chat server can miss before it is removed
+            chat_server_health: dict[str, dict]
+                whether each chat server answered its last ping, when it last did and the pings it has missed in a row
+            health_check_task: asyncio.Task | None
+                the task pinging the chat servers on a schedule
+            ping_tasks: dict[str, asyncio.Task]
+                the tasks pinging chat servers reported dead by name
+            announce_on_lan: bool
+                whether the name server announces itself to peers on the local network
+            lan_announcer: Lan_announcer | None
+                the lan announcer, None until the name server is created
         returns: None
         """
         self.logger = logging.getLogger(name='{__name__}')
         logging.basicConfig(encoding='utf-8', level=logging.DEBUG, filemode='w')
         self.save_file = 'address_book.json'
         self.address_book: dict = self.read_in_address_book(self.save_file)
+        self.chat_server_endpoints: dict[tuple[str, int], str] = {
+            (chat_server['ip'], chat_server['port']): name for name, chat_server in self.address_book.items()
+        }
         self.own_address = {
             'name': 'name_server',
             'ip': '127.0.0.1',
             'port': 8888
         }
-        self.message_separator: bytes = '\n'.encode()
-        self.server_locked_in = False
+        self.max_frame_size = MAX_FRAME_SIZE
+        self.max_chat_servers = 16
+        self.clients_per_chat_server = 50
+        self.privilege_timeout = 30
+        self.pending_chat_servers: dict[str, float] = {}
+        self.hash_ring = Hash_ring(virtual_nodes=64)
+        for name in self.address_book:
+            self.hash_ring.add(name)
+        self.clients: set[str] = set()
+        self.ping_interval = 10
+        self.ping_timeout = 5
+        self.max_missed_pings = 3
+        self.chat_server_health: dict[str, dict] = {}
+        self.health_check_task: asyncio.Task | None = None
+        self.ping_tasks: dict[str, asyncio.Task] = {}
+        self.announce_on_lan = True
+        self.lan_announcer: Lan_announcer | None = None
 
     def add_address(self, name: str, ip: str, port: int) -> None:
         """
@@ -80,6 +423,8 @@ class Name_server:
         if isinstance(name, str) and isinstance(ip, str) and isinstance(port, int):
             if self.address_book.__contains__(name):
                 self.logger.info(f'Address book already contains {name} replacing data')
+                old_address = self.address_book[name]
+                self.chat_server_endpoints.pop((old_address['ip'], old_address['port']), None)
             else:
                 self.logger.info(f'Address book does not already contain {name} creating new entry')
             self.address_book[name] = {
@@ -87,6 +432,8 @@ class Name_server:
                 'ip': ip,
                 'port': port,
             }
+            self.chat_server_endpoints[(ip, port)] = name
+            self.hash_ring.add(name)
             self.logger.debug(f'Successfully added address {name}')
             self.save_address_book()
         else:
@@ -111,21 +458,91 @@ class Name_server:
 
     def is_active_server(self) -> bool:
         """
-        is_active_server checks if the name server knows of an active chat server
+        is_active_server checks if the name server knows of an active chat server or one being established
 
         Returns:
             bool: whether or not the name server knows of an active chat server
         """
-        if self.address_book.__contains__('chat_server'):
-            self.logger.info('Chat server is active')
+        self.expire_pending_chat_servers()
+        if len(self.address_book) > 0:
+            self.logger.info(f'{len(self.address_book)} chat servers active')
             return True
-        elif self.server_locked_in:
+        elif len(self.pending_chat_servers) > 0:
             self.logger.info('Server is locked in')
             return True
         else:
             self.logger.info('No chat server established or locked in')
             return False
 
+    def expire_pending_chat_servers(self) -> None:
+        """
+        expire_pending_chat_servers forgets peers given server privileges that did not establish in time
+        """
+        now = time.monotonic()
+        for name, granted_time in list(self.pending_chat_servers.items()):
+            if now - granted_time > self.privilege_timeout:
+                self.logger.info(f'{name} did not establish its chat server in time')
+                self.pending_chat_servers.pop(name)
+
+    def get_chat_server(self, client_name: str) -> dict | None:
+        """
+        get_chat_server gets the chat server a client is assigned to by consistent hashing on its name
+        so a client keeps its chat server while others join or leave
+        a chat server that missed its last ping is skipped for the next one on the ring until it answers again
+
+        Args:
+            client_name (str): the name of the client
+
+        Returns:
+            dict | None: the address of the chat server or None if there are none that are alive
+        """
+        name = self.hash_ring.get(client_name)
+        if name is None:
+            return None
+        if self.is_chat_server_alive(name=name):
+            return self.address_book[name]
+        for name in self.hash_ring.get_nodes(client_name):
+            if self.is_chat_server_alive(name=name):
+                return self.address_book[name]
+        return None
+
+    def get_chat_servers(self) -> list[dict]:
+        """
+        get_chat_servers gets every registered chat server, sent to the chat servers with each ping
+        so they know which others to replicate their address books to
+
+        Returns:
+            list[dict]: the name, ip and port of each chat server
+        """
+        return list(self.address_book.values())
+
+    def is_more_chat_servers_wanted(self) -> bool:
+        """
+        is_more_chat_servers_wanted checks if the clients have outgrown the chat servers
+
+        Returns:
+            bool: whether or not peers should volunteer to host chat servers
+        """
+        self.expire_pending_chat_servers()
+        chat_server_count = len(self.address_book) + len(self.pending_chat_servers)
+        if chat_server_count >= self.max_chat_servers:
+            return False
+        return len(self.clients) > self.clients_per_chat_server * chat_server_count
+
+    def find_chat_server(self, address) -> str | None:
+        """
+        find_chat_server finds the name of a chat server from its address as clients know it
+
+        Args:
+            address (any): the address with the ip and port of the chat server
+
+        Returns:
+            str | None: the name of the chat server or None if it is not registered
+        """
+        if isinstance(address, dict):
+            return self.chat_server_endpoints.get((address.get('ip'), address.get('port')))
+        return None
+
     async def create_name_server(self) -> None:
         """
         create_name_server hosts a new server on the network at the port and ip defined in the own_address variable
@@ -134,30 +551,54 @@ class Name_server:
             self.logger.info('Creating server...')
             server = await asyncio.start_server(self.listener, self.own_address['ip'], self.own_address['port'])
             self.logger.info('Server created')
+            self.health_check_task = asyncio.create_task(self.check_chat_server_health())
+            if self.announce_on_lan:
+                await self.start_lan_announcer()
             async with server:
                 await server.serve_forever()
         except OSError as error:
             self.logger.error(error)
+        finally:
+            if self.health_check_task is not None:
+                self.health_check_task.cancel()
+            for ping_task in list(self.ping_tasks.values()):
+                ping_task.cancel()
+            if self.lan_announcer is not None:
+                self.lan_announcer.close()
+
+    async def start_lan_announcer(self) -> None:
+        """
+        start_lan_announcer starts announcing the name server on the local network
+        """
+        self.lan_announcer = Lan_announcer(name=self.own_address['name'], port=self.own_address['port'])
+        try:
+            await self.lan_announcer.start()
+            self.logger.info('Announcing on the local network')
+        except OSError as error:
+            self.logger.error(f'Lan announcing unavailable: {error}')
+            self.lan_announcer = None
 
-    def create_message(self, content, command) -> str:  # TODO finish
+    def create_message(self, content, command, request_id: str | None = None) -> str:  # TODO finish
         """
         create_message formats a message to be sent over the network
 
         Args:
             content (any): the content of the message
             command (any): the command of the message
+            request_id (str | None): the request id of the message being replied to so the client can match the reply.
+                Defaults to None.
 
         Returns:
             str: a formatted message
         """
-        if isinstance(content, str):
-            content.replace(self.message_separator.decode(), '')
         message = {
             'command': command,
             'content': content,
             'sender': self.own_address['name']
         }
-        message_json = json.dumps(message) + self.message_separator.decode()
+        if request_id is not None:
+            message['request_id'] = request_id
+        message_json = json.dumps(message)
         return message_json
 
     async def listener(self, reader, writer) -> None:
@@ -170,95 +611,260 @@ class Name_server:
         """
         while True:
             try:
-                message = await reader.readuntil(self.message_separator)
+                message = await read_frame(reader=reader, max_frame_size=self.max_frame_size)
             except ConnectionResetError as error:
                 self.logger.error(error)
                 break
             except asyncio.exceptions.IncompleteReadError as error:
                 self.logger.error(error)
                 break
+            except ValueError as error:
+                # the rest of an oversized frame can not be skipped so the connection is dropped
+                self.logger.error(error)
+                writer.close()
+                break
             message = message.decode()
             message = self.parse_message(message)
             self.logger.info(f'Received message: {message}')
             match message['command'].lower():
+                case 'hello':
+                    # the name server only speaks the json wire format
+                    response = self.create_message(
+                        content={'wire_version': 1},
+                        command='hello',
+                        request_id=message.get('request_id')
+                    )
+                    writer.write(encode_frame(response))
+                    await writer.drain()
                 case 'request server privileges':
-                    if self.is_active_server():
-                        response = self.create_message(
-                            content='',
-                            command='rejected'
-                        )
+                    name = self.get_chat_server_name(message=message)
+                    self.expire_pending_chat_servers()
+                    if name in self.address_book or name in self.pending_chat_servers:
+                        command = 'accepted'
+                    elif len(self.address_book) + len(self.pending_chat_servers) < self.max_chat_servers:
+                        command = 'accepted'
+                        self.pending_chat_servers[name] = time.monotonic()
                     else:
-                        response = self.create_message(
-                            content='',
-                            command='accepted'
-                        )
-                        self.server_locked_in = True
-                    writer.write(response.encode())
+                        command = 'rejected'
+                    response = self.create_message(
+                        content='',
+                        command=command,
+                        request_id=message.get('request_id')
+                    )
+                    writer.write(encode_frame(response))
                     await writer.drain()
-                    self.logger.info(f'Server locked in: {self.server_locked_in}')
+                    self.logger.info(f'Server privileges for {name} {command}')
                 case 'server established':
-                    self.add_address(name='chat_server', ip=message['content']['ip'], port=message['content']['port'])
+                    name = self.get_chat_server_name(message=message)
+                    self.add_address(name=name, ip=message['content']['ip'], port=message['content']['port'])
+                    self.pending_chat_servers.pop(name, None)
+                    self.reset_chat_server_health(name=name)
                     self.logger.info(f'Added chat server to address book {message["content"]}')
+                    # the chat servers replicate their address books to each other so clients on different ones
+                    # can still find each other
+                    response = self.create_message(
+                        content={'chat_servers': self.get_chat_servers()},
+                        command='server registered',
+                        request_id=message.get('request_id')
+                    )
+                    writer.write(encode_frame(response))
+                    await writer.drain()
                 case 'server terminated':
-                    self.remove_address('chat_server')
-                    self.logger.info('Removed chat server from address book')
+                    name = self.find_chat_server(address=message['content'])
+                    if name is not None:
+                        self.remove_chat_server(name=name)
                 case 'request current server ip and port':
-                    if self.is_active_server():
+                    self.clients.add(message['sender'])
+                    chat_server = self.get_chat_server(client_name=message['sender'])
+                    if chat_server is not None:
                         response = self.create_message(
-                            content=self.address_book['chat_server'],
-                            command='server exists'
+                            content=dict(chat_server, more_servers_wanted=self.is_more_chat_servers_wanted()),
+                            command='server exists',
+                            request_id=message.get('request_id')
                         )
-                        self.logger.info('Server exists, sending ip and port...')
+                        self.logger.info(
+                            f'Assigned {message["sender"]} to {chat_server["name"]}, sending ip and port...'
+                            )
                     else:
                         response = self.create_message(
                             content='',
-                            command='no chat server'
+                            command='no chat server',
+                            request_id=message.get('request_id')
                         )
                         self.logger.info('No chat server, sending no server...')
-                    writer.write(response.encode())
+                    writer.write(encode_frame(response))
                     await writer.drain()
                     self.logger.info(f'Response sent: {response}')
-                case 'chat server terminated':
-                    if self.ping_chat_server():
+                case 'chat server terminated' | 'chat server shutdown':
+                    name = self.find_chat_server(address=message['content'])
+                    if name is not None and not self.is_chat_server_recently_alive(name=name):
+                        # answered from the cached health so the listener is not held up by the ping
+                        self.start_ping_task(name=name)
+                    if name is not None and self.is_chat_server_alive(name=name):
                         self.logger.info('Chat server is still alive')
+                        response = self.create_message(
+                            content='',
+                            command='chat server alive',
+                            request_id=message.get('request_id')
+                        )
                     else:
                         self.logger.info('Chat server is dead')
-                        self.remove_address('chat_server')
-                        self.logger.info('Removed chat server from address book')
-                        self.server_locked_in = False
-                        # response
                         response = self.create_message(
                             content='',
-                            command='chat server dead'
+                            command='chat server dead',
+                            request_id=message.get('request_id')
                         )
-                    writer.write(response.encode())
+                    writer.write(encode_frame(response))
+                    await writer.drain()
                 case _:
                     self.logger.error('Invalid command')
 
-    def ping_chat_server(self) -> bool:
+    def get_chat_server_name(self, message: dict) -> str:
         """
-        ping_chat_server pings the chat server
+        get_chat_server_name gets the name a peer hosts its chat server under
+
+        Args:
+            message (dict): the parsed message from the peer
+
+        Returns:
+            str: the name from the server address in the content, or the sender if there is none
+        """
+        if isinstance(message['content'], dict) and isinstance(message['content'].get('name'), str):
+            return message['content']['name']
+        return message['sender']
+
+    async def ping_chat_server(self, name: str) -> bool:
+        """
+        ping_chat_server pings a chat server waiting at most ping_timeout and caches whether it answered
+
+        Args:
+            name (str): the name of the chat server
 
         Returns:
             bool: whether or not the chat server is still alive
         """
-        if self.address_book.__contains__('chat_server'):
-            self.logger.info('Pinging chat server...')
+        if self.address_book.__contains__(name):
+            self.logger.info(f'Pinging chat server {name}...')
             message = self.create_message(
-                content='',
-                command='ping'
+                content={'chat_servers': self.get_chat_servers()},
+                command='ping',
+                request_id='ping'
             )
-            response = self.send_message(
-                message=message,
-                address=self.address_book['chat_server']
-            )
-            if response is None:
-                return False
+            try:
+                response = await asyncio.wait_for(
+                    self.send_message(message=message, address=self.address_book[name]),
+                    timeout=self.ping_timeout
+                )
+            except (asyncio.TimeoutError, asyncio.exceptions.IncompleteReadError, ConnectionError, ValueError) as error:
+                self.logger.warning(f'Chat server {name} did not answer ping: {error!r}')
+                response = None
+            alive = response is not None and response.get('command') == 'pong'
+            health = self.chat_server_health.setdefault(
+                name,
+                {'alive': None, 'last_pong_time': None, 'missed_pings': 0}
+                )
+            health['alive'] = alive
+            if alive:
+                health['last_pong_time'] = time.monotonic()
+                health['missed_pings'] = 0
             else:
-                return True
+                health['missed_pings'] += 1
+            return alive
         else:
             return False
 
+    async def check_chat_server_health(self) -> None:
+        """
+        check_chat_server_health pings every chat server at once every ping_interval
+        removing those that miss max_missed_pings in a row so clients are not sent to a dead server
+        """
+        while True:
+            names = list(self.address_book)
+            results = await asyncio.gather(*[self.ping_chat_server(name=name) for name in names])
+            for name, alive in zip(names, results):
+                if not alive and self.chat_server_health.get(name, {}).get('missed_pings', 0) >= self.max_missed_pings:
+                    self.logger.info(f'Chat server {name} missed {self.chat_server_health[name]["missed_pings"]} pings')
+                    self.remove_chat_server(name=name)
+            await asyncio.sleep(self.ping_interval)
+
+    def is_chat_server_recently_alive(self, name: str) -> bool:
+        """
+        is_chat_server_recently_alive checks if a chat server answered a ping within the last ping_interval
+
+        Args:
+            name (str): the name of the chat server
+
+        Returns:
+            bool: whether or not the cached liveness can be trusted without pinging
+        """
+        health = self.chat_server_health.get(name)
+        return (
+            health is not None
+            and health['alive'] is True
+            and time.monotonic() - health['last_pong_time'] <= self.ping_interval
+        )
+
+    def is_chat_server_alive(self, name: str) -> bool:
+        """
+        is_chat_server_alive checks the cached health of a chat server, one not pinged yet counts as alive
+
+        Args:
+            name (str): the name of the chat server
+
+        Returns:
+            bool: whether or not the chat server answered its last ping
+        """
+        return self.address_book.__contains__(name) and self.chat_server_health.get(name, {}).get('alive') is not False
+
+    def start_ping_task(self, name: str) -> None:
+        """
+        start_ping_task pings a chat server reported dead in the background, at most once at a time
+
+        Args:
+            name (str): the name of the chat server
+        """
+        if name in self.ping_tasks:
+            return
+        self.ping_tasks[name] = asyncio.create_task(self.confirm_chat_server_alive(name=name))
+        self.ping_tasks[name].add_done_callback(lambda _: self.ping_tasks.pop(name, None))
+
+    async def confirm_chat_server_alive(self, name: str) -> bool:
+        """
+        confirm_chat_server_alive pings a chat server reported dead and removes it if it does not answer
+
+        Args:
+            name (str): the name of the chat server
+
+        Returns:
+            bool: whether or not the chat server is still alive
+        """
+        if await self.ping_chat_server(name=name):
+            return True
+        self.logger.info(f'Chat server {name} did not answer after being reported dead')
+        self.remove_chat_server(name=name)
+        return False
+
+    def reset_chat_server_health(self, name: str) -> None:
+        """
+        reset_chat_server_health forgets the liveness of a chat server
+
+        Args:
+            name (str): the name of the chat server
+        """
+        self.chat_server_health.pop(name, None)
+
+    def remove_chat_server(self, name: str) -> None:
+        """
+        remove_chat_server removes a dead chat server, its clients move to the next chat server on the ring
+
+        Args:
+            name (str): the name of the chat server
+        """
+        self.remove_address(name)
+        self.logger.info(f'Removed chat server {name} from address book')
+        self.pending_chat_servers.pop(name, None)
+        self.reset_chat_server_health(name=name)
+
     async def send_message(self, message: str, address: dict) -> dict | None:  # TODO pull from a queue
         """
         send_message sends a message to a specific address
@@ -275,9 +881,12 @@ class Name_server:
         if reader is None or writer is None:
             self.logger.error('Connection Failed')
         else:
-            writer.write(message.encode())
-            await writer.drain()
-            response: bytes = await reader.readuntil(separator=self.message_separator)
+            try:
+                writer.write(encode_frame(message))
+                await writer.drain()
+                response: bytes = await read_frame(reader=reader, max_frame_size=self.max_frame_size)
+            finally:
+                writer.close()
             self.logger.info('Successfully sent message')
             parsed_response = self.parse_message(message=response.decode())
             return parsed_response
@@ -312,10 +921,20 @@ class Name_server:
         Args:
             message (str): the message to be parsed
 
+        Raises:
+            ValueError: if compressed content is larger than max_frame_size
+
         Returns:
             dict: a parsed message
         """
         parsed_message = json.loads(message)
+        if parsed_message.pop('compression', None) == 'zlib':
+            # content compressed by peertopeermessagingapp.compression is base64 encoded json
+            decompressor = zlib.decompressobj()
+            content = decompressor.decompress(base64.b64decode(parsed_message['content']), self.max_frame_size)
+            if decompressor.unconsumed_tail:
+                raise ValueError(f'decompressed content is larger than the max of {self.max_frame_size} bytes')
+            parsed_message['content'] = json.loads(content)
         return parsed_message
 
     def remove_address(self, address: str):
@@ -327,7 +946,10 @@ class Name_server:
         """
         if address in self.address_book.keys():
             self.logger.info(f'Removing address {address}')
-            self.address_book.pop(address)
+            removed_address = self.address_book.pop(address)
+            if self.chat_server_endpoints.get((removed_address['ip'], removed_address['port'])) == address:
+                self.chat_server_endpoints.pop((removed_address['ip'], removed_address['port']))
+            self.hash_ring.remove(address)
             self.save_address_book()
         else:
             self.logger.error(f'Address {address} not found')
@@ -0,0 +1,134 @@
+"""
+benchmarks getting the public key fingerprint of an address from an Address_book against hashing the key
+each time, as done for every message sent with a session key, finding the name with a public key, as done for every
+lan announcement and dht record, against a scan, and listing the known users, at school network sizes
+
+run from the peertopeermessagingapp folder with:
+    PYTHONPATH=src python benchmarks/bench_address_book.py
+"""
+import random
+import time
+from peertopeermessagingapp.address_book import Address_book
+from peertopeermessagingapp.session_cipher import public_key_fingerprint
+
+ADDRESS_COUNTS = [10000, 100000]
+LOOKUP_COUNT = 200
+
+
+def create_addresses(address_count: int) -> dict:
+    """
+    create_addresses creates addresses with a different endpoint and public key each
+
+    Args:
+        address_count (int): the number of addresses
+
+    Returns:
+        dict: the addresses by name
+    """
+    random.seed(10)
+    return {
+        f'student{index}': {
+            'name': f'student{index}',
+            'ip': f'10.{index // 65536}.{index // 256 % 256}.{index % 256}',
+            'port': 5000,
+            'public_key_n': random.getrandbits(2048),
+            'public_key_e': 65537
+        }
+        for index in range(address_count)
+    }
+
+
+def hash_fingerprint(addresses: dict, name: str) -> str:
+    """
+    hash_fingerprint gets the public key fingerprint of an address by hashing its key
+
+    Args:
+        addresses (dict): the addresses by name
+        name (str): the name of the address
+
+    Returns:
+        str: the fingerprint
+    """
+    return public_key_fingerprint(
+        public_key_n=addresses[name]['public_key_n'],
+        public_key_e=addresses[name]['public_key_e']
+        )
+
+
+def scan_public_key(addresses: dict, public_key_n: int, public_key_e: int) -> str | None:
+    """
+    scan_public_key finds the name with a public key by checking every address
+
+    Args:
+        addresses (dict): the addresses by name
+        public_key_n (int): the public key n
+        public_key_e (int): the public key e
+
+    Returns:
+        str | None: the name or None if no address has the key
+    """
+    for name, address in addresses.items():
+        if address['public_key_n'] == public_key_n and address['public_key_e'] == public_key_e:
+            return name
+    return None
+
+
+def time_per_call(function, calls: list[dict]) -> float:
+    """
+    time_per_call times a function over a list of keyword arguments
+
+    Args:
+        function (Callable): the function to time
+        calls (list[dict]): the keyword arguments of each call
+
+    Returns:
+        float: the microseconds per call
+    """
+    start_time = time.perf_counter()
+    for kwargs in calls:
+        function(**kwargs)
+    return (time.perf_counter() - start_time) * 1000000 / len(calls)
+
+
+def main() -> None:
+    """
+    main runs the benchmark and prints the results
+    """
+    print(f'{"addresses":>9} {"lookup":>11} {"dict (us)":>10} {"Address_book (us)":>18}')
+    for address_count in ADDRESS_COUNTS:
+        addresses = create_addresses(address_count=address_count)
+        start_time = time.perf_counter()
+        address_book = Address_book(addresses)
+        build_time = time.perf_counter() - start_time
+        name_calls = [{'name': name} for name in random.sample(list(addresses), LOOKUP_COUNT)]
+        for kwargs in name_calls:
+            assert address_book.get_fingerprint(**kwargs) == hash_fingerprint(addresses, **kwargs)
+        public_key_calls = [
+            {'public_key_n': addresses[kwargs['name']]['public_key_n'], 'public_key_e': 65537}
+            for kwargs in name_calls
+        ]
+        for kwargs in public_key_calls:
+            assert address_book.get_name_by_public_key(**kwargs) == scan_public_key(addresses, **kwargs)
+        rows = [
+            (
+                'fingerprint',
+                lambda **kwargs: hash_fingerprint(addresses, **kwargs),
+                address_book.get_fingerprint,
+                name_calls
+            ),
+            (
+                'public key',
+                lambda **kwargs: scan_public_key(addresses, **kwargs),
+                address_book.get_name_by_public_key,
+                public_key_calls
+            ),
+            ('names', lambda: tuple(addresses.keys()), address_book.get_names, [{}] * LOOKUP_COUNT)
+        ]
+        for lookup, uncached, cached, calls in rows:
+            uncached_time = time_per_call(uncached, calls)
+            print(f'{address_count:9} {lookup:>11} {uncached_time:10.2f} {time_per_call(cached, calls):18.2f}')
+        print(f'{address_count:9} {"build":>11} {"":>10} {build_time * 1000:15.0f} ms')
+
+
+if __name__ == '__main__':
+    main()
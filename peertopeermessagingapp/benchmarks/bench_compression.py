@@ -0,0 +1,86 @@
+"""
+benchmarks the bytes on the wire of 'address book data' responses with and without compression
+for address books the size of a class, a year group and a whole school network
+
+run from the peertopeermessagingapp folder with:
+    PYTHONPATH=src:benchmarks python benchmarks/bench_compression.py
+"""
+import time
+import peertopeermessagingapp.RSA_gen_keys as RSA_gen_keys
+import peertopeermessagingapp.wire_format as wire_format
+from bench_message_throughput import create_network_manager
+
+KEY_BITS = 2048
+ADDRESS_COUNTS = [30, 200, 1500]
+MESSAGE_COUNT = 20
+
+
+def create_address_book(address_count: int, public_key: list[int]) -> dict:
+    """
+    create_address_book creates an address book like the chat server sends
+
+    Args:
+        address_count (int): the number of addresses
+        public_key (list[int]): the public key the addresses keys are made different from
+
+    Returns:
+        dict: the address book
+    """
+    return {
+        f'student{index}': {
+            'name': f'student{index}',
+            'ip': f'10.{index // 256}.{index % 256}.{index % 200 + 1}',
+            'port': 5000 + index,
+            'public_key_n': public_key[0] - 2 * index * 7919 ** 40,
+            'public_key_e': public_key[1]
+        }
+        for index in range(address_count)
+    }
+
+
+def measure(network_manager, content: dict, wire_version: int) -> tuple[int, float]:
+    """
+    measure creates and parses MESSAGE_COUNT address book messages
+
+    Args:
+        network_manager (Network_manager): the network manager to send with
+        content (dict): the address book
+        wire_version (int): the wire format version
+
+    Returns:
+        tuple[int, float]: the bytes per message and the milliseconds to create and parse each message
+    """
+    size = 0
+    start_time = time.perf_counter()
+    for _ in range(MESSAGE_COUNT):
+        message = network_manager.create_message(
+            content=content,
+            command='address book data',
+            target='peer',
+            wire_version=wire_version
+            )
+        size = len(message)
+        assert network_manager.parse_message(message)['content'] == content
+    return size, (time.perf_counter() - start_time) * 1000 / MESSAGE_COUNT
+
+
+def main() -> None:
+    """
+    main runs the benchmark and prints the results
+    """
+    private_key, public_key = RSA_gen_keys.gen_keys(seed=10, complexity=2, key_bits=KEY_BITS)
+    print(f'{"addresses":>9} {"wire":>6} {"raw (bytes)":>12} {"zlib (bytes)":>13} {"raw (ms)":>9} {"zlib (ms)":>10}')
+    for address_count in ADDRESS_COUNTS:
+        content = create_address_book(address_count=address_count, public_key=public_key)
+        wire_versions = [('json', wire_format.WIRE_VERSION_JSON), ('binary', wire_format.WIRE_VERSION_BINARY)]
+        for wire_name, wire_version in wire_versions:
+            network_manager = create_network_manager(private_key=private_key, public_key=public_key)
+            network_manager.use_compression = False
+            raw_size, raw_time = measure(network_manager, content, wire_version)
+            network_manager.use_compression = True
+            zlib_size, zlib_time = measure(network_manager, content, wire_version)
+            print(f'{address_count:9} {wire_name:>6} {raw_size:12} {zlib_size:13} {raw_time:9.2f} {zlib_time:10.2f}')
+
+
+if __name__ == '__main__':
+    main()
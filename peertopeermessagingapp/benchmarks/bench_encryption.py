@@ -0,0 +1,153 @@
+"""
+benchmarks encrypting and decrypting a 10 KB chat message with RSA_encrypt.encrypt_data and RSA_decrypt.decrypt_data
+compares three argument pow against the old (x**e) % n which is only timed on a sample and scaled up
+as it takes minutes for a full message, and decrypting with a RSA_decrypt.Private_key which uses the
+chinese remainder theorem
+
+also compares one RSA block per character against packing as many bytes as fit into each block
+(RSA_encrypt.encrypt_data_blocks) on a 200 character message, in time and json size on the wire
+
+run from the peertopeermessagingapp folder with:
+    PYTHONPATH=src python benchmarks/bench_encryption.py
+"""
+import json
+import random
+import string
+import time
+import peertopeermessagingapp.RSA_decrypt as RSA_decrypt
+import peertopeermessagingapp.RSA_encrypt as RSA_encrypt
+import peertopeermessagingapp.RSA_gen_keys as RSA_gen_keys
+
+MESSAGE_LENGTH = 10 * 1024
+LEGACY_SAMPLE_LENGTH = 100
+# (seed, complexity, key_bits) as passed to RSA_gen_keys.gen_keys
+KEYS = [
+    (10, 1.1, None),
+    (19, 2, None),
+    (10, 2, 1024),  # one modexp per character so a 1024 bit decrypt takes over a minute
+]
+BLOCK_MESSAGE_LENGTH = 200
+BLOCK_KEY_BITS = [512, 1024, 2048]
+
+
+def legacy_encrypt_data(public_key_n: int, public_key_e: int, plain_text: str) -> list[int]:
+    """
+    the original encryption which builds x**e before reducing mod n
+    """
+    return [(ord(char)**public_key_e) % public_key_n for char in plain_text]
+
+
+def legacy_decrypt_data(encrypted: list[int], private_key_n: int, private_key_d: int) -> str:
+    """
+    the original decryption which builds x**d before reducing mod n
+    """
+    return ''.join(chr((chunk**private_key_d) % private_key_n) for chunk in encrypted)
+
+
+def time_call(func, *args) -> tuple[float, object]:
+    """
+    time_call times how long func takes to run
+
+    Args:
+        func (callable): the function to time
+        *args: the args to call func with
+
+    Returns:
+        tuple[float, object]: the time taken in seconds and the value func returned
+    """
+    start_time = time.perf_counter()
+    result = func(*args)
+    return time.perf_counter() - start_time, result
+
+
+def random_message(length: int) -> str:
+    """
+    random_message makes a random printable message
+
+    Args:
+        length (int): the number of characters
+
+    Returns:
+        str: the message
+    """
+    return ''.join(random.choices(string.ascii_letters + string.punctuation + ' ', k=length))
+
+
+def bench_pow() -> None:
+    """
+    bench_pow prints how long a 10 KB message takes to encrypt and decrypt one character per block
+    """
+    message = random_message(MESSAGE_LENGTH)
+    sample = message[:LEGACY_SAMPLE_LENGTH]
+    scale = MESSAGE_LENGTH / LEGACY_SAMPLE_LENGTH
+    print(
+        f'{"n bits":>6} {"old encrypt (s)*":>17} {"new encrypt (s)":>16} '
+        f'{"old decrypt (s)*":>17} {"new decrypt (s)":>16} {"crt decrypt (s)":>16}'
+        )
+    for seed, complexity, key_bits in KEYS:
+        private_key, public_key = RSA_gen_keys.gen_keys(seed=seed, complexity=complexity, key_bits=key_bits)
+        encrypt_time, encrypted = time_call(RSA_encrypt.encrypt_data, public_key[0], public_key[1], message)
+        decrypt_time, decrypted = time_call(RSA_decrypt.decrypt_data, encrypted, private_key[0], private_key[1])
+        assert decrypted == message
+        private_key_context = RSA_decrypt.Private_key(*private_key)
+        crt_decrypt_time, crt_decrypted = time_call(private_key_context.decrypt_data, encrypted)
+        assert crt_decrypted == message
+        if key_bits is None:
+            legacy_encrypt_time, legacy_encrypted = time_call(
+                legacy_encrypt_data, public_key[0], public_key[1], sample
+                )
+            legacy_decrypt_time, _ = time_call(legacy_decrypt_data, legacy_encrypted, private_key[0], private_key[1])
+            legacy_encrypt = f'{legacy_encrypt_time * scale:17.3f}'
+            legacy_decrypt = f'{legacy_decrypt_time * scale:17.3f}'
+        else:
+            legacy_encrypt = legacy_decrypt = f'{"skipped":>17}'
+        print(
+            f'{public_key[0].bit_length():>6} {legacy_encrypt} {encrypt_time:16.3f} '
+            f'{legacy_decrypt} {decrypt_time:16.3f} {crt_decrypt_time:16.3f}'
+            )
+    print(f'* timed on the first {LEGACY_SAMPLE_LENGTH} characters and scaled to {MESSAGE_LENGTH}')
+
+
+def bench_blocks() -> None:
+    """
+    bench_blocks prints the time and size of one block per character against packed blocks
+    """
+    message = random_message(BLOCK_MESSAGE_LENGTH)
+    print(
+        f'{"n bits":>6} {"per char (s)":>13} {"per char (bytes)":>17} '
+        f'{"blocks (s)":>11} {"blocks (bytes)":>15}'
+        )
+    for key_bits in BLOCK_KEY_BITS:
+        private_key, public_key = RSA_gen_keys.gen_keys(seed=10, complexity=2, key_bits=key_bits)
+        private_key_context = RSA_decrypt.Private_key(*private_key)
+
+        def per_char() -> list[int]:
+            encrypted = RSA_encrypt.encrypt_data(public_key[0], public_key[1], message)
+            assert private_key_context.decrypt_data(encrypted) == message
+            return encrypted
+
+        def blocks() -> list[int]:
+            encrypted = RSA_encrypt.encrypt_data_blocks(public_key[0], public_key[1], message)
+            assert private_key_context.decrypt_data_blocks(encrypted) == message
+            return encrypted
+
+        per_char_time, per_char_encrypted = time_call(per_char)
+        blocks_time, blocks_encrypted = time_call(blocks)
+        print(
+            f'{key_bits:>6} {per_char_time:13.3f} {len(json.dumps(per_char_encrypted)):17} '
+            f'{blocks_time:11.3f} {len(json.dumps(blocks_encrypted)):15}'
+            )
+
+
+def main() -> None:
+    """
+    main runs the benchmarks and prints the results
+    """
+    random.seed(0)
+    bench_pow()
+    print()
+    bench_blocks()
+
+
+if __name__ == '__main__':
+    main()
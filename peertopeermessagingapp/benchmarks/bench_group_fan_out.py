@@ -0,0 +1,86 @@
+"""
+benchmarks the cost to the sender of a group chat message sent as one message per member
+against one group message the chat server sends on, for groups the size of a class
+
+run from the peertopeermessagingapp folder with:
+    PYTHONPATH=src:benchmarks python benchmarks/bench_group_fan_out.py
+"""
+import time
+import peertopeermessagingapp.RSA_gen_keys as RSA_gen_keys
+import peertopeermessagingapp.wire_format as wire_format
+from bench_message_throughput import create_network_manager
+
+KEY_BITS = 2048
+MEMBER_COUNTS = [5, 30]
+MESSAGE_COUNT = 20
+CONTENT = {'text': 'see you in the library after school ' * 20, 'sent_time_stamp': 1700000000.0}
+
+
+def add_members(network_manager, member_count: int, public_key: list[int]) -> list[str]:
+    """
+    add_members adds group members with different public keys to the address book
+
+    Args:
+        network_manager (Network_manager): the network manager to send with
+        member_count (int): the number of members
+        public_key (list[int]): the public key the members keys are made different from
+
+    Returns:
+        list[str]: the names of the members
+    """
+    members = [f'student{index}' for index in range(member_count)]
+    for index, member in enumerate(members):
+        network_manager.address_book[member] = {
+            'name': member,
+            'ip': '',
+            'port': 0,
+            'public_key_n': public_key[0] - 2 * index * 7919 ** 40,
+            'public_key_e': public_key[1]
+        }
+    return members
+
+
+def measure(send) -> tuple[int, float]:
+    """
+    measure times sending MESSAGE_COUNT messages, after one to create the session keys
+
+    Args:
+        send (Callable): creates the messages for one chat message and returns them
+
+    Returns:
+        tuple[int, float]: the bytes uploaded and the milliseconds for each chat message
+    """
+    send()
+    size = 0
+    start_time = time.perf_counter()
+    for _ in range(MESSAGE_COUNT):
+        size = sum(len(message) for message in send())
+    return size, (time.perf_counter() - start_time) * 1000 / MESSAGE_COUNT
+
+
+def main() -> None:
+    """
+    main runs the benchmark and prints the results
+    """
+    private_key, public_key = RSA_gen_keys.gen_keys(seed=10, complexity=2, key_bits=KEY_BITS)
+    print(f'{"members":>7} {"per member (bytes)":>19} {"group (bytes)":>14} {"per member (ms)":>16} {"group (ms)":>11}')
+    for member_count in MEMBER_COUNTS:
+        network_manager = create_network_manager(private_key=private_key, public_key=public_key)
+        members = add_members(network_manager=network_manager, member_count=member_count, public_key=public_key)
+        per_member_size, per_member_time = measure(lambda: [
+            network_manager.create_message(
+                content=CONTENT,
+                command='message',
+                target=member,
+                wire_version=wire_format.WIRE_VERSION_JSON
+                )
+            for member in members
+        ])
+        group_size, group_time = measure(lambda: [
+            network_manager.create_group_message(content=CONTENT, group='class', members=members)
+        ])
+        print(f'{member_count:7} {per_member_size:19} {group_size:14} {per_member_time:16.2f} {group_time:11.2f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+"""
+benchmarks the slow steps of RSA key creation
+compares the brute force math_stuff.carmichael(n) against math_stuff.carmichael_from_primes(p, q)
+and times generating the 2 random primes for RSA_gen_keys.generate_2_prime_numbers(key_bits=...)
+
+run from the peertopeermessagingapp folder with:
+    PYTHONPATH=src python benchmarks/bench_key_generation.py
+"""
+import time
+import peertopeermessagingapp.math_stuff as math_stuff
+import peertopeermessagingapp.RSA_gen_keys as RSA_gen_keys
+
+# the brute force carmichael is only run on keys this small otherwise it takes minutes
+BRUTE_FORCE_MAX_N = 5_000
+
+# small primes similar to the ones the seed based key generation produces
+SMALL_PRIME_PAIRS = [
+    (13, 17),
+    (23, 29),
+    (61, 67),
+    (101, 103),
+    (157, 163),
+]
+
+# mersenne primes so that large keys can be benchmarked without generating primes
+LARGE_PRIME_PAIRS = [
+    (2**61 - 1, 2**89 - 1),
+    (2**107 - 1, 2**127 - 1),
+    (2**521 - 1, 2**607 - 1),
+    (2**1279 - 1, 2**2203 - 1),
+]
+
+# key sizes to time random prime generation for
+KEY_BITS = [256, 512, 1024, 2048]
+PRIME_GENERATION_REPEATS = 5
+
+
+def time_call(func, *args, repeats=1) -> float:
+    """
+    time_call times how long func takes to run
+
+    Args:
+        func (callable): the function to time
+        *args: the args to call func with
+        repeats (int): how many times to call func. default 1
+
+    Returns:
+        float: the average time taken in seconds
+    """
+    start_time = time.perf_counter()
+    for _ in range(repeats):
+        func(*args)
+    return (time.perf_counter() - start_time) / repeats
+
+
+def bench_carmichael() -> None:
+    """
+    bench_carmichael prints how long each carmichael function takes for growing n
+    """
+    print(f'{"n bits":>8} {"brute force (s)":>18} {"from primes (s)":>18}')
+    for p, q in SMALL_PRIME_PAIRS + LARGE_PRIME_PAIRS:
+        n = p * q
+        if n <= BRUTE_FORCE_MAX_N:
+            brute_force_time = f'{time_call(math_stuff.carmichael, n):18.6f}'
+        else:
+            brute_force_time = f'{"skipped":>18}'
+        from_primes_time = time_call(math_stuff.carmichael_from_primes, p, q, repeats=1000)
+        print(f'{n.bit_length():>8} {brute_force_time} {from_primes_time:18.9f}')
+
+
+def bench_prime_generation() -> None:
+    """
+    bench_prime_generation prints how long it takes to generate the 2 random primes for each key size
+    """
+    print(f'{"key bits":>8} {"2 random primes (s)":>22}')
+    for key_bits in KEY_BITS:
+        primes_time = time_call(
+            RSA_gen_keys.generate_2_prime_numbers, 0, 2, key_bits, repeats=PRIME_GENERATION_REPEATS
+            )
+        print(f'{key_bits:>8} {primes_time:22.6f}')
+
+
+def main() -> None:
+    """
+    main runs the benchmarks and prints the results
+    """
+    bench_carmichael()
+    print()
+    bench_prime_generation()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+"""
+micro benchmarks for math_stuff.greatest_common_divisor and math_stuff.find_modular_multiplicative_inverse
+compares them against the brute force versions they replaced on growing inputs
+
+run from the peertopeermessagingapp folder with:
+    PYTHONPATH=src python benchmarks/bench_math_stuff.py
+"""
+import random
+import time
+import peertopeermessagingapp.math_stuff as math_stuff
+
+# the brute force versions are O(n) so are only run up to this size
+LEGACY_MAX_VALUE = 10**6
+INPUT_DIGITS = [3, 4, 5, 6, 12, 50, 150, 300, 600]
+REPEATS = 20
+
+
+def legacy_greatest_common_divisor(x, y) -> int:
+    """
+    the original gcd which tests every divisor up to min(x, y)
+    """
+    gdc = 0
+    for num in range(1, min(x, y)+1):
+        if x % num == 0 and y % num == 0:
+            gdc = num
+    return gdc
+
+
+def legacy_find_modular_multiplicative_inverse(a, m) -> int:
+    """
+    the original modular inverse which tests x = 1, 2, 3 ... until a*x % m == 1
+    """
+    x = 1
+    while True:
+        if (a * x) % m == 1:
+            return x
+        x += 1
+
+
+def time_call(func, args_list) -> float:
+    """
+    time_call times how long func takes to run on average
+
+    Args:
+        func (callable): the function to time
+        args_list (list[tuple]): the args to call func with, one call per tuple
+
+    Returns:
+        float: the average time taken in seconds
+    """
+    start_time = time.perf_counter()
+    for args in args_list:
+        func(*args)
+    return (time.perf_counter() - start_time) / len(args_list)
+
+
+def make_inputs(digits: int) -> tuple[list[tuple[int, int]], list[tuple[int, int]]]:
+    """
+    make_inputs makes random inputs with the given number of digits
+
+    Args:
+        digits (int): how many digits the inputs should have
+
+    Returns:
+        tuple[list[tuple[int, int]], list[tuple[int, int]]]: gcd inputs and modular inverse inputs
+    """
+    low, high = 10**(digits - 1), 10**digits - 1
+    gcd_inputs = []
+    inverse_inputs = []
+    while len(inverse_inputs) < REPEATS:
+        a, m = random.randint(low, high), random.randint(low, high)
+        gcd_inputs.append((a, m))
+        if m > 1 and math_stuff.greatest_common_divisor(a, m) == 1:
+            inverse_inputs.append((a, m))
+    return gcd_inputs[:REPEATS], inverse_inputs
+
+
+def main() -> None:
+    """
+    main runs the benchmarks and prints the results
+    """
+    random.seed(0)
+    print(f'{"digits":>6} {"gcd old (s)":>14} {"gcd new (s)":>14} {"inverse old (s)":>16} {"inverse new (s)":>16}')
+    for digits in INPUT_DIGITS:
+        gcd_inputs, inverse_inputs = make_inputs(digits)
+        if 10**digits <= LEGACY_MAX_VALUE:
+            legacy_gcd_time = f'{time_call(legacy_greatest_common_divisor, gcd_inputs):14.6f}'
+            legacy_inverse_time = f'{time_call(legacy_find_modular_multiplicative_inverse, inverse_inputs):16.6f}'
+        else:
+            legacy_gcd_time = f'{"skipped":>14}'
+            legacy_inverse_time = f'{"skipped":>16}'
+        gcd_time = time_call(math_stuff.greatest_common_divisor, gcd_inputs)
+        inverse_time = time_call(math_stuff.find_modular_multiplicative_inverse, inverse_inputs)
+        print(f'{digits:>6} {legacy_gcd_time} {gcd_time:14.6f} {legacy_inverse_time} {inverse_time:16.6f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+"""
+benchmarks how many chat messages per second Network_manager can create and parse
+compares encrypting the content with RSA blocks against a RSA shared session key
+
+run from the peertopeermessagingapp folder with:
+    PYTHONPATH=src python benchmarks/bench_message_throughput.py
+"""
+import time
+from types import SimpleNamespace
+import peertopeermessagingapp.RSA_decrypt as RSA_decrypt
+import peertopeermessagingapp.RSA_gen_keys as RSA_gen_keys
+from peertopeermessagingapp.network_manager import Network_manager
+
+KEY_BITS = [1024, 2048]
+MESSAGE_COUNT = 2000
+CONTENT = {
+    'text': 'did anyone get question 4 on the maths homework?',
+    'chat': 'maths',
+    'sender': 'student',
+    'sent_time_stamp': 1622547800.0,
+    'received_time_stamp': 0.0,
+    'id': '1622547800000'
+}
+
+
+def create_network_manager(private_key: list[int], public_key: list[int]) -> Network_manager:
+    """
+    create_network_manager creates a network manager that sends to itself without starting the network
+
+    Args:
+        private_key (list[int]): the private key of the receiver
+        public_key (list[int]): the public key of the receiver
+
+    Returns:
+        Network_manager: the network manager
+    """
+    user_data = SimpleNamespace(get_private_key_context=lambda: RSA_decrypt.Private_key(*private_key))
+    app = SimpleNamespace(backend=SimpleNamespace(user_data=user_data))
+    network_manager = Network_manager(app=app)
+    network_manager.own_address = {'name': 'benchmark'}
+    network_manager.address_book['peer'] = {
+        'name': 'peer',
+        'ip': '',
+        'port': 0,
+        'public_key_n': public_key[0],
+        'public_key_e': public_key[1]
+    }
+    return network_manager
+
+
+def messages_per_second(network_manager: Network_manager) -> float:
+    """
+    messages_per_second times creating and parsing MESSAGE_COUNT messages
+
+    Args:
+        network_manager (Network_manager): the network manager to send with
+
+    Returns:
+        float: the number of messages created and parsed per second
+    """
+    start_time = time.perf_counter()
+    for _ in range(MESSAGE_COUNT):
+        message = network_manager.create_message(content=CONTENT, command='message', target='peer')
+        assert network_manager.parse_message(message)['content'] == CONTENT
+    return MESSAGE_COUNT / (time.perf_counter() - start_time)
+
+
+def main() -> None:
+    """
+    main runs the benchmark and prints the results
+    """
+    print(f'{"n bits":>6} {"rsa blocks (msg/s)":>19} {"session (msg/s)":>16}')
+    for key_bits in KEY_BITS:
+        private_key, public_key = RSA_gen_keys.gen_keys(seed=10, complexity=2, key_bits=key_bits)
+        rsa_network_manager = create_network_manager(private_key=private_key, public_key=public_key)
+        rsa_network_manager.use_session_encryption = False
+        session_network_manager = create_network_manager(private_key=private_key, public_key=public_key)
+        print(
+            f'{key_bits:>6} {messages_per_second(rsa_network_manager):19.0f} '
+            f'{messages_per_second(session_network_manager):16.0f}'
+            )
+
+
+if __name__ == '__main__':
+    main()
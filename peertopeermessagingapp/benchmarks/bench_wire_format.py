@@ -0,0 +1,67 @@
+"""
+benchmarks the bytes on the wire and messages per second of the json and binary wire formats
+for chat content encrypted with RSA blocks and with a RSA shared session key
+
+run from the peertopeermessagingapp folder with:
+    PYTHONPATH=src python benchmarks/bench_wire_format.py
+"""
+import time
+import peertopeermessagingapp.RSA_gen_keys as RSA_gen_keys
+import peertopeermessagingapp.wire_format as wire_format
+from bench_message_throughput import CONTENT, create_network_manager
+
+KEY_BITS = 2048
+MESSAGE_COUNT = 1000
+LONG_CONTENT = dict(CONTENT, text=CONTENT['text'] * 20)
+
+
+def measure(network_manager, content: dict, wire_version: int) -> tuple[int, float]:
+    """
+    measure creates and parses MESSAGE_COUNT messages with a wire format
+
+    Args:
+        network_manager (Network_manager): the network manager to send with
+        content (dict): the content of each message
+        wire_version (int): the wire format version
+
+    Returns:
+        tuple[int, float]: the bytes per message and the messages created and parsed per second
+    """
+    size = 0
+    start_time = time.perf_counter()
+    for _ in range(MESSAGE_COUNT):
+        message = network_manager.create_message(
+            content=content,
+            command='message',
+            target='peer',
+            wire_version=wire_version
+            )
+        size = len(message)
+        assert network_manager.parse_message(message)['content'] == content
+    return size, MESSAGE_COUNT / (time.perf_counter() - start_time)
+
+
+def main() -> None:
+    """
+    main runs the benchmark and prints the results
+    """
+    private_key, public_key = RSA_gen_keys.gen_keys(seed=10, complexity=2, key_bits=KEY_BITS)
+    print(
+        f'{"encryption":>10} {"content":>8} {"json (bytes)":>13} {"binary (bytes)":>15}'
+        f' {"json (msg/s)":>13} {"binary (msg/s)":>15}'
+        )
+    for use_session_encryption in [False, True]:
+        for content_name, content in [('short', CONTENT), ('long', LONG_CONTENT)]:
+            network_manager = create_network_manager(private_key=private_key, public_key=public_key)
+            network_manager.use_session_encryption = use_session_encryption
+            json_size, json_rate = measure(network_manager, content, wire_format.WIRE_VERSION_JSON)
+            binary_size, binary_rate = measure(network_manager, content, wire_format.WIRE_VERSION_BINARY)
+            encryption = 'session' if use_session_encryption else 'rsa blocks'
+            print(
+                f'{encryption:>10} {content_name:>8} {json_size:13} {binary_size:15}'
+                f' {json_rate:13.0f} {binary_rate:15.0f}'
+                )
+
+
+if __name__ == '__main__':
+    main()
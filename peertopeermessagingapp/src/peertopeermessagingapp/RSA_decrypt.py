@@ -1,5 +1,174 @@
 # # TODO fix decryption/encryption errors
 import logging
+import peertopeermessagingapp.math_stuff as math_stuff
+from peertopeermessagingapp.RSA_encrypt import BLOCK_PADDING_MARKER, get_block_width
+
+
+class Private_key:
+    """
+    Private_key holds a private key and the values precomputed from it so that decryption is fast
+    if the prime factors p and q are known decryption uses the chinese remainder theorem
+    which does 2 half size modular exponentiations instead of 1 full size one (~3-4x faster)
+    attrs:
+        n: int
+            the private key n
+        d: int
+            the private key d
+        p: int | None
+            prime factor 1 of n, None if unknown
+        q: int | None
+            prime factor 2 of n, None if unknown
+        d_p: int | None
+            d mod (p - 1)
+        d_q: int | None
+            d mod (q - 1)
+        q_inv: int | None
+            the modular multiplicative inverse of q mod p
+    methods:
+        decrypt(to_decrypt)
+            decrypts a single chunk
+        decrypt_data(encrypted)
+            decrypts a list of chunks into a str
+        decrypt_data_blocks(encrypted)
+            decrypts a list of packed blocks into a str
+        uses_crt()
+            whether or not decryption uses the chinese remainder theorem
+    """
+    def __init__(self, n: int, d: int, p: int | None = None, q: int | None = None) -> None:
+        """
+        __init__ validates the key and precomputes the chinese remainder theorem values if p and q are valid
+
+        Args:
+            n (int): the private key n
+            d (int): the private key d
+            p (int | None): prime factor 1 of n. Defaults to None.
+            q (int | None): prime factor 2 of n. Defaults to None.
+        """
+        if isinstance(n, int):
+            if isinstance(d, int):
+                self.n = n
+                self.d = d
+                self.p: int | None = None
+                self.q: int | None = None
+                self.d_p: int | None = None
+                self.d_q: int | None = None
+                self.q_inv: int | None = None
+                if isinstance(p, int) and isinstance(q, int):
+                    # crt needs 2 different odd primes
+                    if p * q == n and p != q and p > 2 and q > 2:
+                        self.p = p
+                        self.q = q
+                        self.d_p = d % (p - 1)
+                        self.d_q = d % (q - 1)
+                        self.q_inv = math_stuff.find_modular_multiplicative_inverse(a=q, m=p)
+                    else:
+                        logging.info(f'{__name__}:Private_key: p and q are not valid factors of n not using crt')
+            else:
+                raise ValueError(
+                    f"expected private_key_d type int instead got type {type(d)}"
+                    )
+        else:
+            raise ValueError(
+                f"expected private_key_n type int instead got type {type(n)}"
+                )
+
+    def uses_crt(self) -> bool:
+        """
+        uses_crt whether or not decryption uses the chinese remainder theorem
+
+        Returns:
+            bool: True if p and q are known
+        """
+        return self.q_inv is not None
+
+    def decrypt(self, to_decrypt: int) -> int:
+        """
+        decrypt decrypts a single chunk, to_decrypt is not validated
+
+        Args:
+            to_decrypt (int): the chunk to decrypt must be < n
+
+        Returns:
+            int: the decrypted chunk
+        """
+        if self.q_inv is None:
+            return pow(to_decrypt, self.d, self.n)
+        m_p = pow(to_decrypt, self.d_p, self.p)
+        m_q = pow(to_decrypt, self.d_q, self.q)
+        h = (self.q_inv * (m_p - m_q)) % self.p
+        return m_q + h * self.q
+
+    def decrypt_data(self, encrypted: list[int]) -> str:
+        """
+        decrypt_data decrypts a list of encrypted chunks into a str
+        the list is validated once rather than each chunk as it is decrypted
+
+        Args:
+            encrypted (list[int]): a list of encrypted chunks
+
+        Returns:
+            str: the decrypted text
+        """
+        if isinstance(encrypted, list):
+            if all(isinstance(i, int) for i in encrypted):
+                return ''.join([chr(self.decrypt(e_chunk)) for e_chunk in encrypted])
+            else:
+                raise ValueError(
+                    f"expected encrypted type list[int] instead got {[type(i) for i in encrypted]}"
+                    )
+        else:
+            raise ValueError(
+                f"expected encrypted type list instead got type {type(encrypted)}"
+                )
+
+    def decrypt_data_blocks(self, encrypted: list[int]) -> str:
+        """
+        decrypt_data_blocks decrypts blocks from RSA_encrypt.encrypt_data_blocks into a str
+
+        Args:
+            encrypted (list[int]): a list of encrypted blocks
+
+        Returns:
+            str: the decrypted text
+        """
+        if isinstance(encrypted, list):
+            if all(isinstance(i, int) for i in encrypted):
+                return blocks_to_string(
+                    blocks=[self.decrypt(e_block) for e_block in encrypted],
+                    private_key_n=self.n
+                    )
+            else:
+                raise ValueError(
+                    f"expected encrypted type list[int] instead got {[type(i) for i in encrypted]}"
+                    )
+        else:
+            raise ValueError(
+                f"expected encrypted type list instead got type {type(encrypted)}"
+                )
+
+
+def create_private_key(private_key_n: int, private_key_d: int, public_key_e: int = 65537) -> Private_key:
+    """
+    creates a Private_key from n and d recovering p and q from e so that crt can be used
+    falls back to a Private_key without crt if n can not be factored
+
+    args:
+        private_key_n: int
+            private key n
+        private_key_d: int
+            private key d
+        public_key_e: int
+            public key e. default 65537
+    returns:
+        Private_key
+            the private key
+    """
+    try:
+        p, q = math_stuff.factor_modulus(n=private_key_n, e=public_key_e, d=private_key_d)
+    except ValueError as error:
+        logging.debug(f'{__name__}:create_private_key: {error} not using crt')
+        return Private_key(n=private_key_n, d=private_key_d)
+    return Private_key(n=private_key_n, d=private_key_d, p=p, q=q)
 
 
 def decrypt_data(encrypted: list[int], private_key_n: int, private_key_d: int) -> str:
@@ -74,7 +243,7 @@ def decrypt(private_key_n, private_key_d, to_decrypt) -> int:
     if isinstance(private_key_n, int):
         if isinstance(private_key_d, int):
             if isinstance(to_decrypt, int):
-                decrypted = (to_decrypt**private_key_d) % private_key_n
+                decrypted = pow(to_decrypt, private_key_d, private_key_n)
                 return decrypted
             else:
                 raise ValueError(
@@ -112,3 +281,48 @@ def base_10_to_string(base10_list: list[int]) -> str:
         raise ValueError(
             f"expected base10_list type list instead got type {type(base10_list)}"
             )
+
+
+def decrypt_data_blocks(encrypted: list[int], private_key_n: int, private_key_d: int) -> str:
+    """
+    decrypts blocks from RSA_encrypt.encrypt_data_blocks
+    args:
+        encrypted: list[int]
+            a list of encrypted blocks
+        private_key_n: int
+            private key n
+        private_key_d: int
+            private key d
+    returns:
+        decrypted: str
+            decrypted text
+    """
+    return Private_key(n=private_key_n, d=private_key_d).decrypt_data_blocks(encrypted=encrypted)
+
+
+def blocks_to_string(blocks: list[int], private_key_n: int) -> str:
+    """
+    converts blocks from RSA_encrypt.str_to_blocks back to a string
+    args:
+    blocks: list[int]
+        the decrypted blocks
+    private_key_n: int
+        the private key n the blocks were encrypted for
+    returns: str
+        the string
+    """
+    if isinstance(blocks, list):
+        block_width = get_block_width(public_key_n=private_key_n)
+        try:
+            data = b''.join(block.to_bytes(block_width, 'big') for block in blocks)
+        except OverflowError:
+            raise ValueError(f"expected blocks smaller than {block_width} bytes")
+        data = data.rstrip(b'\x00')
+        if data.endswith(bytes([BLOCK_PADDING_MARKER])):
+            return data[:-1].decode('utf-8')
+        else:
+            raise ValueError("expected blocks to end with padding marker")
+    else:
+        raise ValueError(
+            f"expected blocks type list instead got type {type(blocks)}"
+            )
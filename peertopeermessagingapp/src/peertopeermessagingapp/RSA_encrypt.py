@@ -1,3 +1,7 @@
+# marks the end of the data in the last block, followed by 0 bytes up to the block width (ISO/IEC 7816-4 padding)
+BLOCK_PADDING_MARKER = 0x80
+
+
 def encrypt(public_key_n, public_key_e, to_encrypt) -> int:
     """
     encrypts data
@@ -13,7 +17,7 @@ def encrypt(public_key_n, public_key_e, to_encrypt) -> int:
         if isinstance(public_key_e, int):
             if isinstance(to_encrypt, int):
                 if to_encrypt < public_key_n:
-                    encrypted = (to_encrypt**public_key_e) % public_key_n
+                    encrypted = pow(to_encrypt, public_key_e, public_key_n)
                     return encrypted
                 else:
                     raise ValueError(
@@ -89,3 +93,84 @@ def str_to_base10_by_char(string) -> list[int]:
         return int_str_list
     else:
         raise ValueError(f"expected string type str instead got type {type(string)}")
+
+
+def encrypt_data_blocks(public_key_n=None, public_key_e=None, plain_text=None) -> list[int]:
+    """
+    encrypts plain text packing as many utf-8 bytes as fit below public_key_n into each RSA block
+    decrypt with RSA_decrypt.decrypt_data_blocks
+    args:
+        public_key_n: int
+            public key n, must be at least 256
+        public_key_e: int
+            public key e
+        plain_text: str
+            plain text
+    returns:
+        encrypted: list[int]
+            encrypted blocks
+    """
+    if isinstance(public_key_n, int):
+        if isinstance(public_key_e, int):
+            if isinstance(plain_text, str):
+                blocks = str_to_blocks(string=plain_text, public_key_n=public_key_n)
+                encrypted = [pow(block, public_key_e, public_key_n) for block in blocks]
+                return encrypted
+            else:
+                raise ValueError(
+                    f"expected plainText type str instead got type {type(plain_text)}"
+                    )
+        else:
+            raise ValueError(
+                f"expected publicKE type int instead got type {type(public_key_e)}"
+                )
+    else:
+        raise ValueError(
+            f"expected publicKN type int instead got type {type(public_key_n)}"
+            )
+
+
+def get_block_width(public_key_n) -> int:
+    """
+    the number of bytes that fit in a RSA block for public_key_n
+    every block of this many bytes is < public_key_n
+    args:
+        public_key_n: int
+            public key n
+    returns: int
+        the block width in bytes
+    """
+    if isinstance(public_key_n, int):
+        block_width = (public_key_n.bit_length() - 1) // 8
+        if block_width > 0:
+            return block_width
+        else:
+            raise ValueError(
+                f"expected public_key_n of at least 256 to fit a block instead got {public_key_n}"
+                )
+    else:
+        raise ValueError(f"expected public_key_n type int instead got type {type(public_key_n)}")
+
+
+def str_to_blocks(string, public_key_n) -> list[int]:
+    """
+    converts string to utf-8 and packs the bytes into big endian integers < public_key_n
+    the bytes are padded with BLOCK_PADDING_MARKER then 0 bytes to a multiple of the block width
+    args:
+    string: str
+        the string to convert
+    public_key_n: int
+        the public key n the blocks are for
+    returns: list[int]
+        the blocks
+    """
+    if isinstance(string, str):
+        block_width = get_block_width(public_key_n=public_key_n)
+        data = string.encode('utf-8') + bytes([BLOCK_PADDING_MARKER])
+        data += bytes(-len(data) % block_width)
+        return [
+            int.from_bytes(data[i:i + block_width], 'big')
+            for i in range(0, len(data), block_width)
+            ]
+    else:
+        raise ValueError(f"expected string type str instead got type {type(string)}")
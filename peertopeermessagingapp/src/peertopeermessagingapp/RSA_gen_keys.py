@@ -3,7 +3,7 @@ import peertopeermessagingapp.math_stuff as math_stuff
 import time
 
 
-def gen_keys(seed, complexity) -> tuple[list[int], list[int]]:
+def gen_keys(seed, complexity, key_bits=None) -> tuple[list[int], list[int]]:
     """
     generates prime numbers and then
     gens public and private keys for RSA encryption.
@@ -12,8 +12,10 @@ def gen_keys(seed, complexity) -> tuple[list[int], list[int]]:
             the seed for the primes
         complexity: int
             the complexity of the primes
-    returns: private key: list[int, int], public key: list[int, int]
-        the private and public keys
+        key_bits: int | None
+            the bit length of n, if given random primes are used instead of the seed. default None
+    returns: private key: list[int, int, int, int], public key: list[int, int]
+        the private and public keys, the private key is n, d, p, q
     """
     if isinstance(seed, int):
         if isinstance(complexity, (float, int)):
@@ -22,7 +24,7 @@ def gen_keys(seed, complexity) -> tuple[list[int], list[int]]:
                     logging.info('generating keys...')
                     logging.info('generating prime numbers...')
                     p, q = generate_2_prime_numbers(
-                        generator_seed=seed, complexity=complexity
+                        generator_seed=seed, complexity=complexity, key_bits=key_bits
                         )  # only needs to run once at creation of account
                     logging.info('prime numbers successfully generated')
                     # larger num = better but longer initial calc time
@@ -49,7 +51,9 @@ def gen_keys(seed, complexity) -> tuple[list[int], list[int]]:
             )
 
 
-def generate_2_prime_numbers(generator_seed, complexity: int | float = 2) -> tuple[int, int]:  # TODO optimise
+def generate_2_prime_numbers(
+        generator_seed, complexity: int | float = 2, key_bits: int | None = None
+        ) -> tuple[int, int]:
     """
     a simple algorithm too generate 2 prime numbers
     args:
@@ -57,10 +61,15 @@ def generate_2_prime_numbers(generator_seed, complexity: int | float = 2) -> tup
             a large integer used to generate the prime numbers - low performance with large seed
         complexity: int | float
             the complexity of the prime numbers - low performance with high complexity. default 2
+        key_bits: int | None
+            if given generates 2 random primes of key_bits / 2 bits instead of using the seed
+            eg 1024 or 2048 - ignores generator_seed and complexity. default None
     returns:
         p, q: int, int
             prime nums
     """
+    if key_bits is not None:
+        return generate_2_random_prime_numbers(key_bits=key_bits)
     if isinstance(generator_seed, int):
         if isinstance(complexity, (int, float)):
             logging.info('finding prime number p...')
@@ -85,6 +94,37 @@ def generate_2_prime_numbers(generator_seed, complexity: int | float = 2) -> tup
         raise ValueError(f"expected generatorSeed type int instead got {type(generator_seed)}")
 
 
+def generate_2_random_prime_numbers(key_bits: int) -> tuple[int, int]:
+    """
+    generates 2 different random primes whose product is key_bits long
+    p - 1 and q - 1 are never multiples of 65537 so e = 65537 can always be used
+    args:
+        key_bits: int
+            the bit length of n = p * q, must be even so p and q are the same length
+    returns:
+        p, q: int, int
+            prime nums
+    """
+    if isinstance(key_bits, int):
+        if key_bits >= 16:
+            if key_bits % 2 != 0:
+                raise ValueError(f"expected key_bits to be even instead got {key_bits}")
+            prime_bits = key_bits // 2
+            logging.info(f'generating 2 random {prime_bits} bit primes...')
+            primes_start_time = time.time()
+            primes: list[int] = []
+            while len(primes) < 2:
+                prime = math_stuff.generate_prime(bits=prime_bits)
+                if prime % 65537 != 1 and prime not in primes:
+                    primes.append(prime)
+            logging.info(f'generated random primes after {time.time() - primes_start_time} Seconds')
+            return primes[0], primes[1]
+        else:
+            raise ValueError(f"expected key_bits greater than or = to 16 instead got {key_bits}")
+    else:
+        raise ValueError(f"expected key_bits type int instead got {type(key_bits)}")
+
+
 def create_key(p, q) -> tuple[list[int], list[int]]:
     """
     creates public and private keys based on to prime numbers
@@ -95,7 +135,9 @@ def create_key(p, q) -> tuple[list[int], list[int]]:
             prime num 2 - should be large and unpredictable for best security - low performance with large ints
         returns:
             public_key: list[int, int]
-            private_key: list[int, int]
+                n, e
+            private_key: list[int, int, int, int]
+                n, d, p, q - p and q let RSA_decrypt.Private_key decrypt using the chinese remainder theorem
     """
     create_key_start_time = time.time()
     if isinstance(p, int):
@@ -108,9 +150,10 @@ def create_key(p, q) -> tuple[list[int], list[int]]:
                 logging.info('n successfully calculated')
 
                 # calculate carmichael number for n (k)
+                # p and q are known so lambda(n) = lcm(p - 1, q - 1) rather than brute forcing math_stuff.carmichael(n)
                 logging.info('calculating carmichael...')
                 carmichael_start_time = time.time()
-                k = math_stuff.carmichael(n=n)  # TODO optimise takes 90 percent of time
+                k = math_stuff.carmichael_from_primes(p=p, q=q)
                 logging.info(f'successfully calculated carmichael in {time.time() - carmichael_start_time}s')
 
                 # calculate number co_prime to k (e)
@@ -145,7 +188,7 @@ def create_key(p, q) -> tuple[list[int], list[int]]:
 
                 # format and return keys
                 public_key = [n, e]
-                private_key = [n, d]
+                private_key = [n, d, p, q]
                 logging.info(f'returning asymmetric encryption keys after {time.time() - create_key_start_time}')
                 return public_key, private_key
             else:
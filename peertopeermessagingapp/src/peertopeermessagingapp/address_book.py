@@ -0,0 +1,181 @@
+"""
+this module holds the address book class
+a dict of addresses by name that caches the public key fingerprint of each address
+so a session cipher is found without hashing the public key for every message,
+and indexes the names by fingerprint so a public key claimed for a second name is found without a scan
+addresses are not indexed by endpoint as every message carries the name of its sender
+addresses stay plain dicts as they are sent in messages and saved in user_data as they are
+"""
+from peertopeermessagingapp.session_cipher import public_key_fingerprint
+
+
+class Address_book(dict):
+    """
+    Address_book the addresses by name with their public key fingerprints cached and indexed
+    every change must replace or remove a whole address so the cache and index stay correct,
+    an address is never changed in place
+    attrs:
+        __fingerprints: dict[str, str]
+            the public key fingerprint of each name with a public key
+        __by_fingerprint: dict[str, dict[str, None]]
+            the names with each public key fingerprint, first set first
+        __names: tuple[str, ...] | None
+            the names, None until get_names is called after a change
+    methods:
+        get_fingerprint(name)
+            gets the public key fingerprint of a name
+        get_name_by_public_key(public_key_n, public_key_e)
+            gets the name that has a public key
+        get_names()
+            gets every name
+    """
+    __slots__ = ('__fingerprints', '__by_fingerprint', '__names')
+
+    def __init__(self, addresses: dict | None = None) -> None:
+        """
+        __init__ initialises the address book
+
+        Args:
+            addresses (dict | None): the addresses by name to start with. Defaults to None.
+        """
+        super().__init__()
+        self.__fingerprints: dict[str, str] = {}
+        self.__by_fingerprint: dict[str, dict[str, None]] = {}
+        self.__names: tuple[str, ...] | None = None
+        if addresses is not None:
+            self.update(addresses)
+
+    def __setitem__(self, name: str, address: dict) -> None:
+        if not isinstance(address, dict):
+            raise ValueError(f'expected address type dict instead got type {type(address)}')
+        old_address = super().get(name)
+        if old_address is None:
+            self.__names = None
+        elif (
+            (old_address.get('public_key_n'), old_address.get('public_key_e'))
+            != (address.get('public_key_n'), address.get('public_key_e'))
+        ):
+            self.__unindex(name=name)
+        super().__setitem__(name, address)
+        if name not in self.__fingerprints:
+            self.__index(name=name, address=address)
+
+    def __delitem__(self, name: str) -> None:
+        super().__delitem__(name)
+        self.__unindex(name=name)
+        self.__names = None
+
+    def pop(self, name: str, *default):
+        if name not in self:
+            if len(default) > 0:
+                return default[0]
+            raise KeyError(name)
+        address = super().__getitem__(name)
+        del self[name]
+        return address
+
+    def popitem(self) -> tuple:
+        name = next(reversed(self))
+        return name, self.pop(name)
+
+    def setdefault(self, name: str, default: dict | None = None):
+        if name not in self:
+            self[name] = default
+        return super().__getitem__(name)
+
+    def update(self, *args, **kwargs) -> None:
+        for name, address in dict(*args, **kwargs).items():
+            self[name] = address
+
+    def __ior__(self, addresses: dict) -> 'Address_book':
+        self.update(addresses)
+        return self
+
+    def clear(self) -> None:
+        super().clear()
+        self.__fingerprints.clear()
+        self.__by_fingerprint.clear()
+        self.__names = None
+
+    def copy(self) -> 'Address_book':
+        return Address_book(self)
+
+    def get_fingerprint(self, name: str) -> str:
+        """
+        get_fingerprint gets the public key fingerprint of a name, only hashing the key when it is set
+
+        Args:
+            name (str): the name of the address
+
+        Raises:
+            KeyError: if the name is not in the address book
+
+        Returns:
+            str: the fingerprint from session_cipher.public_key_fingerprint
+        """
+        fingerprint = self.__fingerprints.get(name)
+        if fingerprint is None:
+            address = self[name]  # an address without a public key is not indexed
+            fingerprint = public_key_fingerprint(
+                public_key_n=address['public_key_n'],
+                public_key_e=address['public_key_e']
+                )
+        return fingerprint
+
+    def get_name_by_public_key(self, public_key_n: int, public_key_e: int) -> str | None:
+        """
+        get_name_by_public_key gets the name that has a public key, so a key can not be claimed for a second name
+
+        Args:
+            public_key_n (int): the public key n
+            public_key_e (int): the public key e
+
+        Returns:
+            str | None: the name first set with the key or None if no name has it
+        """
+        names = self.__by_fingerprint.get(
+            public_key_fingerprint(public_key_n=public_key_n, public_key_e=public_key_e)
+            )
+        if not names:
+            return None
+        return next(iter(names))
+
+    def get_names(self) -> tuple[str, ...]:
+        """
+        get_names gets every name, only rebuilt after a name is added or removed
+
+        Returns:
+            tuple[str, ...]: the names in the order they were added
+        """
+        if self.__names is None:
+            self.__names = tuple(self.keys())
+        return self.__names
+
+    def __index(self, name: str, address: dict) -> None:
+        """
+        __index adds the public key fingerprint of an address to the index, addresses without one are not indexed
+
+        Args:
+            name (str): the name of the address
+            address (dict): the address
+        """
+        public_key = (address.get('public_key_n'), address.get('public_key_e'))
+        if not isinstance(public_key[0], int) or not isinstance(public_key[1], int) or public_key[0] == 0:
+            return
+        fingerprint = public_key_fingerprint(public_key_n=public_key[0], public_key_e=public_key[1])
+        self.__fingerprints[name] = fingerprint
+        self.__by_fingerprint.setdefault(fingerprint, {})[name] = None
+
+    def __unindex(self, name: str) -> None:
+        """
+        __unindex removes the public key fingerprint of an address from the index
+
+        Args:
+            name (str): the name of the address
+        """
+        fingerprint = self.__fingerprints.pop(name, None)
+        names = self.__by_fingerprint.get(fingerprint)
+        if names is not None:
+            names.pop(name, None)
+            if len(names) == 0:
+                self.__by_fingerprint.pop(fingerprint)
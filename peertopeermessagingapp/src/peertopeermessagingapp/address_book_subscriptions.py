@@ -0,0 +1,173 @@
+"""
+this module holds the address book subscriptions class
+lets the chat server push address book changes to connected clients instead of each client polling for them
+every subscriber has its own task so one slow or unreachable client does not hold up the others,
+changes made while a push is in flight are sent together in the next one
+"""
+import asyncio
+import logging
+from typing import Awaitable, Callable
+
+Get_changes = Callable[[int, str | None], dict]
+Push = Callable[[str, str, dict], Awaitable[bool]]
+
+
+class Address_book_subscriptions:
+    """
+    Address_book_subscriptions the clients subscribed to address book changes on the chat server
+    pushes 'new client' with the changed addresses and 'client left' with the name of a subscriber that left
+    attrs:
+        logger: logging object
+            the error and info logger for the subscriptions
+        get_changes: Get_changes
+            gets the address book changes after a version, Network_manager.get_address_book_changes
+        push: Push
+            sends a command and content to a subscriber by name, returning whether it was acknowledged
+        max_failures: int
+            the number of failed pushes in a row before a subscriber is treated as having left
+        retry_delay: float
+            the seconds to wait after a failed push, multiplied by the failures in a row
+        __subscribers: dict[str, dict]
+            the epoch, version, pending left names, wake event, failures and push task of each subscriber
+    methods:
+        subscribe(name, epoch, version)
+            subscribes a client that has synced to version
+        unsubscribe(name)
+            removes a subscriber and tells the others it left
+        notify_changes()
+            wakes every subscriber to push the latest changes
+        close()
+            cancels every push task
+    """
+    def __init__(self, get_changes: Get_changes, push: Push, max_failures: int = 3, retry_delay: float = 1) -> None:
+        """
+        __init__ initialises the subscriptions
+
+        Args:
+            get_changes (Get_changes): gets the address book changes after a version
+            push (Push): sends a command and content to a subscriber by name
+            max_failures (int): the failed pushes in a row before a subscriber has left. Defaults to 3.
+            retry_delay (float): the seconds to wait after a failed push. Defaults to 1.
+        """
+        self.logger = logging.getLogger(__name__)
+        self.get_changes = get_changes
+        self.push = push
+        self.max_failures = max_failures
+        self.retry_delay = retry_delay
+        self.__subscribers: dict[str, dict] = {}
+
+    def __len__(self) -> int:
+        return len(self.__subscribers)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.__subscribers
+
+    def subscribe(self, name: str, epoch: str | None, version: int) -> None:
+        """
+        subscribe subscribes a client that has synced to version, must be called from a running event loop
+        subscribing again replaces the old subscription
+
+        Args:
+            name (str): the name of the client in the address book
+            epoch (str | None): the address book epoch the client synced from, None to be sent every address
+            version (int): the address book version the client synced to
+        """
+        self.__remove(name=name)
+        subscriber = {
+            'epoch': epoch,
+            'version': version,
+            'left': set(),
+            'event': asyncio.Event(),
+            'failures': 0,
+            'task': None
+        }
+        self.__subscribers[name] = subscriber
+        subscriber['task'] = asyncio.create_task(self.__push_changes(name=name, subscriber=subscriber))
+        self.logger.info(f'{name} subscribed to address book changes')
+
+    def unsubscribe(self, name: str) -> None:
+        """
+        unsubscribe removes a subscriber and tells the other subscribers it left
+
+        Args:
+            name (str): the name of the subscriber
+        """
+        if self.__remove(name=name) is not None:
+            self.logger.info(f'{name} unsubscribed from address book changes')
+            for subscriber in self.__subscribers.values():
+                subscriber['left'].add(name)
+                subscriber['event'].set()
+
+    def notify_changes(self) -> None:
+        """
+        notify_changes wakes every subscriber to push the changes after the version it has
+        """
+        for subscriber in self.__subscribers.values():
+            subscriber['event'].set()
+
+    def close(self) -> None:
+        """
+        close cancels every push task and removes every subscriber
+        """
+        for name in list(self.__subscribers):
+            self.__remove(name=name)
+
+    def __remove(self, name: str) -> dict | None:
+        """
+        __remove removes a subscriber cancelling its push task unless it is the task calling
+
+        Args:
+            name (str): the name of the subscriber
+
+        Returns:
+            dict | None: the subscriber or None if it was not subscribed
+        """
+        subscriber = self.__subscribers.pop(name, None)
+        if subscriber is not None and subscriber['task'] is not asyncio.current_task():
+            subscriber['task'].cancel()
+        return subscriber
+
+    async def __push_changes(self, name: str, subscriber: dict) -> None:
+        """
+        __push_changes pushes to one subscriber each time it is woken until it leaves
+
+        Args:
+            name (str): the name of the subscriber
+            subscriber (dict): the state of the subscriber
+        """
+        while True:
+            await subscriber['event'].wait()
+            subscriber['event'].clear()
+            if await self.__push_pending(name=name, subscriber=subscriber):
+                subscriber['failures'] = 0
+                continue
+            subscriber['failures'] += 1
+            if subscriber['failures'] >= self.max_failures:
+                self.logger.warning(f'{name} stopped acknowledging address book changes')
+                self.unsubscribe(name=name)
+                return
+            await asyncio.sleep(self.retry_delay * subscriber['failures'])
+            subscriber['event'].set()
+
+    async def __push_pending(self, name: str, subscriber: dict) -> bool:
+        """
+        __push_pending pushes the subscribers that left and the changes the subscriber does not have yet
+
+        Args:
+            name (str): the name of the subscriber
+            subscriber (dict): the state of the subscriber
+
+        Returns:
+            bool: whether or not every push was acknowledged
+        """
+        for left_name in list(subscriber['left']):
+            if not await self.push(name, 'client left', {'name': left_name}):
+                return False
+            subscriber['left'].discard(left_name)
+        changes = self.get_changes(subscriber['version'], subscriber['epoch'])
+        if len(changes['addresses']) > 0:
+            if not await self.push(name, 'new client', changes):
+                return False
+        subscriber['epoch'] = changes['epoch']
+        subscriber['version'] = changes['version']
+        return True
@@ -4,6 +4,7 @@ from peertopeermessagingapp.user_data import user_data
 import os
 import peertopeermessagingapp.RSA_gen_keys as RSA_gen_keys
 from peertopeermessagingapp.message import message
+from peertopeermessagingapp.network_manager import NAME_SERVER_PORT
 
 
 # TODO add tests for funcs
@@ -21,6 +22,8 @@ class Backend_manager:
             the path to the user data file
         key_gen_complexity: float
             the complexity of the key generation
+        key_gen_bits: int | None
+            the bit length of new keys, None generates the keys from the password seed
         __password_separator: str
             the separator for the password
         logger: logging
@@ -58,8 +61,10 @@ class Backend_manager:
             deals with the backend logic for logging out
         init_network()
             deals with the backend logic for initializing network
-        message_received(content, sender)
+        receive_message(content, sender, target)
             deals with the backend logic for recieving a message
+        receive_group_message(content, sender, group, members)
+            deals with the backend logic for recieving a group chat message
     """
     def __init__(self, app) -> None:
         """
@@ -78,6 +83,8 @@ class Backend_manager:
                 the path to the user data file
             key_gen_complexity: float
                 the complexity of the key generation
+            key_gen_bits: int | None
+                the bit length of new keys, None generates the keys from the password seed
             __password_separator: str
                 the separator for the password
             logger: logging
@@ -102,6 +109,7 @@ class Backend_manager:
         self.log_filepath = os.path.join(abs_path, log_filepath_extension)
         self.user_data_filepath = os.path.join(abs_path, user_data_path_extension)
         self.key_gen_complexity = 1.1
+        self.key_gen_bits: int | None = None  # eg 1024 or 2048 for random primes
         self.logger = logging.getLogger(name=__name__)
         self.logger.info('Log file created')
 
@@ -131,13 +139,40 @@ class Backend_manager:
             target (str): the target of the message
         """
         self.logger.debug('Received message')
-        chat = self.user_data.get_chat_dict()[target]  # will have to fix this if group chats are implemented
-        if content.keys().__contains__('sent_time_stamp'):
+        chat = self.user_data.get_chat_dict().get(target)
+        if chat is None:
+            self.logger.warning(f'no chat named {target}')
+        elif content.keys().__contains__('sent_time_stamp'):
             sent_time = content['sent_time_stamp']
-            chat.message_received(content=content['text'], sender=sender, sent_time=sent_time)
+            chat.messager_recieved(message_content=content['text'], sender_id=sender, sent_time=sent_time)
         else:
             self.logger.debug('Received message with no sent time')
 
+    def receive_group_message(self, content: dict, sender: str, group: str, members: list[str]) -> bool:
+        """
+        receive_group_message deals with the backend logic for recieving a group chat message
+        creating the group chat the first time a message from it is received
+        the group name is chosen by the sender so a message is only added to a group chat the sender is in
+
+        Args:
+            content (dict): the content of the message
+            sender (str): the sender of the message
+            group (str): the name of the group
+            members (list[str]): the members the sender sent the message to
+
+        Returns:
+            bool: whether or not the message was added to the group chat
+        """
+        group_chat = self.user_data.get_chat_dict().get(group)
+        if group_chat is None:
+            self.logger.info(f'Added to group chat {group} by {sender}')
+            self.user_data.add_group_chat(name=group, icon='', members=[sender] + members)
+        elif not group_chat.is_group_chat() or not group_chat.users.__contains__(sender):
+            self.logger.warning(f'Rejected message for {group} from {sender}, who is not in a group chat of that name')
+            return False
+        self.receive_message(content=content, sender=sender, target=group)
+        return True
+
     def validate_login(self, username: str, password: str) -> int:
         """
         validate_login validates the login
@@ -199,7 +234,11 @@ class Backend_manager:
         """
         try:
             self.logger.info('Generating private and public keys using RSA encryption')
-            private_key, public_key = RSA_gen_keys.gen_keys(seed=password_seed, complexity=self.key_gen_complexity)
+            private_key, public_key = RSA_gen_keys.gen_keys(
+                seed=password_seed,
+                complexity=self.key_gen_complexity,
+                key_bits=self.key_gen_bits
+                )
             self.logger.info('Successfully generated private and public keys using RSA encryption ')
             self.user_data.set_username(username=username)
             self.user_data.set_encryption_keys(private_key=private_key, public_key=public_key)
@@ -252,7 +291,13 @@ class Backend_manager:
         Args:
             ip (str): the new name server ip
         """
-        self.app.network_manager.add_address(name='name_server', ip=ip, port=8888)  # TODO set port from constant
+        self.app.network_manager.add_address(
+            name='name_server',
+            ip=ip,
+            port=NAME_SERVER_PORT,
+            public_key_n=0,
+            public_key_e=0
+            )
 
     def restart_network(self) -> None:
         """
@@ -6,10 +6,12 @@ from peertopeermessagingapp.message import message
 class Chat:
     """
     Methods:
-        create_chat: name, icon
+        create_chat: name, icon, members
             creates the chat
         add_user: user_id
             adds a user to the chat
+        is_group_chat: none
+            checks if the chat is a group chat
         delete_chat: none
             deletes the chat
         get_messages: none
@@ -138,34 +140,67 @@ class Chat:
         self.logger.debug('Successfully stored message')
         self.logger.info('Sending message...')
         message_dict = message.convert_to_dict()
-        self.app.network_manager.add_message_to_queue(content=message_dict, target=self.name)
-        self.logger.info('Successfully sent message')
-
-    def create_chat(self, name: str, icon: str) -> None:
+        if self.is_group_chat():
+            sent = self.app.network_manager.add_group_message_to_queue(
+                content=message_dict,
+                group=self.name,
+                members=self.users
+                )
+        else:
+            self.app.network_manager.add_message_to_queue(content=message_dict, target=self.name)
+            sent = True
+        if sent:
+            self.logger.info('Successfully sent message')
+        else:
+            self.logger.error('Failed to send message to every member')
+            self.app.GUI.chat_screen.failed_to_send_message()
+
+    def create_chat(self, name: str, icon: str, members: list[str] | None = None) -> None:
         """
         create_chat creates a new chat
 
         Args:
             name (str): the name of the chat
             icon (str): an icon to display for the chat
+            members (list[str] | None): the users in a group chat, None for a direct chat with the user called name.
+                Defaults to None.
         """
         if isinstance(name, str):
             self.name = name
-            self.users.append(name)  # as name == the user the chat is with will have to change if group chats are implemented
+            if members is None:
+                self.users.append(name)  # the name of a direct chat is the user the chat is with
+            else:
+                for member in members:
+                    self.add_user(user_id=member)
             if isinstance(icon, str):
                 if len(icon) <= self.icon_max_len:
                     self.icon = icon
                     # set id
                     self.identifier = f'{name}{time.time}'
 
-    def add_user(self, user_id: str) -> None:  # Unused as multiple users is not implemented
+    def add_user(self, user_id: str) -> None:
         """
-        add_user adds a user to the chat
+        add_user adds a user to the chat, adding it to the address book until its address is found if it is not known
+        it has no public key until then so group messages can not be sent to it
 
         Args:
             user_id (str): the id of the user to add
         """
-        pass
+        if not isinstance(user_id, str) or self.users.__contains__(user_id):
+            return
+        self.users.append(user_id)
+        if not self.app.network_manager.address_book.__contains__(user_id):
+            self.logger.info(f'adding new contact {user_id} to address book')
+            self.app.network_manager.add_address(name=user_id, ip='', port=0, public_key_n=0, public_key_e=0)
+
+    def is_group_chat(self) -> bool:
+        """
+        is_group_chat checks if the chat is a group chat rather than a direct chat with the user called name
+
+        Returns:
+            bool: whether or not the chat is a group chat
+        """
+        return self.users != [self.name]
 
     def delete_chat(self) -> None:  # TODO
         """
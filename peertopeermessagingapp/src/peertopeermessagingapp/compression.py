@@ -0,0 +1,54 @@
+"""
+this module holds the compression applied to message content before it is encrypted
+content is only compressed when it is at least a threshold in size and compressing it makes it smaller,
+the message marks compressed content with its 'compression' field so uncompressed messages are unchanged
+"""
+import zlib
+
+COMPRESSION_ZLIB = 'zlib'
+COMPRESSION_THRESHOLD = 256
+COMPRESSION_LEVEL = 6
+
+
+def compress_content(data: bytes, level: int = COMPRESSION_LEVEL) -> bytes:
+    """
+    compress_content compresses content with zlib
+
+    Args:
+        data (bytes): the content to compress
+        level (int): the zlib compression level from 0 to 9. Defaults to COMPRESSION_LEVEL.
+
+    Returns:
+        bytes: the compressed content
+    """
+    return zlib.compress(data, level)
+
+
+def decompress_content(data: bytes, compression: str, max_size: int) -> bytes:
+    """
+    decompress_content decompresses content from compress_content
+    stops at max_size so a small message can not expand to fill memory
+
+    Args:
+        data (bytes): the compressed content
+        compression (str): the compression from the message
+        max_size (int): the largest decompressed content accepted
+
+    Raises:
+        ValueError: if the compression is unknown, the content is not valid or it is larger than max_size
+
+    Returns:
+        bytes: the content
+    """
+    if compression != COMPRESSION_ZLIB:
+        raise ValueError(f'Unknown compression {compression}')
+    decompressor = zlib.decompressobj()
+    try:
+        decompressed = decompressor.decompress(data, max_size)
+    except zlib.error as error:
+        raise ValueError(f'invalid compressed content: {error}')
+    if decompressor.unconsumed_tail:
+        raise ValueError(f'decompressed content is larger than the max of {max_size} bytes')
+    if not decompressor.eof:
+        raise ValueError('truncated compressed content')
+    return decompressed
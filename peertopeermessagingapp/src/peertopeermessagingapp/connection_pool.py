@@ -0,0 +1,343 @@
+"""
+this module holds the multiplexed connection and connection pool classes
+keeps one stream to each address open between messages so a burst of messages only pays for one TCP handshake
+and lets many requests wait on that stream at once, each reply is matched to its request by request id
+"""
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable
+from peertopeermessagingapp.framing import MAX_FRAME_SIZE, encode_frame, read_frame
+from peertopeermessagingapp.wire_format import WIRE_VERSION_JSON, get_request_id
+
+Open_connection = Callable[[str, int], Awaitable[tuple[asyncio.StreamReader | None, asyncio.StreamWriter | None]]]
+Negotiate = Callable[['Multiplexed_connection'], Awaitable[int]]
+
+
+class Multiplexed_connection:
+    """
+    Multiplexed_connection a stream shared by many in flight requests
+    a read task reads every reply and hands it to the request with the same request id
+    a reply without a request id only goes to a request if it is the only one waiting, for peers that do not echo
+    request ids, otherwise it can not be told which request it answers and is dropped
+    attrs:
+        logger: logging object
+            the error and info logger for the connection
+        reader: asyncio.StreamReader
+            allows reading from the network stream
+        writer: asyncio.StreamWriter
+            allows writing to the network stream
+        max_frame_size: int
+            the largest reply accepted
+        wire_version: int
+            the wire format version agreed with the peer, json until negotiated
+        last_used: float
+            the time.monotonic() a request was last sent or answered
+        __pending: dict[str, asyncio.Future]
+            the futures awaiting a reply by request id, oldest first
+        __read_task: asyncio.Task
+            the task routing replies to pending futures
+    methods:
+        request(message, request_id, timeout)
+            sends a message and waits for the reply with the same request id
+        is_healthy()
+            checks the connection is still open
+        has_pending()
+            checks if any requests are waiting for a reply
+        close()
+            closes the connection failing any pending requests
+    """
+    def __init__(
+            self,
+            reader: asyncio.StreamReader,
+            writer: asyncio.StreamWriter,
+            max_frame_size: int = MAX_FRAME_SIZE
+            ) -> None:
+        """
+        __init__ initialises the connection and starts routing replies, must be called from a running event loop
+
+        Args:
+            reader (asyncio.StreamReader): allows reading from the network stream
+            writer (asyncio.StreamWriter): allows writing to the network stream
+            max_frame_size (int): the largest reply accepted. Defaults to MAX_FRAME_SIZE.
+        """
+        self.logger = logging.getLogger(__name__)
+        self.reader = reader
+        self.writer = writer
+        self.max_frame_size = max_frame_size
+        self.wire_version = WIRE_VERSION_JSON
+        self.last_used = time.monotonic()
+        self.__pending: dict[str, asyncio.Future] = {}
+        self.__read_task = asyncio.create_task(self.__route_replies())
+
+    async def request(self, message: str | bytes, request_id: str, timeout: float | None = None) -> bytes:
+        """
+        request sends a message and waits for the reply with the same request id
+
+        Args:
+            message (str | bytes): the message to be sent
+            request_id (str): the request id of the message
+            timeout (float | None): the seconds to wait for the reply, None to wait forever. Defaults to None.
+
+        Raises:
+            ConnectionResetError: if the connection closes before the reply arrives
+            asyncio.TimeoutError: if there is no reply within timeout
+
+        Returns:
+            bytes: the reply
+        """
+        if not self.is_healthy():
+            raise ConnectionResetError('Connection closed')
+        future = asyncio.get_running_loop().create_future()
+        self.__pending[request_id] = future
+        self.last_used = time.monotonic()
+        try:
+            self.writer.write(encode_frame(message))
+            await self.writer.drain()
+            return await asyncio.wait_for(future, timeout=timeout)
+        finally:
+            self.__pending.pop(request_id, None)
+            self.last_used = time.monotonic()
+
+    async def __route_replies(self) -> None:
+        """
+        __route_replies reads replies until the connection closes and sets the result of the matching future
+        """
+        error: Exception = ConnectionResetError('Connection closed')
+        try:
+            while True:
+                reply = await read_frame(reader=self.reader, max_frame_size=self.max_frame_size)
+                request_id = get_request_id(message=reply)
+                future = self.__pending.pop(request_id, None)
+                if future is None and request_id is None and len(self.__pending) == 1:
+                    future = self.__pending.pop(next(iter(self.__pending)))
+                if future is None and request_id is None and len(self.__pending) > 1:
+                    self.logger.warning('Dropped reply with no request id as more than one request is waiting')
+                elif future is None:
+                    self.logger.warning('Received reply with no waiting request')
+                elif not future.done():
+                    future.set_result(reply)
+        except (ConnectionError, asyncio.exceptions.IncompleteReadError, ValueError) as read_error:
+            self.logger.debug(read_error)
+            error = ConnectionResetError(str(read_error))
+        finally:
+            for future in self.__pending.values():
+                if not future.done():
+                    future.set_exception(error)
+            self.__pending.clear()
+
+    def is_healthy(self) -> bool:
+        """
+        is_healthy checks the connection has not been closed by either end
+
+        Returns:
+            bool: whether or not the connection can be used
+        """
+        return not (self.writer.is_closing() or self.__read_task.done())
+
+    def has_pending(self) -> bool:
+        """
+        has_pending checks if any requests are waiting for a reply
+
+        Returns:
+            bool: whether or not any requests are waiting
+        """
+        return len(self.__pending) > 0
+
+    async def close(self) -> None:
+        """
+        close closes the connection failing any pending requests
+        """
+        self.__read_task.cancel()
+        if not self.writer.is_closing():
+            self.writer.close()
+        try:
+            await self.__read_task
+        except asyncio.CancelledError:
+            pass
+        try:
+            await self.writer.wait_closed()
+        except (ConnectionError, OSError) as error:
+            self.logger.debug(error)
+
+
+class Connection_pool:
+    """
+    Connection_pool one shared multiplexed connection for each (ip, port)
+    attrs:
+        logger: logging object
+            the error and info logger for the connection pool
+        open_connection: Open_connection
+            opens a new connection to an ip and port, returning None, None on failure
+        max_frame_size: int
+            the largest reply accepted
+        max_idle: float
+            the seconds a connection with no pending requests is kept open for
+        negotiate: Negotiate | None
+            agrees the wire format version with the peer when a connection is opened, None to always use json
+        __connections: dict[tuple[str, int], Multiplexed_connection]
+            the open connections
+        __locks: dict[tuple[str, int], asyncio.Lock]
+            stops two requests opening a connection to the same address at once
+    methods:
+        acquire(ip, port)
+            gets the connection to the address, opening one if there is no healthy one
+        get_wire_version(ip, port)
+            gets the wire format version agreed with the address
+        discard(ip, port, connection)
+            closes a connection that failed
+        close_address(ip, port)
+            closes the connection to an address if one is open
+        close_idle()
+            closes connections that have been idle longer than max_idle
+        run_close_idle(interval)
+            closes idle connections on a schedule
+        close_all()
+            closes every connection
+    """
+    def __init__(
+            self,
+            open_connection: Open_connection,
+            max_frame_size: int = MAX_FRAME_SIZE,
+            max_idle: float = 60,
+            negotiate: Negotiate | None = None
+            ) -> None:
+        """
+        __init__ initialises the connection pool
+
+        Args:
+            open_connection (Open_connection): opens a new connection to an ip and port
+            max_frame_size (int): the largest reply accepted. Defaults to MAX_FRAME_SIZE.
+            max_idle (float): the seconds a connection with no pending requests is kept open for. Defaults to 60.
+            negotiate (Negotiate | None): agrees the wire format version when a connection is opened. Defaults to None.
+        """
+        self.logger = logging.getLogger(__name__)
+        self.open_connection = open_connection
+        self.max_frame_size = max_frame_size
+        self.max_idle = max_idle
+        self.negotiate = negotiate
+        self.__connections: dict[tuple[str, int], Multiplexed_connection] = {}
+        self.__locks: dict[tuple[str, int], asyncio.Lock] = {}
+
+    def __len__(self) -> int:
+        return len(self.__connections)
+
+    async def acquire(self, ip: str, port: int) -> tuple[Multiplexed_connection | None, bool]:
+        """
+        acquire gets the connection to the address, opening one if there is no healthy one
+
+        Args:
+            ip (str): the ip of the address
+            port (int): the port of the address
+
+        Returns:
+            tuple[Multiplexed_connection | None, bool]: the connection, None if connection failed,
+                and whether or not the connection was already open
+        """
+        address = (ip, port)
+        lock = self.__locks.setdefault(address, asyncio.Lock())
+        async with lock:
+            connection = self.__connections.get(address)
+            if connection is not None:
+                if self.is_reusable(connection=connection):
+                    self.logger.debug(f'Reusing connection to {ip}:{port}')
+                    return connection, True
+                await self.discard(ip=ip, port=port, connection=connection)
+            reader, writer = await self.open_connection(ip, port)
+            if reader is None or writer is None:
+                return None, False
+            connection = Multiplexed_connection(reader=reader, writer=writer, max_frame_size=self.max_frame_size)
+            if self.negotiate is not None:
+                connection.wire_version = await self.negotiate(connection)
+            self.__connections[address] = connection
+            return connection, False
+
+    def get_wire_version(self, ip: str, port: int) -> int:
+        """
+        get_wire_version gets the wire format version agreed with the address
+
+        Args:
+            ip (str): the ip of the address
+            port (int): the port of the address
+
+        Returns:
+            int: the wire format version, json if there is no open connection
+        """
+        connection = self.__connections.get((ip, port))
+        if connection is None or not connection.is_healthy():
+            return WIRE_VERSION_JSON
+        return connection.wire_version
+
+    async def discard(self, ip: str, port: int, connection: Multiplexed_connection) -> None:
+        """
+        discard closes a connection that failed and removes it from the pool if it is still the pooled one
+
+        Args:
+            ip (str): the ip of the address
+            port (int): the port of the address
+            connection (Multiplexed_connection): the connection
+        """
+        if self.__connections.get((ip, port)) is connection:
+            self.__connections.pop((ip, port))
+        await connection.close()
+
+    async def close_address(self, ip: str, port: int) -> None:
+        """
+        close_address closes the connection to an address if one is open
+
+        Args:
+            ip (str): the ip of the address
+            port (int): the port of the address
+        """
+        connection = self.__connections.get((ip, port))
+        if connection is not None:
+            await self.discard(ip=ip, port=port, connection=connection)
+
+    def is_reusable(self, connection: Multiplexed_connection) -> bool:
+        """
+        is_reusable checks that a connection is open and, if no requests are waiting, has not been idle too long
+
+        Args:
+            connection (Multiplexed_connection): the connection
+
+        Returns:
+            bool: whether or not the connection can be reused
+        """
+        if not connection.is_healthy():
+            return False
+        if not connection.has_pending() and time.monotonic() - connection.last_used > self.max_idle:
+            return False
+        return True
+
+    async def close_idle(self) -> None:
+        """
+        close_idle closes connections that have been idle longer than max_idle
+        """
+        for (ip, port), connection in list(self.__connections.items()):
+            if not self.is_reusable(connection=connection):
+                await self.discard(ip=ip, port=port, connection=connection)
+
+    async def run_close_idle(self, interval: float | None = None) -> None:
+        """
+        run_close_idle closes connections that have been idle longer than max_idle every interval seconds
+        so an idle stream is closed even if nothing is sent to its address again
+
+        Args:
+            interval (float | None): the seconds between sweeps, None for half of max_idle. Defaults to None.
+        """
+        if interval is None:
+            interval = self.max_idle / 2
+        while True:
+            await asyncio.sleep(interval)
+            await self.close_idle()
+
+    async def close_all(self) -> None:
+        """
+        close_all closes every connection and waits for them to close
+        """
+        self.logger.info('Closing pooled connections...')
+        connections = list(self.__connections.values())
+        self.__connections.clear()
+        for connection in connections:
+            await connection.close()
+        self.logger.info('Pooled connections closed')
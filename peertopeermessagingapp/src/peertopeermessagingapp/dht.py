@@ -0,0 +1,561 @@
+"""
+this module holds a kademlia style distributed hash table for peer address records
+each peer stores the records of the names closest to its own by xor distance and routes lookups
+through k-buckets so finding a peer takes O(log n) requests and does not need the name server
+records are signed with the publishers RSA key and a stored record can only be replaced by one with the same key
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable
+
+ID_BITS = 160
+K = 20
+ALPHA = 3
+
+Rpc = Callable[[dict, str, dict], Awaitable[dict | None]]
+Sign = Callable[[int], int]
+Get_public_key = Callable[[str], tuple[int, int] | None]
+
+
+def get_node_id(name: str) -> int:
+    """
+    get_node_id gets the position of a name in the id space
+
+    Args:
+        name (str): the name of the peer or record
+
+    Returns:
+        int: the ID_BITS bit id
+    """
+    return int.from_bytes(hashlib.sha1(name.encode('utf-8')).digest(), 'big')
+
+
+def get_record_hash(record: dict) -> int:
+    """
+    get_record_hash hashes the signed fields of a record
+
+    Args:
+        record (dict): the record
+
+    Returns:
+        int: the sha256 hash of the fields as an integer
+    """
+    fields = [record.get(field) for field in ('name', 'ip', 'port', 'public_key_n', 'public_key_e', 'published_time')]
+    return int.from_bytes(hashlib.sha256(json.dumps(fields).encode('utf-8')).digest(), 'big')
+
+
+def is_valid_record(record, get_public_key: Get_public_key | None = None) -> bool:
+    """
+    is_valid_record checks a record has every field, a public key and a valid signature
+    a record for a name with a known public key must have that key
+
+    Args:
+        record (any): the record
+        get_public_key (Get_public_key | None): gets the known public key of a name, None if it has none.
+            Defaults to None.
+
+    Returns:
+        bool: whether or not the record can be stored
+    """
+    if not isinstance(record, dict):
+        return False
+    if not (
+        isinstance(record.get('name'), str)
+        and isinstance(record.get('ip'), str)
+        and isinstance(record.get('port'), int)
+        and isinstance(record.get('public_key_n'), int)
+        and isinstance(record.get('public_key_e'), int)
+        and isinstance(record.get('published_time'), (int, float))
+    ):
+        return False
+    known_public_key = None if get_public_key is None else get_public_key(record['name'])
+    if known_public_key is not None and known_public_key != (record['public_key_n'], record['public_key_e']):
+        return False
+    if record['public_key_n'] == 0:
+        return False  # an unsigned record could point any name anywhere and have messages to it sent unencrypted
+    signature = record.get('signature')
+    if not isinstance(signature, int) or not 0 <= signature < record['public_key_n']:
+        return False
+    return (
+        pow(signature, record['public_key_e'], record['public_key_n'])
+        == get_record_hash(record) % record['public_key_n']
+    )
+
+
+class Routing_table:
+    """
+    Routing_table the k-buckets of a dht node
+    bucket i holds up to k contacts whose xor distance from the own id has bit length i + 1,
+    least recently seen first, so the table knows many close peers and a few far ones
+    attrs:
+        own_id: int
+            the id of the node the table belongs to
+        k: int
+            the most contacts in each bucket
+        buckets: list[OrderedDict[str, dict]]
+            the contacts by name in each bucket, least recently seen first
+    methods:
+        get_bucket_index(node_id)
+            gets the bucket an id belongs in
+        add_contact(contact)
+            adds or refreshes a contact
+        remove_contact(name)
+            removes a contact that failed to answer
+        get_closest(target_id, count)
+            gets the known contacts closest to an id
+        get_contacts()
+            gets every contact
+    """
+    def __init__(self, own_id: int, k: int = K) -> None:
+        """
+        __init__ initialises an empty routing table
+
+        Args:
+            own_id (int): the id of the node the table belongs to
+            k (int): the most contacts in each bucket. Defaults to K.
+        """
+        self.own_id = own_id
+        self.k = k
+        self.buckets: list[OrderedDict[str, dict]] = [OrderedDict() for _ in range(ID_BITS)]
+
+    def __len__(self) -> int:
+        return sum(len(bucket) for bucket in self.buckets)
+
+    def __contains__(self, name: str) -> bool:
+        node_id = get_node_id(name)
+        return node_id != self.own_id and name in self.buckets[self.get_bucket_index(node_id)]
+
+    def get_bucket_index(self, node_id: int) -> int:
+        """
+        get_bucket_index gets the bucket an id belongs in
+
+        Args:
+            node_id (int): the id, must not be own_id
+
+        Returns:
+            int: the index of the bucket
+        """
+        return (node_id ^ self.own_id).bit_length() - 1
+
+    def add_contact(self, contact: dict) -> dict | None:
+        """
+        add_contact adds a contact or moves it to the end of its bucket as most recently seen
+        a full bucket keeps its contacts, long lived peers are the most likely to stay up
+
+        Args:
+            contact (dict): the name, ip and port of the peer
+
+        Returns:
+            dict | None: the least recently seen contact of the bucket if it was full and the contact was not added,
+                the caller can ping it and remove it if it does not answer
+        """
+        node_id = get_node_id(contact['name'])
+        if node_id == self.own_id:
+            return None
+        bucket = self.buckets[self.get_bucket_index(node_id)]
+        if contact['name'] in bucket:
+            bucket[contact['name']] = contact
+            bucket.move_to_end(contact['name'])
+            return None
+        if len(bucket) < self.k:
+            bucket[contact['name']] = contact
+            return None
+        return next(iter(bucket.values()))
+
+    def remove_contact(self, name: str) -> None:
+        """
+        remove_contact removes a contact if it is in the table
+
+        Args:
+            name (str): the name of the contact
+        """
+        node_id = get_node_id(name)
+        if node_id != self.own_id:
+            self.buckets[self.get_bucket_index(node_id)].pop(name, None)
+
+    def get_closest(self, target_id: int, count: int) -> list[dict]:
+        """
+        get_closest gets the known contacts closest to an id by xor distance
+
+        Args:
+            target_id (int): the id
+            count (int): the most contacts to get
+
+        Returns:
+            list[dict]: the contacts, closest first
+        """
+        return sorted(self.get_contacts(), key=lambda contact: get_node_id(contact['name']) ^ target_id)[:count]
+
+    def get_contacts(self) -> list[dict]:
+        """
+        get_contacts gets every contact
+
+        Returns:
+            list[dict]: the contacts
+        """
+        return [contact for bucket in self.buckets for contact in bucket.values()]
+
+
+class Dht_node:
+    """
+    Dht_node a peer in the distributed hash table
+    answers 'dht ping', 'dht store', 'dht find node' and 'dht find value' requests from other peers
+    and looks up and publishes address records through them
+    attrs:
+        logger: logging object
+            the error and info logger for the node
+        own_contact: dict
+            the name, ip and port other peers reach this node at
+        own_id: int
+            the id of this node
+        rpc: Rpc
+            sends a request to a contact and returns the content of the reply or None if it failed
+        sign: Sign | None
+            signs a record hash with the own private key, None if this node publishes no record
+        get_public_key: Get_public_key | None
+            gets the public key already known for a name, records with a different key are rejected
+        k: int
+            the contacts in each bucket and the peers each record is stored on
+        alpha: int
+            the requests sent at once during a lookup
+        max_lookup_rounds: int
+            the most rounds of requests a lookup sends before giving up
+        record_ttl: float
+            the seconds a record is kept after it was published
+        republish_interval: float
+            the seconds between republishing the own record
+        routing_table: Routing_table
+            the known peers
+        records: dict[str, dict]
+            the stored records by name
+        own_record: dict | None
+            the record published for this node
+    methods:
+        handle_request(sender, command, content)
+            answers a request from another peer
+        bootstrap(contacts)
+            joins the table through known peers
+        lookup(name, find_value)
+            finds the peers closest to a name and, if find_value, its record
+        publish(record)
+            stores a record on the peers closest to its name
+        find_record(name)
+            finds the record of a name
+        run_republish()
+            republishes the own record and expires old records on a schedule
+    """
+    def __init__(
+            self,
+            own_contact: dict,
+            rpc: Rpc,
+            sign: Sign | None = None,
+            get_public_key: Get_public_key | None = None,
+            k: int = K,
+            alpha: int = ALPHA,
+            max_lookup_rounds: int = 8,
+            record_ttl: float = 24 * 3600,
+            republish_interval: float = 3600
+            ) -> None:
+        """
+        __init__ initialises the node
+
+        Args:
+            own_contact (dict): the name, ip and port other peers reach this node at
+            rpc (Rpc): sends a request to a contact and returns the content of the reply
+            sign (Sign | None): signs a record hash with the own private key. Defaults to None.
+            get_public_key (Get_public_key | None): gets the public key already known for a name. Defaults to None.
+            k (int): the contacts in each bucket and the peers each record is stored on. Defaults to K.
+            alpha (int): the requests sent at once during a lookup. Defaults to ALPHA.
+            max_lookup_rounds (int): the most rounds of requests a lookup sends. Defaults to 8.
+            record_ttl (float): the seconds a record is kept after it was published. Defaults to 24 hours.
+            republish_interval (float): the seconds between republishing the own record. Defaults to 1 hour.
+        """
+        self.logger = logging.getLogger(__name__)
+        self.own_contact = own_contact
+        self.own_id = get_node_id(own_contact['name'])
+        self.rpc = rpc
+        self.sign = sign
+        self.get_public_key = get_public_key
+        self.k = k
+        self.alpha = alpha
+        self.max_lookup_rounds = max_lookup_rounds
+        self.record_ttl = record_ttl
+        self.republish_interval = republish_interval
+        self.routing_table = Routing_table(own_id=self.own_id, k=k)
+        self.records: dict[str, dict] = {}
+        self.own_record: dict | None = None
+
+    def handle_request(self, sender, command: str, content) -> dict | None:
+        """
+        handle_request answers a request from another peer and adds the peer to the routing table
+
+        Args:
+            sender (any): the name, ip and port of the peer
+            command (str): the dht command
+            content (any): the content of the request
+
+        Returns:
+            dict | None: the content of the reply or None if the request is invalid
+        """
+        if self.is_valid_contact(contact=sender):
+            self.add_contact(contact=sender)
+        if not isinstance(content, dict):
+            return None
+        match command:
+            case 'dht ping':
+                return {}
+            case 'dht store':
+                return {'stored': self.store_record(record=content.get('record'))}
+            case 'dht find node' | 'dht find value':
+                if not isinstance(content.get('name'), str):
+                    return None
+                if command == 'dht find value':
+                    record = self.get_record(name=content['name'])
+                    if record is not None:
+                        return {'record': record}
+                return {
+                    'contacts': self.routing_table.get_closest(target_id=get_node_id(content['name']), count=self.k)
+                }
+            case _:
+                return None
+
+    def add_contact(self, contact: dict) -> None:
+        """
+        add_contact adds a contact to the routing table
+        if its bucket is full the least recently seen contact is pinged in the background and replaced if it is gone
+
+        Args:
+            contact (dict): the name, ip and port of the peer
+        """
+        contact = {'name': contact['name'], 'ip': contact['ip'], 'port': contact['port']}
+        oldest = self.routing_table.add_contact(contact=contact)
+        if oldest is not None:
+            asyncio.create_task(self.__replace_if_gone(oldest=oldest, contact=contact))
+
+    async def __replace_if_gone(self, oldest: dict, contact: dict) -> None:
+        """
+        __replace_if_gone pings the least recently seen contact of a full bucket and replaces it if it does not answer
+
+        Args:
+            oldest (dict): the least recently seen contact
+            contact (dict): the contact waiting for a place
+        """
+        if await self.rpc(oldest, 'dht ping', {}) is None:
+            self.routing_table.remove_contact(name=oldest['name'])
+            self.routing_table.add_contact(contact=contact)
+        else:
+            self.routing_table.add_contact(contact=oldest)
+
+    def is_valid_contact(self, contact) -> bool:
+        """
+        is_valid_contact checks a contact from another peer has a name, ip and port
+
+        Args:
+            contact (any): the contact
+
+        Returns:
+            bool: whether or not the contact can be added to the routing table
+        """
+        return (
+            isinstance(contact, dict)
+            and isinstance(contact.get('name'), str)
+            and isinstance(contact.get('ip'), str)
+            and isinstance(contact.get('port'), int)
+        )
+
+    def store_record(self, record) -> bool:
+        """
+        store_record stores a valid record unless it is older than the stored one or has a different public key
+
+        Args:
+            record (any): the record
+
+        Returns:
+            bool: whether or not the record was stored
+        """
+        if not is_valid_record(record=record, get_public_key=self.get_public_key) or self.is_expired(record=record):
+            return False
+        stored = self.get_record(name=record['name'])
+        if stored is not None:
+            if (stored['public_key_n'], stored['public_key_e']) != (record['public_key_n'], record['public_key_e']):
+                self.logger.warning(f'Rejected record for {record["name"]} with a different public key')
+                return False
+            if stored['published_time'] > record['published_time']:
+                return False
+        self.records[record['name']] = record
+        return True
+
+    def get_record(self, name: str) -> dict | None:
+        """
+        get_record gets a stored record that has not expired
+
+        Args:
+            name (str): the name of the record
+
+        Returns:
+            dict | None: the record or None if there is none
+        """
+        record = self.records.get(name)
+        if record is not None and self.is_expired(record=record):
+            self.records.pop(name)
+            return None
+        return record
+
+    def is_expired(self, record: dict) -> bool:
+        """
+        is_expired checks if a record was published longer than record_ttl ago
+
+        Args:
+            record (dict): the record
+
+        Returns:
+            bool: whether or not the record has expired
+        """
+        return time.time() - record['published_time'] > self.record_ttl
+
+    async def bootstrap(self, contacts: list[dict]) -> bool:
+        """
+        bootstrap joins the table through known peers by looking up the own name
+        which fills the routing table with the peers closest to this one
+
+        Args:
+            contacts (list[dict]): the name, ip and port of known peers
+
+        Returns:
+            bool: whether or not any peer answered
+        """
+        for contact in contacts:
+            if self.is_valid_contact(contact=contact):
+                self.add_contact(contact=contact)
+        await self.lookup(name=self.own_contact['name'])
+        self.logger.info(f'Joined dht with {len(self.routing_table)} contacts')
+        return len(self.routing_table) > 0
+
+    async def lookup(self, name: str, find_value: bool = False) -> tuple[dict | None, list[dict]]:
+        """
+        lookup asks the closest known peers for closer ones, alpha at a time, until the k closest have all answered
+        or max_lookup_rounds have been sent
+
+        Args:
+            name (str): the name to look up
+            find_value (bool): whether to stop at the first peer with a record for the name. Defaults to False.
+
+        Returns:
+            tuple[dict | None, list[dict]]: the record, None if not found or not find_value,
+                and the k closest peers that answered
+        """
+        target_id = get_node_id(name)
+
+        def distance(contact: dict) -> int:
+            return get_node_id(contact['name']) ^ target_id
+
+        shortlist = {
+            contact['name']: contact
+            for contact in self.routing_table.get_closest(target_id=target_id, count=self.k)
+        }
+        queried: set[str] = set()
+        answered: dict[str, dict] = {}
+        command = 'dht find value' if find_value else 'dht find node'
+        for _ in range(self.max_lookup_rounds):
+            closest = sorted(shortlist.values(), key=distance)[:self.k]
+            batch = [contact for contact in closest if contact['name'] not in queried][:self.alpha]
+            if len(batch) == 0:
+                break
+            queried.update(contact['name'] for contact in batch)
+            replies = await asyncio.gather(*[self.rpc(contact, command, {'name': name}) for contact in batch])
+            for contact, reply in zip(batch, replies):
+                if reply is None:
+                    self.routing_table.remove_contact(name=contact['name'])
+                    shortlist.pop(contact['name'], None)
+                    continue
+                self.add_contact(contact=contact)
+                answered[contact['name']] = contact
+                if (
+                    find_value
+                    and is_valid_record(record=reply.get('record'), get_public_key=self.get_public_key)
+                    and reply['record']['name'] == name
+                ):
+                    self.store_record(record=reply['record'])
+                    return reply['record'], sorted(answered.values(), key=distance)[:self.k]
+                for found in reply.get('contacts', []):
+                    if self.is_valid_contact(contact=found) and found['name'] != self.own_contact['name']:
+                        shortlist.setdefault(found['name'], found)
+        return None, sorted(answered.values(), key=distance)[:self.k]
+
+    async def publish(self, record: dict) -> int:
+        """
+        publish stores a record here and on the k peers closest to its name
+
+        Args:
+            record (dict): the record
+
+        Returns:
+            int: the number of peers that stored the record
+        """
+        self.store_record(record=record)
+        _, closest = await self.lookup(name=record['name'])
+        replies = await asyncio.gather(*[self.rpc(contact, 'dht store', {'record': record}) for contact in closest])
+        stored = sum(1 for reply in replies if reply is not None and reply.get('stored'))
+        self.logger.info(f'Published record for {record["name"]} to {stored} peers')
+        return stored
+
+    async def publish_own_record(self, public_key_n: int, public_key_e: int) -> int:
+        """
+        publish_own_record creates, signs and publishes the record of this node
+
+        Args:
+            public_key_n (int): the own public key n
+            public_key_e (int): the own public key e
+
+        Returns:
+            int: the number of peers that stored the record
+        """
+        if self.sign is None or public_key_n == 0:
+            self.logger.warning('Not publishing own record without a public key to sign it with')
+            return 0
+        record = {
+            'name': self.own_contact['name'],
+            'ip': self.own_contact['ip'],
+            'port': self.own_contact['port'],
+            'public_key_n': public_key_n,
+            'public_key_e': public_key_e,
+            'published_time': time.time()
+        }
+        record['signature'] = self.sign(get_record_hash(record) % public_key_n)
+        self.own_record = record
+        return await self.publish(record=record)
+
+    async def find_record(self, name: str) -> dict | None:
+        """
+        find_record finds the record of a name, stored here or on the peers closest to it
+
+        Args:
+            name (str): the name
+
+        Returns:
+            dict | None: the record or None if no peer has it
+        """
+        record = self.get_record(name=name)
+        if record is not None:
+            return record
+        record, _ = await self.lookup(name=name, find_value=True)
+        return record
+
+    async def run_republish(self) -> None:
+        """
+        run_republish republishes the own record every republish_interval so it outlives record_ttl
+        and reaches peers that joined closer to it, and drops expired records
+        """
+        while True:
+            await asyncio.sleep(self.republish_interval)
+            for name in list(self.records):
+                self.get_record(name=name)
+            if self.own_record is not None:
+                await self.publish_own_record(
+                    public_key_n=self.own_record['public_key_n'],
+                    public_key_e=self.own_record['public_key_e']
+                    )
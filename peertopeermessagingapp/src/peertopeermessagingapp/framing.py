@@ -0,0 +1,47 @@
+"""
+this module holds the length prefixed framing used for messages over the network
+each frame is a 4 byte big endian length followed by that many bytes of message
+so a message is read with two readexactly calls instead of scanning for a separator
+"""
+import asyncio
+import struct
+
+FRAME_HEADER = struct.Struct('!I')
+MAX_FRAME_SIZE = 16 * 1024 * 1024
+
+
+def encode_frame(message: str | bytes) -> bytes:
+    """
+    encode_frame prefixes a message with its length
+
+    Args:
+        message (str | bytes): the message, str is encoded as utf-8
+
+    Returns:
+        bytes: the frame
+    """
+    if isinstance(message, str):
+        message = message.encode('utf-8')
+    return FRAME_HEADER.pack(len(message)) + message
+
+
+async def read_frame(reader: asyncio.StreamReader, max_frame_size: int = MAX_FRAME_SIZE) -> bytes:
+    """
+    read_frame reads one frame from the stream
+
+    Args:
+        reader (asyncio.StreamReader): allows reading from the network stream
+        max_frame_size (int): the largest message accepted. Defaults to MAX_FRAME_SIZE.
+
+    Raises:
+        ValueError: if the frame is larger than max_frame_size, the stream can not be read further
+        asyncio.IncompleteReadError: if the stream ends part way through a frame
+
+    Returns:
+        bytes: the message
+    """
+    header = await reader.readexactly(FRAME_HEADER.size)
+    (frame_size,) = FRAME_HEADER.unpack(header)
+    if frame_size > max_frame_size:
+        raise ValueError(f'frame of {frame_size} bytes is larger than the max of {max_frame_size} bytes')
+    return await reader.readexactly(frame_size)
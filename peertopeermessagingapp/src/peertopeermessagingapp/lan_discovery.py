@@ -0,0 +1,294 @@
+"""
+this module holds the lan discovery class
+finds peers, chat servers and the name server on the local network over udp multicast
+so a classroom of laptops can find each other without knowing the name server ip first
+a starting peer sends its announcement as a query and everyone who hears a query answers it
+so a new peer finds the others as soon as it starts rather than after the next announcement
+answers go to the group rather than back to the sender as apps on the same device share the port
+"""
+import asyncio
+import json
+import logging
+import socket
+import struct
+import time
+from typing import Callable
+
+MULTICAST_GROUP = '239.255.80.80'
+MULTICAST_PORT = 8890
+ANNOUNCE_INTERVAL = 5
+MAX_DATAGRAM_SIZE = 8192
+ROLES = ('peer', 'chat_server', 'name_server')
+
+On_discovered = Callable[[dict], None]
+
+
+def create_announcement(announcement: dict, query: bool) -> bytes:
+    """
+    create_announcement formats an announcement as a datagram
+
+    Args:
+        announcement (dict): the name, role, port and public key to announce
+        query (bool): whether everyone who hears it should answer with their own announcements
+
+    Returns:
+        bytes: the datagram
+    """
+    return json.dumps({'type': 'announce', 'query': query} | announcement).encode('utf-8')
+
+
+def parse_announcement(data: bytes) -> dict | None:
+    """
+    parse_announcement loads a datagram as an announcement, checking it has every field with the right type
+    the ip is not sent as the sender can not always tell which of its ips the others can reach
+
+    Args:
+        data (bytes): the datagram
+
+    Returns:
+        dict | None: the announcement or None if the datagram is not a valid announcement
+    """
+    try:
+        announcement = json.loads(data)
+    except (UnicodeDecodeError, json.JSONDecodeError):
+        return None
+    if not isinstance(announcement, dict) or announcement.get('type') != 'announce':
+        return None
+    if not isinstance(announcement.get('name'), str) or announcement.get('role') not in ROLES:
+        return None
+    if not all(isinstance(announcement.get(field), int) for field in ['port', 'public_key_n', 'public_key_e']):
+        return None
+    return announcement
+
+
+class Lan_discovery(asyncio.DatagramProtocol):
+    """
+    Lan_discovery announces this device and listens for the announcements of others on the local network
+    keeps what it hears for ttl seconds and passes every new or changed address to on_discovered
+    attrs:
+        logger: logging object
+            the error and info logger for the discovery
+        announcements: list[dict]
+            the name, role, port and public key of each thing this device announces
+        on_discovered: On_discovered
+            called with the name, role, ip, port and public key of each new or changed address
+        group: str
+            the multicast group
+        port: int
+            the udp port announcements are sent to
+        announce_interval: float
+            the seconds between announcements
+        ttl: float
+            the seconds an address is kept after it was last heard
+        transport: asyncio.DatagramTransport | None
+            the udp transport, None until started
+        __discovered: dict[tuple[str, str], dict]
+            the addresses heard by role and name with when they expire
+        __discovered_event: asyncio.Event | None
+            set each time an address is discovered
+        __task: asyncio.Task | None
+            the task announcing on a schedule
+    methods:
+        start()
+            joins the multicast group and starts announcing
+        close()
+            stops announcing and leaves the multicast group
+        set_announcements(announcements)
+            changes what this device announces and announces it
+        announce(query)
+            sends the announcements to the group
+        get_discovered(role)
+            gets the addresses heard recently
+        wait_for(role, timeout)
+            waits for an address with a role to be heard
+    """
+    def __init__(
+            self,
+            announcements: list[dict],
+            on_discovered: On_discovered,
+            group: str = MULTICAST_GROUP,
+            port: int = MULTICAST_PORT,
+            announce_interval: float = ANNOUNCE_INTERVAL
+            ) -> None:
+        """
+        __init__ initialises the discovery
+
+        Args:
+            announcements (list[dict]): the name, role, port and public key of each thing this device announces
+            on_discovered (On_discovered): called with each new or changed address
+            group (str): the multicast group. Defaults to MULTICAST_GROUP.
+            port (int): the udp port announcements are sent to. Defaults to MULTICAST_PORT.
+            announce_interval (float): the seconds between announcements. Defaults to ANNOUNCE_INTERVAL.
+        """
+        self.logger = logging.getLogger(__name__)
+        self.announcements = announcements
+        self.on_discovered = on_discovered
+        self.group = group
+        self.port = port
+        self.announce_interval = announce_interval
+        self.ttl = announce_interval * 3
+        self.transport: asyncio.DatagramTransport | None = None
+        self.__discovered: dict[tuple[str, str], dict] = {}
+        self.__discovered_event: asyncio.Event | None = None
+        self.__task: asyncio.Task | None = None
+
+    async def start(self) -> None:
+        """
+        start joins the multicast group, sends a query and starts announcing on a schedule
+
+        Raises:
+            OSError: if the udp socket can not be created or the group can not be joined
+        """
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
+        try:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            if hasattr(socket, 'SO_REUSEPORT'):
+                # lets more than one app on the same device listen to the group
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+            sock.bind(('', self.port))
+            membership = struct.pack('4s4s', socket.inet_aton(self.group), socket.inet_aton('0.0.0.0'))
+            sock.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, membership)
+            sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, 1)  # stay on the local network
+            sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_LOOP, 1)
+        except OSError:
+            sock.close()
+            raise
+        self.__discovered_event = asyncio.Event()
+        await asyncio.get_running_loop().create_datagram_endpoint(lambda: self, sock=sock)
+        self.announce(query=True)
+        self.__task = asyncio.create_task(self.__run_announce())
+        self.logger.info(f'Listening for peers on {self.group}:{self.port}')
+
+    def close(self) -> None:
+        """
+        close stops announcing and leaves the multicast group
+        """
+        if self.__task is not None:
+            self.__task.cancel()
+            self.__task = None
+        if self.transport is not None:
+            self.transport.close()
+            self.transport = None
+
+    def connection_made(self, transport: asyncio.DatagramTransport) -> None:
+        self.transport = transport
+
+    def connection_lost(self, exc: Exception | None) -> None:
+        self.transport = None
+
+    def error_received(self, exc: Exception) -> None:
+        self.logger.warning(f'Discovery error: {exc}')
+
+    def set_announcements(self, announcements: list[dict]) -> None:
+        """
+        set_announcements changes what this device announces, announcing it straight away
+
+        Args:
+            announcements (list[dict]): the name, role, port and public key of each thing this device announces
+        """
+        self.announcements = announcements
+        self.announce(query=False)
+
+    def announce(self, query: bool) -> None:
+        """
+        announce sends the announcements to the group
+
+        Args:
+            query (bool): whether everyone who hears it should answer with their own announcements
+        """
+        if self.transport is None:
+            return
+        for announcement in self.announcements:
+            self.transport.sendto(create_announcement(announcement=announcement, query=query), (self.group, self.port))
+
+    def datagram_received(self, data: bytes, addr: tuple[str, int]) -> None:
+        if len(data) > MAX_DATAGRAM_SIZE:
+            return
+        announcement = parse_announcement(data=data)
+        if announcement is None or self.is_own(announcement=announcement):
+            return
+        if announcement['query']:
+            self.announce(query=False)
+        address = {
+            'name': announcement['name'],
+            'role': announcement['role'],
+            'ip': addr[0],
+            'port': announcement['port'],
+            'public_key_n': announcement['public_key_n'],
+            'public_key_e': announcement['public_key_e']
+        }
+        key = (address['role'], address['name'])
+        discovered = self.__discovered.get(key)
+        self.__discovered[key] = {'address': address, 'expires': time.monotonic() + self.ttl}
+        if discovered is None or discovered['address'] != address:
+            self.logger.info(f'Discovered {address["role"]} {address["name"]} at {address["ip"]}:{address["port"]}')
+            self.on_discovered(address)
+            if self.__discovered_event is not None:
+                self.__discovered_event.set()
+
+    def is_own(self, announcement: dict) -> bool:
+        """
+        is_own checks if an announcement is one this device sent, which the group sends back to it
+
+        Args:
+            announcement (dict): the announcement
+
+        Returns:
+            bool: whether or not this device announces the same role and name
+        """
+        return any(
+            own['name'] == announcement['name'] and own['role'] == announcement['role']
+            for own in self.announcements
+        )
+
+    def get_discovered(self, role: str | None = None) -> list[dict]:
+        """
+        get_discovered gets the addresses heard within the last ttl seconds, removing older ones
+
+        Args:
+            role (str | None): only get addresses with this role, None for every role. Defaults to None.
+
+        Returns:
+            list[dict]: the name, role, ip, port and public key of each address
+        """
+        now = time.monotonic()
+        for key in [key for key, discovered in self.__discovered.items() if discovered['expires'] < now]:
+            self.__discovered.pop(key)
+        return [
+            discovered['address'] for discovered in self.__discovered.values()
+            if role is None or discovered['address']['role'] == role
+        ]
+
+    async def wait_for(self, role: str, timeout: float) -> dict | None:
+        """
+        wait_for waits for an address with a role to be heard
+
+        Args:
+            role (str): the role
+            timeout (float): the most seconds to wait
+
+        Returns:
+            dict | None: the address or None if none was heard in time
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            discovered = self.get_discovered(role=role)
+            if len(discovered) > 0:
+                return discovered[0]
+            if self.__discovered_event is None or time.monotonic() >= deadline:
+                return None
+            self.__discovered_event.clear()
+            try:
+                await asyncio.wait_for(self.__discovered_event.wait(), deadline - time.monotonic())
+            except asyncio.TimeoutError:
+                return None
+
+    async def __run_announce(self) -> None:
+        """
+        __run_announce announces every announce_interval so others keep this device past their ttl
+        and drops addresses that have not been heard within the ttl
+        """
+        while True:
+            await asyncio.sleep(self.announce_interval)
+            self.announce(query=False)
+            self.get_discovered()
@@ -0,0 +1,255 @@
+"""
+this module holds the mailbox class
+keeps messages for peers that are offline on the chat server until they come back
+each recipient has a folder of append-only segment files of length prefixed records,
+storing a message is one append and delivered segments are deleted whole rather than rewritten
+the chat server calls it through asyncio.to_thread so the disk is never read or written on the event loop
+"""
+import base64
+import json
+import logging
+import os
+import threading
+import time
+from peertopeermessagingapp.framing import FRAME_HEADER, encode_frame
+
+SEGMENT_EXTENSION = '.seg'
+
+
+class Mailbox:
+    """
+    Mailbox the messages waiting on the chat server for each offline recipient
+    messages stay encrypted for the recipient so the chat server can not read them
+    attrs:
+        logger: logging object
+            the error and info logger for the mailbox
+        directory: str
+            the folder holding a folder of segments for each recipient
+        max_messages: int
+            the most messages kept for each recipient
+        max_bytes: int
+            the most bytes of messages kept for each recipient
+        segment_size: int
+            the bytes a segment grows to before messages go in a new one
+        __recipients: dict[str, dict]
+            the segments of each recipient with their message and byte counts, and whether the last is sealed
+        __lock: threading.RLock
+            stops two threads changing the segments at once
+    methods:
+        store(recipient, message)
+            appends a message to the mailbox of a recipient
+        read(recipient)
+            reads every message waiting for a recipient
+        remove(recipient, last_segment)
+            deletes the segments that have been delivered
+        get_message_count(recipient)
+            gets the number of messages waiting for a recipient
+    """
+    def __init__(
+            self,
+            directory: str,
+            max_messages: int = 1000,
+            max_bytes: int = 8 * 1024 * 1024,
+            segment_size: int = 1024 * 1024
+            ) -> None:
+        """
+        __init__ initialises the mailbox loading the segments already on disk
+
+        Args:
+            directory (str): the folder holding a folder of segments for each recipient
+            max_messages (int): the most messages kept for each recipient. Defaults to 1000.
+            max_bytes (int): the most bytes of messages kept for each recipient. Defaults to 8 MiB.
+            segment_size (int): the bytes a segment grows to before messages go in a new one. Defaults to 1 MiB.
+        """
+        self.logger = logging.getLogger(__name__)
+        self.directory = directory
+        self.max_messages = max_messages
+        self.max_bytes = max_bytes
+        self.segment_size = segment_size
+        self.__recipients: dict[str, dict] = {}
+        self.__lock = threading.RLock()
+        self.__load()
+
+    def __contains__(self, recipient: str) -> bool:
+        return self.get_message_count(recipient=recipient) > 0
+
+    def store(self, recipient: str, message: str | bytes) -> bool:
+        """
+        store appends a message to the mailbox of a recipient
+
+        Args:
+            recipient (str): the name of the recipient
+            message (str | bytes): the message, from create_message for the recipient
+
+        Returns:
+            bool: whether or not the message was stored, False if the mailbox is full
+        """
+        binary = isinstance(message, bytes)
+        record = encode_frame(json.dumps({
+            'message': base64.b64encode(message).decode('ascii') if binary else message,
+            'binary': binary,
+            'stored_time': time.time()
+        }))
+        with self.__lock:
+            mailbox = self.__recipients.setdefault(recipient, {'segments': {}, 'sealed': True})
+            if self.get_message_count(recipient=recipient) >= self.max_messages:
+                self.logger.warning(f'Mailbox of {recipient} is full')
+                return False
+            if sum(segment['bytes'] for segment in mailbox['segments'].values()) + len(record) > self.max_bytes:
+                self.logger.warning(f'Mailbox of {recipient} is full')
+                return False
+            if mailbox['sealed'] or mailbox['segments'][max(mailbox['segments'])]['bytes'] >= self.segment_size:
+                number = max(mailbox['segments'], default=-1) + 1
+                mailbox['segments'][number] = {'messages': 0, 'bytes': 0}
+                mailbox['sealed'] = False
+                os.makedirs(self.__get_recipient_directory(recipient=recipient), exist_ok=True)
+            number = max(mailbox['segments'])
+            with open(self.__get_segment_path(recipient=recipient, number=number), 'ab') as file:
+                file.write(record)
+            mailbox['segments'][number]['messages'] += 1
+            mailbox['segments'][number]['bytes'] += len(record)
+            return True
+
+    def read(self, recipient: str) -> tuple[list[str | bytes], int]:
+        """
+        read reads every message waiting for a recipient in the order they were stored
+        the last segment is sealed so messages stored while these are delivered go in a new one
+
+        Args:
+            recipient (str): the name of the recipient
+
+        Returns:
+            tuple[list[str | bytes], int]: the messages and the last segment read, -1 if there are none
+        """
+        with self.__lock:
+            mailbox = self.__recipients.get(recipient)
+            if mailbox is None or len(mailbox['segments']) == 0:
+                return [], -1
+            mailbox['sealed'] = True
+            numbers = sorted(mailbox['segments'])
+        messages = []
+        for number in numbers:
+            # the segments are sealed so nothing is appended to them while they are read outside the lock
+            for record in self.__read_segment(path=self.__get_segment_path(recipient=recipient, number=number)):
+                messages.append(base64.b64decode(record['message']) if record['binary'] else record['message'])
+        return messages, numbers[-1]
+
+    def remove(self, recipient: str, last_segment: int) -> None:
+        """
+        remove deletes the segments of a recipient up to and including last_segment once they are delivered
+
+        Args:
+            recipient (str): the name of the recipient
+            last_segment (int): the last segment from read
+        """
+        with self.__lock:
+            mailbox = self.__recipients.get(recipient)
+            if mailbox is None:
+                return
+            for number in [number for number in mailbox['segments'] if number <= last_segment]:
+                mailbox['segments'].pop(number)
+                try:
+                    os.remove(self.__get_segment_path(recipient=recipient, number=number))
+                except FileNotFoundError:
+                    pass
+            if len(mailbox['segments']) == 0:
+                self.__recipients.pop(recipient)
+                try:
+                    os.rmdir(self.__get_recipient_directory(recipient=recipient))
+                except OSError:
+                    pass
+
+    def get_message_count(self, recipient: str) -> int:
+        """
+        get_message_count gets the number of messages waiting for a recipient
+
+        Args:
+            recipient (str): the name of the recipient
+
+        Returns:
+            int: the number of messages
+        """
+        with self.__lock:
+            mailbox = self.__recipients.get(recipient)
+            if mailbox is None:
+                return 0
+            return sum(segment['messages'] for segment in mailbox['segments'].values())
+
+    def __get_recipient_directory(self, recipient: str) -> str:
+        """
+        __get_recipient_directory gets the folder of a recipient,
+        named by the hex of its name so any name is a valid folder
+
+        Args:
+            recipient (str): the name of the recipient
+
+        Returns:
+            str: the path of the folder
+        """
+        return os.path.join(self.directory, recipient.encode('utf-8').hex())
+
+    def __get_segment_path(self, recipient: str, number: int) -> str:
+        """
+        __get_segment_path gets the path of a segment
+
+        Args:
+            recipient (str): the name of the recipient
+            number (int): the number of the segment
+
+        Returns:
+            str: the path of the segment file
+        """
+        return os.path.join(self.__get_recipient_directory(recipient=recipient), f'{number:08d}{SEGMENT_EXTENSION}')
+
+    def __read_segment(self, path: str) -> list[dict]:
+        """
+        __read_segment reads the records of a segment
+        a record cut short by the chat server stopping part way through an append is dropped
+
+        Args:
+            path (str): the path of the segment file
+
+        Returns:
+            list[dict]: the records
+        """
+        try:
+            with open(path, 'rb') as file:
+                data = file.read()
+        except FileNotFoundError:
+            return []
+        records = []
+        offset = 0
+        while offset + FRAME_HEADER.size <= len(data):
+            (record_size,) = FRAME_HEADER.unpack_from(data, offset)
+            offset += FRAME_HEADER.size
+            if offset + record_size > len(data):
+                self.logger.warning(f'Dropped a partly written record in {path}')
+                break
+            records.append(json.loads(data[offset:offset + record_size]))
+            offset += record_size
+        return records
+
+    def __load(self) -> None:
+        """
+        __load loads the message and byte counts of the segments already on disk
+        the folder is only made once a message is stored
+        """
+        if not os.path.isdir(self.directory):
+            return
+        for folder in os.listdir(self.directory):
+            try:
+                recipient = bytes.fromhex(folder).decode('utf-8')
+            except (ValueError, UnicodeDecodeError):
+                continue
+            segments = {}
+            for file_name in os.listdir(os.path.join(self.directory, folder)):
+                if not file_name.endswith(SEGMENT_EXTENSION):
+                    continue
+                path = os.path.join(self.directory, folder, file_name)
+                segments[int(file_name.removesuffix(SEGMENT_EXTENSION))] = {
+                    'messages': len(self.__read_segment(path=path)),
+                    'bytes': os.path.getsize(path)
+                }
+            if len(segments) > 0:
+                # messages stored after a restart go in a new segment after any partly written record
+                self.__recipients[recipient] = {'segments': segments, 'sealed': True}
@@ -4,8 +4,16 @@ a module with a bunch of math stuff used by RSA cryptosystem
 
 
 import logging
+import math
+import secrets
 import time
 
+# number of random bases tested by miller_rabin for numbers too large for the deterministic bases
+MILLER_RABIN_ROUNDS = 40
+# testing these bases is deterministic for all n < MILLER_RABIN_DETERMINISTIC_LIMIT
+MILLER_RABIN_BASES = [2, 3, 5, 7, 11, 13, 17, 19, 23, 29, 31, 37, 41]
+MILLER_RABIN_DETERMINISTIC_LIMIT = 3317044064679887385961981
+
 
 def carmichael(n) -> int:
     """
@@ -38,6 +46,67 @@ def carmichael(n) -> int:
             )
 
 
+def carmichael_from_primes(p, q) -> int:
+    """
+    finds carmichael`s totient function of n = p * q using the known prime factors
+    lambda(n) = lcm(p - 1, q - 1) or p * (p - 1) if p == q
+    gives the same k as carmichael(n) without testing every co-prime of n
+    args:
+        p: int
+            prime factor 1 of n
+        q: int
+            prime factor 2 of n
+    returns: int
+        the value k
+    """
+    if isinstance(p, int):
+        if isinstance(q, int):
+            if p > 1 and q > 1:
+                logging.info(f"{__name__}:carmichael_from_primes: calculating carmichael`s totient function...")
+                if p == q:
+                    # n = p**2 therefore lambda(n) = phi(p**2)
+                    return p * (p - 1)
+                return least_common_multiple(p - 1, q - 1)
+            else:
+                raise ValueError(
+                    f"expected p and q greater than 1 instead got {p} and {q}"
+                    )
+        else:
+            raise ValueError(
+                f"expected q type int instead got type {type(q)}"
+                )
+    else:
+        raise ValueError(
+            f"expected p type int instead got type {type(p)}"
+            )
+
+
+def least_common_multiple(x, y) -> int:
+    """
+    finds the lcm of x, y
+    args:
+        x: int
+            one of the values to find lcm of
+        y: int
+            one of the values to find lcm of
+    returns: int
+        the lcm of x and y
+    """
+    if isinstance(x, int):
+        if isinstance(y, int):
+            if x == 0 or y == 0:
+                return 0
+            return abs(x * y) // math.gcd(x, y)
+        else:
+            raise ValueError(
+                f"expected y type int instead got type {type(y)}"
+                )
+    else:
+        raise ValueError(
+            f"expected x type int instead got type {type(x)}"
+            )
+
+
 def find_nearest_prime(number, search_direction=1) -> int:
     """
     finds the nearest prime to number in the search_direction
@@ -109,21 +178,34 @@ def find_co_prime(a) -> list[int]:
 def find_modular_multiplicative_inverse(a, m) -> int:
     """
     finds the modular multiplicative inverse x of a to m
+    uses the extended euclidean algorithm so takes O(log m) steps
     args:
         a: int
             the value for a for a*x % m = 1
         m: int
             the value for m for a*x % m = 1
     returns: int
-        the modular multiplicative inverse of a and m
+        the modular multiplicative inverse of a and m, the smallest positive x
     """
     if isinstance(a, int) or isinstance(a, float):
         if isinstance(m, int) or isinstance(m, float):
-            x = 1
-            while True:  # TODO ensure this is not an infinite loop
-                if (a * x) % m == 1:
-                    return x
-                x += 1
+            if isinstance(a, float) and not a.is_integer():
+                raise ValueError(f"expected a to be a whole number instead got {a}")
+            if isinstance(m, float) and not m.is_integer():
+                raise ValueError(f"expected m to be a whole number instead got {m}")
+            a, m = int(a), int(m)
+            if m > 1:
+                gcd, x, _ = extended_euclidean(a % m, m)
+                if gcd == 1:
+                    return x % m
+                else:
+                    raise ValueError(
+                        f"{a} has no modular multiplicative inverse mod {m} as gcd is {gcd}"
+                        )
+            else:
+                raise ValueError(
+                    f"expected m greater than 1 instead got {m}"
+                    )
         else:
             raise ValueError(
                 f"expected m type int, float instead got type {type(m)}"
@@ -134,29 +216,234 @@ def find_modular_multiplicative_inverse(a, m) -> int:
             )
 
 
-def is_prime(n) -> bool:
+def extended_euclidean(a, b) -> tuple[int, int, int]:
+    """
+    finds gcd(a, b) and x, y such that a*x + b*y = gcd(a, b)
+    args:
+        a: int
+            value a
+        b: int
+            value b
+    returns: tuple[int, int, int]
+        gcd, x, y
+    """
+    if isinstance(a, int):
+        if isinstance(b, int):
+            old_r, r = a, b
+            old_x, x = 1, 0
+            old_y, y = 0, 1
+            while r != 0:
+                quotient = old_r // r
+                old_r, r = r, old_r - quotient * r
+                old_x, x = x, old_x - quotient * x
+                old_y, y = y, old_y - quotient * y
+            return old_r, old_x, old_y
+        else:
+            raise ValueError(
+                f"expected b type int instead got type {type(b)}"
+                )
+    else:
+        raise ValueError(
+            f"expected a type int instead got type {type(a)}"
+            )
+
+
+def is_prime(n, rounds=MILLER_RABIN_ROUNDS) -> bool:
     """
     checks if n is prime
+    trial divides by the small primes then runs miller rabin on anything left
     args:
         n: int
             the value to check if prime
+        rounds: int
+            the number of miller rabin rounds for large n. default MILLER_RABIN_ROUNDS
     returns: bool
         if prime
     """
     if isinstance(n, int):
         logging.debug('start checking if num prime...')
-        for i in range(2, n):
-            logging.debug(f'checking if {n} prime {(i / n) * 100}%')
-            if (n % i) == 0:
+        if n < 2:
+            return False
+        for small_prime in SMALL_PRIMES:
+            if n == small_prime:
+                return True
+            if n % small_prime == 0:
                 logging.debug('number not prime')
                 return False
-        logging.debug('{n} is prime')
-        return True
+        if n < SMALL_PRIMES[-1] ** 2:
+            # no factor <= sqrt(n) therefore n is prime
+            return True
+        return miller_rabin(n, rounds=rounds)
     raise ValueError(
         f"expected n type int instead got type {type(n)}"
         )
 
 
+def miller_rabin(n, rounds=MILLER_RABIN_ROUNDS) -> bool:
+    """
+    probabilistic primality test of n
+    deterministic for n < MILLER_RABIN_DETERMINISTIC_LIMIT as every base in MILLER_RABIN_BASES is tested
+    otherwise the chance of a composite passing is at most 4**-rounds
+    args:
+        n: int
+            the odd value > 3 to check if prime
+        rounds: int
+            the number of random bases to test for large n. default MILLER_RABIN_ROUNDS
+    returns: bool
+        if probably prime
+    """
+    if isinstance(n, int):
+        if isinstance(rounds, int):
+            if n > 3 and n % 2 == 1:
+                # write n - 1 as d * 2**s with d odd
+                d = n - 1
+                s = 0
+                while d % 2 == 0:
+                    d //= 2
+                    s += 1
+                if n < MILLER_RABIN_DETERMINISTIC_LIMIT:
+                    bases = MILLER_RABIN_BASES
+                else:
+                    bases = [secrets.randbelow(n - 3) + 2 for _ in range(rounds)]
+                for base in bases:
+                    x = pow(base, d, n)
+                    if x == 1 or x == n - 1:
+                        continue
+                    for _ in range(s - 1):
+                        x = pow(x, 2, n)
+                        if x == n - 1:
+                            break
+                    else:
+                        return False  # base is a witness that n is composite
+                return True
+            else:
+                raise ValueError(
+                    f"expected n odd and greater than 3 instead got {n}"
+                    )
+        else:
+            raise ValueError(
+                f"expected rounds type int instead got type {type(rounds)}"
+                )
+    else:
+        raise ValueError(
+            f"expected n type int instead got type {type(n)}"
+            )
+
+
+def generate_prime(bits) -> int:
+    """
+    generates a random prime number that is exactly bits long
+    the top 2 bits are set so that the product of 2 primes is exactly 2 * bits long
+    args:
+        bits: int
+            the bit length of the prime
+    returns: int
+        a random prime number
+    """
+    if isinstance(bits, int):
+        if bits >= 8:
+            logging.debug(f'generating {bits} bit prime...')
+            generate_prime_start_time = time.time()
+            # random candidates need far fewer rounds than adversarial ones (FIPS 186-4 table C.2)
+            if bits >= 1024:
+                rounds = 5
+            elif bits >= 512:
+                rounds = 7
+            else:
+                rounds = MILLER_RABIN_ROUNDS
+            while True:
+                candidate = secrets.randbits(bits) | (0b11 << (bits - 2)) | 1
+                if is_prime(candidate, rounds=rounds):
+                    logging.debug(f'generated prime in {time.time() - generate_prime_start_time}s')
+                    return candidate
+        else:
+            raise ValueError(
+                f"expected bits greater than or = to 8 instead got {bits}"
+                )
+    else:
+        raise ValueError(
+            f"expected bits type int instead got type {type(bits)}"
+            )
+
+
+def factor_modulus(n, e, d) -> tuple[int, int]:
+    """
+    finds the prime factors p, q of an RSA modulus n from the public key e and private key d
+    uses the fact that e*d - 1 is a multiple of lambda(n) to find a non trivial square root of 1 mod n
+    args:
+        n: int
+            the RSA modulus n = p * q
+        e: int
+            the public key e
+        d: int
+            the private key d
+    returns: tuple[int, int]
+        p, q with p < q
+    """
+    if isinstance(n, int):
+        if isinstance(e, int):
+            if isinstance(d, int):
+                k = e * d - 1
+                if n > 3 and k > 0 and k % 2 == 0:
+                    # write k as t * 2**s with t odd
+                    t = k
+                    s = 0
+                    while t % 2 == 0:
+                        t //= 2
+                        s += 1
+                    for base in SMALL_PRIMES[:100]:
+                        if n % base == 0:
+                            return min(base, n // base), max(base, n // base)
+                        x = pow(base, t, n)
+                        for _ in range(s):
+                            y = pow(x, 2, n)
+                            if y == 1 and x != 1 and x != n - 1:
+                                p = math.gcd(x - 1, n)
+                                return min(p, n // p), max(p, n // p)
+                            if y == 1:
+                                break
+                            x = y
+                raise ValueError(
+                    "could not factor n with the given e and d"
+                    )
+            else:
+                raise ValueError(
+                    f"expected d type int instead got type {type(d)}"
+                    )
+        else:
+            raise ValueError(
+                f"expected e type int instead got type {type(e)}"
+                )
+    else:
+        raise ValueError(
+            f"expected n type int instead got type {type(n)}"
+            )
+
+
+def sieve_of_eratosthenes(limit) -> list[int]:
+    """
+    finds all primes up to and including limit
+    args:
+        limit: int
+            the largest value to check
+    returns: list[int]
+        all primes <= limit
+    """
+    if isinstance(limit, int):
+        if limit < 2:
+            return []
+        is_prime_list = [True] * (limit + 1)
+        is_prime_list[0] = is_prime_list[1] = False
+        for num in range(2, math.isqrt(limit) + 1):
+            if is_prime_list[num]:
+                is_prime_list[num * num::num] = [False] * len(range(num * num, limit + 1, num))
+        return [num for num, num_is_prime in enumerate(is_prime_list) if num_is_prime]
+    else:
+        raise ValueError(
+            f"expected limit type int instead got type {type(limit)}"
+            )
+
+
 def is_co_prime(a, b) -> bool:
     """
     checks if a is coPrime to b
@@ -191,6 +478,7 @@ def is_co_prime(a, b) -> bool:
 def greatest_common_divisor(x, y) -> int:
     """
     finds the gdc of x, y
+    uses stein`s binary gcd algorithm so takes O(log(x * y)) steps
     args:
         x: int
             one of the values to find gdc of
@@ -201,11 +489,20 @@ def greatest_common_divisor(x, y) -> int:
     """
     if isinstance(x, int):
         if isinstance(y, int):
-            gdc = 0
-            for num in range(1, min(x, y)+1):
-                if x % num == 0 and y % num == 0:
-                    gdc = num
-            return gdc
+            x, y = abs(x), abs(y)
+            if x == 0:
+                return y
+            if y == 0:
+                return x
+            # the power of 2 shared by x and y
+            shift = ((x | y) & -(x | y)).bit_length() - 1
+            x >>= (x & -x).bit_length() - 1
+            while y != 0:
+                y >>= (y & -y).bit_length() - 1
+                if x > y:
+                    x, y = y, x
+                y -= x
+            return x << shift
         else:
             raise ValueError(
                 f"expected y type int instead got type {type(y)}"
@@ -241,3 +538,7 @@ def append_to_int(num, to_add) -> int:
         raise ValueError(
             f"expected num type int or num str instead got type {type(num)}"
             )
+
+
+# primes used to quickly filter candidates before running miller rabin
+SMALL_PRIMES = sieve_of_eratosthenes(1000)
@@ -1,9 +1,31 @@
 import asyncio
+import base64
+import itertools
 import json
 import logging
+import os
+import secrets
 import socket
+import time
+from collections import OrderedDict
 import peertopeermessagingapp.RSA_encrypt as RSA_encrypt
 import peertopeermessagingapp.RSA_decrypt as RSA_decrypt
+from peertopeermessagingapp.session_cipher import Session_cache, Session_cipher
+from peertopeermessagingapp.retry_scheduler import Retry_scheduler
+from peertopeermessagingapp.framing import MAX_FRAME_SIZE, encode_frame, read_frame
+from peertopeermessagingapp.connection_pool import Connection_pool, Multiplexed_connection
+from peertopeermessagingapp.address_book import Address_book
+from peertopeermessagingapp.address_book_subscriptions import Address_book_subscriptions
+from peertopeermessagingapp.dht import Dht_node, is_valid_record
+from peertopeermessagingapp.lan_discovery import Lan_discovery
+from peertopeermessagingapp.mailbox import Mailbox
+import peertopeermessagingapp.wire_format as wire_format
+import peertopeermessagingapp.compression as compression
+
+# addresses each peer keeps for itself that are not synced from the chat server
+LOCAL_ADDRESSES = ('name_server', 'chat_server')
+NAME_SERVER_PLACEHOLDER_IP = '127.100.1'  # the name server ip before one is set or discovered
+NAME_SERVER_PORT = 8888
 
 
 # TODO chat server shuting down
@@ -15,10 +37,10 @@ class Network_manager:
             the app class
         logger: logging object
             the error and info logger for the name server class
-        message_separator: bytes
-            the message separator for communication over the network
-        address_book: dict
-            holds the address of the current chat_server if any
+        max_frame_size: int
+            the largest message accepted from the network
+        address_book: Address_book
+            holds the address of the current chat_server if any, with public key fingerprints cached
         own_address: dict
             holds the address of the name server
         message_queue: asyncio.Queue
@@ -29,11 +51,120 @@ class Network_manager:
             the task for the client server
         message_queue_task: asyncio.Task
             the task for the message queue
+        retry_task: asyncio.Task
+            the task putting failed messages back on the message queue
+        idle_connection_task: asyncio.Task
+            the task closing pooled connections that have been idle too long
+        use_session_encryption: bool
+            whether content is encrypted with a RSA shared session key instead of RSA alone
+        use_binary_wire_format: bool
+            whether the binary wire format is offered to peers when a connection is opened
+        wire_versions: tuple[int, ...]
+            the wire format versions offered and accepted, see wire_format
+        hello_timeout: float
+            the seconds to wait for a peer to agree a wire format before using json
+        session_ciphers: Session_cache
+            the session ciphers for sending to each peer by (name, public key fingerprint)
+        peer_session_ciphers: Session_cache
+            the session ciphers received from peers by (sender, session id)
+        group_session_ciphers: Session_cache
+            the session ciphers for sending to each group by (group, member public key fingerprints)
+        max_group_fan_out: int
+            the most group members the chat server sends a group message to at once
+        connection_pool: Connection_pool
+            the open connections shared by send_message
+        response_timeout: float
+            the seconds send_message waits for a reply
+        __request_ids: itertools.count
+            numbers each request so its reply can be found on a shared connection
+        queue_batch_size: int
+            the most queued items send_messages_from_queue takes at once
+        max_in_flight_per_peer: int
+            the most messages waiting for acknowledgement from each target
+        __peer_semaphores: dict[str, asyncio.Semaphore]
+            limits the messages in flight to each target
+        direct_retry_interval: float
+            the seconds after a direct delivery fails before it is tried before the chat server relay again
+        __delivery_paths: dict[str, dict]
+            the delivery path that last worked for each target and when direct delivery to it last failed
+        mailbox_path: str
+            the folder the chat server keeps messages for offline peers in
+        mailbox: Mailbox | None
+            the messages kept for offline peers, None until the chat server first needs it
+        __draining_mailboxes: set[str]
+            the peers the chat server is delivering kept messages to
+        __send_tasks: set[asyncio.Task]
+            the tasks sending batches from the message queue
+        retry_scheduler: Retry_scheduler
+            holds failed messages until their backoff has passed
+        dead_letters: list[dict]
+            the queued messages that used all their attempts, saved in user_data until their target comes back
+        use_compression: bool
+            whether message content is compressed before it is encrypted
+        compression_threshold: int
+            the fewest bytes of content that are compressed, smaller content is sent as is
+        compression_level: int
+            the zlib compression level from 0 to 9
+        compressed_messages: int
+            the number of messages sent with compressed content
+        compression_bytes_in: int
+            the bytes of content before compression in the compressed messages
+        compression_bytes_saved: int
+            the bytes of content compression has saved
+        address_book_epoch: str
+            identifies this run of the address book versions, a client seeing a new epoch syncs from the start
+        address_book_version: int
+            the version of the latest change to the address book, increases with every change
+        __address_versions: OrderedDict[str, int]
+            the version each address last changed at, oldest change first
+            so changes since a version are found without a full scan
+        synced_address_book_epoch: str | None
+            the epoch of the chat server address book last synced from
+        synced_address_book_version: int
+            the chat server address book version last synced to
+        address_book_subscriptions: Address_book_subscriptions
+            the clients the chat server pushes address book changes to
+        chat_server_name: str | None
+            the name this peer hosts its chat server under, None if it hosts none
+        peer_chat_servers: dict[str, dict]
+            the name, ip and port of the other chat servers, from the name server
+        chat_server_replication: Address_book_subscriptions
+            the other chat servers the chat server pushes the address book changes made on it to
+        __remote_addresses: set[str]
+            the names last changed by a chat server, which are not replicated again
+        volunteer_as_chat_server: bool
+            whether to host a chat server when the name server asks for more, not only when there is none
+        chat_server_wanted: bool
+            whether the name server last said its chat servers have more clients than they should
+        use_dht: bool
+            whether peers publish and look up each others addresses in a distributed hash table
+        dht_bootstrap_addresses: list[dict]
+            the name, ip and port of peers to join the dht through as well as the known addresses
+        dht: Dht_node | None
+            the dht node, None until the dht is started
+        dht_task: asyncio.Task | None
+            the task republishing the own dht record
+        use_lan_discovery: bool
+            whether peers and servers on the local network are found over udp multicast
+        lan_discovery_timeout: float
+            the seconds to wait on start for the name server to be discovered if its ip is not set
+        lan_discovery: Lan_discovery | None
+            the lan discovery, None until it is started
     methods:
         start(self)
             starts the network manager
         add_address(self, name: str, ip: str, port: int, public_key_e: int, public_key_n: int)
             adds a new address to the address book
+        remove_address_endpoint(self, name: str)
+            clears the ip and port of an address that left
+        get_address_book_changes(self, since: int, epoch: str | None)
+            gets the addresses changed after a version for a client
+        apply_address_book_changes(self, changes: dict)
+            merges the changes from the chat server into the address book
+        subscribe_address_book(self)
+            syncs the address book and has the chat server push changes from then on
+        set_peer_chat_servers(self, chat_servers: list)
+            replicates the address book to the other chat servers
         load_address_book(self)
             loads the address book from file
         save_address_book(self)
@@ -60,10 +191,10 @@ class Network_manager:
                 the app class
             logger: logging object
                 the error and info logger for the name server class
-            message_separator: bytes
-                the message separator for communication over the network
-            address_book: dict
-                holds the address of the current chat_server if any
+            max_frame_size: int
+                the largest message accepted from the network
+            address_book: Address_book
+                holds the address of the current chat_server if any, with public key fingerprints cached
             own_address: dict
                 holds the address of the name server
             message_queue: asyncio.Queue
@@ -74,17 +205,179 @@ class Network_manager:
                 the task for the client server
             message_queue_task: asyncio.Task
                 the task for the message queue
+            retry_task: asyncio.Task
+                the task putting failed messages back on the message queue
+            idle_connection_task: asyncio.Task
+                the task closing pooled connections that have been idle too long
+            use_session_encryption: bool
+                whether content is encrypted with a RSA shared session key instead of RSA alone
+            use_binary_wire_format: bool
+                whether the binary wire format is offered to peers when a connection is opened
+            wire_versions: tuple[int, ...]
+                the wire format versions offered and accepted, see wire_format
+            hello_timeout: float
+                the seconds to wait for a peer to agree a wire format before using json
+            session_ciphers: Session_cache
+                the session ciphers for sending to each peer by (name, public key fingerprint)
+            peer_session_ciphers: Session_cache
+                the session ciphers received from peers by (sender, session id)
+            group_session_ciphers: Session_cache
+                the session ciphers for sending to each group by (group, member public key fingerprints)
+            max_group_fan_out: int
+                the most group members the chat server sends a group message to at once
+            connection_pool: Connection_pool
+                the open connections shared by send_message
+            response_timeout: float
+                the seconds send_message waits for a reply
+            __request_ids: itertools.count
+                numbers each request so its reply can be found on a shared connection
+            queue_batch_size: int
+                the most queued items send_messages_from_queue takes at once
+            max_in_flight_per_peer: int
+                the most messages waiting for acknowledgement from each target
+            __peer_semaphores: dict[str, asyncio.Semaphore]
+                limits the messages in flight to each target
+            direct_retry_interval: float
+                the seconds after a direct delivery fails before it is tried before the chat server relay again
+            __delivery_paths: dict[str, dict]
+                the delivery path that last worked for each target and when direct delivery to it last failed
+            mailbox_path: str
+                the folder the chat server keeps messages for offline peers in
+            mailbox: Mailbox | None
+                the messages kept for offline peers, None until the chat server first needs it
+            __draining_mailboxes: set[str]
+                the peers the chat server is delivering kept messages to
+            __send_tasks: set[asyncio.Task]
+                the tasks sending batches from the message queue
+            retry_scheduler: Retry_scheduler
+                holds failed messages until their backoff has passed
+            dead_letters: list[dict]
+                the queued messages that used all their attempts, saved in user_data until their target comes back
+            use_compression: bool
+                whether message content is compressed before it is encrypted
+            compression_threshold: int
+                the fewest bytes of content that are compressed, smaller content is sent as is
+            compression_level: int
+                the zlib compression level from 0 to 9
+            compressed_messages: int
+                the number of messages sent with compressed content
+            compression_bytes_in: int
+                the bytes of content before compression in the compressed messages
+            compression_bytes_saved: int
+                the bytes of content compression has saved
+            address_book_epoch: str
+                identifies this run of the address book versions, a client seeing a new epoch syncs from the start
+            address_book_version: int
+                the version of the latest change to the address book, increases with every change
+            __address_versions: OrderedDict[str, int]
+                the version each address last changed at, oldest change first
+                so changes since a version are found without a full scan
+            synced_address_book_epoch: str | None
+                the epoch of the chat server address book last synced from
+            synced_address_book_version: int
+                the chat server address book version last synced to
+            address_book_subscriptions: Address_book_subscriptions
+                the clients the chat server pushes address book changes to
+            chat_server_name: str | None
+                the name this peer hosts its chat server under, None if it hosts none
+            peer_chat_servers: dict[str, dict]
+                the name, ip and port of the other chat servers, from the name server
+            chat_server_replication: Address_book_subscriptions
+                the other chat servers the chat server pushes the address book changes made on it to
+            __remote_addresses: set[str]
+                the names last changed by a chat server, which are not replicated again
+            volunteer_as_chat_server: bool
+                whether to host a chat server when the name server asks for more, not only when there is none
+            chat_server_wanted: bool
+                whether the name server last said its chat servers have more clients than they should
+            use_dht: bool
+                whether peers publish and look up each others addresses in a distributed hash table
+            dht_bootstrap_addresses: list[dict]
+                the name, ip and port of peers to join the dht through as well as the known addresses
+            dht: Dht_node | None
+                the dht node, None until the dht is started
+            dht_task: asyncio.Task | None
+                the task republishing the own dht record
+            use_lan_discovery: bool
+                whether peers and servers on the local network are found over udp multicast
+            lan_discovery_timeout: float
+                the seconds to wait on start for the name server to be discovered if its ip is not set
+            lan_discovery: Lan_discovery | None
+                the lan discovery, None until it is started
         """
         self.app = app
         self.logger = logging.getLogger(name='{__name__}')
-        self.message_separator: bytes = '\n'.encode()  # TODO decide message sep
-        self.address_book: dict = {}
+        self.max_frame_size = MAX_FRAME_SIZE
+        self.address_book = Address_book()
         self.message_queue = asyncio.Queue()
         self.chat_server_task: asyncio.Task | None = None  # type: ignore
         self.client_server_task: asyncio.Task | None = None
         self.message_queue_task: asyncio.Task | None = None
+        self.retry_task: asyncio.Task | None = None
+        self.idle_connection_task: asyncio.Task | None = None
         self.shutdown_event = asyncio.Event()
         self.main_task: asyncio.Task | None  = None
+        self.use_session_encryption = True
+        self.use_binary_wire_format = True
+        self.wire_versions = wire_format.SUPPORTED_WIRE_VERSIONS
+        self.hello_timeout = 5
+        # rekeys each peer hourly or after 10000 messages
+        self.session_ciphers = Session_cache(max_size=256, ttl=3600, max_messages=10000)
+        # keeps received sessions longer than the sender so a live session is not unwrapped twice
+        self.peer_session_ciphers = Session_cache(max_size=1024, ttl=2 * 3600, max_messages=None)
+        # a change of members gets a new group key so a member who left can not read later messages
+        self.group_session_ciphers = Session_cache(max_size=64, ttl=3600, max_messages=10000)
+        self.max_group_fan_out = 16
+        self.connection_pool = Connection_pool(
+            open_connection=self.establish_connection,
+            max_frame_size=self.max_frame_size,
+            max_idle=60,
+            negotiate=self.negotiate_wire_version
+            )
+        self.response_timeout = 30
+        self.__request_ids = itertools.count()
+        self.queue_batch_size = 64
+        self.max_in_flight_per_peer = 8
+        self.__peer_semaphores: dict[str, asyncio.Semaphore] = {}
+        self.direct_retry_interval = 60
+        self.__delivery_paths: dict[str, dict] = {}
+        self.mailbox_path = os.path.join(os.path.split(os.path.abspath(__file__))[0], 'storage', 'mailbox')
+        self.mailbox: Mailbox | None = None
+        self.__draining_mailboxes: set[str] = set()
+        self.__send_tasks: set[asyncio.Task] = set()
+        self.retry_scheduler = Retry_scheduler(base_delay=1, max_delay=300, max_attempts=8)
+        self.dead_letters: list[dict] = []
+        self.use_compression = True
+        self.compression_threshold = compression.COMPRESSION_THRESHOLD
+        self.compression_level = compression.COMPRESSION_LEVEL
+        self.compressed_messages = 0
+        self.compression_bytes_in = 0
+        self.compression_bytes_saved = 0
+        self.address_book_epoch = secrets.token_hex(8)
+        self.address_book_version = 0
+        self.__address_versions: OrderedDict[str, int] = OrderedDict()
+        self.synced_address_book_epoch: str | None = None
+        self.synced_address_book_version = 0
+        self.address_book_subscriptions = Address_book_subscriptions(
+            get_changes=self.get_address_book_changes,
+            push=self.push_to_subscriber
+            )
+        self.chat_server_name: str | None = None
+        self.peer_chat_servers: dict[str, dict] = {}
+        self.chat_server_replication = Address_book_subscriptions(
+            get_changes=self.get_replicated_changes,
+            push=self.push_to_chat_server
+            )
+        self.__remote_addresses: set[str] = set()
+        self.volunteer_as_chat_server = False
+        self.chat_server_wanted = False
+        self.use_dht = False
+        self.dht_bootstrap_addresses: list[dict] = []
+        self.dht: Dht_node | None = None
+        self.dht_task: asyncio.Task | None = None
+        self.use_lan_discovery = True
+        self.lan_discovery_timeout = 1
+        self.lan_discovery: Lan_discovery | None = None
 
     def start(self) -> None:
         """
@@ -100,12 +393,13 @@ class Network_manager:
         }
         self.add_address(
             name='name_server',
-            ip='127.100.1',  # default place holder value
-            port=8888,  # TODO should be loaded from constant
+            ip=NAME_SERVER_PLACEHOLDER_IP,
+            port=NAME_SERVER_PORT,
             public_key_e=0,  # unencrypted comms
             public_key_n=0
             )  # a small server that holds the name and address of the current active server
         self.load_address_book()
+        self.load_dead_letters()
         if self.main_task is None:
             self.__boot_main_loop()
         elif not self.main_task.done():
@@ -156,22 +450,32 @@ class Network_manager:
         """
         main starts all the main processes of the network manager
         """
+        if self.use_lan_discovery:
+            await self.start_lan_discovery()
         self.logger.debug('Checking for established server...')
         server_exists = await self.is_active_server()
         if server_exists:
             self.logger.info('Found established server')
+            if self.volunteer_as_chat_server and self.chat_server_wanted:
+                self.logger.info('Name server wants more chat servers, volunteering...')
+                await self.create_chat_server()
         else:
             self.logger.info('Attempting to establishing server...')
             await self.create_chat_server()
         # start tasks
         self.logger.info('Starting tasks...')
         self.client_server_task = asyncio.create_task(self.create_chat_client())
-        asyncio.create_task(self.get_address_book())
         self.message_queue_task = asyncio.create_task(self.send_messages_from_queue())
+        self.retry_task = asyncio.create_task(self.retry_scheduler.run(put=self.message_queue.put_nowait))
+        self.idle_connection_task = asyncio.create_task(self.connection_pool.run_close_idle())
         self.logger.info('Tasks started')
-        # update address book
-        self.logger.debug('Updating address book...')
-        asyncio.create_task(self.get_address_book())
+        if self.use_dht:
+            # joined once the client listener is up so peers can answer back, addresses can then
+            # still be found if the name server is down
+            asyncio.create_task(self.start_dht())
+        # update address book and have changes pushed from now on
+        self.logger.debug('Subscribing to address book...')
+        asyncio.create_task(self.subscribe_address_book())
         # await shutdown event
         self.logger.debug('Finished booting local network awaiting shutdown')
         await self.shutdown_event.wait()
@@ -194,6 +498,9 @@ class Network_manager:
         shutdown_network_manager shuts down the network manager
         """
         self.save_address_book()
+        await self.unsubscribe_address_book()
+        self.address_book_subscriptions.close()
+        self.chat_server_replication.close()
         await self.__shutdown_chat_server()
 
         if self.client_server_task is not None:
@@ -216,6 +523,34 @@ class Network_manager:
         else:
             self.logger.error('No message queue to shutdown')
 
+        for task in list(self.__send_tasks):
+            task.cancel()
+        await asyncio.gather(*self.__send_tasks, return_exceptions=True)
+
+        if self.retry_task is not None:
+            self.retry_task.cancel()
+            try:
+                await self.retry_task
+            except asyncio.CancelledError:
+                self.logger.info('Retry scheduler shutdown')
+        # messages still waiting to be retried are kept as dead letters so they are not lost
+        for queue_item in self.retry_scheduler.clear():
+            self.add_dead_letter(queue_item=queue_item)
+
+        if self.idle_connection_task is not None:
+            self.idle_connection_task.cancel()
+            try:
+                await self.idle_connection_task
+            except asyncio.CancelledError:
+                self.logger.info('Idle connection sweep shutdown')
+
+        if self.dht_task is not None:
+            self.dht_task.cancel()
+        if self.lan_discovery is not None:
+            self.lan_discovery.close()
+
+        await self.connection_pool.close_all()
+
     async def __shutdown_chat_server(self):
         """
         __shutdown_chat_server shuts down the chat server if it exists
@@ -236,11 +571,10 @@ class Network_manager:
                 if message is None:
                     self.logger.error('No message to send')
                 else:
-                    response_reader = await self.send_message(
+                    parsed_response = await self.send_message(
                         address=self.address_book['name_server'],
                         message=message
                     )
-                    parsed_response = await self.read_and_parse_response(response_reader)
                     self.logger.debug(f'Name server Response: {parsed_response}')
         else:
             self.logger.warning('No chat server to shutdown')
@@ -250,10 +584,15 @@ class Network_manager:
         load_address_book loads the address book from user_data
         """
         self.address_book = self.app.backend.user_data.address_book
-        if isinstance(self.address_book, dict):
+        if isinstance(self.address_book, Address_book):
             pass
+        elif isinstance(self.address_book, dict):
+            self.address_book = Address_book(self.address_book)
         else:
-            self.address_book = {}
+            self.address_book = Address_book()
+        self.__address_versions.clear()
+        for name in self.address_book:
+            self.__record_address_change(name=name)
 
     def save_address_book(self) -> None:
         """
@@ -261,6 +600,58 @@ class Network_manager:
         """
         self.app.backend.user_data.address_book = self.address_book
 
+    def load_dead_letters(self) -> None:
+        """
+        load_dead_letters loads the dead letters from user_data
+        """
+        self.dead_letters = self.app.backend.user_data.dead_letters
+        if isinstance(self.dead_letters, list):
+            pass
+        else:
+            self.dead_letters = []
+
+    def save_dead_letters(self) -> None:
+        """
+        save_dead_letters saves the dead letters to user_data
+        """
+        self.app.backend.user_data.dead_letters = self.dead_letters
+
+    def add_dead_letter(self, queue_item: dict) -> None:
+        """
+        add_dead_letter stores a queued message that could not be sent until its target comes back
+
+        Args:
+            queue_item (dict): the queued message and its target
+        """
+        self.logger.warning(f'Giving up on message to {queue_item["target"]} until it comes back')
+        queue_item.pop('attempts', None)
+        if isinstance(queue_item['message'], bytes):
+            # user_data is saved as json so binary messages are stored as base64
+            queue_item = {
+                'message': base64.b64encode(queue_item['message']).decode(),
+                'target': queue_item['target'],
+                'binary': True
+            }
+        self.dead_letters.append(queue_item)
+        self.save_dead_letters()
+
+    def retry_dead_letters(self, target: str) -> None:
+        """
+        retry_dead_letters puts the dead letters for a target back on the message queue
+
+        Args:
+            target (str): the name of the address that came back
+        """
+        queue_items = [queue_item for queue_item in self.dead_letters if queue_item['target'] == target]
+        if len(queue_items) > 0:
+            self.logger.info(f'Retrying {len(queue_items)} dead letters to {target}')
+            self.dead_letters = [queue_item for queue_item in self.dead_letters if queue_item['target'] != target]
+            self.save_dead_letters()
+            for queue_item in queue_items:
+                if queue_item.pop('binary', False):
+                    queue_item['message'] = base64.b64decode(queue_item['message'])
+                self.message_queue.put_nowait(queue_item)
+
     async def is_active_server(self) -> bool:  # TODO add the ability to get the updated server location if server is locked in but not currently active
         """
         is_active_server checks if the name server knows of an active chat server
@@ -268,59 +659,51 @@ class Network_manager:
         Returns:
             bool: whether or not the name server knows of an active chat server
         """
-        reader, writer = await self.establish_connection(
-            ip=self.address_book['name_server']['ip'],
-            port=self.address_book['name_server']['port']
-            )
-        if reader is None or writer is None:
-            self.logger.error('Connection to name server Failed')
+        request_chat_server_message = self.create_message(
+                target='name_server',
+                command='Request Current Server Ip and Port',
+                content=''
+                )
+        if request_chat_server_message is None:
+            self.logger.error('no message to send')
             return False
         else:
-            self.logger.info('connections to name_server established')
-            request_chat_server_message = self.create_message(
-                    target='name_server',
-                    command='Request Current Server Ip and Port',
-                    content=''
-                    )
-            if request_chat_server_message is None:
-                self.logger.error('no message to send')
+            self.logger.info('requesting server ip and port from name server...')
+            parsed_response = await self.send_message(
+                message=request_chat_server_message,
+                address=self.address_book['name_server']
+                )  # request the current server ip and port from the established peer
+            if parsed_response is None:
+                self.logger.warning('invalid response')
                 return False
             else:
-                writer.write(
-                    request_chat_server_message.encode()
-                    )  # request the current server ip and port from the established peer
-                await writer.drain()
-                self.logger.info('requested server ip and port from name server awaiting response...')
-                parsed_response = await self.read_and_parse_response(reader)
-                if parsed_response is None:
-                    self.logger.warning('invalid response')
-                    return False
-                else:
-                    self.logger.info(f'Response: {parsed_response}')
-                    try:
-                        if parsed_response['sender'] == self.address_book['name_server']['name']:
-                            if parsed_response['content'] == 'no chat server':
-                                self.logger.info('No chat server established')
-                                return False
-                            elif parsed_response['command'] == 'server exists':
-                                self.logger.info('found established chat server')
-                                self.add_address(
-                                    name='chat_server',
-                                    ip=parsed_response['content']['ip'],
-                                    port=parsed_response['content']['port'],
-                                    public_key_e=0,  # unencrypted comms
-                                    public_key_n=0
-                                )
-                                return True
-                            else:
-                                self.logger.error('Establish peer returned invalid Response')
-                                return False
+                self.logger.info(f'Response: {parsed_response}')
+                try:
+                    if parsed_response['sender'] == self.address_book['name_server']['name']:
+                        if parsed_response['command'] == 'no chat server':
+                            self.logger.info('No chat server established')
+                            return False
+                        elif parsed_response['command'] == 'server exists':
+                            self.logger.info('found established chat server')
+                            # the name server assigns each client one of its chat servers
+                            self.chat_server_wanted = parsed_response['content'].get('more_servers_wanted', False)
+                            self.add_address(
+                                name='chat_server',
+                                ip=parsed_response['content']['ip'],
+                                port=parsed_response['content']['port'],
+                                public_key_e=0,  # unencrypted comms
+                                public_key_n=0
+                            )
+                            return True
                         else:
                             self.logger.error('Establish peer returned invalid Response')
                             return False
-                    except ValueError:
+                    else:
                         self.logger.error('Establish peer returned invalid Response')
                         return False
+                except ValueError:
+                    self.logger.error('Establish peer returned invalid Response')
+                    return False
 
     async def read_and_parse_response(self, reader) -> dict | None:
         """
@@ -333,13 +716,15 @@ class Network_manager:
             dict | None: the parsed response
         """
         try:
-            response = await reader.readuntil(self.message_separator)
+            response = await read_frame(reader=reader, max_frame_size=self.max_frame_size)
             parsed_response = self.parse_message(message=response)
             return parsed_response
         except ConnectionResetError as error:
             self.logger.error(error)
         except asyncio.exceptions.IncompleteReadError as error:
             self.logger.error(error)
+        except ValueError as error:
+            self.logger.error(error)
 
     def add_address(self, name: str, ip: str, port: int, public_key_n: int, public_key_e: int) -> None:
         """
@@ -352,52 +737,440 @@ class Network_manager:
             public_key_n (int): the n value of the public key of the address
             public_key_e (int): the e value of the public key of the address
         """
+        if self.__set_address(name=name, ip=ip, port=port, public_key_n=public_key_n, public_key_e=public_key_e):
+            self.__remote_addresses.discard(name)
+            self.logger.debug('Saving address book...')
+            self.save_address_book()
+            self.logger.debug('saved address book')
+            # sync contact data from chat server
+            self.logger.debug('Syncing contact data...')
+            self.add_message_to_queue('update address book', 'chat_server')
+
+    def add_client_address(self, name: str, address) -> bool:
+        """
+        add_client_address adds the address a client sent the chat server
+        a client can not replace the public key the address book already has for its name or leave its key out
+
+        Args:
+            name (str): the name of the client
+            address (any): the ip, port and public key of the client
+
+        Returns:
+            bool: whether or not the address was added
+        """
+        if (
+            name in LOCAL_ADDRESSES
+            or not isinstance(address, dict)
+            or not isinstance(address.get('ip'), str)
+            or not isinstance(address.get('port'), int)
+            or not isinstance(address.get('public_key_n'), int)
+            or not isinstance(address.get('public_key_e'), int)
+            or address['public_key_n'] == 0
+        ):
+            self.logger.error(f'Invalid address for {name}')
+            return False
+        known_public_key = self.get_known_public_key(name=name)
+        if known_public_key is not None and known_public_key != (address['public_key_n'], address['public_key_e']):
+            self.logger.warning(f'Ignoring address for {name} with a different public key')
+            return False
+        if self.is_public_key_of_another_name(
+                name=name,
+                public_key_n=address['public_key_n'],
+                public_key_e=address['public_key_e']
+                ):
+            return False
+        if self.__set_address(
+                name=name,
+                ip=address['ip'],
+                port=address['port'],
+                public_key_n=address['public_key_n'],
+                public_key_e=address['public_key_e']
+                ):
+            self.__remote_addresses.discard(name)
+            self.logger.debug('Saving address book...')
+            self.save_address_book()
+            self.logger.debug('saved address book')
+        return True
+
+    def remove_address_endpoint(self, name: str) -> None:
+        """
+        remove_address_endpoint clears the ip and port of an address that left, keeping its public key
+        so messages to it go through the chat server until it comes back
+
+        Args:
+            name (str): the name of the address
+        """
+        address = self.address_book.get(name)
+        if address is None or name in LOCAL_ADDRESSES:
+            return
+        if self.__set_address(
+                name=name,
+                ip='',
+                port=0,
+                public_key_n=address['public_key_n'],
+                public_key_e=address['public_key_e']
+                ):
+            self.__remote_addresses.add(name)
+            self.logger.debug('Saving address book...')
+            self.save_address_book()
+            self.logger.debug('saved address book')
+
+    def __set_address(self, name: str, ip: str, port: int, public_key_n: int, public_key_e: int) -> bool:
+        """
+        __set_address sets an address in the address book without saving, recording a new version if it changed
+
+        Args:
+            name (str): the name of the address
+            ip (str): the ip of the address
+            port (int): the port of the address
+            public_key_n (int): the n value of the public key of the address
+            public_key_e (int): the e value of the public key of the address
+
+        Returns:
+            bool: whether or not the address book changed
+        """
         if isinstance(name, str) and isinstance(ip, str) and isinstance(port, int):
-            if self.address_book.__contains__(name):
-                self.logger.info(f'Address book already contains {name} replacing data')
-            else:
-                self.logger.info(f'Address book does not already contain {name} creating new entry')
-            self.address_book[name] = {
+            address = {
                 'name': name,
                 'ip': ip,
                 'port': port,
                 'public_key_n': public_key_n,
                 'public_key_e': public_key_e
             }
+            if ip != '' and port != 0:
+                # the address was heard from again, at the same ip and port or a new one,
+                # so messages that gave up on it can be tried again
+                self.retry_dead_letters(target=name)
+            if self.address_book.__contains__(name):
+                if self.address_book[name] == address:
+                    self.logger.debug(f'Address book already contains {name} unchanged')
+                    return False
+                self.logger.info(f'Address book already contains {name} replacing data')
+            else:
+                self.logger.info(f'Address book does not already contain {name} creating new entry')
+            self.address_book[name] = address
+            self.__record_address_change(name=name)
             self.logger.debug(f'Successfully added address {name}')
+            return True
+        else:
+            self.logger.error('Invalid address data')
+            return False
+
+    def __record_address_change(self, name: str) -> None:
+        """
+        __record_address_change gives an address the next address book version
+        the local name_server and chat_server entries are not shared with clients so get no version
+
+        Args:
+            name (str): the name of the address that changed
+        """
+        if name in LOCAL_ADDRESSES:
+            return
+        self.address_book_version += 1
+        self.__address_versions[name] = self.address_book_version
+        self.__address_versions.move_to_end(name)
+        self.address_book_subscriptions.notify_changes()
+        self.chat_server_replication.notify_changes()
+
+    def get_address_book_changes(self, since: int, epoch: str | None = None) -> dict:
+        """
+        get_address_book_changes gets the addresses changed after a version
+        walks the changes newest first and stops at since so the work is proportional to the changes
+        a client with a different epoch has versions from another run so is sent every address
+
+        Args:
+            since (int): the version the client last synced to
+            epoch (str | None): the epoch the client last synced from, None if it has never synced. Defaults to None.
+
+        Returns:
+            dict: the epoch, the current version and the changed addresses by name
+        """
+        if epoch != self.address_book_epoch or not isinstance(since, int):
+            since = 0
+        addresses = {}
+        for name, version in reversed(self.__address_versions.items()):
+            if version <= since:
+                break
+            addresses[name] = self.address_book[name]
+        return {
+            'epoch': self.address_book_epoch,
+            'version': self.address_book_version,
+            'addresses': addresses
+        }
+
+    def is_valid_address_book_changes(self, changes) -> bool:
+        """
+        is_valid_address_book_changes checks that changes from the chat server are shaped like get_address_book_changes
+
+        Args:
+            changes (any): the content of the message
+
+        Returns:
+            bool: whether or not the changes can be applied
+        """
+        if (
+            not isinstance(changes, dict)
+            or not isinstance(changes.get('epoch'), str)
+            or not isinstance(changes.get('version'), int)
+            or not isinstance(changes.get('addresses'), dict)
+        ):
+            return False
+        for name, address in changes['addresses'].items():
+            if (
+                not isinstance(name, str)
+                or not isinstance(address, dict)
+                or not isinstance(address.get('ip'), str)
+                or not isinstance(address.get('port'), int)
+                or not isinstance(address.get('public_key_n'), int)
+                or not isinstance(address.get('public_key_e'), int)
+            ):
+                return False
+        return True
+
+    def apply_address_book_changes(self, changes: dict) -> bool:
+        """
+        apply_address_book_changes merges changes from get_address_book_changes on the chat server
+        saving once for all of them and remembering the version for the next sync
+        a change never replaces a public key the address book already has
+
+        Args:
+            changes (dict): the epoch, version and changed addresses by name
+
+        Returns:
+            bool: whether or not the changes were valid
+        """
+        if not self.is_valid_address_book_changes(changes=changes):
+            self.logger.error('Invalid address book changes')
+            return False
+        changed = False
+        for name, address in changes['addresses'].items():
+            if name in LOCAL_ADDRESSES:
+                continue
+            known_public_key = self.get_known_public_key(name=name)
+            if known_public_key is not None and known_public_key != (address['public_key_n'], address['public_key_e']):
+                self.logger.warning(f'Ignoring address book change to the public key of {name}')
+                continue
+            if self.__set_address(
+                    name=name,
+                    ip=address['ip'],
+                    port=address['port'],
+                    public_key_e=address['public_key_e'],
+                    public_key_n=address['public_key_n']
+                    ):
+                self.__remote_addresses.add(name)
+                changed = True
+        if changed:
             self.logger.debug('Saving address book...')
             self.save_address_book()
             self.logger.debug('saved address book')
-            # sync contact data from chat server
-            self.logger.debug('Syncing contact data...')
-            self.add_message_to_queue('update address book', 'chat_server')
+        if changes['epoch'] == self.synced_address_book_epoch:
+            # a push and a sync can cross so the version only moves forward
+            self.synced_address_book_version = max(self.synced_address_book_version, changes['version'])
         else:
-            self.logger.error('Invalid address data')
+            self.synced_address_book_epoch = changes['epoch']
+            self.synced_address_book_version = changes['version']
+        return True
+
+    def set_peer_chat_servers(self, chat_servers: list) -> None:
+        """
+        set_peer_chat_servers sets the other chat servers from the list the name server sends with each ping
+        so clients assigned to different chat servers can still find each other, a new chat server is sent
+        every address and then the changes made on this chat server, a chat server that is gone is dropped
+
+        Args:
+            chat_servers (list): the name, ip and port of every chat server
+        """
+        if self.chat_server_name is None:
+            return
+        peer_chat_servers = {}
+        for chat_server in chat_servers:
+            if (
+                isinstance(chat_server, dict)
+                and isinstance(chat_server.get('name'), str)
+                and isinstance(chat_server.get('ip'), str)
+                and isinstance(chat_server.get('port'), int)
+                and chat_server['name'] != self.chat_server_name
+            ):
+                peer_chat_servers[chat_server['name']] = {
+                    'name': chat_server['name'],
+                    'ip': chat_server['ip'],
+                    'port': chat_server['port']
+                }
+        for name, chat_server in list(self.peer_chat_servers.items()):
+            if peer_chat_servers.get(name) != chat_server:
+                self.logger.info(f'Stopped replicating the address book to {name}')
+                self.chat_server_replication.unsubscribe(name=name)
+        self.peer_chat_servers = peer_chat_servers
+        for name in peer_chat_servers:
+            # also subscribes a chat server again after it stopped acknowledging
+            if not self.chat_server_replication.__contains__(name):
+                self.logger.info(f'Replicating the address book to {name}')
+                self.chat_server_replication.subscribe(name=name, epoch=None, version=0)
+
+    def get_replicated_changes(self, since: int, epoch: str | None = None) -> dict:
+        """
+        get_replicated_changes gets the address book changes after a version made on this chat server
+        changes from another chat server are left out as every chat server sends its own changes to the others
+
+        Args:
+            since (int): the version the other chat server last got
+            epoch (str | None): the epoch it last got changes from, None if it has never had any. Defaults to None.
+
+        Returns:
+            dict: the epoch, the current version and the changed addresses by name
+        """
+        changes = self.get_address_book_changes(since=since, epoch=epoch)
+        changes['addresses'] = {
+            name: address for name, address in changes['addresses'].items()
+            if not self.__remote_addresses.__contains__(name)
+        }
+        return changes
+
+    async def push_to_chat_server(self, name: str, command: str, content: dict) -> bool:
+        """
+        push_to_chat_server sends the address book changes made on this chat server to another chat server
+        clients leaving are only pushed to the clients of their own chat server
+
+        Args:
+            name (str): the name of the other chat server
+            command (str): 'new client' or 'client left'
+            content (dict): the change
+
+        Returns:
+            bool: whether or not the other chat server acknowledged the change
+        """
+        if command != 'new client':
+            return True
+        chat_server = self.peer_chat_servers.get(name)
+        if chat_server is None:
+            return False
+        message = self.create_replication_message(content=content, request_id=str(next(self.__request_ids)))
+        parsed_acknowledgement = await self.send_message(message=message, address=chat_server)
+        return (
+            isinstance(parsed_acknowledgement, dict)
+            and parsed_acknowledgement.get('command') == 'address book replicated'
+        )
+
+    def create_replication_message(self, content: dict, request_id: str) -> str:
+        """
+        create_replication_message formats address book changes for another chat server, always unencrypted json
+        as chat servers have no keys
+
+        Args:
+            content (dict): the epoch, version and changed addresses by name
+            request_id (str): the request id of the message
+
+        Returns:
+            str: a formatted message
+        """
+        message = {
+            'command': 'replicate address book',
+            'content': content,
+            'sender': self.chat_server_name,
+            'request_id': request_id
+        }
+        return json.dumps(message)
+
+    def apply_replicated_changes(self, addresses: dict) -> None:
+        """
+        apply_replicated_changes merges the address book changes from another chat server
+        messages kept here for a client of the other chat server are delivered once it is heard from
+
+        Args:
+            addresses (dict): the changed addresses by name
+        """
+        changed = False
+        for name, address in addresses.items():
+            if name in LOCAL_ADDRESSES or not isinstance(address, dict):
+                continue
+            try:
+                if self.__set_address(
+                        name=name,
+                        ip=address['ip'],
+                        port=address['port'],
+                        public_key_e=address['public_key_e'],
+                        public_key_n=address['public_key_n']
+                        ):
+                    self.__remote_addresses.add(name)
+                    changed = True
+            except KeyError as error:
+                self.logger.error(f'Invalid replicated address {error}')
+                continue
+            if self.mailbox is not None and self.mailbox.__contains__(name):
+                self.__start_send_task(self.deliver_mailbox(name=name))
+        if changed:
+            self.logger.debug('Saving address book...')
+            self.save_address_book()
+            self.logger.debug('saved address book')
 
     def parse_message(self, message) -> dict:
         """
         parse_message parses messages into a dictionary so that they can be processed
+        accepts both the json and binary wire formats
 
         Args:
-            message (str): the message to be parsed
+            message (str | bytes): the message to be parsed
 
         Returns:
             dict: the parsed message
         """
-        parsed_message = json.loads(message)
+        binary = wire_format.is_binary_message(message=message)
+        if binary:
+            parsed_message = wire_format.decode_binary_message(message=message)
+        else:
+            parsed_message = json.loads(message)
         encrypted_message_content = parsed_message['content']
-        if [isinstance(i, int) for i in encrypted_message_content].count(False) > 0:
+        message_compression = parsed_message.get('compression')
+        if parsed_message.get('encryption') == 'session':
+            message_content = self.decrypt_session_content(
+                sender=parsed_message['sender'],
+                content=encrypted_message_content,
+                session=parsed_message['session'],
+                message_compression=message_compression
+                )
+        elif parsed_message.__contains__('encryption'):
+            message_content = self.decrypt_message_content(
+                private_key=self.app.backend.user_data.get_private_key_context(),
+                content=encrypted_message_content,
+                encryption=parsed_message['encryption'],
+                message_compression=message_compression
+                )
+        elif binary and message_compression is None:
             self.logger.info('Message unencrypted')
-            message_content = encrypted_message_content
+            message_content = encrypted_message_content  # binary messages carry the content as is
         else:
-            message_content = self.decrypt_message_content(
-                private_key_d=self.app.backend.user_data.get_private_key('d'),
-                private_key_n=self.app.backend.user_data.get_private_key('n'),
-                content=encrypted_message_content
+            self.logger.info('Message unencrypted')
+            message_content = self.load_message_content(
+                content=encrypted_message_content,
+                message_compression=message_compression
                 )
         parsed_message['content'] = message_content
         return parsed_message
 
+    def load_message_content(self, content, message_compression: str | None = None):
+        """
+        load_message_content loads unencrypted content which create_message formats as json
+        decompressing it first if the message is compressed
+
+        Args:
+            content (any): the content of the message
+            message_compression (str | None): the compression from the message, None if not compressed.
+                Defaults to None.
+
+        Returns:
+            any: the loaded content or the content unchanged if it is not json
+        """
+        if message_compression is not None:
+            content = self.decompress_message_content(content=content, message_compression=message_compression)
+            if isinstance(content, bytes):
+                return wire_format.decode_value(content)
+        if isinstance(content, str):
+            try:
+                return json.loads(content)
+            except json.JSONDecodeError:
+                return content
+        return content
+
     async def report_dead_chat_server(self) -> None:
         """
         report_dead_chat_server reports that the chat server is dead
@@ -411,11 +1184,10 @@ class Network_manager:
         if message is None:
             self.logger.error('No message to send')
         else:
-            response_reader = await self.send_message(
+            parsed_response = await self.send_message(
                 address=self.address_book['name_server'],
                 message=message
             )
-            parsed_response = await self.read_and_parse_response(response_reader)
             if parsed_response is None:
                 self.logger.warning('Invalid response')
             else:
@@ -427,8 +1199,10 @@ class Network_manager:
                     self.logger.debug('Saving address book...')
                     self.save_address_book()
                     self.logger.debug('saved address book')
-                    self.logger.info('Attempting to creat new chat server...')
-                    await self.create_chat_server()
+                    # the name server moves this client to another chat server if there is one
+                    if not await self.is_active_server():
+                        self.logger.info('Attempting to creat new chat server...')
+                        await self.create_chat_server()
                 else:
                     self.logger.info('Chat server not dead')
 
@@ -443,6 +1217,12 @@ class Network_manager:
         self.logger.info('Adding message to queue...')
         if content == 'update address book':
             self.message_queue.put_nowait(content)
+            self.logger.info('Address book update added to queue')
+            return
+        if self.dht is not None and not self.is_address_known(name=target):
+            self.logger.info(f'Looking up {target} before queuing message...')
+            self.__start_send_task(self.__add_message_to_queue_after_lookup(content=content, target=target))
+            return
         message = self.create_message(
             target=target,
             content=content,
@@ -455,161 +1235,1133 @@ class Network_manager:
         self.message_queue.put_nowait(queue_item)
         self.logger.info('Message added to queue')
 
-    async def send_messages_from_queue(self) -> None:
+    def add_group_message_to_queue(self, content, group: str, members: list[str]) -> bool:
         """
-        send_messages_from_queue sends messages from the message queue
-        runs on a separate thread to allow separation between the asynchronous network manager and the rest of the application
+        add_group_message_to_queue adds a group chat message to the message queue
+        it is sent once to the chat server which sends it on to every member
+        members without a public key are looked up in the dht first if it is running,
+        as a member added to a chat has no key until its address is found
+
+        Args:
+            content (dict): the content of the message
+            group (str): the name of the group
+            members (list[str]): the names of the members
+
+        Returns:
+            bool: whether or not every member can be sent to,
+                False if a member has no public key and can not be looked up
         """
-        running = True
-        while running:
-            try:
-                self.logger.info('Awaiting message from queue...')
-                message = await self.message_queue.get()
-            except Exception as e:
-                self.logger.error(f'Failed to get message from queue {e}')
-            try:
-                if message == 'update address book':
-                    await self.get_address_book()
-                    continue
-                else:
-                    self.logger.info('Found message in queue...')
-                    acknowledgement = await self.send_message(
-                        message=message['message'],
-                        address=self.address_book[message['target']]
-                        )
-                    parsed_acknowledgement = self.parse_message(message=acknowledgement)
-                    if isinstance(parsed_acknowledgement, dict):
-                        if parsed_acknowledgement['command'] == 'message sent':
-                            self.logger.info('Message sent')
-                            continue  # skips message failure
-                    # message failure
-                    self.add_message_to_queue(
-                        content=message['message'],
-                        target=message['target']
-                        )
-                    self.app.GUI.chat_screen.failed_to_send_message()
-                    self.logger.error('Failed to send message')
-            except Exception as e:
-                self.logger.error(f'Encountered error: {e}')
-                # TODO determine if the above code is necessary
-                self.app.GUI.chat_screen.failed_to_send_message()
-                self.logger.error('Failed to send message')
+        self.logger.info('Adding group message to queue...')
+        missing = self.get_members_without_public_key(members=members)
+        if len(missing) > 0 and self.dht is not None:
+            self.logger.info(f'Looking up {", ".join(missing)} before queuing group message...')
+            self.__start_send_task(self.__add_group_message_to_queue_after_lookup(
+                content=content,
+                group=group,
+                members=members,
+                missing=missing
+                ))
+            return True
+        return self.__queue_group_message(content=content, group=group, members=members)
 
-    async def send_message(self, message: str, address: dict) -> dict | None:  # TODO pull from a queue
+    async def __add_group_message_to_queue_after_lookup(
+            self,
+            content,
+            group: str,
+            members: list[str],
+            missing: list[str]
+            ) -> None:
         """
-        send_message sends a message to a specific address
+        __add_group_message_to_queue_after_lookup looks up the members without a public key in the dht
+        then queues the group message, failing the send if any member still has no public key
 
         Args:
-            message (str): the message to be sent, in json format usually
-            address (dict): the name of the address to send the message to
-
-        Returns:
-            dict | None: a parsed response from the receiver
+            content (dict): the content of the message
+            group (str): the name of the group
+            members (list[str]): the names of the members
+            missing (list[str]): the members without a public key
         """
-        self.logger.info('Sending message...')
-        reader, writer = await self.establish_connection(ip=address['ip'], port=address['port'])
-        if reader is None or writer is None:
-            self.logger.error('Connection Failed')
-        else:
-            writer.write(message.encode())
-            await writer.drain()
-            response: bytes = await reader.readuntil(separator=self.message_separator)
-            self.logger.info('Successfully sent message')
-            parsed_response = self.parse_message(message=response)
-            return parsed_response
+        await asyncio.gather(*[self.lookup_address(name=member) for member in missing])
+        if not self.__queue_group_message(content=content, group=group, members=members):
+            self.app.GUI.chat_screen.failed_to_send_message()
 
-    async def get_address_book(self) -> None:
+    def __queue_group_message(self, content, group: str, members: list[str]) -> bool:
         """
-        get_address_book updates the address book from the chat server
+        __queue_group_message creates a group chat message and adds it to the message queue
+
+        Args:
+            content (dict): the content of the message
+            group (str): the name of the group
+            members (list[str]): the names of the members
+
+        Returns:
+            bool: whether or not the message was queued for every member
         """
-        self.logger.info('Updating address book...')
-        message = self.create_message(
-                target='chat_server',
-                command='requesting address book',
-                content=''
-                )
+        message = self.create_group_message(content=content, group=group, members=members)
         if message is None:
             self.logger.error('no message to send')
-        else:
-            response = await self.send_message(
-                message=message,
-                address=self.address_book['chat_server']
-            )
-            parsed_message = self.parse_message(message=response)
-            if parsed_message is None:
-                self.logger.error('Failed to get address book')
-                self.logger.debug('Assuming that the chat server is dead')
-                await self.report_dead_chat_server()
-            elif isinstance(parsed_message, dict):
-                for key in parsed_message['content']:
-                    self.add_address(
-                        name=key,
-                        ip=parsed_message['content'][key]['ip'],
-                        port=parsed_message['content'][key]['port'],
-                        public_key_e=parsed_message['content'][key]['public_key_e'],
-                        public_key_n=parsed_message['content'][key]['public_key_n']
-                        )
-            self.logger.info('Address book updated')
+            return False
+        queue_item = {
+            'message': message,
+            'target': 'chat_server'
+        }
+        self.message_queue.put_nowait(queue_item)
+        self.logger.info('Group message added to queue')
+        return len(self.get_members_without_public_key(members=members)) == 0
 
-    async def establish_connection(self, ip, port) -> tuple[asyncio.StreamReader | None, asyncio.StreamWriter | None]:
+    def get_members_without_public_key(self, members: list[str]) -> list[str]:
         """
-        establish_connection establishes a connection to a specific address
+        get_members_without_public_key gets the members of a group that can not be sent to securely
 
         Args:
-            ip (str): the ip of the address
-            port (int): the port of the address
+            members (list[str]): the names of the members
 
         Returns:
-            tuple[asyncio.StreamReader | None, asyncio.StreamWriter | None]: a stream reader and writer if connection was successful else None
+            list[str]: the members, other than this peer, with no public key in the address book
         """
-        self.logger.info('Connecting...')
-        reader, writer = None, None
-        try:
-            reader, writer = await asyncio.open_connection(ip, port)
-            self.logger.info('Connected')
-            return reader, writer
+        own_name = self.own_address.get('name')
+        missing = []
+        for member in dict.fromkeys(members):
+            if member == own_name:
+                continue
+            address = self.address_book.get(member)
+            if address is None or (address['public_key_n'] == 0 and address['public_key_e'] == 0):
+                missing.append(member)
+        return missing
+
+    async def __add_message_to_queue_after_lookup(self, content, target: str) -> None:
+        """
+        __add_message_to_queue_after_lookup looks up the address of target in the dht then queues the message
+
+        Args:
+            content (str): the content of the message
+            target (str): the target of the message
+        """
+        if await self.lookup_address(name=target) is None:
+            self.logger.warning(f'{target} not found in dht')
+        message = self.create_message(target=target, content=content, command='message')
+        self.message_queue.put_nowait({'message': message, 'target': target})
+
+    async def start_lan_discovery(self) -> None:
+        """
+        start_lan_discovery starts announcing this peer on the local network and adding the peers and servers heard
+        waits up to lan_discovery_timeout for the name server if its ip has not been set
+        """
+        self.logger.info('Starting lan discovery...')
+        self.lan_discovery = Lan_discovery(
+            announcements=self.get_lan_announcements(),
+            on_discovered=self.add_discovered_address
+            )
+        try:
+            await self.lan_discovery.start()
+        except OSError as error:
+            self.logger.error(f'Lan discovery unavailable: {error}')
+            self.lan_discovery = None
+            return
+        if self.address_book['name_server']['ip'] == NAME_SERVER_PLACEHOLDER_IP:
+            await self.lan_discovery.wait_for(role='name_server', timeout=self.lan_discovery_timeout)
+
+    def get_lan_announcements(self, chat_server_port: int | None = None) -> list[dict]:
+        """
+        get_lan_announcements gets what this peer announces on the local network
+
+        Args:
+            chat_server_port (int | None): the port of the chat server this peer hosts, None if it hosts none.
+                Defaults to None.
+
+        Returns:
+            list[dict]: the name, role, port and public key of this peer and its chat server
+        """
+        announcements = [{
+            'name': self.own_address['name'],
+            'role': 'peer',
+            'port': self.own_address['port'],
+            'public_key_n': self.own_address['public_key_n'],
+            'public_key_e': self.own_address['public_key_e']
+        }]
+        if chat_server_port is not None:
+            announcements.append({
+                'name': f'{self.own_address["name"]}-server',
+                'role': 'chat_server',
+                'port': chat_server_port,
+                'public_key_n': 0,  # unencrypted comms
+                'public_key_e': 0
+            })
+        return announcements
+
+    def add_discovered_address(self, address: dict) -> None:
+        """
+        add_discovered_address adds an address heard on the local network to the address book
+        a discovered name server replaces the placeholder but not an ip set by the user
+        and a discovered chat server is only used until the name server assigns one
+        a discovered peer must have a public key and only changes the address of a name in the address book
+        if it has the same public key, or the name has none yet, as anyone on the network can announce any name
+
+        Args:
+            address (dict): the name, role, ip, port and public key from Lan_discovery
+        """
+        match address['role']:
+            case 'peer':
+                if address['name'] in LOCAL_ADDRESSES or address['name'] == self.own_address.get('name'):
+                    return
+                name = address['name']
+                if address['public_key_n'] == 0:
+                    self.logger.warning(f'Ignored lan announcement for {name} without a public key')
+                    return
+                # a contact added from a chat has a public key of 0 until one is found for it
+                known_public_key = self.get_known_public_key(name=name)
+                public_key = (address['public_key_n'], address['public_key_e'])
+                if known_public_key is not None and known_public_key != public_key:
+                    self.logger.warning(f'Ignored lan announcement for {name} with a different public key')
+                    return
+                if self.is_public_key_of_another_name(
+                        name=name,
+                        public_key_n=public_key[0],
+                        public_key_e=public_key[1]
+                        ):
+                    return
+            case 'name_server':
+                if (
+                    self.address_book.__contains__('name_server')
+                    and self.address_book['name_server']['ip'] != NAME_SERVER_PLACEHOLDER_IP
+                ):
+                    return
+                name = 'name_server'
+            case 'chat_server':
+                if self.is_address_known(name='chat_server'):
+                    return
+                name = 'chat_server'
+            case _:
+                return
+        self.add_address(
+            name=name,
+            ip=address['ip'],
+            port=address['port'],
+            public_key_n=address['public_key_n'],
+            public_key_e=address['public_key_e']
+            )
+
+    def is_address_known(self, name: str) -> bool:
+        """
+        is_address_known checks if the address book has somewhere to reach a name
+        contacts added from a chat have no ip or port until their address is found
+
+        Args:
+            name (str): the name of the address
+
+        Returns:
+            bool: whether or not the address has an ip and port
+        """
+        address = self.address_book.get(name)
+        return address is not None and address['ip'] != '' and address['port'] != 0
+
+    def get_known_public_key(self, name: str) -> tuple[int, int] | None:
+        """
+        get_known_public_key gets the public key the address book has for a name so dht records can not replace it
+
+        Args:
+            name (str): the name of the address
+
+        Returns:
+            tuple[int, int] | None: the public key n and e or None if the name has no public key
+        """
+        address = self.address_book.get(name)
+        if address is None or address['public_key_n'] == 0:
+            return None
+        return address['public_key_n'], address['public_key_e']
+
+    def is_public_key_of_another_name(self, name: str, public_key_n: int, public_key_e: int) -> bool:
+        """
+        is_public_key_of_another_name checks if a public key claimed for a name already belongs to another name
+        so a peer can not announce or publish itself under a second name with the same key
+
+        Args:
+            name (str): the name the public key is claimed for
+            public_key_n (int): the public key n
+            public_key_e (int): the public key e
+
+        Returns:
+            bool: whether or not the address book has the public key for another name
+        """
+        owner = self.address_book.get_name_by_public_key(public_key_n=public_key_n, public_key_e=public_key_e)
+        if owner is None or owner == name:
+            return False
+        self.logger.warning(f'Ignored public key claimed for {name} that belongs to {owner}')
+        return True
+
+    async def start_dht(self) -> bool:
+        """
+        start_dht joins the dht through the bootstrap and known addresses, publishes the own address
+        and starts republishing it
+
+        Returns:
+            bool: whether or not any peer answered
+        """
+        self.logger.info('Starting dht...')
+        own_contact = {'name': self.own_address['name'], 'ip': self.own_address['ip'], 'port': self.own_address['port']}
+        private_key = self.app.backend.user_data.get_private_key_context()
+        self.dht = Dht_node(
+            own_contact=own_contact,
+            rpc=self.dht_rpc,
+            sign=private_key.decrypt,
+            get_public_key=self.get_known_public_key
+            )
+        contacts = list(self.dht_bootstrap_addresses) + [
+            {'name': name, 'ip': address['ip'], 'port': address['port']}
+            for name, address in self.address_book.items()
+            if name not in LOCAL_ADDRESSES and self.is_address_known(name=name)
+        ]
+        joined = await self.dht.bootstrap(contacts=contacts)
+        await self.dht.publish_own_record(
+            public_key_n=self.own_address['public_key_n'],
+            public_key_e=self.own_address['public_key_e']
+            )
+        self.dht_task = asyncio.create_task(self.dht.run_republish())
+        return joined
+
+    async def lookup_address(self, name: str) -> dict | None:
+        """
+        lookup_address gets an address from the address book or, if it is not known, from the dht
+        only the ip and port of a name with a public key in the address book are taken from the dht,
+        and only from a record with that public key
+
+        Args:
+            name (str): the name of the address
+
+        Returns:
+            dict | None: the address or None if it could not be found
+        """
+        if self.is_address_known(name=name):
+            return self.address_book[name]
+        if self.dht is None:
+            return None
+        record = await self.dht.find_record(name=name)
+        if record is None:
+            return None
+        if not is_valid_record(record=record, get_public_key=self.get_known_public_key):
+            self.logger.warning(f'Rejected dht record for {name} that is unsigned or has a different public key')
+            return None
+        if self.is_public_key_of_another_name(
+                name=name,
+                public_key_n=record['public_key_n'],
+                public_key_e=record['public_key_e']
+                ):
+            return None
+        address = self.address_book.get(name, record)
+        if address['public_key_n'] == 0:
+            address = record  # a contact added from a chat has no public key until it is found
+        self.add_address(
+            name=name,
+            ip=record['ip'],
+            port=record['port'],
+            public_key_n=address['public_key_n'],
+            public_key_e=address['public_key_e']
+            )
+        return self.address_book[name]
+
+    async def dht_rpc(self, contact: dict, command: str, content: dict) -> dict | None:
+        """
+        dht_rpc sends a dht request to a peers client listener
+
+        Args:
+            contact (dict): the name, ip and port of the peer
+            command (str): the dht command
+            content (dict): the content of the request
+
+        Returns:
+            dict | None: the content of the reply or None if the peer did not answer
+        """
+        message = self.create_dht_message(command=command, content=content, request_id=str(next(self.__request_ids)))
+        try:
+            parsed_response = await self.send_message(message=message, address=contact)
+        except (ValueError, KeyError) as error:
+            self.logger.error(error)
+            return None
+        if (
+            parsed_response is None
+            or parsed_response.get('command') != 'dht reply'
+            or not isinstance(parsed_response.get('content'), dict)
+        ):
+            return None
+        return parsed_response['content']
+
+    def create_dht_message(self, command: str, content: dict, request_id: str | None) -> str:
+        """
+        create_dht_message formats a dht message, always unencrypted json as dht peers may not be in the address book
+        records are public and signed so do not need encrypting
+
+        Args:
+            command (str): the dht command or 'dht reply'
+            content (dict): the content of the message
+            request_id (str | None): the request id of the message
+
+        Returns:
+            str: a formatted message
+        """
+        message = {
+            'command': command,
+            'content': content,
+            'sender': self.own_address.get('name'),
+            'contact': {
+                'name': self.own_address.get('name'),
+                'ip': self.own_address.get('ip'),
+                'port': self.own_address.get('port')
+            },
+            'request_id': request_id
+        }
+        return json.dumps(message)
+
+    async def send_messages_from_queue(self) -> None:
+        """
+        send_messages_from_queue sends messages from the message queue
+        runs on a separate thread to allow separation between the asynchronous network manager and the rest of the application
+        takes everything queued up to queue_batch_size at once and groups it by target,
+        each group is written back to back on the shared connection and acknowledged by its own task
+        so a backlog clears in one round trip and the next batch does not wait for acknowledgements
+        """
+        running = True
+        while running:
+            self.logger.info('Awaiting message from queue...')
+            batch = [await self.message_queue.get()]
+            while len(batch) < self.queue_batch_size and not self.message_queue.empty():
+                batch.append(self.message_queue.get_nowait())
+            self.logger.info(f'Found {len(batch)} messages in queue...')
+            update_address_book = False
+            batches: dict[str, list[dict]] = {}
+            for queue_item in batch:
+                if queue_item == 'update address book':
+                    update_address_book = True
+                else:
+                    batches.setdefault(queue_item['target'], []).append(queue_item)
+            if update_address_book:
+                # any number of queued updates only need one refresh
+                self.__start_send_task(self.get_address_book())
+            for target, queue_items in batches.items():
+                self.__start_send_task(self.send_batch(target=target, queue_items=queue_items))
+
+    def __start_send_task(self, coroutine) -> None:
+        """
+        __start_send_task runs a coroutine from the message queue as a task that is cancelled on shutdown
+
+        Args:
+            coroutine (Coroutine): the coroutine to run
+        """
+        task = asyncio.create_task(coroutine)
+        self.__send_tasks.add(task)
+        task.add_done_callback(self.__send_task_done)
+
+    def __send_task_done(self, task: asyncio.Task) -> None:
+        """
+        __send_task_done forgets a finished send task and logs any error it raised
+
+        Args:
+            task (asyncio.Task): the finished task
+        """
+        self.__send_tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            self.logger.error(f'Encountered error: {task.exception()}')
+
+    async def send_batch(self, target: str, queue_items: list[dict]) -> None:
+        """
+        send_batch sends queued messages for one target without waiting for each acknowledgement in turn
+
+        Args:
+            target (str): the target of the messages
+            queue_items (list[dict]): the queued messages in the order they were queued
+        """
+        self.logger.info(f'Sending {len(queue_items)} messages to {target}...')
+        await asyncio.gather(*[self.send_queue_item(queue_item=queue_item) for queue_item in queue_items])
+
+    async def send_queue_item(self, queue_item: dict) -> None:
+        """
+        send_queue_item sends a queued message once fewer than max_in_flight_per_peer are waiting on its target
+        if it is not acknowledged it is retried after a backoff or, once out of attempts, kept as a dead letter
+
+        Args:
+            queue_item (dict): the queued message and its target
+        """
+        target = queue_item['target']
+        if not self.__peer_semaphores.__contains__(target):
+            self.__peer_semaphores[target] = asyncio.Semaphore(self.max_in_flight_per_peer)
+        async with self.__peer_semaphores[target]:
+            try:
+                if await self.deliver_message(target=target, message=queue_item['message']):
+                    self.logger.info('Message sent')
+                    # target is reachable again so messages that gave up on it are sent after this one
+                    self.retry_dead_letters(target=target)
+                    return  # skips message failure
+            except Exception as e:
+                self.logger.error(f'Encountered error: {e}')
+        # message failure
+        self.logger.error('Failed to send message')
+        if not self.retry_scheduler.schedule(queue_item=queue_item):
+            self.add_dead_letter(queue_item=queue_item)
+            self.app.GUI.chat_screen.failed_to_send_message()
+
+    async def deliver_message(self, target: str, message: str | bytes) -> bool:
+        """
+        deliver_message sends a message to a peer directly or relayed through the chat server
+        trying the path that last worked first and remembering which path was acknowledged
+
+        Args:
+            target (str): the name of the peer
+            message (str | bytes): the message, from create_message for target
+
+        Returns:
+            bool: whether or not the message was acknowledged
+        """
+        delivery_path = self.__delivery_paths.setdefault(target, {'path': 'direct', 'direct_failed_time': None})
+        for path in self.get_delivery_paths(target=target):
+            if path == 'direct':
+                parsed_acknowledgement = await self.send_message(message=message, address=self.address_book[target])
+            else:
+                parsed_acknowledgement = await self.relay_message(target=target, message=message)
+            if (
+                isinstance(parsed_acknowledgement, dict)
+                and parsed_acknowledgement.get('command') in ['message sent', 'message stored']
+            ):
+                if parsed_acknowledgement['command'] == 'message stored':
+                    self.logger.info(f'{target} is offline, message kept by the chat server')
+                delivery_path['path'] = path
+                if path == 'direct':
+                    delivery_path['direct_failed_time'] = None
+                return True
+            if path == 'direct':
+                delivery_path['direct_failed_time'] = time.monotonic()
+            self.logger.info(f'{path} delivery to {target} failed')
+        return False
+
+    def get_delivery_paths(self, target: str) -> list[str]:
+        """
+        get_delivery_paths gets the order to try the delivery paths to a peer in
+        direct needs an ip and port for the peer, relay needs a chat server that is not the peer
+        a peer last reached through the relay is tried directly first again once direct_retry_interval has passed
+
+        Args:
+            target (str): the name of the peer
+
+        Returns:
+            list[str]: 'direct' and 'relay' in the order to try them
+        """
+        paths = []
+        if self.is_address_known(name=target):
+            paths.append('direct')
+        if target not in LOCAL_ADDRESSES and self.is_address_known(name='chat_server'):
+            paths.append('relay')
+        delivery_path = self.__delivery_paths.get(target)
+        if delivery_path is not None and delivery_path['path'] == 'relay' and len(paths) == 2:
+            direct_failed_time = delivery_path['direct_failed_time']
+            if direct_failed_time is not None and time.monotonic() - direct_failed_time < self.direct_retry_interval:
+                paths.reverse()
+        return paths
+
+    async def relay_message(self, target: str, message: str | bytes) -> dict | None:
+        """
+        relay_message asks the chat server to forward a message to a peer
+        the message stays encrypted for the peer so the chat server can not read it
+
+        Args:
+            target (str): the name of the peer
+            message (str | bytes): the message, from create_message for target
+
+        Returns:
+            dict | None: the parsed acknowledgement from the chat server
+        """
+        binary = isinstance(message, bytes)
+        relay_message = self.create_message(
+            target='chat_server',
+            content={
+                'target': target,
+                'message': base64.b64encode(message).decode('ascii') if binary else message,
+                'binary': binary
+            },
+            command='relay message'
+            )
+        if relay_message is None:
+            self.logger.error('no message to send')
+            return None
+        return await self.send_message(message=relay_message, address=self.address_book['chat_server'])
+
+    async def forward_relayed_message(self, writer, message: dict, wire_version: int) -> None:
+        """
+        forward_relayed_message forwards a message relayed through the chat server to its target
+        and replies 'message sent' once the target acknowledges it
+        if the target can not be reached or has kept messages waiting the message is kept in its mailbox
+        and 'message stored' is replied, so the sender is done in one round trip either way
+        kept messages waiting are then delivered if the target can be reached, so a failed delivery is retried
+
+        Args:
+            writer (asyncio.streams.StreamWriter): allows writing to the network stream of the sender
+            message (dict): the parsed 'relay message' request
+            wire_version (int): the wire format agreed on the connection
+        """
+        command = 'relay failed'
+        content = message['content']
+        if (
+            isinstance(content, dict)
+            and isinstance(content.get('target'), str)
+            and isinstance(content.get('message'), str)
+            and self.address_book.__contains__(content['target'])
+            and content['target'] not in LOCAL_ADDRESSES
+        ):
+            target = content['target']
+            try:
+                relayed_message = base64.b64decode(content['message']) if content.get('binary') else content['message']
+                # the request id was numbered by the sender so may already be in use on the connection to the target
+                relayed_message = wire_format.set_request_id(
+                    message=relayed_message,
+                    request_id=str(next(self.__request_ids))
+                    )
+            except ValueError as error:
+                self.logger.error(error)
+            else:
+                mailbox = self.get_mailbox()
+                held = mailbox.__contains__(target)
+                if self.is_address_known(name=target) and not held:
+                    parsed_acknowledgement = await self.send_message(
+                        message=relayed_message,
+                        address=self.address_book[target]
+                        )
+                    if (
+                        isinstance(parsed_acknowledgement, dict)
+                        and parsed_acknowledgement.get('command') == 'message sent'
+                    ):
+                        command = 'message sent'
+                if command != 'message sent' and await asyncio.to_thread(
+                    mailbox.store,
+                    recipient=target,
+                    message=relayed_message
+                ):
+                    # kept behind any earlier messages so the target gets them in order
+                    command = 'message stored'
+                    if held:
+                        self.__start_send_task(self.deliver_mailbox(name=target))
+        else:
+            self.logger.error('Invalid relay message')
+        response = self.create_acknowledgement(
+            command=command,
+            request_id=message.get('request_id'),
+            wire_version=wire_version
+            )
+        writer.write(encode_frame(response))
+        await writer.drain()
+
+    def get_mailbox(self) -> Mailbox:
+        """
+        get_mailbox gets the mailbox of the chat server, loading it from mailbox_path the first time
+
+        Returns:
+            Mailbox: the messages kept for offline peers
+        """
+        if self.mailbox is None:
+            self.mailbox = Mailbox(directory=self.mailbox_path)
+        return self.mailbox
+
+    async def deliver_mailbox(self, name: str) -> bool:
+        """
+        deliver_mailbox sends the messages kept for a peer that has come back
+        in as few 'mailbox' messages as fit in a frame
+        they are only removed once every batch is acknowledged so a peer may get a batch twice but never loses one
+        the segments are read and removed in a thread so the event loop keeps serving other peers meanwhile
+
+        Args:
+            name (str): the name of the peer
+
+        Returns:
+            bool: whether or not every kept message was delivered
+        """
+        mailbox = self.get_mailbox()
+        if name in self.__draining_mailboxes or not mailbox.__contains__(name) or not self.is_address_known(name=name):
+            return False
+        self.__draining_mailboxes.add(name)
+        try:
+            messages, last_segment = await asyncio.to_thread(mailbox.read, recipient=name)
+            self.logger.info(f'Delivering {len(messages)} kept messages to {name}...')
+            batch: list[dict] = []
+            batch_size = 0
+            batches = [batch]
+            for kept_message in messages:
+                binary = isinstance(kept_message, bytes)
+                item = {
+                    'message': base64.b64encode(kept_message).decode('ascii') if binary else kept_message,
+                    'binary': binary
+                }
+                item_size = len(item['message'])
+                if len(batch) > 0 and batch_size + item_size > self.max_frame_size // 2:
+                    batch = []
+                    batch_size = 0
+                    batches.append(batch)
+                batch.append(item)
+                batch_size += item_size
+            for batch in batches:
+                mailbox_message = self.create_mailbox_message(messages=batch, request_id=str(next(self.__request_ids)))
+                parsed_acknowledgement = await self.send_message(
+                    message=mailbox_message,
+                    address=self.address_book[name]
+                    )
+                if (
+                    not isinstance(parsed_acknowledgement, dict)
+                    or parsed_acknowledgement.get('command') != 'mailbox received'
+                ):
+                    self.logger.warning(f'{name} did not acknowledge kept messages')
+                    return False
+            await asyncio.to_thread(mailbox.remove, recipient=name, last_segment=last_segment)
+            self.logger.info(f'Delivered kept messages to {name}')
+        finally:
+            self.__draining_mailboxes.discard(name)
+        if mailbox.__contains__(name):
+            # messages kept while these were being delivered
+            self.__start_send_task(self.deliver_mailbox(name=name))
+        return True
+
+    def create_mailbox_message(self, messages: list[dict], request_id: str) -> str:
+        """
+        create_mailbox_message formats a batch of kept messages, always unencrypted json
+        as each kept message is still encrypted for the peer
+
+        Args:
+            messages (list[dict]): the kept messages, base64 encoded if binary
+            request_id (str): the request id of the message
+
+        Returns:
+            str: a formatted message
+        """
+        message = {
+            'command': 'mailbox',
+            'content': {'messages': messages},
+            'sender': self.own_address.get('name'),
+            'request_id': request_id
+        }
+        return json.dumps(message)
+
+    def handle_mailbox_message(self, message: dict) -> None:
+        """
+        handle_mailbox_message handles each chat message in a batch kept by the chat server while this peer was offline
+
+        Args:
+            message (dict): the parsed 'mailbox' message
+        """
+        content = message['content']
+        if not isinstance(content, dict) or not isinstance(content.get('messages'), list):
+            self.logger.error('Invalid mailbox message')
+            return
+        self.logger.info(f'Received {len(content["messages"])} messages kept while offline')
+        for item in content['messages']:
+            try:
+                kept_message = base64.b64decode(item['message']) if item.get('binary') else item['message']
+                kept_message = self.parse_message(kept_message)
+            except (ValueError, KeyError, TypeError) as error:
+                self.logger.error(f'Invalid kept message: {error}')
+                continue
+            if kept_message.get('command') == 'message':
+                self.handle_chat_message(kept_message)
+            elif kept_message.get('command') == 'group message':
+                self.handle_group_message(kept_message)
+
+    async def send_message(self, message: str | bytes, address: dict) -> dict | None:  # TODO pull from a queue
+        """
+        send_message sends a message to a specific address and waits for the reply with the same request id
+        the connection to the address is shared so other requests can be in flight at the same time
+        reconnects once if a pooled connection was closed while idle
+
+        Args:
+            message (str | bytes): the message to be sent, from create_message
+            address (dict): the name of the address to send the message to
+
+        Returns:
+            dict | None: a parsed response from the receiver
+        """
+        self.logger.info('Sending message...')
+        ip, port = address['ip'], address['port']
+        request_id = wire_format.get_request_id(message=message)
+        for attempt in range(2):
+            connection, reused = await self.connection_pool.acquire(ip=ip, port=port)
+            if connection is None:
+                self.logger.error('Connection Failed')
+                return None
+            try:
+                response = await connection.request(
+                    message=message, request_id=request_id, timeout=self.response_timeout
+                    )
+                break
+            except ConnectionError as error:
+                await self.connection_pool.discard(ip=ip, port=port, connection=connection)
+                if not reused or attempt > 0:
+                    self.logger.error(error)
+                    return None
+                # the peer closed the pooled connection while it was idle so retry once on a new one
+                self.logger.info('Pooled connection closed reconnecting...')
+            except asyncio.TimeoutError:
+                self.logger.error('Timed out waiting for response')
+                return None
+        self.logger.info('Successfully sent message')
+        parsed_response = self.parse_message(message=response)
+        return parsed_response
+
+    async def get_address_book(self) -> None:
+        """
+        get_address_book updates the address book with the changes on the chat server since the last sync
+        """
+        self.logger.info('Updating address book...')
+        message = self.create_message(
+                target='chat_server',
+                command='requesting address book',
+                content={'epoch': self.synced_address_book_epoch, 'since': self.synced_address_book_version}
+                )
+        if message is None:
+            self.logger.error('no message to send')
+        else:
+            parsed_message = await self.send_message(
+                message=message,
+                address=self.address_book['chat_server']
+            )
+            if parsed_message is None:
+                self.logger.error('Failed to get address book')
+                self.logger.debug('Assuming that the chat server is dead')
+                await self.report_dead_chat_server()
+            elif self.apply_address_book_changes(changes=parsed_message['content']):
+                self.logger.info(f'Address book updated with {len(parsed_message["content"]["addresses"])} changes')
+
+    async def subscribe_address_book(self) -> bool:
+        """
+        subscribe_address_book syncs the address book from the chat server and subscribes to changes
+        the chat server then pushes changes to client_listener so polling is only needed if this fails
+
+        Returns:
+            bool: whether or not the subscription was accepted
+        """
+        self.logger.info('Subscribing to address book...')
+        message = self.create_message(
+                target='chat_server',
+                command='subscribe address book',
+                content={
+                    'epoch': self.synced_address_book_epoch,
+                    'since': self.synced_address_book_version,
+                    # the chat server may not know this client yet so can not reply to it without its address
+                    'address': {
+                        'ip': self.own_address.get('ip'),
+                        'port': self.own_address.get('port'),
+                        'public_key_n': self.own_address.get('public_key_n'),
+                        'public_key_e': self.own_address.get('public_key_e')
+                    }
+                }
+                )
+        if message is None:
+            self.logger.error('no message to send')
+            return False
+        parsed_message = await self.send_message(
+            message=message,
+            address=self.address_book['chat_server']
+        )
+        if parsed_message is None or not isinstance(parsed_message['content'], dict):
+            self.logger.error('Failed to subscribe to address book')
+            self.add_message_to_queue('update address book', 'chat_server')
+            return False
+        self.apply_address_book_changes(changes=parsed_message['content'])
+        self.logger.info('Subscribed to address book')
+        return True
+
+    async def unsubscribe_address_book(self) -> None:
+        """
+        unsubscribe_address_book tells the chat server to stop pushing changes so other clients hear this one left
+        """
+        if self.address_book.__contains__('chat_server') and len(self.connection_pool) > 0:
+            message = self.create_message(
+                target='chat_server',
+                command='unsubscribe address book',
+                content=''
+                )
+            if message is not None:
+                await self.send_message(message=message, address=self.address_book['chat_server'])
+
+    async def push_to_subscriber(self, name: str, command: str, content: dict) -> bool:
+        """
+        push_to_subscriber sends an address book change from the chat server to a subscriber
+
+        Args:
+            name (str): the name of the subscriber
+            command (str): 'new client' or 'client left'
+            content (dict): the change
+
+        Returns:
+            bool: whether or not the subscriber acknowledged the change
+        """
+        message = self.create_message(target=name, command=command, content=content)
+        if message is None:
+            return False
+        parsed_response = await self.send_message(message=message, address=self.address_book[name])
+        return parsed_response is not None
+
+    async def establish_connection(self, ip, port) -> tuple[asyncio.StreamReader | None, asyncio.StreamWriter | None]:
+        """
+        establish_connection establishes a connection to a specific address
+
+        Args:
+            ip (str): the ip of the address
+            port (int): the port of the address
+
+        Returns:
+            tuple[asyncio.StreamReader | None, asyncio.StreamWriter | None]: a stream reader and writer if connection was successful else None
+        """
+        self.logger.info('Connecting...')
+        reader, writer = None, None
+        try:
+            reader, writer = await asyncio.open_connection(ip, port)
+            self.logger.info('Connected')
+            return reader, writer
         except ConnectionRefusedError as error:
             self.logger.error(error)
         except OSError as error:
             self.logger.error(error)
         return reader, writer
 
-    def create_message(self, content, command: str, target: str) -> str | None:  # TODO finish
+    async def negotiate_wire_version(self, connection: Multiplexed_connection) -> int:
+        """
+        negotiate_wire_version offers the supported wire format versions on a new connection
+        the peer answers with the newest version both support, peers that do not answer are sent json
+
+        Args:
+            connection (Multiplexed_connection): the new connection
+
+        Returns:
+            int: the agreed wire format version
+        """
+        if not self.use_binary_wire_format:
+            return wire_format.WIRE_VERSION_JSON
+        request_id = str(next(self.__request_ids))
+        hello = self.create_hello_message(content={'wire_versions': list(self.wire_versions)}, request_id=request_id)
+        try:
+            reply = self.parse_message(
+                message=await connection.request(message=hello, request_id=request_id, timeout=self.hello_timeout)
+                )
+        except (ConnectionError, asyncio.TimeoutError, ValueError) as error:
+            self.logger.warning(f'Wire format negotiation failed using json: {error}')
+            return wire_format.WIRE_VERSION_JSON
+        content = reply.get('content')
+        if (
+            reply.get('command') == 'hello'
+            and isinstance(content, dict)
+            and content.get('wire_version') in self.wire_versions
+        ):
+            self.logger.debug(f'Using wire format version {content["wire_version"]}')
+            return content['wire_version']
+        return wire_format.WIRE_VERSION_JSON
+
+    def choose_wire_version(self, offered) -> int:
+        """
+        choose_wire_version chooses the newest wire format version offered by a peer that is also supported
+
+        Args:
+            offered (any): the versions offered by the peer
+
+        Returns:
+            int: the chosen wire format version, json if there are none in common
+        """
+        if not self.use_binary_wire_format or not isinstance(offered, list):
+            return wire_format.WIRE_VERSION_JSON
+        common = [version for version in offered if version in self.wire_versions]
+        return max(common, default=wire_format.WIRE_VERSION_JSON)
+
+    def create_hello_message(self, content: dict, request_id: str | None) -> str:
+        """
+        create_hello_message formats a hello message, always json as it is sent before a wire format is agreed
+
+        Args:
+            content (dict): the offered or chosen wire format versions
+            request_id (str | None): the request id of the hello
+
+        Returns:
+            str: a formatted message
+        """
+        message = {
+            'command': 'hello',
+            'content': content,
+            'sender': self.own_address.get('name'),
+            'request_id': request_id
+        }
+        return json.dumps(message)
+
+    def get_wire_version(self, target: str) -> int:
+        """
+        get_wire_version gets the wire format version agreed with the address of target
+
+        Args:
+            target (str): the name of the address
+
+        Returns:
+            int: the wire format version
+        """
+        target_address = self.address_book[target]
+        return self.connection_pool.get_wire_version(ip=target_address['ip'], port=target_address['port'])
+
+    def create_acknowledgement(
+            self,
+            command: str,
+            request_id: str | None,
+            wire_version: int,
+            content=''
+            ) -> str | bytes:
+        """
+        create_acknowledgement formats a reply with little or no content, which is never encrypted
+        so a peer can be acknowledged before it is in the address book
+
+        Args:
+            command (str): the command of the reply
+            request_id (str | None): the request id of the message being replied to
+            wire_version (int): the wire format agreed on the connection
+            content (any): the content of the reply. Defaults to ''.
+
+        Returns:
+            str | bytes: a formatted message, bytes in the binary wire format
+        """
+        message = {
+            'command': command,
+            'content': content,
+            'sender': self.own_address.get('name'),
+            'request_id': request_id
+        }
+        if wire_version == wire_format.WIRE_VERSION_BINARY:
+            return wire_format.encode_binary_message(message=message)
+        return json.dumps(message)
+
+    def create_message(
+            self,
+            content,
+            command: str,
+            target: str,
+            request_id: str | None = None,
+            wire_version: int | None = None
+            ) -> str | bytes | None:  # TODO finish
         """
         create_message formats a message to be sent over the network
+        in the binary wire format content is only json encoded when it is encrypted and cipher text is raw bytes
+        content of at least compression_threshold bytes is compressed before it is encrypted
 
         Args:
             content (any): the content of the message
             command (str): the command of the message
             target (str): the name of the address to send the message to
+            request_id (str | None): the request id of the message being replied to, None for a new request.
+                Defaults to None.
+            wire_version (int | None): the wire format to use, None for the one agreed with target. Defaults to None.
 
         Returns:
-            str | None: a formatted message
+            str | bytes | None: a formatted message, bytes in the binary wire format
         """
         if self.address_book.__contains__(target):
             self.logger.debug('address found')
             target_address = self.address_book[target]
-            content = json.dumps(content)
+            if wire_version is None:
+                wire_version = self.get_wire_version(target=target)
+            binary = wire_version == wire_format.WIRE_VERSION_BINARY
+            encryption = None
+            session = None
+            message_compression = None
             if target_address['public_key_e'] == 0 and target_address['public_key_n'] == 0:
                 self.logger.info('Not Encrypting message')
+                if binary:
+                    compressed = None
+                    if self.use_compression:
+                        compressed = self.compress_message_content(content=wire_format.encode_value(content), raw=True)
+                else:
+                    content = json.dumps(content)
+                    compressed = self.compress_message_content(content=content)
+                if compressed is not None:
+                    content, message_compression = compressed, compression.COMPRESSION_ZLIB
             else:
-                content = self.encrypt_message_content(
-                    public_key_e=target_address['public_key_e'],
-                    public_key_n=target_address['public_key_n'],
-                    content=content
-                    )
-            content.replace(self.message_separator.decode(), '')
+                plain_text = json.dumps(content)
+                compressed = self.compress_message_content(content=plain_text)
+                if compressed is not None:
+                    plain_text, message_compression = compressed, compression.COMPRESSION_ZLIB
+                if self.use_session_encryption:
+                    encryption = 'session'
+                    content, session = self.encrypt_session_content(target=target, content=plain_text, binary=binary)
+                elif binary:
+                    encryption, blocks = self.encrypt_message_blocks(
+                        public_key_e=target_address['public_key_e'],
+                        public_key_n=target_address['public_key_n'],
+                        content=plain_text
+                        )
+                    content = wire_format.int_blocks_to_bytes(
+                        blocks=blocks,
+                        block_size=wire_format.get_block_size(target_address['public_key_n'])
+                        )
+                else:
+                    encryption, content = self.encrypt_message_content(
+                        public_key_e=target_address['public_key_e'],
+                        public_key_n=target_address['public_key_n'],
+                        content=plain_text
+                        )
             message = {
                 'command': command,
                 'content': content,
-                'sender': self.own_address['name']
+                'sender': self.own_address['name'],
+                'request_id': request_id if request_id is not None else str(next(self.__request_ids))
             }
-            message_json = json.dumps(message) + self.message_separator.decode()
+            if encryption is not None:
+                message['encryption'] = encryption
+            if session is not None:
+                message['session'] = session
+            if message_compression is not None:
+                message['compression'] = message_compression
+            if binary:
+                return wire_format.encode_binary_message(message=message)
+            message_json = json.dumps(message)
             return message_json
         else:
             self.logger.debug('address not found')
             return None
 
+    def compress_message_content(self, content: str | bytes, raw: bool = False) -> str | bytes | None:
+        """
+        compress_message_content compresses content if it is large enough and compressing it saves bytes
+        compressed content is base64 encoded so it can be encrypted or put in a json message as text
+
+        Args:
+            content (str | bytes): the content to be compressed, str is encoded as utf-8
+            raw (bool): whether to leave the compressed content as bytes for the binary wire format. Defaults to False.
+
+        Returns:
+            str | bytes | None: the compressed content or None if the content should be sent as is
+        """
+        if not self.use_compression:
+            return None
+        data = content.encode('utf-8') if isinstance(content, str) else content
+        if len(data) < self.compression_threshold:
+            return None
+        compressed = compression.compress_content(data=data, level=self.compression_level)
+        if not raw:
+            compressed = base64.b64encode(compressed).decode('ascii')
+        if len(compressed) >= len(data):
+            return None
+        self.compressed_messages += 1
+        self.compression_bytes_in += len(data)
+        self.compression_bytes_saved += len(data) - len(compressed)
+        return compressed
+
+    def decompress_message_content(self, content: str | bytes, message_compression: str) -> str | bytes:
+        """
+        decompress_message_content decompresses content from compress_message_content
+
+        Args:
+            content (str | bytes): the compressed content, base64 text or raw bytes from the binary wire format
+            message_compression (str): the compression from the message
+
+        Returns:
+            str | bytes: the content, str if the compressed content was base64 text
+        """
+        if isinstance(content, str):
+            return compression.decompress_content(
+                data=base64.b64decode(content),
+                compression=message_compression,
+                max_size=self.max_frame_size
+                ).decode('utf-8')
+        return compression.decompress_content(
+            data=content,
+            compression=message_compression,
+            max_size=self.max_frame_size
+            )
+
     def handle_chat_message(self, message: dict) -> None:
         """
         handle_chat_message handles the receiving of a chat message
@@ -618,17 +2370,18 @@ class Network_manager:
             message (dict): the message to be added to the queue
         """
         if message.__contains__('content') and message.__contains__('sender'):
-            self.app.backend.message_received(
+            self.app.backend.receive_message(
                 content=message['content'],
                 sender=message['sender'],
-                target=message['target']
+                target=message['sender']  # a direct chat is kept under the name of the other peer
                 )
         else:
             self.logger.error('Invalid message')
 
-    def encrypt_message_content(self, public_key_n: int, public_key_e: int, content: str) -> str:
+    def encrypt_message_content(self, public_key_n: int, public_key_e: int, content: str) -> tuple[str, str]:
         """
         encrypt_message_content encrypts the content of the message if public key is not 0
+        packs as many bytes as fit into each RSA block unless n is too small for a block
 
         Args:
             public_key_n (int): the public key n of the address
@@ -636,38 +2389,391 @@ class Network_manager:
             content (str): the content to be encrypted
 
         Returns:
-            str: the encrypted content converted to a json formatted string
+            tuple[str, str]: the encryption used ('rsa_blocks' or 'rsa') and the encrypted content as json
         """
-        encrypted = RSA_encrypt.encrypt_data(
-            public_key_e=public_key_e,
+        encryption, encrypted = self.encrypt_message_blocks(
             public_key_n=public_key_n,
-            plain_text=content
+            public_key_e=public_key_e,
+            content=content
             )
         str_encrypted = json.dumps(encrypted)
-        return str_encrypted
+        return encryption, str_encrypted
+
+    def encrypt_message_blocks(self, public_key_n: int, public_key_e: int, content: str) -> tuple[str, list[int]]:
+        """
+        encrypt_message_blocks encrypts content with RSA leaving the cipher text as integers for either wire format
+
+        Args:
+            public_key_n (int): the public key n of the address
+            public_key_e (int): the public key e of the address
+            content (str): the content to be encrypted
+
+        Returns:
+            tuple[str, list[int]]: the encryption used ('rsa_blocks' or 'rsa') and the cipher text
+        """
+        if public_key_n.bit_length() > 8:
+            encryption = 'rsa_blocks'
+            encrypted = RSA_encrypt.encrypt_data_blocks(
+                public_key_e=public_key_e,
+                public_key_n=public_key_n,
+                plain_text=content
+                )
+        else:
+            encryption = 'rsa'
+            encrypted = RSA_encrypt.encrypt_data(
+                public_key_e=public_key_e,
+                public_key_n=public_key_n,
+                plain_text=content
+                )
+        return encryption, encrypted
+
+    def get_session_cipher(self, target: str) -> Session_cipher:
+        """
+        get_session_cipher gets the session cipher for sending to target
+        creating one and wrapping its key with the targets public key if there is no valid one cached
+        the cache is keyed by the public key fingerprint so a peer changing keys gets a new session
+
+        Args:
+            target (str): the name of the address
+
+        Returns:
+            Session_cipher: the session cipher for the target
+        """
+        target_address = self.address_book[target]
+        cache_key = (target, self.address_book.get_fingerprint(name=target))
+        session_cipher = self.session_ciphers.get(cache_key)
+        if session_cipher is not None:
+            return session_cipher
+        self.logger.info(f'Creating session key for {target}...')
+        session_cipher = Session_cipher()
+        encryption, wrapped_key = self.encrypt_message_blocks(
+            public_key_n=target_address['public_key_n'],
+            public_key_e=target_address['public_key_e'],
+            content=json.dumps(session_cipher.export_key())
+            )
+        session_cipher.wrapped_key = {
+            'encryption': encryption,
+            'content': json.dumps(wrapped_key)
+        }
+        session_cipher.wrapped_key_binary = {
+            'encryption': encryption,
+            'content': wire_format.int_blocks_to_bytes(
+                blocks=wrapped_key,
+                block_size=wire_format.get_block_size(target_address['public_key_n'])
+                )
+        }
+        self.session_ciphers.put(key=cache_key, session_cipher=session_cipher)
+        return session_cipher
+
+    def get_group_session_cipher(self, group: str, members: list[str]) -> Session_cipher:
+        """
+        get_group_session_cipher gets the session cipher for sending to a group
+        creating one and wrapping its key with each members public key if there is no valid one cached
+        wrapped_key holds the wrapped key of each member by name
+
+        Args:
+            group (str): the name of the group
+            members (list[str]): the names of the members, each must have a public key in the address book
+
+        Returns:
+            Session_cipher: the session cipher for the group
+        """
+        cache_key = (
+            group,
+            tuple(sorted((member, self.address_book.get_fingerprint(name=member)) for member in members))
+        )
+        session_cipher = self.group_session_ciphers.get(cache_key)
+        if session_cipher is not None:
+            return session_cipher
+        self.logger.info(f'Creating group key for {group}...')
+        session_cipher = Session_cipher()
+        session_cipher.wrapped_key = {}
+        for member in members:
+            encryption, wrapped_key = self.encrypt_message_blocks(
+                public_key_n=self.address_book[member]['public_key_n'],
+                public_key_e=self.address_book[member]['public_key_e'],
+                content=json.dumps(session_cipher.export_key())
+                )
+            session_cipher.wrapped_key[member] = {
+                'encryption': encryption,
+                'content': json.dumps(wrapped_key)
+            }
+        self.group_session_ciphers.put(key=cache_key, session_cipher=session_cipher)
+        return session_cipher
+
+    def create_group_message(self, content, group: str, members: list[str]) -> str | None:
+        """
+        create_group_message formats a group chat message for the chat server to send on to each member
+        the content is encrypted once with the group key and only the group key is wrapped for each member
+        members without a public key can not be sent to securely so are left out
+
+        Args:
+            content (dict): the content of the message
+            group (str): the name of the group
+            members (list[str]): the names of the members
+
+        Returns:
+            str | None: a formatted message, always json, or None if no member can be sent to
+        """
+        own_name = self.own_address.get('name')
+        missing = self.get_members_without_public_key(members=members)
+        for member in missing:
+            self.logger.error(f'No public key for {member} can not send group message to them')
+        recipients = [member for member in dict.fromkeys(members) if member != own_name and member not in missing]
+        if len(recipients) == 0:
+            return None
+        plain_text = json.dumps(content)
+        message_compression = None
+        compressed = self.compress_message_content(content=plain_text)
+        if compressed is not None:
+            plain_text, message_compression = compressed, compression.COMPRESSION_ZLIB
+        session_cipher = self.get_group_session_cipher(group=group, members=recipients)
+        encrypted = session_cipher.encrypt(plain_text=plain_text)
+        message = {
+            'command': 'group message',
+            'content': {
+                'group': group,
+                'members': recipients,
+                'session': {'id': session_cipher.session_id, 'nonce': encrypted['nonce'], 'mac': encrypted['mac']},
+                'keys': session_cipher.wrapped_key,
+                'cipher_text': encrypted['cipher_text'],
+                'compression': message_compression
+            },
+            'sender': own_name,
+            'request_id': str(next(self.__request_ids))
+        }
+        return json.dumps(message)
+
+    async def fan_out_group_message(self, writer, message: dict, wire_version: int) -> None:
+        """
+        fan_out_group_message sends a group message on to each member at once, up to max_group_fan_out at a time
+        each member gets the same cipher text with only their wrapped key, members that can not be reached
+        have it kept in their mailbox and members that could not decrypt it have failed,
+        then 'message sent' is replied with who it was delivered to, stored for and failed for
+
+        Args:
+            writer (asyncio.streams.StreamWriter): allows writing to the network stream of the sender
+            message (dict): the parsed 'group message' request
+            wire_version (int): the wire format agreed on the connection
+        """
+        content = message['content']
+        if not (
+            isinstance(content, dict)
+            and isinstance(content.get('group'), str)
+            and isinstance(content.get('keys'), dict)
+            and isinstance(content.get('session'), dict)
+            and isinstance(content.get('cipher_text'), str)
+        ):
+            self.logger.error('Invalid group message')
+            response = self.create_acknowledgement(
+                command='relay failed',
+                request_id=message.get('request_id'),
+                wire_version=wire_version
+                )
+            writer.write(encode_frame(response))
+            await writer.drain()
+            return
+        mailbox = self.get_mailbox()
+        semaphore = asyncio.Semaphore(self.max_group_fan_out)
+
+        async def send_to_member(member: str) -> str:
+            if not self.address_book.__contains__(member) or member in LOCAL_ADDRESSES:
+                return 'failed'
+            member_message = json.dumps({
+                'command': 'group message',
+                'content': {
+                    'group': content['group'],
+                    'members': list(content['keys']),
+                    'session': content['session'] | {'key': content['keys'][member]},
+                    'cipher_text': content['cipher_text'],
+                    'compression': content.get('compression')
+                },
+                'sender': message['sender'],
+                'request_id': str(next(self.__request_ids))
+            })
+            held = mailbox.__contains__(member)
+            if self.is_address_known(name=member) and not held:
+                async with semaphore:
+                    parsed_acknowledgement = await self.send_message(
+                        message=member_message,
+                        address=self.address_book[member]
+                        )
+                command = parsed_acknowledgement.get('command') if isinstance(parsed_acknowledgement, dict) else None
+                if command == 'message sent':
+                    return 'delivered'
+                if command == 'message failed':
+                    return 'failed'  # the member could not decrypt it so keeping it would not help
+            if await asyncio.to_thread(mailbox.store, recipient=member, message=member_message):
+                if held:
+                    self.__start_send_task(self.deliver_mailbox(name=member))
+                return 'stored'
+            return 'failed'
+
+        members = list(content['keys'])
+        self.logger.info(f'Sending group message for {content["group"]} to {len(members)} members...')
+        results = await asyncio.gather(*[send_to_member(member=member) for member in members])
+        outcome = {'delivered': [], 'stored': [], 'failed': []}
+        for member, result in zip(members, results):
+            outcome[result].append(member)
+        response = self.create_acknowledgement(
+            command='message sent',
+            request_id=message.get('request_id'),
+            wire_version=wire_version,
+            content=outcome
+            )
+        writer.write(encode_frame(response))
+        await writer.drain()
+
+    def handle_group_message(self, message: dict) -> bool:
+        """
+        handle_group_message decrypts a group chat message with the group key wrapped for this peer
+        and passes it to the backend
+
+        Args:
+            message (dict): the parsed 'group message' from the chat server
+
+        Returns:
+            bool: whether or not the message was decrypted and added to a group chat the sender is in
+        """
+        content = message['content']
+        if (
+            not isinstance(content, dict)
+            or not isinstance(content.get('group'), str)
+            or not isinstance(content.get('session'), dict)
+            or not isinstance(content.get('members'), list)
+        ):
+            self.logger.error('Invalid group message')
+            return False
+        try:
+            group_content = self.decrypt_session_content(
+                sender=message['sender'],
+                content=content['cipher_text'],
+                session=content['session'],
+                message_compression=content.get('compression')
+                )
+        except (ValueError, KeyError, TypeError) as error:
+            self.logger.error(f'Could not decrypt group message: {error}')
+            return False
+        if not isinstance(group_content, dict):
+            self.logger.error('Invalid group message')
+            return False
+        return self.app.backend.receive_group_message(
+            content=group_content,
+            sender=message['sender'],
+            group=content['group'],
+            members=[member for member in content['members'] if member != self.own_address.get('name')]
+            )
+
+    def encrypt_session_content(self, target: str, content: str, binary: bool = False) -> tuple[str | bytes, dict]:
+        """
+        encrypt_session_content encrypts the content of a message with the session key for the target
+        the RSA wrapped session key is sent with each message but only calculated once
+
+        Args:
+            target (str): the name of the address
+            content (str): the content to be encrypted
+            binary (bool): whether to leave the cipher text as bytes for the binary wire format. Defaults to False.
+
+        Returns:
+            tuple[str | bytes, dict]: the encrypted content and the session data for the message
+        """
+        session_cipher = self.get_session_cipher(target=target)
+        if binary:
+            encrypted = session_cipher.encrypt_bytes(plain_text=content)
+            wrapped_key = session_cipher.wrapped_key_binary
+        else:
+            encrypted = session_cipher.encrypt(plain_text=content)
+            wrapped_key = session_cipher.wrapped_key
+        session = {
+            'id': session_cipher.session_id,
+            'key': wrapped_key,
+            'nonce': encrypted['nonce'],
+            'mac': encrypted['mac']
+        }
+        return encrypted['cipher_text'], session
+
+    def decrypt_session_content(
+            self,
+            sender: str,
+            content: str | bytes,
+            session: dict,
+            message_compression: str | None = None
+            ):
+        """
+        decrypt_session_content decrypts content encrypted with a session key
+        the session key is unwrapped with RSA the first time a session is seen from the sender
+
+        Args:
+            sender (str): the name of the sender
+            content (str | bytes): the encrypted content, bytes from the binary wire format
+            session (dict): the session data from the message
+            message_compression (str | None): the compression from the message, None if not compressed.
+                Defaults to None.
+
+        Returns:
+            any: the decrypted content
+        """
+        cache_key = (sender, session['id'])
+        session_cipher = self.peer_session_ciphers.get(cache_key)
+        if session_cipher is None:
+            self.logger.info(f'Unwrapping session key from {sender}...')
+            key = self.decrypt_message_content(
+                private_key=self.app.backend.user_data.get_private_key_context(),
+                content=session['key']['content'],
+                encryption=session['key']['encryption']
+                )
+            session_cipher = Session_cipher(key=base64.b64decode(key), session_id=session['id'])
+            self.peer_session_ciphers.put(key=cache_key, session_cipher=session_cipher)
+        encrypted = {
+            'nonce': session['nonce'],
+            'cipher_text': content,
+            'mac': session['mac']
+        }
+        if isinstance(content, bytes):
+            decrypted = session_cipher.decrypt_bytes(encrypted=encrypted)
+        else:
+            decrypted = session_cipher.decrypt(encrypted=encrypted)
+        return self.load_message_content(content=decrypted, message_compression=message_compression)
 
-    def decrypt_message_content(self, private_key_n: int, private_key_d: int, content: str):
+    def decrypt_message_content(
+            self,
+            private_key: RSA_decrypt.Private_key,
+            content: str | bytes,
+            encryption: str = 'rsa',
+            message_compression: str | None = None
+            ):
         """
-        decrypt_message_content decrypts the content of the message the content is a json formatted string
+        decrypt_message_content decrypts the content of the message
+        the content is a json formatted list of integers or, from the binary wire format, the packed blocks
 
         Args:
-            private_key_n (int): own private key n
-            private_key_d (int): own private key d
-            content (str): the content to be decrypted
+            private_key (RSA_decrypt.Private_key): own private key, cached by user_data
+            content (str | bytes): the content to be decrypted
+            encryption (str): the encryption from the message, 'rsa_blocks' or 'rsa'. Defaults to 'rsa'.
+            message_compression (str | None): the compression from the message, None if not compressed.
+                Defaults to None.
 
         Returns:
             any: the decrypted content
         """
-        parsed_content = json.loads(content)
+        if isinstance(content, bytes):
+            parsed_content = wire_format.bytes_to_int_blocks(
+                data=content,
+                block_size=wire_format.get_block_size(private_key.n)
+                )
+        else:
+            parsed_content = json.loads(content)
         if parsed_content is None:
             return ''
         if isinstance(parsed_content, list):
-            decrypted = RSA_decrypt.decrypt_data(
-                private_key_d=private_key_d,
-                private_key_n=private_key_n,
-                encrypted=parsed_content
-                )
-            return decrypted
+            match encryption:
+                case 'rsa_blocks':
+                    decrypted = private_key.decrypt_data_blocks(encrypted=parsed_content)
+                case 'rsa':
+                    decrypted = private_key.decrypt_data(encrypted=parsed_content)
+                case _:
+                    raise ValueError(f'Unknown encryption {encryption}')
+            return self.load_message_content(content=decrypted, message_compression=message_compression)
         else:
             return parsed_content
 
@@ -718,6 +2824,7 @@ class Network_manager:
                         case 'accepted':
                             server = await asyncio.start_server(self.server_listener, ip, port)
                             self.logger.info('Server created')
+                            self.chat_server_name = server_address['name']
                             server_established_message = self.create_message(
                                     target='name_server',
                                     content=server_address,
@@ -726,17 +2833,31 @@ class Network_manager:
                             if server_established_message is None:
                                 self.logger.error('no message to send')
                             else:
-                                await self.send_message(
+                                registered_response = await self.send_message(
                                     message=server_established_message,
                                     address=self.address_book['name_server']
                                     )
-                                self.add_address(
-                                    name='chat_server',
-                                    ip=ip,
-                                    port=port,
-                                    public_key_e=0,  # unencrypted comms
-                                    public_key_n=0
-                                    )
+                                if (
+                                    isinstance(registered_response, dict)
+                                    and isinstance(registered_response['content'], dict)
+                                    and isinstance(registered_response['content'].get('chat_servers'), list)
+                                ):
+                                    self.set_peer_chat_servers(
+                                        chat_servers=registered_response['content']['chat_servers']
+                                        )
+                                if self.lan_discovery is not None:
+                                    self.lan_discovery.set_announcements(
+                                        self.get_lan_announcements(chat_server_port=port)
+                                        )
+                                if not self.address_book.__contains__('chat_server'):
+                                    # a volunteer keeps the chat server the name server assigned it
+                                    self.add_address(
+                                        name='chat_server',
+                                        ip=ip,
+                                        port=port,
+                                        public_key_e=0,  # unencrypted comms
+                                        public_key_n=0
+                                        )
                             self.chat_server_task: asyncio.Task = asyncio.create_task(self.init_server(server))
                         case 'rejected':
                             self.logger.warn('Established peer rejected server privileges')
@@ -764,23 +2885,196 @@ class Network_manager:
             reader (asyncio.streams.StreamReader): allows reading from the network stream
             writer (asyncio.streams.StreamWriter): allows writing to the network stream
         """
+        wire_version = wire_format.WIRE_VERSION_JSON  # until the client says hello
         while True:
             try:
-                message = await reader.readuntil(self.message_separator)
+                message = await read_frame(reader=reader, max_frame_size=self.max_frame_size)
             except ConnectionResetError as error:
                 self.logger.error(error)
                 break
             except asyncio.exceptions.IncompleteReadError as error:
                 self.logger.error(error)
                 break
-            message = message.decode()
-            message = self.parse_message(message)
-            self.logger.info(f'Received message: {message}')
-            match message['command']:
-                case 'message':
-                    self.handle_chat_message(message)
-                case _:
-                    self.logger.error('Invalid command')
+            except ValueError as error:
+                # the rest of an oversized frame can not be skipped so the connection is dropped
+                self.logger.error(error)
+                writer.close()
+                break
+            try:
+                parsed_message = self.parse_message(message)
+                self.logger.info(f'Received message: {parsed_message}')
+                wire_version = await self.handle_client_message(
+                    writer=writer,
+                    message=parsed_message,
+                    wire_version=wire_version
+                    )
+            except ConnectionError as error:
+                self.logger.error(error)
+                break
+            except Exception as error:
+                # one bad frame must not close a connection other requests are waiting on
+                self.logger.error(f'Invalid message: {error}')
+                await self.reply_invalid_message(writer=writer, message=message, wire_version=wire_version)
+
+    async def handle_client_message(self, writer, message: dict, wire_version: int) -> int:
+        """
+        handle_client_message handles a message read by client_listener
+
+        Args:
+            writer (asyncio.streams.StreamWriter): allows writing to the network stream
+            message (dict): the parsed message
+            wire_version (int): the wire format agreed on the connection
+
+        Returns:
+            int: the wire format agreed on the connection, changed by 'hello'
+        """
+        match message['command']:
+            case 'hello':
+                wire_version = self.choose_wire_version(offered=message['content'].get('wire_versions'))
+                response = self.create_hello_message(
+                    content={'wire_version': wire_version},
+                    request_id=message.get('request_id')
+                    )
+                writer.write(encode_frame(response))
+                await writer.drain()
+            case 'message':
+                self.handle_chat_message(message)
+                response = self.create_acknowledgement(
+                    command='message sent',
+                    request_id=message.get('request_id'),
+                    wire_version=wire_version
+                    )
+                writer.write(encode_frame(response))
+                await writer.drain()
+            case 'group message':
+                # a message that can not be decrypted or added to its group chat fails so the sender knows
+                response = self.create_acknowledgement(
+                    command='message sent' if self.handle_group_message(message) else 'message failed',
+                    request_id=message.get('request_id'),
+                    wire_version=wire_version
+                    )
+                writer.write(encode_frame(response))
+                await writer.drain()
+            case 'mailbox':
+                self.handle_mailbox_message(message)
+                response = self.create_acknowledgement(
+                    command='mailbox received',
+                    request_id=message.get('request_id'),
+                    wire_version=wire_version
+                    )
+                writer.write(encode_frame(response))
+                await writer.drain()
+            case 'dht ping' | 'dht store' | 'dht find node' | 'dht find value':
+                reply = None
+                if self.dht is not None:
+                    reply = self.dht.handle_request(
+                        sender=message.get('contact'),
+                        command=message['command'],
+                        content=message['content']
+                        )
+                response = self.create_dht_message(
+                    command='dht reply',
+                    content=reply if reply is not None else {'error': 'dht unavailable'},
+                    request_id=message.get('request_id')
+                    )
+                writer.write(encode_frame(response))
+                await writer.drain()
+            case 'new client':
+                if not self.is_from_chat_server(writer=writer):
+                    await self.reject_push(writer=writer, message=message, wire_version=wire_version)
+                    return wire_version
+                self.apply_address_book_changes(changes=message['content'])
+                await self.acknowledge_push(writer=writer, message=message, wire_version=wire_version)
+            case 'client left':
+                if not self.is_from_chat_server(writer=writer):
+                    await self.reject_push(writer=writer, message=message, wire_version=wire_version)
+                    return wire_version
+                if (
+                    isinstance(message['content'], dict)
+                    and self.address_book.__contains__(message['content'].get('name'))
+                ):
+                    self.logger.info(f'{message["content"]["name"]} left')
+                    left_address = self.address_book[message['content']['name']]
+                    await self.connection_pool.close_address(ip=left_address['ip'], port=left_address['port'])
+                    # the chat server pushes the address again when it comes back
+                    self.remove_address_endpoint(name=message['content']['name'])
+                await self.acknowledge_push(writer=writer, message=message, wire_version=wire_version)
+            case _:
+                self.logger.error('Invalid command')
+        return wire_version
+
+    async def reply_invalid_message(self, writer, message: str | bytes, wire_version: int) -> None:
+        """
+        reply_invalid_message replies to a message that could not be parsed or handled
+        so the request waiting on it fails at once and the connection stays open for the others
+
+        Args:
+            writer (asyncio.streams.StreamWriter): allows writing to the network stream
+            message (str | bytes): the message as read
+            wire_version (int): the wire format agreed on the connection
+        """
+        request_id = wire_format.get_request_id(message=message)
+        response = self.create_acknowledgement(
+            command='invalid message',
+            request_id=request_id if isinstance(request_id, str) else None,
+            wire_version=wire_version
+            )
+        try:
+            writer.write(encode_frame(response))
+            await writer.drain()
+        except ConnectionError as error:
+            self.logger.error(error)
+
+    def is_from_chat_server(self, writer) -> bool:
+        """
+        is_from_chat_server checks that a connection comes from the chat server so only it can push address book changes
+
+        Args:
+            writer (asyncio.streams.StreamWriter): allows writing to the network stream
+
+        Returns:
+            bool: whether or not the peer of the connection is the chat server
+        """
+        peername = writer.get_extra_info('peername')
+        if peername is None or not self.is_address_known('chat_server'):
+            return False
+        return peername[0] == self.address_book['chat_server']['ip']
+
+    async def reject_push(self, writer, message: dict, wire_version: int) -> None:
+        """
+        reject_push replies to an address book change pushed by anything other than the chat server
+
+        Args:
+            writer (asyncio.streams.StreamWriter): allows writing to the network stream
+            message (dict): the parsed push
+            wire_version (int): the wire format agreed on the connection
+        """
+        self.logger.warning(f'Rejected {message["command"]} pushed by {writer.get_extra_info("peername")}')
+        response = self.create_acknowledgement(
+            command='push rejected',
+            request_id=message.get('request_id'),
+            wire_version=wire_version
+            )
+        writer.write(encode_frame(response))
+        await writer.drain()
+
+    async def acknowledge_push(self, writer, message: dict, wire_version: int) -> None:
+        """
+        acknowledge_push replies to an address book change pushed by the chat server
+        the chat server is in the address book as chat_server rather than by its name so the reply is not encrypted
+
+        Args:
+            writer (asyncio.streams.StreamWriter): allows writing to the network stream
+            message (dict): the parsed push
+            wire_version (int): the wire format agreed on the connection
+        """
+        response = self.create_acknowledgement(
+            command='address book updated',
+            request_id=message.get('request_id'),
+            wire_version=wire_version
+            )
+        writer.write(encode_frame(response))
+        await writer.drain()
 
     async def server_listener(self, reader, writer) -> None:
         """
@@ -790,58 +3084,204 @@ class Network_manager:
             reader (asyncio.streams.StreamReader): allows reading from the network stream
             writer (asyncio.streams.StreamWriter): allows writing to the network stream
         """
+        wire_version = wire_format.WIRE_VERSION_JSON  # until the client says hello
         while True:
             try:
-                message = await reader.readuntil(self.message_separator)
+                message = await read_frame(reader=reader, max_frame_size=self.max_frame_size)
             except ConnectionResetError as error:
                 self.logger.error(error)
                 break
             except asyncio.exceptions.IncompleteReadError as error:
                 self.logger.error(error)
                 break
-            message = message.decode()
-            message = self.parse_message(message)
-            self.logger.info(f'Received message: {message}')
-            match message['command']:
-                case 'update address book':
-                    if isinstance(message['content'], dict):
-                        updated_client_address_book = {
-                            key: self.address_book.get(key, message['content'][key])
-                            for key in message['content']
-                        }
-                        response = self.create_message(
-                            target=message['sender'],
-                            content=updated_client_address_book,
-                            command='address book data'
-                            )
-                    if response is None:
-                        self.logger.error('no message to send')
-                    else:
-                        writer.write(response.encode())
-                        await writer.drain()
-                case 'new client':
-                    if isinstance(message['content'], dict):
-                        if message.__contains__('ip') and message.__contains__('port') and message.__contains__('name'):
-                            self.add_address(
-                                name=message['content']['name'],
-                                ip=message['content']['ip'],
-                                port=message['content']['port'],
-                                public_key_e=message['content']['public_key_e'],
-                                public_key_n=message['content']['public_key_n']
-                                )
-                case 'ping':
+            except ValueError as error:
+                # the rest of an oversized frame can not be skipped so the connection is dropped
+                self.logger.error(error)
+                writer.close()
+                break
+            try:
+                parsed_message = self.parse_message(message)
+                self.logger.info(f'Received message: {parsed_message}')
+                wire_version = await self.handle_server_message(
+                    writer=writer,
+                    message=parsed_message,
+                    wire_version=wire_version
+                    )
+            except ConnectionError as error:
+                self.logger.error(error)
+                break
+            except Exception as error:
+                # one bad frame must not close a connection other requests are waiting on
+                self.logger.error(f'Invalid message: {error}')
+                await self.reply_invalid_message(writer=writer, message=message, wire_version=wire_version)
+
+    async def handle_server_message(self, writer, message: dict, wire_version: int) -> int:
+        """
+        handle_server_message handles a message read by server_listener
+
+        Args:
+            writer (asyncio.streams.StreamWriter): allows writing to the network stream
+            message (dict): the parsed message
+            wire_version (int): the wire format agreed on the connection
+
+        Returns:
+            int: the wire format agreed on the connection, changed by 'hello'
+        """
+        match message['command']:
+            case 'hello':
+                wire_version = self.choose_wire_version(offered=message['content'].get('wire_versions'))
+                response = self.create_hello_message(
+                    content={'wire_version': wire_version},
+                    request_id=message.get('request_id')
+                    )
+                writer.write(encode_frame(response))
+                await writer.drain()
+            case 'update address book':
+                if isinstance(message['content'], dict):
+                    updated_client_address_book = {
+                        key: self.address_book.get(key, message['content'][key])
+                        for key in message['content']
+                    }
                     response = self.create_message(
-                            target=message['sender'],
-                            content='',
-                            command='pong'
-                            )
-                    if response is None:
-                        self.logger.error('no message to send')
-                    else:
-                        writer.write(response.encode())
-                        await writer.drain()
-                case _:
-                    self.logger.error('Invalid command')
+                        target=message['sender'],
+                        content=updated_client_address_book,
+                        command='address book data',
+                        request_id=message.get('request_id'),
+                        wire_version=wire_version
+                        )
+                if response is None:
+                    self.logger.error('no message to send')
+                else:
+                    writer.write(encode_frame(response))
+                    await writer.drain()
+            case 'subscribe address book':
+                since = message['content'].get('since', 0) if isinstance(message['content'], dict) else 0
+                epoch = message['content'].get('epoch') if isinstance(message['content'], dict) else None
+                if isinstance(message['content'], dict):
+                    self.add_client_address(name=message['sender'], address=message['content'].get('address'))
+                if self.address_book.__contains__(message['sender']):
+                    # subscribers cleared the ip and port of the sender if it left so are pushed it again,
+                    # and other chat servers deliver the messages they kept for it
+                    self.__remote_addresses.discard(message['sender'])
+                    self.__record_address_change(name=message['sender'])
+                changes = self.get_address_book_changes(since=since, epoch=epoch)
+                response = self.create_message(
+                    target=message['sender'],
+                    content=changes,
+                    command='address book data',
+                    request_id=message.get('request_id'),
+                    wire_version=wire_version
+                    )
+                if response is None:
+                    # the client is told at once rather than waiting for a reply that never comes
+                    self.logger.error('no message to send')
+                    response = self.create_acknowledgement(
+                        command='subscribe failed',
+                        request_id=message.get('request_id'),
+                        wire_version=wire_version
+                        )
+                    writer.write(encode_frame(response))
+                    await writer.drain()
+                else:
+                    self.address_book_subscriptions.subscribe(
+                        name=message['sender'],
+                        epoch=changes['epoch'],
+                        version=changes['version']
+                        )
+                    writer.write(encode_frame(response))
+                    await writer.drain()
+                    # a subscribing peer has come online so gets the messages kept for it
+                    self.__start_send_task(self.deliver_mailbox(name=message['sender']))
+            case 'relay message':
+                # forwarded in its own task so the sender's other requests on the connection are not held up
+                self.__start_send_task(
+                    self.forward_relayed_message(writer=writer, message=message, wire_version=wire_version)
+                    )
+            case 'group message':
+                self.__start_send_task(
+                    self.fan_out_group_message(writer=writer, message=message, wire_version=wire_version)
+                    )
+            case 'unsubscribe address book':
+                self.address_book_subscriptions.unsubscribe(name=message['sender'])
+                response = self.create_message(
+                    target=message['sender'],
+                    content='',
+                    command='unsubscribed',
+                    request_id=message.get('request_id'),
+                    wire_version=wire_version
+                    )
+                if response is None:
+                    self.logger.error('no message to send')
+                else:
+                    writer.write(encode_frame(response))
+                    await writer.drain()
+            case 'requesting address book':
+                since = message['content'].get('since', 0) if isinstance(message['content'], dict) else 0
+                epoch = message['content'].get('epoch') if isinstance(message['content'], dict) else None
+                response = self.create_message(
+                    target=message['sender'],
+                    content=self.get_address_book_changes(since=since, epoch=epoch),
+                    command='address book data',
+                    request_id=message.get('request_id'),
+                    wire_version=wire_version
+                    )
+                if response is None:
+                    self.logger.error('no message to send')
+                    response = self.create_acknowledgement(
+                        command='address book unavailable',
+                        request_id=message.get('request_id'),
+                        wire_version=wire_version
+                        )
+                writer.write(encode_frame(response))
+                await writer.drain()
+            case 'new client':
+                if isinstance(message['content'], dict) and isinstance(message['content'].get('name'), str):
+                    self.add_client_address(name=message['content']['name'], address=message['content'])
+                response = self.create_acknowledgement(
+                    command='client added',
+                    request_id=message.get('request_id'),
+                    wire_version=wire_version
+                    )
+                writer.write(encode_frame(response))
+                await writer.drain()
+            case 'replicate address book':
+                if (
+                    message['sender'] in self.peer_chat_servers
+                    and isinstance(message['content'], dict)
+                    and isinstance(message['content'].get('addresses'), dict)
+                ):
+                    self.apply_replicated_changes(addresses=message['content']['addresses'])
+                else:
+                    self.logger.error('Invalid replicated address book')
+                response = self.create_acknowledgement(
+                    command='address book replicated',
+                    request_id=message.get('request_id'),
+                    wire_version=wire_version
+                    )
+                writer.write(encode_frame(response))
+                await writer.drain()
+            case 'ping':
+                if (
+                    isinstance(message['content'], dict)
+                    and isinstance(message['content'].get('chat_servers'), list)
+                ):
+                    # the name server sends every chat server with its health checks
+                    self.set_peer_chat_servers(chat_servers=message['content']['chat_servers'])
+                response = self.create_message(
+                        target=message['sender'],
+                        content='',
+                        command='pong',
+                        request_id=message.get('request_id'),
+                        wire_version=wire_version
+                        )
+                if response is None:
+                    self.logger.error('no message to send')
+                else:
+                    writer.write(encode_frame(response))
+                    await writer.drain()
+            case _:
+                self.logger.error('Invalid command')
+        return wire_version
 
 
 if __name__ == '__main__':
@@ -0,0 +1,128 @@
+"""
+this module holds the retry scheduler class
+holds failed sends in a heap until their jittered exponential backoff has passed
+so an offline peer is not retried in a busy loop
+"""
+import asyncio
+import heapq
+import itertools
+import logging
+import random
+import time
+from typing import Callable
+
+
+class Retry_scheduler:
+    """
+    Retry_scheduler schedules failed queue items to be queued again after a backoff
+    the number of attempts is stored in the queue item under 'attempts'
+    attrs:
+        logger: logging object
+            the error and info logger for the retry scheduler
+        base_delay: float
+            the seconds to wait before the first retry
+        max_delay: float
+            the most seconds to wait before a retry
+        max_attempts: int
+            the number of failed sends before a queue item is given up on
+        __heap: list[tuple[float, int, dict]]
+            the queue items by the time.monotonic() they are due
+        __counter: itertools.count
+            breaks ties between queue items due at the same time so they stay in order
+        __wake_event: asyncio.Event | None
+            set when a queue item is scheduled so run can recheck the next due time
+    methods:
+        get_delay(attempts)
+            gets the jittered backoff after a number of failed attempts
+        schedule(queue_item)
+            schedules a queue item to be retried if it has attempts left
+        run(put)
+            puts queue items back on the queue as they become due
+        clear()
+            removes and returns every scheduled queue item
+    """
+    def __init__(self, base_delay: float = 1, max_delay: float = 300, max_attempts: int = 8) -> None:
+        """
+        __init__ initialises the retry scheduler
+
+        Args:
+            base_delay (float): the seconds to wait before the first retry. Defaults to 1.
+            max_delay (float): the most seconds to wait before a retry. Defaults to 300.
+            max_attempts (int): the number of failed sends before a queue item is given up on. Defaults to 8.
+        """
+        self.logger = logging.getLogger(__name__)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_attempts = max_attempts
+        self.__heap: list[tuple[float, int, dict]] = []
+        self.__counter = itertools.count()
+        self.__wake_event: asyncio.Event | None = None
+
+    def __len__(self) -> int:
+        return len(self.__heap)
+
+    def get_delay(self, attempts: int) -> float:
+        """
+        get_delay gets the backoff after a number of failed attempts
+        doubles each attempt up to max_delay and is jittered between half and all of that
+        so peers that failed together do not all retry together
+
+        Args:
+            attempts (int): the number of failed attempts
+
+        Returns:
+            float: the seconds to wait
+        """
+        delay = min(self.max_delay, self.base_delay * 2 ** (attempts - 1))
+        return delay / 2 + random.uniform(0, delay / 2)
+
+    def schedule(self, queue_item: dict) -> bool:
+        """
+        schedule counts a failed attempt and schedules the queue item to be retried if it has attempts left
+
+        Args:
+            queue_item (dict): the queue item that failed to send
+
+        Returns:
+            bool: whether or not the queue item was scheduled, False if it has used all its attempts
+        """
+        queue_item['attempts'] = queue_item.get('attempts', 0) + 1
+        if queue_item['attempts'] >= self.max_attempts:
+            return False
+        delay = self.get_delay(attempts=queue_item['attempts'])
+        self.logger.info(f'Retrying message to {queue_item["target"]} in {delay:.1f}s')
+        heapq.heappush(self.__heap, (time.monotonic() + delay, next(self.__counter), queue_item))
+        if self.__wake_event is not None:
+            self.__wake_event.set()
+        return True
+
+    async def run(self, put: Callable[[dict], None]) -> None:
+        """
+        run puts queue items back on the queue as they become due, sleeping until the next one is due
+
+        Args:
+            put (Callable[[dict], None]): puts a queue item back on the queue
+        """
+        self.__wake_event = asyncio.Event()
+        while True:
+            now = time.monotonic()
+            while len(self.__heap) > 0 and self.__heap[0][0] <= now:
+                _, _, queue_item = heapq.heappop(self.__heap)
+                put(queue_item)
+            timeout = self.__heap[0][0] - now if len(self.__heap) > 0 else None
+            self.__wake_event.clear()
+            try:
+                await asyncio.wait_for(self.__wake_event.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    def clear(self) -> list[dict]:
+        """
+        clear removes and returns every scheduled queue item
+
+        Returns:
+            list[dict]: the scheduled queue items, soonest first
+        """
+        queue_items = [queue_item for _, _, queue_item in sorted(self.__heap)]
+        self.__heap.clear()
+        return queue_items
@@ -0,0 +1,318 @@
+"""
+this module holds the session cipher and session cache classes
+a symmetric cipher for chat content, its key is shared once with RSA so each message only costs a hash
+"""
+import base64
+import hashlib
+import hmac
+import secrets
+import time
+from collections import OrderedDict
+
+SESSION_KEY_LENGTH = 32
+SESSION_ID_LENGTH = 8
+NONCE_LENGTH = 16
+FINGERPRINT_LENGTH = 16
+
+
+def public_key_fingerprint(public_key_n: int, public_key_e: int) -> str:
+    """
+    public_key_fingerprint a short hash identifying a public key
+
+    Args:
+        public_key_n (int): the public key n
+        public_key_e (int): the public key e
+
+    Returns:
+        str: the hex fingerprint
+    """
+    return hashlib.sha256(f'{public_key_n}:{public_key_e}'.encode()).hexdigest()[:FINGERPRINT_LENGTH]
+
+
+class Session_cipher:
+    """
+    Session_cipher encrypts and decrypts content with a shared session key
+    the keystream is shake_256(encryption key + nonce) xored with the plain text
+    and the nonce and cipher text are authenticated with hmac-sha256 so tampered messages are rejected
+    attrs:
+        session_id: str
+            identifies the session key to the receiver
+        key: bytes
+            the session key
+        wrapped_key: dict | None
+            the session key encrypted with the peers public key, or with each members by name for a group,
+            only set by the sender
+        wrapped_key_binary: dict | None
+            wrapped_key with the RSA blocks as raw bytes for the binary wire format, only set by the sender
+        created_time: float
+            the time.monotonic() the session cipher was created
+        message_count: int
+            the number of messages encrypted with the session key
+        __encryption_key: bytes
+            the key for the keystream derived from key
+        __mac_key: bytes
+            the key for the hmac derived from key
+    methods:
+        export_key()
+            returns the session key as base64 so it can be wrapped with RSA
+        encrypt(plain_text)
+            encrypts plain text
+        decrypt(encrypted)
+            decrypts and authenticates encrypted content
+        encrypt_bytes(plain_text)
+            encrypts plain text without base64 encoding
+        decrypt_bytes(encrypted)
+            decrypts and authenticates content from encrypt_bytes
+    """
+    def __init__(self, key: bytes | None = None, session_id: str | None = None) -> None:
+        """
+        __init__ initialises the session cipher generating a new random key and id if none are given
+
+        Args:
+            key (bytes | None): the session key. Defaults to None.
+            session_id (str | None): the session id. Defaults to None.
+        """
+        if key is None:
+            key = secrets.token_bytes(SESSION_KEY_LENGTH)
+        if session_id is None:
+            session_id = secrets.token_hex(SESSION_ID_LENGTH)
+        if isinstance(key, bytes) and len(key) == SESSION_KEY_LENGTH:
+            if isinstance(session_id, str):
+                self.session_id = session_id
+                self.key = key
+                self.wrapped_key: dict | None = None
+                self.wrapped_key_binary: dict | None = None
+                self.created_time = time.monotonic()
+                self.message_count = 0
+                self.__encryption_key = hmac.new(key, b'encryption', hashlib.sha256).digest()
+                self.__mac_key = hmac.new(key, b'authentication', hashlib.sha256).digest()
+            else:
+                raise ValueError(f'expected session_id type str instead got type {type(session_id)}')
+        else:
+            raise ValueError(f'expected key type bytes of length {SESSION_KEY_LENGTH}')
+
+    def export_key(self) -> str:
+        """
+        export_key returns the session key as base64 so it can be wrapped with RSA
+
+        Returns:
+            str: the base64 session key
+        """
+        return base64.b64encode(self.key).decode()
+
+    def encrypt(self, plain_text: str) -> dict:
+        """
+        encrypt encrypts plain text with a new random nonce
+
+        Args:
+            plain_text (str): the text to encrypt
+
+        Returns:
+            dict: the base64 nonce, cipher_text and mac
+        """
+        encrypted = self.encrypt_bytes(plain_text=plain_text)
+        return {field: base64.b64encode(value).decode() for field, value in encrypted.items()}
+
+    def decrypt(self, encrypted: dict) -> str:
+        """
+        decrypt authenticates and decrypts content from encrypt
+
+        Args:
+            encrypted (dict): the base64 nonce, cipher_text and mac
+
+        Raises:
+            ValueError: the mac does not match so the content was tampered with or used a different key
+
+        Returns:
+            str: the plain text
+        """
+        if isinstance(encrypted, dict):
+            return self.decrypt_bytes(
+                encrypted={field: base64.b64decode(encrypted[field]) for field in ('nonce', 'cipher_text', 'mac')}
+                )
+        else:
+            raise ValueError(f'expected encrypted type dict instead got type {type(encrypted)}')
+
+    def encrypt_bytes(self, plain_text: str) -> dict[str, bytes]:
+        """
+        encrypt_bytes encrypts plain text with a new random nonce
+
+        Args:
+            plain_text (str): the text to encrypt
+
+        Returns:
+            dict[str, bytes]: the nonce, cipher_text and mac
+        """
+        if isinstance(plain_text, str):
+            self.message_count += 1
+            nonce = secrets.token_bytes(NONCE_LENGTH)
+            cipher_text = self.__xor_keystream(data=plain_text.encode('utf-8'), nonce=nonce)
+            mac = self.__mac(nonce=nonce, cipher_text=cipher_text)
+            return {
+                'nonce': nonce,
+                'cipher_text': cipher_text,
+                'mac': mac
+            }
+        else:
+            raise ValueError(f'expected plain_text type str instead got type {type(plain_text)}')
+
+    def decrypt_bytes(self, encrypted: dict[str, bytes]) -> str:
+        """
+        decrypt_bytes authenticates and decrypts content from encrypt_bytes
+
+        Args:
+            encrypted (dict[str, bytes]): the nonce, cipher_text and mac
+
+        Raises:
+            ValueError: the mac does not match so the content was tampered with or used a different key
+
+        Returns:
+            str: the plain text
+        """
+        if isinstance(encrypted, dict):
+            nonce = encrypted['nonce']
+            cipher_text = encrypted['cipher_text']
+            if hmac.compare_digest(encrypted['mac'], self.__mac(nonce=nonce, cipher_text=cipher_text)):
+                return self.__xor_keystream(data=cipher_text, nonce=nonce).decode('utf-8')
+            else:
+                raise ValueError(f'message authentication failed for session {self.session_id}')
+        else:
+            raise ValueError(f'expected encrypted type dict instead got type {type(encrypted)}')
+
+    def __xor_keystream(self, data: bytes, nonce: bytes) -> bytes:
+        """
+        __xor_keystream xors data with the keystream for the nonce, encrypts and decrypts
+
+        Args:
+            data (bytes): the data to xor
+            nonce (bytes): the nonce of the message
+
+        Returns:
+            bytes: the xored data
+        """
+        if len(data) == 0:
+            return b''
+        keystream = hashlib.shake_256(self.__encryption_key + nonce).digest(len(data))
+        xored = int.from_bytes(data, 'big') ^ int.from_bytes(keystream, 'big')
+        return xored.to_bytes(len(data), 'big')
+
+    def __mac(self, nonce: bytes, cipher_text: bytes) -> bytes:
+        """
+        __mac calculates the hmac of a message
+
+        Args:
+            nonce (bytes): the nonce of the message
+            cipher_text (bytes): the cipher text of the message
+
+        Returns:
+            bytes: the hmac
+        """
+        return hmac.new(self.__mac_key, self.session_id.encode() + nonce + cipher_text, hashlib.sha256).digest()
+
+
+class Session_cache:
+    """
+    Session_cache a least recently used cache of session ciphers
+    a session cipher is evicted once it is older than ttl or has encrypted max_messages
+    so that keys are rotated without restarting the app
+    attrs:
+        max_size: int
+            the most session ciphers to keep, the least recently used is evicted first
+        ttl: float
+            the seconds a session cipher can be used for
+        max_messages: int | None
+            the number of messages a session cipher can encrypt before a new key is made, None for no limit
+        __session_ciphers: OrderedDict[tuple, Session_cipher]
+            the cached session ciphers, most recently used last
+    methods:
+        get(key)
+            gets a session cipher if it is cached and still valid
+        put(key, session_cipher)
+            adds a session cipher to the cache
+        remove(key)
+            removes a session cipher from the cache
+        clear()
+            removes all session ciphers
+    """
+    def __init__(self, max_size: int = 256, ttl: float = 3600, max_messages: int | None = 10000) -> None:
+        """
+        __init__ initialises the session cache
+
+        Args:
+            max_size (int): the most session ciphers to keep. Defaults to 256.
+            ttl (float): the seconds a session cipher can be used for. Defaults to 3600.
+            max_messages (int | None): messages per session key, None for no limit. Defaults to 10000.
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self.max_messages = max_messages
+        self.__session_ciphers: OrderedDict[tuple, Session_cipher] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self.__session_ciphers)
+
+    def __contains__(self, key: tuple) -> bool:
+        return self.get(key) is not None
+
+    def get(self, key: tuple) -> Session_cipher | None:
+        """
+        get gets a session cipher if it is cached and still valid, evicting it if it has expired
+
+        Args:
+            key (tuple): the key of the session cipher
+
+        Returns:
+            Session_cipher | None: the session cipher or None if there is no valid one
+        """
+        session_cipher = self.__session_ciphers.get(key)
+        if session_cipher is None:
+            return None
+        if self.is_expired(session_cipher=session_cipher):
+            self.__session_ciphers.pop(key)
+            return None
+        self.__session_ciphers.move_to_end(key)
+        return session_cipher
+
+    def put(self, key: tuple, session_cipher: Session_cipher) -> None:
+        """
+        put adds a session cipher to the cache evicting the least recently used if the cache is full
+
+        Args:
+            key (tuple): the key of the session cipher
+            session_cipher (Session_cipher): the session cipher
+        """
+        self.__session_ciphers[key] = session_cipher
+        self.__session_ciphers.move_to_end(key)
+        while len(self.__session_ciphers) > self.max_size:
+            self.__session_ciphers.popitem(last=False)
+
+    def remove(self, key: tuple) -> None:
+        """
+        remove removes a session cipher from the cache if it is cached
+
+        Args:
+            key (tuple): the key of the session cipher
+        """
+        self.__session_ciphers.pop(key, None)
+
+    def clear(self) -> None:
+        """
+        clear removes all session ciphers
+        """
+        self.__session_ciphers.clear()
+
+    def is_expired(self, session_cipher: Session_cipher) -> bool:
+        """
+        is_expired checks if a session cipher is too old or has encrypted too many messages
+
+        Args:
+            session_cipher (Session_cipher): the session cipher to check
+
+        Returns:
+            bool: whether or not the session cipher should be replaced
+        """
+        if time.monotonic() - session_cipher.created_time > self.ttl:
+            return True
+        if self.max_messages is not None and session_cipher.message_count >= self.max_messages:
+            return True
+        return False
@@ -5,6 +5,7 @@ import peertopeermessagingapp.RSA_encrypt as RSA_encrypt
 import peertopeermessagingapp.RSA_decrypt as RSA_decrypt
 import peertopeermessagingapp.chat as chat
 from peertopeermessagingapp.message import message
+from peertopeermessagingapp.address_book import Address_book
 from dataclasses import dataclass
 
 
@@ -26,10 +27,14 @@ class user_data:
             the private key of the user
         __public_key: list[int]
             the public key of the user
+        __private_key_context: RSA_decrypt.Private_key | None
+            the private key with its chinese remainder theorem values precomputed
         logger: logging.Logger
             the info and error logger
-        address_book: dict
+        address_book: Address_book
             the address book of the user
+        dead_letters: list[dict]
+            the queued messages that could not be sent, kept until their target comes back
     methods:
         get_address(name)
             returns an address from the address book if it exists
@@ -43,6 +48,8 @@ class user_data:
         get_public_key(key)
             returns the public key of the user
             key can be 'n' or 'e'
+        get_private_key_context()
+            returns the RSA_decrypt.Private_key of the user
         save_user_data()
             saves the user data to the user data file
         set_username(username)
@@ -74,10 +81,12 @@ class user_data:
             loads the user data from the user data file
         add_chat(chat)
             adds a chat to the user data
+        add_group_chat(name, icon, members)
+            adds a group chat to the user data
         remove_chat(chat)
             removes a chat from the user data
         get_known_users()
-            returns a list of the known users
+            returns the known users
     """
     def __init__(self, app) -> None:  # TODO: make private variable accessible eg add funcs to access them
         """
@@ -100,10 +109,14 @@ class user_data:
                 the private key of the user
             __public_key: list[int]
                 the public key of the user
+            __private_key_context: RSA_decrypt.Private_key | None
+                the private key with its chinese remainder theorem values precomputed
             logger: logging.Logger
                 the info and error logger
-            address_book: dict
+            address_book: Address_book
                 the address book of the user
+            dead_letters: list[dict]
+                the queued messages that could not be sent, kept until their target comes back
         """
         self.username = None
         self.__chats = {}
@@ -112,21 +125,23 @@ class user_data:
         self.__user_data = {}  # TODO Remove
         self.__private_key: list[int] = []
         self.__public_key: list[int] = []
+        self.__private_key_context: RSA_decrypt.Private_key | None = None
         self.logger = logging.getLogger(name=__name__)
-        self.address_book = {}
+        self.address_book = Address_book()
+        self.dead_letters: list[dict] = []
 
-    def get_known_users(self) -> list[str]:
+    def get_known_users(self) -> tuple[str, ...]:
         """
-        get_known_users returns a list of the known users
+        get_known_users returns the known users
 
         Returns:
-            list[str]: a list of the known users
+            tuple[str, ...]: the known users
         """
         if self.address_book is None:
             self.logger.error('Address book is None')
-            return []
+            return ()
         else:
-            return list(self.address_book.keys())
+            return self.address_book.get_names()
 
     def get_address(self, name) -> dict | None:
         """
@@ -214,6 +229,22 @@ class user_data:
                 case _:
                     raise ValueError(f'Invalid key expected n or e instead got {key}')
 
+    def get_private_key_context(self) -> RSA_decrypt.Private_key:
+        """
+        get_private_key_context returns the private key of the user as a RSA_decrypt.Private_key
+        decrypting with it uses the chinese remainder theorem if p and q are known
+
+        Raises:
+            ValueError: private key is undefined
+                raises ValueError if the private key is undefined
+
+        Returns:
+            RSA_decrypt.Private_key: the private key
+        """
+        if self.__private_key_context is None:
+            raise ValueError('Private key is undefined')
+        return self.__private_key_context
+
     def set_username(self, username) -> None:
         if isinstance(username, str):
             self.username = username
@@ -225,7 +256,7 @@ class user_data:
         set_encryption_keys sets the encryption keys of the user
 
         Args:
-            private_key (list[int]): the private key of the user
+            private_key (list[int]): the private key of the user, n, d and optionally p, q
             public_key (list[int]): the public key of the user
 
         Raises:
@@ -236,8 +267,9 @@ class user_data:
         """
         if all(isinstance(item, int) for item in private_key):
             if all(isinstance(item, int) for item in public_key):
-                self.__private_key = private_key  # N, D
+                self.__private_key = private_key  # N, D, P, Q
                 self.__public_key = public_key  # N, E
+                self.__private_key_context = RSA_decrypt.Private_key(*private_key[:4])
                 self.__user_data['public_key_n'] = public_key[0]
                 self.__user_data['public_key_e'] = public_key[1]
             else:
@@ -316,23 +348,26 @@ class user_data:
             Boolean: whether or not the decryption was successful
         """
         # check if login is valid
-        self.logger.debug('decrypting decrypt checker...')
-        decrypt_checker = RSA_decrypt.decrypt_data(
-            encrypted=data['decrypt_checker'],
+        # p and q are recovered from n, d and e so decryption can use the chinese remainder theorem
+        self.logger.debug('creating private key...')
+        private_key = RSA_decrypt.create_private_key(
             private_key_n=privateKN,
-            private_key_d=privateKD
+            private_key_d=privateKD,
+            public_key_e=data.get('public_key_e', 65537)
             )
+        self.logger.debug('decrypting decrypt checker...')
+        try:
+            decrypt_checker = private_key.decrypt_data(encrypted=data['decrypt_checker'])
+        except ValueError as error:  # an invalid key can decrypt to values that are not characters
+            self.logger.warning(f'Decrypt checker invalid {error}')
+            return False
         self.logger.debug('successfully decrypted decrypt checker')
         self.logger.debug(f'validating decrypt checker \'{decrypt_checker}\'...')
         if decrypt_checker == username:
             self.logger.debug('decrypt checker valid')
             # decrypt user data
             self.logger.debug('decrypting user data...')
-            user_data_decrypted = RSA_decrypt.decrypt_data(
-                encrypted=data['data'],
-                private_key_d=privateKD,
-                private_key_n=privateKN
-                )
+            user_data_decrypted = private_key.decrypt_data(encrypted=data['data'])
 
             # format as dictionary and store in memory
             self.logger.debug('Successfully decrypted user data')
@@ -341,18 +376,28 @@ class user_data:
             self.logger.debug('successfully formatted json')
             self.logger.debug('setting vars...')
             self.username = username
-            self.set_encryption_keys(
-                private_key=[
+            if private_key.uses_crt():
+                private_key_list = [privateKN, privateKD, private_key.p, private_key.q]
+            elif 'private_key_p' in self.__user_data and 'private_key_q' in self.__user_data:
+                private_key_list = [
                     privateKN,
-                    privateKD
-                    ],
+                    privateKD,
+                    self.__user_data['private_key_p'],
+                    self.__user_data['private_key_q']
+                    ]
+            else:
+                private_key_list = [privateKN, privateKD]
+            self.set_encryption_keys(
+                private_key=private_key_list,
                 public_key=[
                     self.__user_data['public_key_n'],
                     self.__user_data['public_key_e'],
                     ]
                 )
             if self.__user_data.__contains__('address_book'):
-                self.address_book = self.__user_data['address_book']
+                self.address_book = Address_book(self.__user_data['address_book'])
+            if self.__user_data.__contains__('dead_letters'):
+                self.dead_letters = self.__user_data['dead_letters']
             self.logger.debug('successfully set vars')
             return True
         else:
@@ -369,6 +414,7 @@ class user_data:
         """
         encrypted_data = {
             'username': self.username,
+            'public_key_e': self.get_public_key(key='e'),  # public, used to recover p and q on login
             'decrypt_checker': RSA_encrypt.encrypt_data(
                 plain_text=self.username,  # TODO make dict to make clearer
                 public_key_n=self.get_public_key(key='n'),
@@ -404,8 +450,13 @@ class user_data:
             'public_key_e': self.get_public_key(key='e'),
             'theme': self.__app.GUI.theme,
             'chats': chat_dict,
-            'address_book': self.address_book
+            'address_book': self.address_book,
+            'dead_letters': self.dead_letters
         }
+        private_key_context = self.get_private_key_context()
+        if private_key_context.uses_crt():
+            data_to_save['private_key_p'] = private_key_context.p
+            data_to_save['private_key_q'] = private_key_context.q
         return data_to_save
 
     def save_to_file(self) -> None:
@@ -492,6 +543,26 @@ class user_data:
             new_chat.create_chat(name=name, icon=icon)  # TODO move create_chat into init
             self.__chats[name] = (new_chat)
 
+    def add_group_chat(self, name: str, icon: str, members: list[str]) -> None:
+        """
+        add_group_chat adds a new group chat to the user
+
+        Args:
+            name (str): the name of the group
+            icon (str): the icon of the chat
+            members (list[str]): the names of the other users in the group
+        """
+        if self.__chats.__contains__(name):
+            self.logger.warning(f'chat {name} already exists')
+        else:
+            new_chat = chat.Chat(app=self.__app)
+            new_chat.create_chat(
+                name=name,
+                icon=icon,
+                members=[member for member in members if member != self.username]
+                )
+            self.__chats[name] = new_chat
+
     def remove_chat(self, chat) -> None:
         """
         remove_chat removes a chat from the user
@@ -0,0 +1,362 @@
+"""
+this module holds the binary wire format for messages
+version 1 is the json envelope, version 2 is a fixed header followed by a compact typed map
+where cipher text is raw bytes instead of json lists of integers or base64
+a binary message starts with BINARY_MAGIC which a json message never does, so both can share a connection
+"""
+import json
+import struct
+
+WIRE_VERSION_JSON = 1
+WIRE_VERSION_BINARY = 2
+SUPPORTED_WIRE_VERSIONS = (WIRE_VERSION_JSON, WIRE_VERSION_BINARY)
+BINARY_MAGIC = 0xB1
+# magic, version, request id length
+BINARY_HEADER = struct.Struct('!BBH')
+
+TAG_NONE = 0x00
+TAG_FALSE = 0x01
+TAG_TRUE = 0x02
+TAG_INT = 0x03
+TAG_FLOAT = 0x04
+TAG_STR = 0x05
+TAG_BYTES = 0x06
+TAG_LIST = 0x07
+TAG_MAP = 0x08
+LENGTH = struct.Struct('!I')
+INT_LENGTH = struct.Struct('!H')
+FLOAT = struct.Struct('!d')
+# a tag byte followed by a length, packed together when encoding
+TAGGED_LENGTH = struct.Struct('!BI')
+TAGGED_INT_LENGTH = struct.Struct('!BH')
+TAGGED_FLOAT = struct.Struct('!Bd')
+ENCODED_NONE = bytes([TAG_NONE])
+ENCODED_FALSE = bytes([TAG_FALSE])
+ENCODED_TRUE = bytes([TAG_TRUE])
+
+
+def encode_value(value) -> bytes:
+    """
+    encode_value encodes a value as a tag byte followed by its data
+
+    Args:
+        value (None | bool | int | float | str | bytes | list | tuple | dict): the value to encode, map keys must be str
+
+    Raises:
+        ValueError: if the value or a value inside it can not be encoded
+
+    Returns:
+        bytes: the encoded value
+    """
+    parts: list[bytes] = []
+    _encode_into(value, parts)
+    return b''.join(parts)
+
+
+def _encode_into(value, parts: list[bytes]) -> None:
+    """
+    _encode_into encodes a value onto the end of parts
+
+    Args:
+        value (any): the value to encode
+        parts (list[bytes]): the encoded parts so far
+    """
+    if isinstance(value, str):
+        data = value.encode('utf-8')
+        parts.append(TAGGED_LENGTH.pack(TAG_STR, len(data)))
+        parts.append(data)
+    elif isinstance(value, dict):
+        parts.append(TAGGED_LENGTH.pack(TAG_MAP, len(value)))
+        for key, item in value.items():
+            if not isinstance(key, str):
+                raise ValueError(f'expected map key type str instead got type {type(key)}')
+            _encode_into(key, parts)
+            _encode_into(item, parts)
+    elif isinstance(value, (bytes, bytearray)):
+        parts.append(TAGGED_LENGTH.pack(TAG_BYTES, len(value)))
+        parts.append(bytes(value))
+    elif value is None:
+        parts.append(ENCODED_NONE)
+    elif value is True:
+        parts.append(ENCODED_TRUE)
+    elif value is False:
+        parts.append(ENCODED_FALSE)
+    elif isinstance(value, int):
+        data = value.to_bytes((value.bit_length() + 8) // 8, 'big', signed=True)
+        parts.append(TAGGED_INT_LENGTH.pack(TAG_INT, len(data)))
+        parts.append(data)
+    elif isinstance(value, float):
+        parts.append(TAGGED_FLOAT.pack(TAG_FLOAT, value))
+    elif isinstance(value, (list, tuple)):
+        parts.append(TAGGED_LENGTH.pack(TAG_LIST, len(value)))
+        for item in value:
+            _encode_into(item, parts)
+    else:
+        raise ValueError(f'can not encode type {type(value)}')
+
+
+def decode_value(data: bytes):
+    """
+    decode_value decodes a value from encode_value
+
+    Args:
+        data (bytes): the encoded value
+
+    Raises:
+        ValueError: if the data is not a single encoded value
+
+    Returns:
+        any: the value
+    """
+    value, offset = _decode_from(memoryview(data), 0)
+    if offset != len(data):
+        raise ValueError(f'{len(data) - offset} bytes left over after decoding value')
+    return value
+
+
+def _decode_from(data: memoryview, offset: int) -> tuple:
+    """
+    _decode_from decodes the value starting at offset
+
+    Args:
+        data (memoryview): the encoded data
+        offset (int): where the value starts
+
+    Raises:
+        ValueError: if the data is truncated or has an unknown tag
+
+    Returns:
+        tuple[any, int]: the value and the offset after it
+    """
+    try:
+        tag = data[offset]
+        offset += 1
+        match tag:
+            case 0x00:
+                return None, offset
+            case 0x01:
+                return False, offset
+            case 0x02:
+                return True, offset
+            case 0x03:
+                (length,) = INT_LENGTH.unpack_from(data, offset)
+                offset += INT_LENGTH.size
+                value = int.from_bytes(_read(data=data, offset=offset, length=length), 'big', signed=True)
+                return value, offset + length
+            case 0x04:
+                (value,) = FLOAT.unpack_from(data, offset)
+                return value, offset + FLOAT.size
+            case 0x05 | 0x06:
+                (length,) = LENGTH.unpack_from(data, offset)
+                offset += LENGTH.size
+                value = _read(data=data, offset=offset, length=length)
+                return (value.decode('utf-8') if tag == TAG_STR else value), offset + length
+            case 0x07:
+                (length,) = LENGTH.unpack_from(data, offset)
+                offset += LENGTH.size
+                items = []
+                for _ in range(length):
+                    item, offset = _decode_from(data, offset)
+                    items.append(item)
+                return items, offset
+            case 0x08:
+                (length,) = LENGTH.unpack_from(data, offset)
+                offset += LENGTH.size
+                items = {}
+                for _ in range(length):
+                    key, offset = _decode_from(data, offset)
+                    items[key], offset = _decode_from(data, offset)
+                return items, offset
+            case _:
+                raise ValueError(f'unknown tag {tag}')
+    except (IndexError, struct.error) as error:
+        raise ValueError(f'truncated value: {error}')
+
+
+def _read(data: memoryview, offset: int, length: int) -> bytes:
+    """
+    _read reads length bytes from offset
+
+    Args:
+        data (memoryview): the encoded data
+        offset (int): where to start
+        length (int): the number of bytes
+
+    Raises:
+        ValueError: if there are fewer than length bytes left
+
+    Returns:
+        bytes: the bytes
+    """
+    if offset + length > len(data):
+        raise ValueError('truncated value')
+    return bytes(data[offset:offset + length])
+
+
+def is_binary_message(message: str | bytes) -> bool:
+    """
+    is_binary_message checks if a message uses the binary wire format
+
+    Args:
+        message (str | bytes): the message
+
+    Returns:
+        bool: whether or not the message is binary
+    """
+    return isinstance(message, (bytes, bytearray)) and len(message) > 0 and message[0] == BINARY_MAGIC
+
+
+def encode_binary_message(message: dict) -> bytes:
+    """
+    encode_binary_message encodes a message with the binary wire format
+    the request id goes in the fixed header so replies can be routed without decoding the rest
+
+    Args:
+        message (dict): the message, its values must be supported by encode_value
+
+    Returns:
+        bytes: the encoded message
+    """
+    fields = dict(message)
+    request_id = str(fields.pop('request_id', '') or '').encode('utf-8')
+    return BINARY_HEADER.pack(BINARY_MAGIC, WIRE_VERSION_BINARY, len(request_id)) + request_id + encode_value(fields)
+
+
+def decode_binary_message(message: bytes) -> dict:
+    """
+    decode_binary_message decodes a message from encode_binary_message
+
+    Args:
+        message (bytes): the encoded message
+
+    Raises:
+        ValueError: if the message is not a binary message
+
+    Returns:
+        dict: the message
+    """
+    request_id = get_binary_request_id(message=message)
+    fields = decode_value(message[BINARY_HEADER.size + len(request_id.encode('utf-8')):])
+    if not isinstance(fields, dict):
+        raise ValueError(f'expected message type dict instead got type {type(fields)}')
+    if request_id:
+        fields['request_id'] = request_id
+    return fields
+
+
+def get_binary_request_id(message: bytes) -> str:
+    """
+    get_binary_request_id reads the request id from the header of a binary message
+
+    Args:
+        message (bytes): the encoded message
+
+    Raises:
+        ValueError: if the message is not a binary message of a supported version
+
+    Returns:
+        str: the request id, empty if the message has none
+    """
+    if len(message) < BINARY_HEADER.size:
+        raise ValueError('truncated message header')
+    magic, version, request_id_length = BINARY_HEADER.unpack_from(message)
+    if magic != BINARY_MAGIC or version != WIRE_VERSION_BINARY:
+        raise ValueError(f'unsupported binary message version {version}')
+    return bytes(message[BINARY_HEADER.size:BINARY_HEADER.size + request_id_length]).decode('utf-8')
+
+
+def get_request_id(message: str | bytes) -> str | None:
+    """
+    get_request_id gets the request id of a message in either wire format
+
+    Args:
+        message (str | bytes): the message
+
+    Returns:
+        str | None: the request id or None if the message has none or can not be read
+    """
+    try:
+        if is_binary_message(message=message):
+            return get_binary_request_id(message=message) or None
+        parsed_message = json.loads(message)
+    except (ValueError, UnicodeDecodeError):
+        return None
+    if isinstance(parsed_message, dict):
+        return parsed_message.get('request_id')
+    return None
+
+
+def set_request_id(message: str | bytes, request_id: str) -> str | bytes:
+    """
+    set_request_id replaces the request id of a message in either wire format without touching its content
+    so a message can be forwarded on a connection where its old request id may already be in use
+
+    Args:
+        message (str | bytes): the message
+        request_id (str): the new request id
+
+    Raises:
+        ValueError: if the message can not be read
+
+    Returns:
+        str | bytes: the message with the new request id in the same wire format
+    """
+    if is_binary_message(message=message):
+        old_request_id = get_binary_request_id(message=message).encode('utf-8')
+        new_request_id = request_id.encode('utf-8')
+        return (
+            BINARY_HEADER.pack(BINARY_MAGIC, WIRE_VERSION_BINARY, len(new_request_id))
+            + new_request_id
+            + bytes(message[BINARY_HEADER.size + len(old_request_id):])
+        )
+    parsed_message = json.loads(message)
+    if not isinstance(parsed_message, dict):
+        raise ValueError(f'expected message type dict instead got type {type(parsed_message)}')
+    parsed_message['request_id'] = request_id
+    return json.dumps(parsed_message)
+
+
+def get_block_size(public_key_n: int) -> int:
+    """
+    get_block_size gets the number of bytes every cipher text block for n fits in
+
+    Args:
+        public_key_n (int): the public key n
+
+    Returns:
+        int: the number of bytes
+    """
+    return (public_key_n.bit_length() + 7) // 8
+
+
+def int_blocks_to_bytes(blocks: list[int], block_size: int) -> bytes:
+    """
+    int_blocks_to_bytes packs RSA cipher text blocks as fixed width big endian bytes
+
+    Args:
+        blocks (list[int]): the cipher text blocks, each below n
+        block_size (int): the bytes each block takes, from get_block_size
+
+    Returns:
+        bytes: the packed blocks
+    """
+    return b''.join([block.to_bytes(block_size, 'big') for block in blocks])
+
+
+def bytes_to_int_blocks(data: bytes, block_size: int) -> list[int]:
+    """
+    bytes_to_int_blocks unpacks cipher text blocks from int_blocks_to_bytes
+
+    Args:
+        data (bytes): the packed blocks
+        block_size (int): the bytes each block takes, from get_block_size
+
+    Raises:
+        ValueError: if data is not a whole number of blocks
+
+    Returns:
+        list[int]: the cipher text blocks
+    """
+    if block_size <= 0 or len(data) % block_size != 0:
+        raise ValueError(f'{len(data)} bytes is not a whole number of {block_size} byte blocks')
+    return [int.from_bytes(data[index:index + block_size], 'big') for index in range(0, len(data), block_size)]
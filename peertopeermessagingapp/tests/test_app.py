@@ -1,12 +1,45 @@
 import pytest
 from src.peertopeermessagingapp.user_data import user_data
 from src.peertopeermessagingapp.RSA_encrypt import encrypt_data
-from src.peertopeermessagingapp.RSA_decrypt import decrypt_data
-from src.peertopeermessagingapp.RSA_gen_keys import gen_keys
+from src.peertopeermessagingapp.RSA_decrypt import decrypt_data, Private_key, create_private_key
+from src.peertopeermessagingapp.RSA_gen_keys import gen_keys, generate_2_prime_numbers
 from src.peertopeermessagingapp.message import message
+from src.peertopeermessagingapp.session_cipher import Session_cache, Session_cipher, public_key_fingerprint
+from src.peertopeermessagingapp.retry_scheduler import Retry_scheduler
+from src.peertopeermessagingapp.framing import encode_frame, read_frame
+from src.peertopeermessagingapp.compression import compress_content, decompress_content
+from src.peertopeermessagingapp.address_book_subscriptions import Address_book_subscriptions
+from src.peertopeermessagingapp.address_book import Address_book
+from src.peertopeermessagingapp.connection_pool import Connection_pool
+from src.peertopeermessagingapp.dht import Dht_node, Routing_table, get_node_id, get_record_hash, is_valid_record
+from src.peertopeermessagingapp.lan_discovery import Lan_discovery, create_announcement
+from src.peertopeermessagingapp.mailbox import Mailbox
+from src.peertopeermessagingapp.chat import Chat
+from src.peertopeermessagingapp.backend import Backend_manager
+import src.peertopeermessagingapp.math_stuff as math_stuff
+import asyncio
+import importlib.util
 import json
+import os
+import socket
+import time
 import src.peertopeermessagingapp.network_manager as network_manager
 
+NAME_SERVER_PATH = os.path.join(os.path.dirname(__file__), '..', '..', 'name_server', 'name_server.py')
+
+
+def load_name_server():
+    """
+    load_name_server loads the name server module, which runs on its own so is not part of the package
+
+    Returns:
+        module: the name server module
+    """
+    spec = importlib.util.spec_from_file_location('name_server', NAME_SERVER_PATH)
+    name_server = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(name_server)
+    return name_server
+
 
 class Test_Encrypt_data:
 
@@ -85,6 +118,156 @@ class Test_Encrypt_data:
             assert decrypted == plain_text
 
 
+class Test_carmichael:
+
+    # the factor based lambda(n) matches the brute force carmichael for small keys
+    def test_carmichael_from_primes_matches_brute_force(self) -> None:
+        primes = [3, 5, 7, 11, 13, 17, 19, 23]
+        for p in primes:
+            for q in primes:
+                assert math_stuff.carmichael_from_primes(p, q) == math_stuff.carmichael(p * q)
+
+    # raises ValueError if p is not an integer
+    def test_raises_value_error_if_p_not_int(self) -> None:
+        with pytest.raises(ValueError, match="expected p type int instead got type <class 'str'>"):
+            math_stuff.carmichael_from_primes('13', 17)
+
+
+class Test_primes:
+
+    # miller rabin with the small prime filter agrees with trial division
+    def test_is_prime_matches_trial_division(self) -> None:
+        for n in range(-5, 10000):
+            expected = n > 1 and all(n % i != 0 for i in range(2, int(n ** 0.5) + 1))
+            assert math_stuff.is_prime(n) == expected
+
+    # detects large primes and large composites
+    def test_is_prime_large_numbers(self) -> None:
+        assert math_stuff.is_prime(2**127 - 1)
+        assert not math_stuff.is_prime(2**127 + 1)
+        assert not math_stuff.is_prime(3215031751)  # strong pseudoprime to bases 2, 3, 5 and 7
+
+    # generates 2 different primes whose product has the requested bit length
+    def test_generate_2_prime_numbers_with_key_bits(self) -> None:
+        p, q = generate_2_prime_numbers(generator_seed=0, key_bits=256)
+        assert p != q
+        assert math_stuff.is_prime(p) and math_stuff.is_prime(q)
+        assert (p * q).bit_length() == 256
+
+    # raises ValueError rather than making a shorter key than asked for
+    def test_raises_value_error_for_odd_or_small_key_bits(self) -> None:
+        with pytest.raises(ValueError, match="expected key_bits to be even"):
+            generate_2_prime_numbers(generator_seed=0, key_bits=257)
+        with pytest.raises(ValueError, match="expected key_bits greater than or = to 16"):
+            gen_keys(seed=10, complexity=2, key_bits=8)
+
+
+class Test_gcd_and_modular_inverse:
+
+    # binary gcd agrees with the definition on small values
+    def test_greatest_common_divisor(self) -> None:
+        for x in range(0, 60):
+            for y in range(1, 60):
+                expected = max(num for num in range(1, max(x, y) + 1) if x % num == 0 and y % num == 0)
+                assert math_stuff.greatest_common_divisor(x, y) == expected
+
+    # extended euclid finds the smallest positive inverse on large keys
+    def test_find_modular_multiplicative_inverse(self) -> None:
+        m = (2**89 - 2) * (2**61 - 2)
+        d = math_stuff.find_modular_multiplicative_inverse(65537, m)
+        assert 0 < d < m
+        assert (65537 * d) % m == 1
+        assert math_stuff.find_modular_multiplicative_inverse(17, 72) == 17
+
+    # raises ValueError rather than looping forever when there is no inverse
+    def test_raises_value_error_if_no_inverse(self) -> None:
+        with pytest.raises(ValueError, match="has no modular multiplicative inverse"):
+            math_stuff.find_modular_multiplicative_inverse(6, 9)
+
+
+class Test_private_key:
+
+    # decrypting with the chinese remainder theorem gives the same result as plain decryption
+    def test_crt_decrypt_matches_decrypt_data(self) -> None:
+        private, public = gen_keys(seed=10, complexity=2, key_bits=512)
+        private_key = Private_key(*private)
+        assert private_key.uses_crt()
+        plain_text = 'hello world $%$_#@_@!)'
+        encrypted = encrypt_data(public_key_n=public[0], public_key_e=public[1], plain_text=plain_text)
+        assert private_key.decrypt_data(encrypted) == plain_text
+        assert private_key.decrypt_data(encrypted) == decrypt_data(
+            encrypted=encrypted,
+            private_key_n=private[0],
+            private_key_d=private[1]
+            )
+
+    # recovers p and q from n, d and e so that crt can be used on login
+    def test_create_private_key_recovers_factors(self) -> None:
+        private, public = gen_keys(seed=10, complexity=2)
+        private_key = create_private_key(private_key_n=private[0], private_key_d=private[1], public_key_e=public[1])
+        assert private_key.uses_crt()
+        assert sorted([private_key.p, private_key.q]) == sorted(private[2:])
+
+    # falls back to plain decryption when p and q are not valid
+    def test_private_key_without_valid_factors(self) -> None:
+        private_key = Private_key(n=323, d=17, p=3, q=5)
+        assert not private_key.uses_crt()
+        assert private_key.decrypt_data([48, 16, 115, 48, 83]) == 'test1'
+
+
+class Test_session_cipher:
+
+    # encrypts and decrypts with the same key
+    def test_encrypts_and_decrypts(self) -> None:
+        cipher = Session_cipher()
+        receiver = Session_cipher(key=cipher.key, session_id=cipher.session_id)
+        for plain_text in ['', 'hello', 'hello wörld 🙂' * 100]:
+            encrypted = cipher.encrypt(plain_text)
+            assert encrypted['cipher_text'] != plain_text or plain_text == ''
+            assert receiver.decrypt(encrypted) == plain_text
+
+    # rejects cipher text that has been tampered with
+    def test_rejects_tampered_cipher_text(self) -> None:
+        cipher = Session_cipher()
+        encrypted = cipher.encrypt('hello')
+        encrypted['cipher_text'] = Session_cipher().encrypt('jello')['cipher_text']
+        with pytest.raises(ValueError, match='message authentication failed'):
+            cipher.decrypt(encrypted)
+
+
+class Test_session_cache:
+
+    # evicts the least recently used session cipher when full
+    def test_evicts_least_recently_used(self) -> None:
+        cache = Session_cache(max_size=2)
+        first, second, third = Session_cipher(), Session_cipher(), Session_cipher()
+        cache.put(key=('a', '1'), session_cipher=first)
+        cache.put(key=('b', '1'), session_cipher=second)
+        assert cache.get(('a', '1')) is first
+        cache.put(key=('c', '1'), session_cipher=third)
+        assert cache.get(('b', '1')) is None
+        assert cache.get(('a', '1')) is first
+        assert len(cache) == 2
+
+    # expires session ciphers after max_messages or ttl
+    def test_expires_session_ciphers(self) -> None:
+        cache = Session_cache(max_messages=2)
+        cipher = Session_cipher()
+        cache.put(key=('a', '1'), session_cipher=cipher)
+        cipher.encrypt('hello')
+        assert cache.get(('a', '1')) is cipher
+        cipher.encrypt('hello')
+        assert cache.get(('a', '1')) is None
+        cache = Session_cache(ttl=-1)
+        cache.put(key=('a', '1'), session_cipher=Session_cipher())
+        assert ('a', '1') not in cache
+
+    # a new public key fingerprint gives a different cache key
+    def test_public_key_fingerprint(self) -> None:
+        assert public_key_fingerprint(public_key_n=323, public_key_e=5) == public_key_fingerprint(323, 5)
+        assert public_key_fingerprint(public_key_n=323, public_key_e=5) != public_key_fingerprint(323, 7)
+
+
 class Test_message_encrypt:
 
     # Encrypts valid message data correctly with the correct module import
@@ -263,6 +446,27 @@ class Test_user_data_store_load:
         decrypted_user_data = user.decrypt_user_data(data=data, username=username, privateKN=323, privateKD=17)
         assert decrypted_user_data
 
+    # the private key is rebuilt with p and q on login so decryption uses crt
+    def test_load_uses_crt_private_key(self, mocker):
+        app = mocker.Mock()
+        app.GUI.theme = {'thing': 'test'}
+        private, public = gen_keys(seed=12, complexity=2)
+        user = user_data(app)
+        user.set_username('test1')
+        user.set_encryption_keys(private, public)
+        encrypted_user_data = user.encrypt_user_data()
+        assert encrypted_user_data['public_key_e'] == public[1]
+
+        loaded_user = user_data(app)
+        assert loaded_user.decrypt_user_data(
+            data=encrypted_user_data,
+            username='test1',
+            privateKN=private[0],
+            privateKD=private[1]
+            )
+        assert loaded_user.get_private_key_context().uses_crt()
+        assert loaded_user.get_public_key('e') == public[1]
+
 
 class Test_network_messaging:
     def test_message_create(self, mocker) -> None:
@@ -288,11 +492,57 @@ class Test_network_messaging:
         expected_message = json.dumps(
             {
                 'command': 'command',
-                'content': content_json.replace('\n', ''),
-                'sender': 'self name'
+                'content': content_json,
+                'sender': 'self name',
+                'request_id': '0'
             }
         )
-        assert message == expected_message + '\n'
+        assert message == expected_message
+
+    # encrypted messages are packed into blocks and decrypted back to the original content
+    def test_encrypted_message_round_trip(self, mocker) -> None:
+        private, public = gen_keys(seed=10, complexity=2, key_bits=512)
+        app = mocker.Mock()
+        app.backend.user_data.get_private_key_context.return_value = Private_key(*private)
+        nm = network_manager.Network_manager(app=app)
+        nm.use_session_encryption = False
+        nm.own_address = {'name': 'self name'}
+        nm.address_book['test_address'] = {
+            'name': 'test_address',
+            'ip': '',
+            'port': 0,
+            'public_key_e': public[1],
+            'public_key_n': public[0]
+        }
+        content = {'text': 'hello world', 'sent_time_stamp': 1622547800}
+        message = nm.create_message(content=content, command='message', target='test_address')
+        assert json.loads(message)['encryption'] == 'rsa_blocks'
+        parsed_message = nm.parse_message(message)
+        assert parsed_message['content'] == content
+        assert parsed_message['sender'] == 'self name'
+
+    # session encrypted messages only unwrap the session key with RSA once per session
+    def test_session_encrypted_message_round_trip(self, mocker) -> None:
+        private, public = gen_keys(seed=10, complexity=2, key_bits=512)
+        app = mocker.Mock()
+        app.backend.user_data.get_private_key_context.return_value = Private_key(*private)
+        nm = network_manager.Network_manager(app=app)
+        nm.own_address = {'name': 'self name'}
+        nm.address_book['test_address'] = {
+            'name': 'test_address',
+            'ip': '',
+            'port': 0,
+            'public_key_e': public[1],
+            'public_key_n': public[0]
+        }
+        for text in ['hello world', 'second message']:
+            content = {'text': text}
+            message = nm.create_message(content=content, command='message', target='test_address')
+            assert json.loads(message)['encryption'] == 'session'
+            assert nm.parse_message(message)['content'] == content
+        assert len(nm.session_ciphers) == 1
+        assert len(nm.peer_session_ciphers) == 1
+        assert app.backend.user_data.get_private_key_context.call_count == 1
 
     def test_parse_message(self, mocker) -> None:
         nm = network_manager.Network_manager(None)
@@ -304,3 +554,1531 @@ class Test_network_messaging:
         message_to_parse = json.dumps(expected_message)
         parsed_message = nm.parse_message(message_to_parse)
         assert parsed_message == expected_message
+
+
+class Test_connection_pool:
+
+    # a burst of messages to one address reuses a single connection which is closed on shutdown
+    def test_send_message_reuses_connection(self) -> None:
+        connections = []
+
+        async def listener(reader, writer) -> None:
+            connections.append(writer)
+            while True:
+                try:
+                    await read_frame(reader)
+                except asyncio.exceptions.IncompleteReadError:
+                    break
+                writer.write(encode_frame(json.dumps({'command': 'message sent', 'content': '', 'sender': 'server'})))
+                await writer.drain()
+
+        async def run() -> None:
+            server = await asyncio.start_server(listener, '127.0.0.1', 0)
+            port = server.sockets[0].getsockname()[1]
+            nm = network_manager.Network_manager(app=None)
+            nm.use_binary_wire_format = False  # the fake server only speaks json
+            address = {'ip': '127.0.0.1', 'port': port}
+            for _ in range(5):
+                response = await nm.send_message(message='{"command": "ping"}', address=address)
+                assert response['command'] == 'message sent'
+            assert len(connections) == 1
+            assert len(nm.connection_pool) == 1
+            # the server closing the idle connection makes the next send reconnect
+            connections[0].close()
+            await asyncio.sleep(0.01)
+            response = await nm.send_message(message='{"command": "ping"}', address=address)
+            assert response['command'] == 'message sent'
+            assert len(connections) == 2
+            await nm.connection_pool.close_all()
+            assert len(nm.connection_pool) == 0
+            server.close()
+            await server.wait_closed()
+
+        asyncio.run(run())
+
+    # replies are routed to the request with the same request id even when they arrive out of order
+    def test_send_message_multiplexes_requests(self) -> None:
+        connections = []
+
+        async def listener(reader, writer) -> None:
+            connections.append(writer)
+            requests = []
+            while True:
+                try:
+                    requests.append(json.loads(await read_frame(reader)))
+                except asyncio.exceptions.IncompleteReadError:
+                    break
+                if len(requests) == 3:
+                    # answer in reverse order once every request has arrived
+                    for request in reversed(requests):
+                        reply = {
+                            'command': 'pong',
+                            'content': request['content'],
+                            'sender': 'server',
+                            'request_id': request['request_id']
+                            }
+                        writer.write(encode_frame(json.dumps(reply)))
+                    await writer.drain()
+                    requests = []
+
+        async def run() -> None:
+            server = await asyncio.start_server(listener, '127.0.0.1', 0)
+            port = server.sockets[0].getsockname()[1]
+            nm = network_manager.Network_manager(app=None)
+            nm.use_binary_wire_format = False  # the fake server only speaks json
+            nm.own_address = {'name': 'self name'}
+            nm.address_book['server'] = {
+                'name': 'server', 'ip': '127.0.0.1', 'port': port, 'public_key_e': 0, 'public_key_n': 0
+                }
+            responses = await asyncio.gather(*[
+                nm.send_message(
+                    message=nm.create_message(content=f'request {i}', command='ping', target='server'),
+                    address=nm.address_book['server']
+                    )
+                for i in range(3)
+                ])
+            assert [response['content'] for response in responses] == ['request 0', 'request 1', 'request 2']
+            assert len(connections) == 1
+            await nm.connection_pool.close_all()
+            server.close()
+            await server.wait_closed()
+
+        asyncio.run(run())
+
+    # a reply without a request id is dropped rather than given to the wrong one of several waiting requests
+    def test_reply_without_request_id_is_dropped(self) -> None:
+        async def listener(reader, writer) -> None:
+            requests = [json.loads(await read_frame(reader)) for _ in range(2)]
+            writer.write(encode_frame(json.dumps({'command': 'pong', 'content': 'no id', 'sender': 'server'})))
+            for request in reversed(requests):
+                reply = {'command': 'pong', 'content': request['content'], 'request_id': request['request_id']}
+                writer.write(encode_frame(json.dumps(reply)))
+            await writer.drain()
+
+        async def run() -> None:
+            server = await asyncio.start_server(listener, '127.0.0.1', 0)
+            port = server.sockets[0].getsockname()[1]
+            connection, _ = await Connection_pool(open_connection=asyncio.open_connection).acquire('127.0.0.1', port)
+            replies = await asyncio.gather(*[
+                connection.request(
+                    message=json.dumps({'content': f'request {i}', 'request_id': str(i)}), request_id=str(i), timeout=2
+                    )
+                for i in range(2)
+                ])
+            assert [json.loads(reply)['content'] for reply in replies] == ['request 0', 'request 1']
+            await connection.close()
+            server.close()
+            await server.wait_closed()
+
+        asyncio.run(run())
+
+    # the sweep closes a connection left idle longer than max_idle without another send to its address
+    def test_run_close_idle_closes_idle_connection(self) -> None:
+        closed = asyncio.Event()
+
+        async def listener(reader, writer) -> None:
+            while True:
+                try:
+                    await read_frame(reader)
+                except asyncio.exceptions.IncompleteReadError:
+                    break
+                writer.write(encode_frame(json.dumps({'command': 'message sent', 'content': '', 'sender': 'server'})))
+                await writer.drain()
+            closed.set()
+
+        async def run() -> None:
+            server = await asyncio.start_server(listener, '127.0.0.1', 0)
+            port = server.sockets[0].getsockname()[1]
+            nm = network_manager.Network_manager(app=None)
+            nm.use_binary_wire_format = False  # the fake server only speaks json
+            nm.connection_pool.max_idle = 0.05
+            sweep_task = asyncio.create_task(nm.connection_pool.run_close_idle(interval=0.01))
+            await nm.send_message(message='{"command": "ping"}', address={'ip': '127.0.0.1', 'port': port})
+            assert len(nm.connection_pool) == 1
+            await asyncio.wait_for(closed.wait(), timeout=2)
+            assert len(nm.connection_pool) == 0
+            sweep_task.cancel()
+            server.close()
+            await server.wait_closed()
+
+        asyncio.run(run())
+
+    # a frame that can not be parsed or handled is answered with an error and the connection stays open
+    def test_invalid_frame_keeps_connection_open(self, mocker) -> None:
+        async def run() -> None:
+            nm = network_manager.Network_manager(app=mocker.Mock())
+            nm.own_address = {'name': 'self name'}
+            for listener in [nm.client_listener, nm.server_listener]:
+                server = await asyncio.start_server(listener, '127.0.0.1', 0)
+                connection, _ = await Connection_pool(open_connection=asyncio.open_connection).acquire(
+                    '127.0.0.1',
+                    server.sockets[0].getsockname()[1]
+                    )
+                commandless = {'content': '', 'request_id': '2'}
+                hello = {'command': 'hello', 'content': {'wire_versions': [1]}, 'sender': 'peer', 'request_id': '3'}
+                # a reply to a frame that is not json has no request id so is only matched when nothing else waits
+                reply = await connection.request(message='not json', request_id='1', timeout=2)
+                assert json.loads(reply)['command'] == 'invalid message'
+                replies = await asyncio.gather(
+                    connection.request(message=json.dumps(commandless), request_id='2', timeout=2),
+                    connection.request(message=json.dumps(hello), request_id='3', timeout=2)
+                    )
+                assert [json.loads(reply)['command'] for reply in replies] == ['invalid message', 'hello']
+                assert connection.is_healthy()
+                await connection.close()
+                server.close()
+                await server.wait_closed()
+
+        asyncio.run(run())
+
+
+class Test_message_queue:
+
+    # a backlog for one peer is written back to back and acknowledged in one round trip
+    def test_send_messages_from_queue_pipelines_backlog(self, mocker) -> None:
+        received = []
+        all_received = asyncio.Event()
+
+        async def listener(reader, writer) -> None:
+            requests = []
+            while True:
+                try:
+                    requests.append(json.loads(await read_frame(reader)))
+                except asyncio.exceptions.IncompleteReadError:
+                    break
+                if len(requests) == 5:
+                    # only acknowledges once the whole backlog has arrived, so serial sending would never finish
+                    received.extend(requests)
+                    for request in requests:
+                        reply = {
+                            'command': 'message sent',
+                            'content': '',
+                            'sender': 'peer',
+                            'request_id': request['request_id']
+                        }
+                        writer.write(encode_frame(json.dumps(reply)))
+                    await writer.drain()
+                    all_received.set()
+
+        async def run() -> None:
+            server = await asyncio.start_server(listener, '127.0.0.1', 0)
+            port = server.sockets[0].getsockname()[1]
+            nm = network_manager.Network_manager(app=mocker.Mock())
+            nm.use_binary_wire_format = False  # the fake server only speaks json
+            nm.own_address = {'name': 'self name'}
+            nm.address_book['peer'] = {
+                'name': 'peer',
+                'ip': '127.0.0.1',
+                'port': port,
+                'public_key_e': 0,
+                'public_key_n': 0
+            }
+            for i in range(5):
+                nm.add_message_to_queue(content=f'message {i}', target='peer')
+            queue_task = asyncio.create_task(nm.send_messages_from_queue())
+            await asyncio.wait_for(all_received.wait(), timeout=5)
+            await asyncio.sleep(0.05)
+            queue_task.cancel()
+            assert [json.loads(request['content']) for request in received] == [f'message {i}' for i in range(5)]
+            assert nm.message_queue.empty()
+            nm.app.GUI.chat_screen.failed_to_send_message.assert_not_called()
+            await nm.connection_pool.close_all()
+            server.close()
+            await server.wait_closed()
+
+        asyncio.run(run())
+
+
+class Test_retry_scheduler:
+
+    # the backoff doubles each attempt, is jittered and is capped at max_delay
+    def test_get_delay(self) -> None:
+        scheduler = Retry_scheduler(base_delay=1, max_delay=10)
+        for attempts, delay in [(1, 1), (2, 2), (3, 4), (4, 8), (5, 10), (20, 10)]:
+            assert delay / 2 <= scheduler.get_delay(attempts=attempts) <= delay
+
+    # queue items are put back once due and given up on after max_attempts
+    def test_schedule_and_run(self) -> None:
+        scheduler = Retry_scheduler(base_delay=0.01, max_delay=0.01, max_attempts=3)
+        queue_item = {'message': 'message', 'target': 'peer'}
+
+        async def run() -> None:
+            queue = asyncio.Queue()
+            run_task = asyncio.create_task(scheduler.run(put=queue.put_nowait))
+            assert scheduler.schedule(queue_item=queue_item)
+            assert await asyncio.wait_for(queue.get(), timeout=1) is queue_item
+            assert scheduler.schedule(queue_item=queue_item)
+            assert await asyncio.wait_for(queue.get(), timeout=1) is queue_item
+            assert not scheduler.schedule(queue_item=queue_item)
+            assert len(scheduler) == 0
+            run_task.cancel()
+
+        asyncio.run(run())
+
+    # failed sends back off and become dead letters which are retried when the target comes back
+    def test_failed_send_becomes_dead_letter(self, mocker) -> None:
+        app = mocker.Mock()
+        app.backend.user_data.dead_letters = []
+        nm = network_manager.Network_manager(app=app)
+        nm.own_address = {'name': 'self name'}
+        nm.retry_scheduler = Retry_scheduler(base_delay=0.01, max_delay=0.01, max_attempts=2)
+        nm.address_book['peer'] = {'name': 'peer', 'ip': '127.0.0.1', 'port': 1, 'public_key_e': 0, 'public_key_n': 0}
+        mocker.patch.object(nm, 'send_message', return_value=None)
+        queue_item = {'message': 'message', 'target': 'peer'}
+
+        async def run() -> None:
+            await nm.send_queue_item(queue_item=queue_item)
+            assert len(nm.retry_scheduler) == 1
+            app.GUI.chat_screen.failed_to_send_message.assert_not_called()
+            await nm.send_queue_item(queue_item=nm.retry_scheduler.clear()[0])
+            assert app.backend.user_data.dead_letters == [queue_item]
+            app.GUI.chat_screen.failed_to_send_message.assert_called_once()
+            nm.add_address(name='peer', ip='127.0.0.1', port=2, public_key_n=0, public_key_e=0)
+            assert nm.dead_letters == []
+            assert nm.message_queue.get_nowait() is queue_item
+
+        asyncio.run(run())
+
+    # dead letters are retried when the target comes back at the same ip and port or a send to it gets through
+    def test_dead_letters_retried_when_target_comes_back_unmoved(self, mocker) -> None:
+        app = mocker.Mock()
+        app.backend.user_data.dead_letters = []
+        nm = network_manager.Network_manager(app=app)
+        nm.address_book['peer'] = {'name': 'peer', 'ip': '127.0.0.1', 'port': 1, 'public_key_e': 0, 'public_key_n': 0}
+        nm.add_dead_letter(queue_item={'message': 'first', 'target': 'peer'})
+        nm.add_address(name='peer', ip='127.0.0.1', port=1, public_key_n=0, public_key_e=0)
+        assert nm.dead_letters == []
+        assert nm.message_queue.get_nowait()['message'] == 'first'
+        nm.add_dead_letter(queue_item={'message': 'second', 'target': 'peer'})
+        mocker.patch.object(nm, 'deliver_message', return_value=True)
+        asyncio.run(nm.send_queue_item(queue_item={'message': 'third', 'target': 'peer'}))
+        assert nm.dead_letters == []
+        assert nm.message_queue.get_nowait()['message'] == 'second'
+
+
+class Test_framing:
+
+    # frames are read back whole, including content with new lines, and oversized frames are refused
+    def test_read_frame(self) -> None:
+        async def run() -> None:
+            reader = asyncio.StreamReader()
+            frames = ['{"content": "line one\\nline two"}', 'hello wörld 🙂' * 1000, '']
+            for frame in frames:
+                reader.feed_data(encode_frame(frame))
+            for frame in frames:
+                assert (await read_frame(reader)).decode() == frame
+            reader.feed_data(encode_frame(b'x' * 11))
+            with pytest.raises(ValueError, match='larger than the max of 10 bytes'):
+                await read_frame(reader, max_frame_size=10)
+            reader = asyncio.StreamReader()
+            reader.feed_data(encode_frame(b'message')[:6])
+            reader.feed_eof()
+            with pytest.raises(asyncio.IncompleteReadError):
+                await read_frame(reader)
+
+        asyncio.run(run())
+
+
+class Test_wire_format:
+
+    # binary messages decode to the same content as json messages and are smaller
+    def test_binary_message_round_trip(self, mocker) -> None:
+        private, public = gen_keys(seed=10, complexity=2, key_bits=512)
+        app = mocker.Mock()
+        app.backend.user_data.get_private_key_context.return_value = Private_key(*private)
+        nm = network_manager.Network_manager(app=app)
+        nm.own_address = {'name': 'self name'}
+        nm.address_book['peer'] = {
+            'name': 'peer',
+            'ip': '',
+            'port': 0,
+            'public_key_e': public[1],
+            'public_key_n': public[0]
+        }
+        nm.address_book['server'] = {'name': 'server', 'ip': '', 'port': 0, 'public_key_e': 0, 'public_key_n': 0}
+        content = {'text': 'hello wörld', 'sent_time_stamp': 1622547800.5, 'read': False, 'id': None}
+        for use_session_encryption in [True, False]:
+            nm.use_session_encryption = use_session_encryption
+            for target in ['peer', 'server']:
+                json_message = nm.create_message(content=content, command='message', target=target, wire_version=1)
+                binary_message = nm.create_message(content=content, command='message', target=target, wire_version=2)
+                assert isinstance(binary_message, bytes)
+                assert len(binary_message) < len(json_message)
+                parsed_message = nm.parse_message(binary_message)
+                assert parsed_message['content'] == content
+                assert parsed_message['sender'] == 'self name'
+
+    # a new connection agrees the binary wire format with a peer that supports it
+    def test_negotiates_binary_wire_format(self) -> None:
+        async def run() -> None:
+            server_nm = network_manager.Network_manager(app=None)
+            server_nm.own_address = {'name': 'server'}
+            server_nm.address_book['self name'] = {
+                'name': 'self name',
+                'ip': '',
+                'port': 0,
+                'public_key_e': 0,
+                'public_key_n': 0
+            }
+            server = await asyncio.start_server(server_nm.server_listener, '127.0.0.1', 0)
+            port = server.sockets[0].getsockname()[1]
+            nm = network_manager.Network_manager(app=None)
+            nm.own_address = {'name': 'self name'}
+            nm.address_book['server'] = {
+                'name': 'server',
+                'ip': '127.0.0.1',
+                'port': port,
+                'public_key_e': 0,
+                'public_key_n': 0
+            }
+            assert nm.get_wire_version('server') == 1
+            for _ in range(2):
+                ping = nm.create_message(content='', command='ping', target='server')
+                response = await nm.send_message(message=ping, address=nm.address_book['server'])
+                assert response['command'] == 'pong'
+                assert nm.get_wire_version('server') == 2
+            assert isinstance(ping, bytes)
+            await nm.connection_pool.close_all()
+            server.close()
+            await server.wait_closed()
+
+        asyncio.run(run())
+
+
+class Test_compression:
+
+    # large content is compressed before encryption in every format and decodes to the same content
+    def test_compressed_message_round_trip(self, mocker) -> None:
+        private, public = gen_keys(seed=10, complexity=2, key_bits=512)
+        app = mocker.Mock()
+        app.backend.user_data.get_private_key_context.return_value = Private_key(*private)
+        nm = network_manager.Network_manager(app=app)
+        nm.own_address = {'name': 'self name'}
+        nm.address_book['peer'] = {
+            'name': 'peer',
+            'ip': '',
+            'port': 0,
+            'public_key_e': public[1],
+            'public_key_n': public[0]
+        }
+        nm.address_book['server'] = {'name': 'server', 'ip': '', 'port': 0, 'public_key_e': 0, 'public_key_n': 0}
+        content = {
+            f'student {i}': {
+                'name': f'student {i}',
+                'ip': f'10.0.0.{i}',
+                'port': 5000 + i,
+                'public_key_e': 65537,
+                'public_key_n': 0
+            }
+            for i in range(50)
+        }
+        for use_session_encryption in [True, False]:
+            nm.use_session_encryption = use_session_encryption
+            for target in ['peer', 'server']:
+                for wire_version in [1, 2]:
+                    nm.use_compression = False
+                    uncompressed_message = nm.create_message(
+                        content=content,
+                        command='address book data',
+                        target=target,
+                        wire_version=wire_version
+                        )
+                    nm.use_compression = True
+                    message = nm.create_message(
+                        content=content,
+                        command='address book data',
+                        target=target,
+                        wire_version=wire_version
+                        )
+                    assert len(message) * 2 < len(uncompressed_message)
+                    parsed_message = nm.parse_message(message)
+                    assert parsed_message['compression'] == 'zlib'
+                    assert parsed_message['content'] == content
+        assert nm.compressed_messages == 8
+        assert nm.compression_bytes_saved * 2 > nm.compression_bytes_in
+
+    # content below the threshold is sent as is
+    def test_small_content_not_compressed(self, mocker) -> None:
+        nm = network_manager.Network_manager(app=mocker.Mock())
+        nm.own_address = {'name': 'self name'}
+        nm.address_book['server'] = {'name': 'server', 'ip': '', 'port': 0, 'public_key_e': 0, 'public_key_n': 0}
+        message = nm.create_message(content='hello', command='message', target='server', wire_version=1)
+        assert 'compression' not in json.loads(message)
+        assert nm.compressed_messages == 0
+
+    # decompression stops at the max size instead of expanding a small message without limit
+    def test_decompress_content_limits_size(self) -> None:
+        data = compress_content(b'a' * 10000)
+        assert decompress_content(data=data, compression='zlib', max_size=10000) == b'a' * 10000
+        with pytest.raises(ValueError):
+            decompress_content(data=data, compression='zlib', max_size=1000)
+        with pytest.raises(ValueError):
+            decompress_content(data=data[:-4], compression='zlib', max_size=10000)
+        with pytest.raises(ValueError):
+            decompress_content(data=data, compression='lzma', max_size=10000)
+
+
+class Test_address_book_sync:
+
+    # the chat server only sends the addresses changed since the version the client last synced to
+    def test_get_address_book_changes(self, mocker) -> None:
+        nm = network_manager.Network_manager(app=mocker.Mock())
+        for i in range(3):
+            nm.add_address(name=f'student {i}', ip='10.0.0.1', port=5000 + i, public_key_n=0, public_key_e=0)
+        nm.add_address(name='chat_server', ip='10.0.0.9', port=9000, public_key_n=0, public_key_e=0)
+        changes = nm.get_address_book_changes(since=0)
+        assert changes['version'] == 3
+        assert set(changes['addresses']) == {'student 0', 'student 1', 'student 2'}
+        nm.add_address(name='student 0', ip='10.0.0.1', port=5000, public_key_n=0, public_key_e=0)
+        assert nm.address_book_version == 3
+        nm.add_address(name='student 1', ip='10.0.0.2', port=5001, public_key_n=0, public_key_e=0)
+        changes = nm.get_address_book_changes(since=3, epoch=nm.address_book_epoch)
+        assert changes['version'] == 4
+        assert list(changes['addresses']) == ['student 1']
+        assert len(nm.get_address_book_changes(since=3, epoch='old epoch')['addresses']) == 3
+
+    # a client syncs everything once then only the changes
+    def test_get_address_book_syncs_changes(self, mocker) -> None:
+        async def run() -> None:
+            server_nm = network_manager.Network_manager(app=mocker.Mock())
+            server_nm.own_address = {'name': 'server'}
+            server = await asyncio.start_server(server_nm.server_listener, '127.0.0.1', 0)
+            port = server.sockets[0].getsockname()[1]
+            server_nm.add_address(name='self name', ip='127.0.0.1', port=1, public_key_n=0, public_key_e=0)
+            for i in range(3):
+                server_nm.add_address(name=f'student {i}', ip='10.0.0.1', port=5000 + i, public_key_n=0, public_key_e=0)
+            nm = network_manager.Network_manager(app=mocker.Mock())
+            nm.own_address = {'name': 'self name'}
+            nm.add_address(name='chat_server', ip='127.0.0.1', port=port, public_key_n=0, public_key_e=0)
+            await nm.get_address_book()
+            assert nm.synced_address_book_version == 4
+            assert nm.address_book['student 2']['port'] == 5002
+            changes = mocker.spy(nm, 'apply_address_book_changes')
+            server_nm.add_address(name='student 2', ip='10.0.0.3', port=6002, public_key_n=0, public_key_e=0)
+            await nm.get_address_book()
+            assert list(changes.call_args.kwargs['changes']['addresses']) == ['student 2']
+            assert nm.address_book['student 2']['port'] == 6002
+            assert nm.synced_address_book_version == 5
+            await nm.connection_pool.close_all()
+            server.close()
+            await server.wait_closed()
+
+        asyncio.run(run())
+
+
+class Test_address_book_subscriptions:
+
+    # a subscriber that never acknowledges does not hold up pushes to the others
+    def test_slow_subscriber_does_not_stall_others(self) -> None:
+        async def run() -> None:
+            pushed = []
+            stalled = asyncio.Event()
+
+            async def push(name: str, command: str, content: dict) -> bool:
+                if name == 'slow':
+                    await stalled.wait()
+                pushed.append((name, command, content))
+                return True
+
+            subscriptions = Address_book_subscriptions(
+                get_changes=lambda since, epoch: {
+                    'epoch': 'e',
+                    'version': 2,
+                    'addresses': {'new': {}} if since < 2 else {}
+                },
+                push=push
+                )
+            subscriptions.subscribe(name='slow', epoch='e', version=1)
+            subscriptions.subscribe(name='fast', epoch='e', version=1)
+            subscriptions.notify_changes()
+            await asyncio.sleep(0.01)
+            assert pushed == [('fast', 'new client', {'epoch': 'e', 'version': 2, 'addresses': {'new': {}}})]
+            subscriptions.unsubscribe(name='slow')
+            await asyncio.sleep(0.01)
+            assert pushed[-1] == ('fast', 'client left', {'name': 'slow'})
+            assert len(subscriptions) == 1
+            subscriptions.close()
+
+        asyncio.run(run())
+
+    # the chat server pushes a new client to every subscriber without them polling
+    def test_chat_server_pushes_new_client(self, mocker) -> None:
+        async def run() -> None:
+            server_nm = network_manager.Network_manager(app=mocker.Mock())
+            server_nm.own_address = {'name': 'server'}
+            server = await asyncio.start_server(server_nm.server_listener, '127.0.0.1', 0)
+            port = server.sockets[0].getsockname()[1]
+            clients = []
+            for name in ['a', 'b']:
+                nm = network_manager.Network_manager(app=mocker.Mock())
+                nm.own_address = {'name': name}
+                nm.add_address(name='chat_server', ip='127.0.0.1', port=port, public_key_n=0, public_key_e=0)
+                client_server = await asyncio.start_server(nm.client_listener, '127.0.0.1', 0)
+                server_nm.add_address(
+                    name=name,
+                    ip='127.0.0.1',
+                    port=client_server.sockets[0].getsockname()[1],
+                    public_key_n=0,
+                    public_key_e=0
+                    )
+                clients.append((nm, client_server))
+            for nm, _ in clients:
+                assert await nm.subscribe_address_book()
+            assert len(server_nm.address_book_subscriptions) == 2
+            server_nm.add_address(name='c', ip='10.0.0.3', port=5003, public_key_n=0, public_key_e=0)
+            await asyncio.sleep(0.2)
+            for nm, _ in clients:
+                assert nm.address_book['c']['port'] == 5003
+                assert nm.synced_address_book_version == server_nm.address_book_version
+            server_nm.address_book_subscriptions.close()
+            for nm, client_server in clients:
+                await nm.connection_pool.close_all()
+                client_server.close()
+                await client_server.wait_closed()
+            await server_nm.connection_pool.close_all()
+            server.close()
+            await server.wait_closed()
+
+        asyncio.run(run())
+
+    # subscribers clear the ip and port of a client that left and get them back when it subscribes again
+    def test_client_left_clears_endpoint_until_it_comes_back(self, mocker) -> None:
+        async def run() -> None:
+            server_nm = network_manager.Network_manager(app=mocker.Mock())
+            server_nm.own_address = {'name': 'server'}
+            server = await asyncio.start_server(server_nm.server_listener, '127.0.0.1', 0)
+            port = server.sockets[0].getsockname()[1]
+            clients = {}
+            for name in ['a', 'b']:
+                nm = network_manager.Network_manager(app=mocker.Mock())
+                nm.own_address = {'name': name}
+                nm.add_address(name='chat_server', ip='127.0.0.1', port=port, public_key_n=0, public_key_e=0)
+                client_server = await asyncio.start_server(nm.client_listener, '127.0.0.1', 0)
+                client_port = client_server.sockets[0].getsockname()[1]
+                server_nm.add_address(name=name, ip='127.0.0.1', port=client_port, public_key_n=0, public_key_e=0)
+                clients[name] = (nm, client_server)
+            for nm, _ in clients.values():
+                assert await nm.subscribe_address_book()
+            a, b = clients['a'][0], clients['b'][0]
+            a_port = b.address_book['a']['port']
+            await a.unsubscribe_address_book()
+            await asyncio.sleep(0.2)
+            assert (b.address_book['a']['ip'], b.address_book['a']['port']) == ('', 0)
+            assert await a.subscribe_address_book()
+            await asyncio.sleep(0.2)
+            assert b.address_book['a']['port'] == a_port
+            server_nm.address_book_subscriptions.close()
+            for nm, client_server in clients.values():
+                await nm.connection_pool.close_all()
+                client_server.close()
+                await client_server.wait_closed()
+            await server_nm.connection_pool.close_all()
+            server.close()
+            await server.wait_closed()
+
+        asyncio.run(run())
+
+    # only the chat server can push changes, which can not replace a public key or have the wrong shape
+    def test_rejects_pushes_not_from_chat_server(self, mocker) -> None:
+        async def run() -> None:
+            nm = network_manager.Network_manager(app=mocker.Mock())
+            nm.own_address = {'name': 'a'}
+            nm.add_address(name='chat_server', ip='10.0.0.9', port=9000, public_key_n=0, public_key_e=0)
+            nm.add_address(name='b', ip='10.0.0.2', port=5002, public_key_n=33, public_key_e=3)
+            client_server = await asyncio.start_server(nm.client_listener, '127.0.0.1', 0)
+            reader, writer = await asyncio.open_connection('127.0.0.1', client_server.sockets[0].getsockname()[1])
+            push = {
+                'command': 'new client',
+                'content': {
+                    'epoch': 'e',
+                    'version': 1,
+                    'addresses': {'c': {'ip': '10.6.6.6', 'port': 6666, 'public_key_n': 0, 'public_key_e': 0}}
+                },
+                'sender': 'server',
+                'request_id': '1'
+            }
+            writer.write(encode_frame(json.dumps(push)))
+            await writer.drain()
+            reply = json.loads(await asyncio.wait_for(read_frame(reader=reader), timeout=2))
+            assert reply['command'] == 'push rejected'
+            assert not nm.address_book.__contains__('c')
+            writer.close()
+            await writer.wait_closed()
+            client_server.close()
+            await client_server.wait_closed()
+            assert not nm.apply_address_book_changes(changes={'epoch': 'e', 'version': 1})
+            assert nm.apply_address_book_changes(changes={
+                'epoch': 'e',
+                'version': 2,
+                'addresses': {'b': {'ip': '10.6.6.6', 'port': 6666, 'public_key_n': 35, 'public_key_e': 3}}
+                })
+            assert nm.address_book['b']['ip'] == '10.0.0.2'
+            assert nm.synced_address_book_version == 2
+
+        asyncio.run(run())
+
+    # a client the chat server does not know yet is added from its subscription and always gets a reply
+    def test_subscribe_adds_unknown_client(self, mocker) -> None:
+        async def run() -> None:
+            server_nm = network_manager.Network_manager(app=mocker.Mock())
+            server_nm.own_address = {'name': 'server'}
+            server = await asyncio.start_server(server_nm.server_listener, '127.0.0.1', 0)
+            port = server.sockets[0].getsockname()[1]
+            private, public = gen_keys(seed=50, complexity=2)
+            nm = network_manager.Network_manager(app=mocker.Mock())
+            nm.app.backend.user_data.get_private_key_context.return_value = create_private_key(
+                private_key_n=private[0], private_key_d=private[1], public_key_e=public[1]
+                )
+            nm.own_address = {
+                'name': 'a',
+                'ip': '127.0.0.1',
+                'port': 5001,
+                'public_key_n': public[0],
+                'public_key_e': public[1]
+                }
+            nm.add_address(name='chat_server', ip='127.0.0.1', port=port, public_key_n=0, public_key_e=0)
+            assert await nm.subscribe_address_book()
+            assert server_nm.get_known_public_key(name='a') == (public[0], public[1])
+            assert server_nm.address_book['a']['port'] == 5001
+            keyless_nm = network_manager.Network_manager(app=mocker.Mock())
+            keyless_nm.own_address = {
+                'name': 'b',
+                'ip': '127.0.0.1',
+                'port': 5002,
+                'public_key_n': 0,
+                'public_key_e': 0
+                }
+            keyless_nm.add_address(name='chat_server', ip='127.0.0.1', port=port, public_key_n=0, public_key_e=0)
+            start = time.monotonic()
+            assert not await keyless_nm.subscribe_address_book()
+            assert time.monotonic() - start < keyless_nm.response_timeout
+            assert not server_nm.address_book.__contains__('b')
+            server_nm.address_book_subscriptions.close()
+            for client_nm in [nm, keyless_nm]:
+                await client_nm.connection_pool.close_all()
+            server.close()
+            await server.wait_closed()
+
+        asyncio.run(run())
+
+
+class Test_address_book:
+
+    # fingerprints are cached and indexed until the public key changes and the names follow added and removed addresses
+    def test_fingerprints_and_names(self) -> None:
+        address_book = Address_book({
+            'a': {'name': 'a', 'ip': '10.0.0.1', 'port': 5000, 'public_key_n': 3233, 'public_key_e': 17}
+        })
+        address_book['b'] = {'name': 'b', 'ip': '10.0.0.2', 'port': 5000, 'public_key_n': 0, 'public_key_e': 0}
+        assert address_book.get_fingerprint(name='a') == public_key_fingerprint(public_key_n=3233, public_key_e=17)
+        assert address_book.get_names() == ('a', 'b')
+        assert address_book.get_name_by_public_key(public_key_n=3233, public_key_e=17) == 'a'
+        assert address_book.get_name_by_public_key(public_key_n=0, public_key_e=0) is None
+        address_book['a'] = {'name': 'a', 'ip': '10.0.0.3', 'port': 5000, 'public_key_n': 3233, 'public_key_e': 17}
+        assert address_book.get_fingerprint(name='a') == public_key_fingerprint(public_key_n=3233, public_key_e=17)
+        address_book['a'] = {'name': 'a', 'ip': '10.0.0.3', 'port': 5000, 'public_key_n': 3599, 'public_key_e': 17}
+        assert address_book.get_fingerprint(name='a') == public_key_fingerprint(public_key_n=3599, public_key_e=17)
+        assert address_book.get_name_by_public_key(public_key_n=3233, public_key_e=17) is None
+        assert address_book.get_name_by_public_key(public_key_n=3599, public_key_e=17) == 'a'
+        address_book.pop('a')
+        with pytest.raises(KeyError):
+            address_book.get_fingerprint(name='a')
+        assert address_book.get_name_by_public_key(public_key_n=3599, public_key_e=17) is None
+        assert address_book.get_names() == ('b',)
+        assert json.loads(json.dumps(address_book)) == {'b': address_book['b']}
+
+
+class Test_dht:
+
+    # buckets hold at most k contacts and the closest contacts are sorted by distance
+    def test_routing_table(self) -> None:
+        routing_table = Routing_table(own_id=get_node_id('own'), k=2)
+        contacts = [{'name': f'peer{index}', 'ip': '10.0.0.1', 'port': 5000 + index} for index in range(40)]
+        for contact in contacts:
+            routing_table.add_contact(contact=contact)
+        assert all(len(bucket) <= 2 for bucket in routing_table.buckets)
+        target_id = get_node_id('target')
+        closest = routing_table.get_closest(target_id=target_id, count=5)
+        distances = [get_node_id(contact['name']) ^ target_id for contact in closest]
+        assert distances == sorted(distances)
+        routing_table.remove_contact(name=closest[0]['name'])
+        assert not routing_table.__contains__(closest[0]['name'])
+
+    # records are only stored with a valid signature and the first public key seen for a name
+    def test_signed_records(self) -> None:
+        async def run() -> None:
+            private, public = gen_keys(seed=10, complexity=2)
+            private_key = create_private_key(private_key_n=private[0], private_key_d=private[1])
+            node = Dht_node(
+                own_contact={'name': 'a', 'ip': '127.0.0.1', 'port': 5000},
+                rpc=lambda *args: asyncio.sleep(0),
+                sign=private_key.decrypt
+                )
+            await node.publish_own_record(public_key_n=public[0], public_key_e=public[1])
+            record = node.own_record
+            assert is_valid_record(record=record)
+            assert not is_valid_record(record=record | {'port': 6000})
+            other = Dht_node(
+                own_contact={'name': 'b', 'ip': '127.0.0.1', 'port': 5001},
+                rpc=lambda *args: asyncio.sleep(0)
+                )
+            assert other.store_record(record=record)
+            assert not other.store_record(record=record | {'public_key_n': 3233, 'public_key_e': 17, 'signature': 0})
+            known = Dht_node(
+                own_contact={'name': 'c', 'ip': '127.0.0.1', 'port': 5002},
+                rpc=lambda *args: asyncio.sleep(0),
+                get_public_key=lambda name: (public[0], public[1]) if name == 'a' else None
+                )
+            unsigned = record | {'public_key_n': 0, 'public_key_e': 0, 'published_time': time.time() + 1}
+            assert not is_valid_record(record=unsigned)
+            assert not other.store_record(record=unsigned | {'name': 'd'})
+            assert not known.store_record(record=unsigned)
+            assert known.store_record(record=record)
+            assert await other.publish_own_record(public_key_n=0, public_key_e=0) == 0
+
+        asyncio.run(run())
+
+    # every peer finds every other peers record in a bounded number of requests
+    def test_lookup(self) -> None:
+        async def run() -> None:
+            nodes: dict[str, Dht_node] = {}
+            requests = []
+            private, public = gen_keys(seed=10, complexity=2)
+            private_key = create_private_key(private_key_n=private[0], private_key_d=private[1])
+
+            async def rpc_from(sender: dict, contact: dict, command: str, content: dict) -> dict | None:
+                requests.append(command)
+                node = nodes.get(contact['name'])
+                return None if node is None else node.handle_request(sender=sender, command=command, content=content)
+
+            for index in range(60):
+                contact = {'name': f'peer{index}', 'ip': '10.0.0.1', 'port': 5000 + index}
+                nodes[contact['name']] = Dht_node(
+                    own_contact=contact,
+                    rpc=lambda *args, sender=contact: rpc_from(sender, *args),
+                    sign=private_key.decrypt,
+                    k=4
+                    )
+            bootstrap = nodes['peer0'].own_contact
+            for node in nodes.values():
+                await node.bootstrap(contacts=[bootstrap])
+            for node in nodes.values():
+                await node.publish_own_record(public_key_n=public[0], public_key_e=public[1])
+            nodes.pop('peer59')
+            requests.clear()
+            record = await nodes['peer1'].find_record(name='peer42')
+            assert record['port'] == 5042
+            assert len(requests) <= nodes['peer1'].alpha * nodes['peer1'].max_lookup_rounds
+            assert await nodes['peer2'].find_record(name='missing') is None
+
+        asyncio.run(run())
+
+    # a peer missing from the address book is looked up in the dht over the client listeners
+    def test_lookup_address(self, mocker) -> None:
+        async def run() -> None:
+            managers = []
+            for seed, name in enumerate(['a', 'b']):
+                private, public = gen_keys(seed=seed + 60, complexity=2)
+                nm = network_manager.Network_manager(app=mocker.Mock())
+                nm.app.backend.user_data.get_private_key_context.return_value = create_private_key(
+                    private_key_n=private[0], private_key_d=private[1], public_key_e=public[1]
+                    )
+                server = await asyncio.start_server(nm.client_listener, '127.0.0.1', 0)
+                nm.own_address = {
+                    'name': name,
+                    'ip': '127.0.0.1',
+                    'port': server.sockets[0].getsockname()[1],
+                    'public_key_n': public[0],
+                    'public_key_e': public[1]
+                    }
+                managers.append((nm, server))
+            a, b = managers[0][0], managers[1][0]
+            a.dht_bootstrap_addresses = [{'name': 'b', 'ip': '127.0.0.1', 'port': b.own_address['port']}]
+            await b.start_dht()
+            assert await a.start_dht()
+            assert not a.is_address_known(name='b')
+            address = await a.lookup_address(name='b')
+            assert address['port'] == b.own_address['port']
+            assert a.get_known_public_key(name='b') == (b.own_address['public_key_n'], b.own_address['public_key_e'])
+            assert (await b.lookup_address(name='a'))['port'] == a.own_address['port']
+            for nm, server in managers:
+                nm.dht_task.cancel()
+                await nm.connection_pool.close_all()
+                server.close()
+                await server.wait_closed()
+
+        asyncio.run(run())
+
+    # a dht record can not replace the public key the address book has for a name, only its ip and port
+    def test_lookup_address_keeps_known_public_key(self, mocker) -> None:
+        async def run() -> None:
+            managers = []
+            for seed, name in enumerate(['a', 'b']):
+                private, public = gen_keys(seed=seed + 60, complexity=2)
+                nm = network_manager.Network_manager(app=mocker.Mock())
+                nm.app.backend.user_data.get_private_key_context.return_value = create_private_key(
+                    private_key_n=private[0], private_key_d=private[1], public_key_e=public[1]
+                    )
+                server = await asyncio.start_server(nm.client_listener, '127.0.0.1', 0)
+                nm.own_address = {
+                    'name': name,
+                    'ip': '127.0.0.1',
+                    'port': server.sockets[0].getsockname()[1],
+                    'public_key_n': public[0],
+                    'public_key_e': public[1]
+                    }
+                managers.append((nm, server))
+            a, b = managers[0][0], managers[1][0]
+            a.dht_bootstrap_addresses = [{'name': 'b', 'ip': '127.0.0.1', 'port': b.own_address['port']}]
+            a.add_address(name='b', ip='', port=0, public_key_n=3233, public_key_e=17)
+            a.add_address(name='c', ip='', port=0, public_key_n=0, public_key_e=0)
+            await b.start_dht()
+            await a.start_dht()
+            assert await a.lookup_address(name='b') is None
+            assert a.address_book['b'] == {'name': 'b', 'ip': '', 'port': 0, 'public_key_n': 3233, 'public_key_e': 17}
+            assert 'b' not in a.dht.records
+            private, public = gen_keys(seed=62, complexity=2)
+            record = {
+                'name': 'c',
+                'ip': '127.0.0.1',
+                'port': 5003,
+                'public_key_n': public[0],
+                'public_key_e': public[1],
+                'published_time': time.time()
+                }
+            private_key = create_private_key(private_key_n=private[0], private_key_d=private[1])
+            record['signature'] = private_key.decrypt(get_record_hash(record) % public[0])
+            assert b.dht.store_record(record=record)
+            assert (await a.lookup_address(name='c'))['port'] == 5003
+            assert a.get_known_public_key(name='c') == (public[0], public[1])
+            # a record without a key would have messages to d sent unencrypted to wherever it points
+            b.dht.records['d'] = record | {'name': 'd', 'public_key_n': 0, 'public_key_e': 0}
+            assert await a.lookup_address(name='d') is None
+            assert not a.address_book.__contains__('d')
+            for nm, server in managers:
+                nm.dht_task.cancel()
+                await nm.connection_pool.close_all()
+                server.close()
+                await server.wait_closed()
+
+        asyncio.run(run())
+
+
+class Test_lan_discovery:
+
+    # announcements from others are passed on once with the ip they came from, queries are answered and own ones ignored
+    def test_datagram_received(self, mocker) -> None:
+        discovered = []
+        own = {'name': 'a', 'role': 'peer', 'port': 8000, 'public_key_n': 3233, 'public_key_e': 17}
+        lan_discovery = Lan_discovery(announcements=[own], on_discovered=discovered.append)
+        lan_discovery.transport = mocker.Mock()
+        other = {'name': 'b', 'role': 'peer', 'port': 8001, 'public_key_n': 0, 'public_key_e': 0}
+        lan_discovery.datagram_received(create_announcement(announcement=other, query=True), ('10.0.0.2', 8890))
+        lan_discovery.datagram_received(create_announcement(announcement=other, query=False), ('10.0.0.2', 8890))
+        lan_discovery.datagram_received(create_announcement(announcement=own, query=False), ('10.0.0.1', 8890))
+        lan_discovery.datagram_received(b'not json', ('10.0.0.3', 8890))
+        assert discovered == [other | {'ip': '10.0.0.2'}]
+        assert lan_discovery.transport.sendto.call_count == 1
+        assert lan_discovery.get_discovered(role='name_server') == []
+        assert lan_discovery.get_discovered(role='peer') == discovered
+
+    # a discovered name server replaces the placeholder but not an ip set by the user
+    def test_add_discovered_address(self, mocker) -> None:
+        nm = network_manager.Network_manager(app=mocker.Mock())
+        nm.own_address = {'name': 'a'}
+        nm.add_address(
+            name='name_server',
+            ip=network_manager.NAME_SERVER_PLACEHOLDER_IP,
+            port=8888,
+            public_key_n=0,
+            public_key_e=0
+            )
+        name_server = {
+            'name': 'name_server',
+            'role': 'name_server',
+            'ip': '10.0.0.9',
+            'port': 8888,
+            'public_key_n': 0,
+            'public_key_e': 0
+        }
+        nm.add_discovered_address(address=name_server)
+        assert nm.address_book['name_server']['ip'] == '10.0.0.9'
+        nm.add_discovered_address(address=name_server | {'ip': '10.0.0.8'})
+        assert nm.address_book['name_server']['ip'] == '10.0.0.9'
+        peer = {'name': 'b', 'role': 'peer', 'ip': '10.0.0.2', 'port': 8000, 'public_key_n': 3233, 'public_key_e': 17}
+        nm.add_discovered_address(address=peer)
+        nm.add_discovered_address(address=peer | {'name': 'a', 'ip': '10.0.0.1', 'public_key_n': 0, 'public_key_e': 0})
+        assert nm.address_book['b']['ip'] == '10.0.0.2'
+        assert not nm.address_book.__contains__('a')
+        nm.add_discovered_address(address=peer | {'ip': '10.0.0.3'})
+        assert nm.address_book['b']['ip'] == '10.0.0.3'
+        # a contact added from a chat gets its address and public key from its first announcement
+        nm.add_address(name='c', ip='', port=0, public_key_n=0, public_key_e=0)
+        nm.add_discovered_address(address=peer | {'name': 'c', 'ip': '10.0.0.4'})
+        assert nm.get_known_public_key(name='c') is None  # the public key of b can not be claimed for c
+        nm.add_discovered_address(address=peer | {'name': 'c', 'ip': '10.0.0.4', 'public_key_n': 3599})
+        assert nm.get_known_public_key(name='c') == (3599, 17)
+        assert nm.address_book['c']['ip'] == '10.0.0.4'
+        nm.add_discovered_address(address=peer | {'name': 'd', 'public_key_n': 0, 'public_key_e': 0})
+        assert not nm.address_book.__contains__('d')
+
+    # an announcement of a known name with a different public key is ignored
+    def test_add_discovered_address_ignores_spoofed_peer(self, mocker) -> None:
+        nm = network_manager.Network_manager(app=mocker.Mock())
+        nm.own_address = {'name': 'a'}
+        nm.add_address(name='b', ip='10.0.0.2', port=8000, public_key_n=3233, public_key_e=17)
+        spoofed = {'name': 'b', 'role': 'peer', 'ip': '10.0.0.66', 'port': 9000}
+        nm.add_discovered_address(address=spoofed | {'public_key_n': 0, 'public_key_e': 0})
+        nm.add_discovered_address(address=spoofed | {'public_key_n': 1517, 'public_key_e': 17})
+        assert nm.address_book['b'] == {
+            'name': 'b',
+            'ip': '10.0.0.2',
+            'port': 8000,
+            'public_key_n': 3233,
+            'public_key_e': 17
+        }
+
+    # two devices on the same network find each other as soon as the second starts
+    def test_multicast_discovery(self) -> None:
+        async def run() -> None:
+            found: dict[str, list] = {'a': [], 'b': []}
+            lan_discoveries = [
+                Lan_discovery(
+                    announcements=[{'name': name, 'role': 'peer', 'port': 8000, 'public_key_n': 0, 'public_key_e': 0}],
+                    on_discovered=found[name].append,
+                    port=18890
+                    )
+                for name in found
+            ]
+            try:
+                for lan_discovery in lan_discoveries:
+                    await lan_discovery.start()
+            except OSError:
+                pytest.skip('multicast unavailable')
+            try:
+                assert (await lan_discoveries[0].wait_for(role='peer', timeout=2))['name'] == 'b'
+                assert (await lan_discoveries[1].wait_for(role='peer', timeout=2))['name'] == 'a'
+            finally:
+                for lan_discovery in lan_discoveries:
+                    lan_discovery.close()
+
+        asyncio.run(run())
+
+
+class Test_delivery_router:
+
+    # the request id of a message is replaced in either wire format leaving the rest as it was
+    def test_set_request_id(self) -> None:
+        message = {'command': 'message', 'content': 'hi', 'sender': 'a', 'request_id': '1'}
+        binary_message = network_manager.wire_format.encode_binary_message(message=message)
+        relabelled = network_manager.wire_format.set_request_id(message=binary_message, request_id='relay-10')
+        decoded = network_manager.wire_format.decode_binary_message(message=relabelled)
+        assert decoded == message | {'request_id': 'relay-10'}
+        relabelled = network_manager.wire_format.set_request_id(message=json.dumps(message), request_id='relay-10')
+        assert json.loads(relabelled) == message | {'request_id': 'relay-10'}
+
+    # a peer without a known endpoint is reached through the chat server then directly once its endpoint is known
+    def test_relay_then_direct(self, mocker) -> None:
+        async def run() -> None:
+            managers = {}
+            for name, listener in [('server', 'server_listener'), ('a', 'client_listener'), ('b', 'client_listener')]:
+                nm = network_manager.Network_manager(app=mocker.Mock())
+                server = await asyncio.start_server(getattr(nm, listener), '127.0.0.1', 0)
+                nm.own_address = {
+                    'name': name,
+                    'ip': '127.0.0.1',
+                    'port': server.sockets[0].getsockname()[1],
+                    'public_key_n': 0,
+                    'public_key_e': 0
+                    }
+                managers[name] = (nm, server)
+            server_nm, a, b = managers['server'][0], managers['a'][0], managers['b'][0]
+            server_nm.add_address(name='b', ip='127.0.0.1', port=b.own_address['port'], public_key_n=0, public_key_e=0)
+            a.add_address(
+                name='chat_server',
+                ip='127.0.0.1',
+                port=server_nm.own_address['port'],
+                public_key_n=0,
+                public_key_e=0
+                )
+            a.add_address(name='b', ip='', port=0, public_key_n=0, public_key_e=0)  # as added by user_data.add_chat
+            assert a.get_delivery_paths(target='b') == ['relay']
+            message = a.create_message(target='b', content='hello', command='message')
+            assert await a.deliver_message(target='b', message=message)
+            b.app.backend.receive_message.assert_called_once_with(content='hello', sender='a', target='a')
+            a.add_address(name='b', ip='127.0.0.1', port=b.own_address['port'], public_key_n=0, public_key_e=0)
+            assert a.get_delivery_paths(target='b') == ['direct', 'relay']
+            message = a.create_message(target='b', content='hello again', command='message')
+            send_message = mocker.spy(a, 'send_message')
+            assert await a.deliver_message(target='b', message=message)
+            assert send_message.call_args.kwargs['address']['port'] == b.own_address['port']
+            for nm, server in managers.values():
+                await nm.connection_pool.close_all()
+                server.close()
+                await server.wait_closed()
+
+        asyncio.run(run())
+
+    # once direct delivery fails the relay is tried first until direct_retry_interval has passed
+    def test_remembers_relay(self, mocker) -> None:
+        async def run() -> None:
+            nm = network_manager.Network_manager(app=mocker.Mock())
+            nm.own_address = {'name': 'a'}
+            nm.add_address(name='chat_server', ip='127.0.0.1', port=8888, public_key_n=0, public_key_e=0)
+            nm.add_address(name='b', ip='127.0.0.1', port=8001, public_key_n=0, public_key_e=0)
+            mocker.patch.object(nm, 'send_message', return_value=None)
+            mocker.patch.object(nm, 'relay_message', return_value={'command': 'message sent'})
+            assert await nm.deliver_message(target='b', message='{}')
+            assert nm.send_message.call_count == 1
+            assert nm.get_delivery_paths(target='b') == ['relay', 'direct']
+            assert await nm.deliver_message(target='b', message='{}')
+            assert nm.send_message.call_count == 1
+            nm.direct_retry_interval = 0
+            assert nm.get_delivery_paths(target='b') == ['direct', 'relay']
+
+        asyncio.run(run())
+
+
+class Test_mailbox:
+
+    # messages are kept in order across segments, bounded, reloaded from disk and removed once delivered
+    def test_store_read_remove(self, tmp_path) -> None:
+        mailbox = Mailbox(directory=str(tmp_path), max_messages=5, segment_size=100)
+        for index in range(4):
+            assert mailbox.store(recipient='b', message=f'message {index} ' + 'x' * 50)
+        assert mailbox.store(recipient='b', message=b'\xb1binary')
+        assert not mailbox.store(recipient='b', message='one too many')
+        reloaded = Mailbox(directory=str(tmp_path), max_messages=6)
+        messages, last_segment = reloaded.read(recipient='b')
+        assert messages[0].startswith('message 0') and messages[-1] == b'\xb1binary'
+        assert len(messages) == 5 and last_segment > 0
+        assert reloaded.store(recipient='b', message='kept while delivering')
+        reloaded.remove(recipient='b', last_segment=last_segment)
+        assert reloaded.read(recipient='b')[0] == ['kept while delivering']
+        assert reloaded.get_message_count(recipient='c') == 0
+
+    # messages stored from many threads at once are all kept, as the chat server stores them off the event loop
+    def test_store_from_threads(self, tmp_path) -> None:
+        async def run() -> None:
+            mailbox = Mailbox(directory=str(tmp_path), segment_size=200)
+            stored = await asyncio.gather(*[
+                asyncio.to_thread(mailbox.store, recipient='b', message=f'message {index} ' + 'x' * 50)
+                for index in range(50)
+            ])
+            assert all(stored)
+            messages, last_segment = await asyncio.to_thread(mailbox.read, recipient='b')
+            assert sorted(messages) == sorted(f'message {index} ' + 'x' * 50 for index in range(50))
+            assert Mailbox(directory=str(tmp_path)).get_message_count(recipient='b') == 50
+            await asyncio.to_thread(mailbox.remove, recipient='b', last_segment=last_segment)
+            assert not mailbox.__contains__('b')
+
+        asyncio.run(run())
+
+    # a message for an offline peer is kept by the chat server and delivered when the peer subscribes
+    def test_offline_delivery(self, mocker, tmp_path) -> None:
+        async def run() -> None:
+            managers = {}
+            for name, listener in [('server', 'server_listener'), ('a', 'client_listener'), ('b', 'client_listener')]:
+                nm = network_manager.Network_manager(app=mocker.Mock())
+                server = await asyncio.start_server(getattr(nm, listener), '127.0.0.1', 0)
+                nm.own_address = {
+                    'name': name,
+                    'ip': '127.0.0.1',
+                    'port': server.sockets[0].getsockname()[1],
+                    'public_key_n': 0,
+                    'public_key_e': 0
+                    }
+                managers[name] = (nm, server)
+            server_nm, a, b = managers['server'][0], managers['a'][0], managers['b'][0]
+            server_nm.mailbox_path = str(tmp_path)
+            managers['b'][1].close()  # b is offline
+            await managers['b'][1].wait_closed()
+            server_nm.add_address(name='b', ip='127.0.0.1', port=b.own_address['port'], public_key_n=0, public_key_e=0)
+            for nm in [a, b]:
+                nm.add_address(
+                    name='chat_server',
+                    ip='127.0.0.1',
+                    port=server_nm.own_address['port'],
+                    public_key_n=0,
+                    public_key_e=0
+                    )
+            a.add_address(name='b', ip='', port=0, public_key_n=0, public_key_e=0)
+            for text in ['first', 'second']:
+                message = a.create_message(target='b', content=text, command='message')
+                assert await a.deliver_message(target='b', message=message)
+            assert server_nm.mailbox.get_message_count(recipient='b') == 2
+            managers['b'] = (b, await asyncio.start_server(b.client_listener, '127.0.0.1', b.own_address['port']))
+            assert await b.subscribe_address_book()
+            await asyncio.sleep(0.2)
+            received = [call.kwargs['content'] for call in b.app.backend.receive_message.call_args_list]
+            assert received == ['first', 'second']
+            assert server_nm.mailbox.get_message_count(recipient='b') == 0
+            server_nm.address_book_subscriptions.close()
+            for nm, server in managers.values():
+                await nm.connection_pool.close_all()
+                server.close()
+                await server.wait_closed()
+
+        asyncio.run(run())
+
+    # a message for a peer with kept messages is stored behind them and they are all delivered if it can be reached
+    def test_kept_messages_delivered_with_next_message(self, mocker, tmp_path) -> None:
+        async def run() -> None:
+            managers = {}
+            for name, listener in [('server', 'server_listener'), ('a', 'client_listener'), ('b', 'client_listener')]:
+                nm = network_manager.Network_manager(app=mocker.Mock())
+                server = await asyncio.start_server(getattr(nm, listener), '127.0.0.1', 0)
+                nm.own_address = {
+                    'name': name,
+                    'ip': '127.0.0.1',
+                    'port': server.sockets[0].getsockname()[1],
+                    'public_key_n': 0,
+                    'public_key_e': 0
+                    }
+                managers[name] = (nm, server)
+            server_nm, a, b = managers['server'][0], managers['a'][0], managers['b'][0]
+            server_nm.mailbox_path = str(tmp_path)
+            server_nm.add_address(name='b', ip='127.0.0.1', port=b.own_address['port'], public_key_n=0, public_key_e=0)
+            a.add_address(
+                name='chat_server',
+                ip='127.0.0.1',
+                port=server_nm.own_address['port'],
+                public_key_n=0,
+                public_key_e=0
+                )
+            a.add_address(name='b', ip='', port=0, public_key_n=0, public_key_e=0)
+            # kept while b was offline and not yet delivered
+            first = a.create_message(target='b', content='first', command='message')
+            server_nm.get_mailbox().store(recipient='b', message=first)
+            message = a.create_message(target='b', content='second', command='message')
+            assert await a.deliver_message(target='b', message=message)
+            await asyncio.sleep(0.2)
+            received = [call.kwargs['content'] for call in b.app.backend.receive_message.call_args_list]
+            assert received == ['first', 'second']
+            assert server_nm.mailbox.get_message_count(recipient='b') == 0
+            for nm, server in managers.values():
+                await nm.connection_pool.close_all()
+                server.close()
+                await server.wait_closed()
+
+        asyncio.run(run())
+
+
+class Test_group_chat:
+
+    # a chat with members other than the user it is named after is a group chat and sends through the group queue
+    def test_group_chat_send(self, mocker) -> None:
+        app = mocker.Mock()
+        app.network_manager.address_book = {}
+        group_chat = Chat(app=app)
+        group_chat.create_chat(name='class', icon='', members=['b', 'c', 'b'])
+        assert group_chat.users == ['b', 'c'] and group_chat.is_group_chat()
+        assert app.network_manager.add_address.call_count == 2
+        group_chat.send_message(message=message(chat=group_chat, message_id='1', content='hi', app=app))
+        app.network_manager.add_group_message_to_queue.assert_called_once()
+        direct_chat = Chat(app=app)
+        direct_chat.create_chat(name='b', icon='')
+        assert not direct_chat.is_group_chat()
+
+    # the body is encrypted once for the group, the chat server sends it to each member and keeps it for offline ones
+    # a member that can not decrypt it does not acknowledge it so it is not kept for them
+    def test_group_message_fan_out(self, mocker, tmp_path) -> None:
+        async def run() -> None:
+            managers = {}
+            listeners = [
+                ('server', 'server_listener'),
+                ('a', 'client_listener'),
+                ('b', 'client_listener'),
+                ('c', 'client_listener'),
+                ('d', 'client_listener')
+            ]
+            for seed, (name, listener) in enumerate(listeners):
+                private, public = gen_keys(seed=seed + 20, complexity=2)
+                nm = network_manager.Network_manager(app=mocker.Mock())
+                nm.app.backend.user_data.get_private_key_context.return_value = create_private_key(
+                    private_key_n=private[0], private_key_d=private[1], public_key_e=public[1]
+                    )
+                server = await asyncio.start_server(getattr(nm, listener), '127.0.0.1', 0)
+                nm.own_address = {
+                    'name': name,
+                    'ip': '127.0.0.1',
+                    'port': server.sockets[0].getsockname()[1],
+                    'public_key_n': public[0],
+                    'public_key_e': public[1]
+                    }
+                managers[name] = (nm, server)
+            server_nm, a, b, c, d = [managers[name][0] for name in ['server', 'a', 'b', 'c', 'd']]
+            server_nm.mailbox_path = str(tmp_path)
+            managers['c'][1].close()  # c is offline
+            await managers['c'][1].wait_closed()
+            for nm, key_owner in [(b, b), (c, c), (d, b)]:  # a has the wrong key for d
+                server_nm.add_address(
+                    name=nm.own_address['name'],
+                    ip='127.0.0.1',
+                    port=nm.own_address['port'],
+                    public_key_n=0,
+                    public_key_e=0
+                    )
+                a.add_address(
+                    name=nm.own_address['name'],
+                    ip='',
+                    port=0,
+                    public_key_n=key_owner.own_address['public_key_n'],
+                    public_key_e=key_owner.own_address['public_key_e']
+                    )
+            a.add_address(
+                name='chat_server',
+                ip='127.0.0.1',
+                port=server_nm.own_address['port'],
+                public_key_n=0,
+                public_key_e=0
+                )
+            wrap = mocker.spy(a, 'encrypt_message_blocks')
+            for text in ['first', 'second']:
+                group_message = a.create_group_message(
+                    content={'text': text, 'sent_time_stamp': 1.0},
+                    group='class',
+                    members=['a', 'b', 'c', 'd']
+                    )
+                parsed_acknowledgement = await a.send_message(
+                    message=group_message,
+                    address=a.address_book['chat_server']
+                    )
+                assert parsed_acknowledgement['command'] == 'message sent'
+                assert parsed_acknowledgement['content'] == {'delivered': ['b'], 'stored': ['c'], 'failed': ['d']}
+            assert wrap.call_count == 3  # the group key is wrapped once per member not once per message
+            received = [call.kwargs['content']['text'] for call in b.app.backend.receive_group_message.call_args_list]
+            assert received == ['first', 'second']
+            assert b.app.backend.receive_group_message.call_args.kwargs['members'] == ['c', 'd']
+            assert not d.app.backend.receive_group_message.called
+            assert server_nm.mailbox.get_message_count(recipient='d') == 0
+            assert b.app.backend.receive_group_message.call_args.kwargs['sender'] == 'a'
+            assert server_nm.mailbox.get_message_count(recipient='c') == 2
+            for nm, server in managers.values():
+                await nm.connection_pool.close_all()
+                server.close()
+                await server.wait_closed()
+
+        asyncio.run(run())
+
+    # a member added to a chat without a public key fails the send rather than being skipped quietly
+    def test_group_message_without_member_key_fails(self, mocker) -> None:
+        private, public = gen_keys(seed=30, complexity=2)
+        nm = network_manager.Network_manager(app=mocker.Mock())
+        nm.app.network_manager = nm
+        nm.own_address = {'name': 'a'}
+        nm.add_address(name='b', ip='', port=0, public_key_n=public[0], public_key_e=public[1])
+        group_chat = Chat(app=nm.app)
+        group_chat.create_chat(name='class', icon='', members=['b', 'e'])
+        assert nm.address_book['e']['public_key_n'] == 0
+        group_chat.send_message(message=mocker.Mock(**{'convert_to_dict.return_value': {'text': 'hi'}}))
+        nm.app.GUI.chat_screen.failed_to_send_message.assert_called_once()
+        queue_items = [nm.message_queue.get_nowait() for _ in range(nm.message_queue.qsize())]
+        group_messages = [json.loads(item['message']) for item in queue_items if isinstance(item, dict)]
+        assert [group_message['content']['members'] for group_message in group_messages] == [['b']]
+
+    # a group message is only added to a group chat of that name that the sender is in
+    def test_receive_group_message_checks_sender(self, mocker) -> None:
+        app = mocker.Mock()
+        app.network_manager.address_book = {}
+        backend = Backend_manager(app=app)
+        received = mocker.patch.object(backend, 'receive_message')
+        backend.user_data.add_chat(name='b', icon='')
+        content = {'text': 'hi', 'sent_time_stamp': 1622547800}
+        assert not backend.receive_group_message(content=content, sender='a', group='b', members=['c'])
+        assert backend.receive_group_message(content=content, sender='a', group='class', members=['c'])
+        assert backend.user_data.get_chat_dict()['class'].users == ['a', 'c']
+        assert not backend.receive_group_message(content=content, sender='d', group='class', members=['c'])
+        assert received.call_count == 1
+
+    # members without a public key are looked up in the dht before the group key is wrapped for them
+    def test_group_message_looks_up_member_keys(self, mocker) -> None:
+        async def run() -> None:
+            managers = {}
+            for seed, name in enumerate(['a', 'b']):
+                private, public = gen_keys(seed=seed + 40, complexity=2)
+                nm = network_manager.Network_manager(app=mocker.Mock())
+                nm.app.backend.user_data.get_private_key_context.return_value = create_private_key(
+                    private_key_n=private[0], private_key_d=private[1], public_key_e=public[1]
+                    )
+                server = await asyncio.start_server(nm.client_listener, '127.0.0.1', 0)
+                nm.own_address = {
+                    'name': name,
+                    'ip': '127.0.0.1',
+                    'port': server.sockets[0].getsockname()[1],
+                    'public_key_n': public[0],
+                    'public_key_e': public[1]
+                    }
+                managers[name] = (nm, server)
+            a, b = managers['a'][0], managers['b'][0]
+            a.dht_bootstrap_addresses = [{'name': 'b', 'ip': '127.0.0.1', 'port': b.own_address['port']}]
+            await b.start_dht()
+            await a.start_dht()
+            a.add_address(name='b', ip='', port=0, public_key_n=0, public_key_e=0)  # added from a chat
+            assert a.add_group_message_to_queue(content={'text': 'hi'}, group='class', members=['a', 'b'])
+            queue_item = await asyncio.wait_for(a.message_queue.get(), timeout=2)
+            while queue_item == 'update address book':
+                queue_item = await asyncio.wait_for(a.message_queue.get(), timeout=2)
+            assert json.loads(queue_item['message'])['content']['members'] == ['b']
+            assert a.get_known_public_key(name='b') == (b.own_address['public_key_n'], b.own_address['public_key_e'])
+            assert not a.app.GUI.chat_screen.failed_to_send_message.called
+            for nm, server in managers.values():
+                nm.dht_task.cancel()
+                await nm.connection_pool.close_all()
+                server.close()
+                await server.wait_closed()
+
+        asyncio.run(run())
+
+
+class Test_name_server:
+
+    # keys spread over every chat server and adding one only moves keys onto it
+    def test_hash_ring(self) -> None:
+        hash_ring = load_name_server().Hash_ring(virtual_nodes=64)
+        for node in ['a-server', 'b-server', 'c-server']:
+            hash_ring.add(node)
+        keys = [f'student{index}' for index in range(1000)]
+        assigned = {key: hash_ring.get(key) for key in keys}
+        assert set(assigned.values()) == {'a-server', 'b-server', 'c-server'}
+        hash_ring.add('d-server')
+        moved = [key for key in keys if hash_ring.get(key) != assigned[key]]
+        assert 0 < len(moved) < len(keys) / 2
+        assert all(hash_ring.get(key) == 'd-server' for key in moved)
+        hash_ring.remove('d-server')
+        assert {key: hash_ring.get(key) for key in keys} == assigned
+        assert load_name_server().Hash_ring().get('student0') is None
+        nodes = hash_ring.get_nodes('student0')
+        assert nodes[0] == assigned['student0']
+        assert sorted(nodes) == ['a-server', 'b-server', 'c-server']
+
+    # a client is sent to the next chat server on the ring while its own missed its last ping
+    def test_get_chat_server_skips_dead(self, tmp_path, monkeypatch) -> None:
+        monkeypatch.chdir(tmp_path)  # the name server saves its address book in the working folder
+        name_server = load_name_server().Name_server()
+        for index, name in enumerate(['a-server', 'b-server', 'c-server']):
+            name_server.add_address(name=name, ip='10.0.0.1', port=5000 + index)
+        assigned = name_server.get_chat_server(client_name='student0')['name']
+        name_server.chat_server_health[assigned] = {'alive': False, 'last_pong_time': None, 'missed_pings': 1}
+        next_name = name_server.hash_ring.get_nodes('student0')[1]
+        assert name_server.get_chat_server(client_name='student0')['name'] == next_name
+        for name in name_server.address_book:
+            name_server.chat_server_health[name] = {'alive': False, 'last_pong_time': None, 'missed_pings': 1}
+        assert name_server.get_chat_server(client_name='student0') is None
+
+    # a chat server reported dead is answered for from the cached health and pinged in the background
+    def test_reported_dead_chat_server_answered_from_cache(self, tmp_path, monkeypatch) -> None:
+        monkeypatch.chdir(tmp_path)
+
+        async def run() -> None:
+            async def never_answer(reader, writer) -> None:
+                await reader.read()
+
+            stalled_server = await asyncio.start_server(never_answer, '127.0.0.1', 0)
+            stalled_port = stalled_server.sockets[0].getsockname()[1]
+            name_server = load_name_server().Name_server()
+            name_server.ping_timeout = 1
+            name_server.add_address(name='a-server', ip='127.0.0.1', port=stalled_port)
+            server = await asyncio.start_server(name_server.listener, '127.0.0.1', 0)
+            reader, writer = await asyncio.open_connection('127.0.0.1', server.sockets[0].getsockname()[1])
+            report = {
+                'command': 'chat server shutdown',
+                'content': {'ip': '127.0.0.1', 'port': stalled_port},
+                'sender': 'student0',
+                'request_id': '1'
+            }
+            writer.write(encode_frame(json.dumps(report)))
+            await writer.drain()
+            reply = json.loads(await asyncio.wait_for(read_frame(reader=reader), timeout=name_server.ping_timeout / 2))
+            assert reply['command'] == 'chat server alive'  # not pinged yet
+            await asyncio.sleep(name_server.ping_timeout + 0.2)
+            assert not name_server.address_book.__contains__('a-server')
+            writer.close()
+            await writer.wait_closed()
+            for running_server in [server, stalled_server]:
+                running_server.close()
+                await running_server.wait_closed()
+
+        asyncio.run(run())
+
+    # the health check keeps a chat server that answers, sending it the other chat servers,
+    # and removes one that misses max_missed_pings in a row
+    def test_check_chat_server_health(self, mocker, tmp_path, monkeypatch) -> None:
+        monkeypatch.chdir(tmp_path)  # the name server saves its address book in the working folder
+
+        async def run() -> None:
+            chat_server_nm = network_manager.Network_manager(app=mocker.Mock())
+            chat_server_nm.own_address = {'name': 'a'}
+            chat_server_nm.chat_server_name = 'a-server'
+            chat_server_nm.add_address(name='name_server', ip='127.0.0.1', port=1, public_key_n=0, public_key_e=0)
+            server = await asyncio.start_server(chat_server_nm.server_listener, '127.0.0.1', 0)
+            with socket.socket() as unused_socket:
+                unused_socket.bind(('127.0.0.1', 0))
+                dead_port = unused_socket.getsockname()[1]
+            name_server = load_name_server().Name_server()
+            name_server.ping_interval = 0.01
+            name_server.ping_timeout = 1
+            name_server.max_missed_pings = 2
+            name_server.add_address(name='a-server', ip='127.0.0.1', port=server.sockets[0].getsockname()[1])
+            name_server.add_address(name='b-server', ip='127.0.0.1', port=dead_port)
+            assert name_server.find_chat_server(address={'ip': '127.0.0.1', 'port': dead_port}) == 'b-server'
+            health_check_task = asyncio.create_task(name_server.check_chat_server_health())
+            for _ in range(200):
+                if 'b-server' not in name_server.address_book:
+                    break
+                await asyncio.sleep(0.01)
+            assert list(name_server.address_book) == ['a-server']
+            assert name_server.find_chat_server(address={'ip': '127.0.0.1', 'port': dead_port}) is None
+            # the 0.01 second ping_interval may have passed since the last pong so the cached health is checked
+            assert name_server.is_chat_server_alive(name='a-server')
+            assert name_server.chat_server_health['a-server']['missed_pings'] == 0
+            await asyncio.sleep(0.05)
+            assert chat_server_nm.peer_chat_servers == {}
+            health_check_task.cancel()
+            chat_server_nm.chat_server_replication.close()
+            server.close()
+            await server.wait_closed()
+
+        asyncio.run(run())
+
+
+class Test_chat_server_replication:
+
+    # an address added on one chat server reaches the others once, without being sent back
+    def test_replicates_address_book(self, mocker) -> None:
+        async def run() -> None:
+            managers = {}
+            for name in ['a', 'b']:
+                nm = network_manager.Network_manager(app=mocker.Mock())
+                nm.own_address = {'name': name}
+                nm.chat_server_name = f'{name}-server'
+                server = await asyncio.start_server(nm.server_listener, '127.0.0.1', 0)
+                managers[name] = (nm, server)
+            chat_servers = [
+                {'name': f'{name}-server', 'ip': '127.0.0.1', 'port': server.sockets[0].getsockname()[1]}
+                for name, (_, server) in managers.items()
+            ]
+            a, b = managers['a'][0], managers['b'][0]
+            a.add_address(name='x', ip='10.0.0.1', port=5001, public_key_n=0, public_key_e=0)
+            for nm in [a, b]:
+                nm.set_peer_chat_servers(chat_servers=chat_servers)
+            assert list(a.peer_chat_servers) == ['b-server']
+            b.add_address(name='y', ip='10.0.0.2', port=5002, public_key_n=0, public_key_e=0)
+            await asyncio.sleep(0.2)
+            assert b.address_book['x']['port'] == 5001
+            assert a.address_book['y']['port'] == 5002
+            versions = (a.address_book_version, b.address_book_version)
+            assert list(b.get_replicated_changes(since=0)['addresses']) == ['y']
+            a.add_address(name='x', ip='10.0.0.1', port=6001, public_key_n=0, public_key_e=0)
+            await asyncio.sleep(0.2)
+            assert b.address_book['x']['port'] == 6001
+            assert (a.address_book_version, b.address_book_version) == (versions[0] + 1, versions[1] + 1)
+            a.set_peer_chat_servers(chat_servers=chat_servers[:1])
+            assert len(a.chat_server_replication) == 0
+            for nm, server in managers.values():
+                nm.chat_server_replication.close()
+                await nm.connection_pool.close_all()
+                server.close()
+                await server.wait_closed()
+
+        asyncio.run(run())